@@ -0,0 +1,452 @@
+"""
+Serviço HTTP/JSON sobre o open_crud (tornado), para quiosques e terminais da farmácia
+acessarem os dados sem passar pelo modelo de rerun do Streamlit.
+
+Todas as rotas, exceto o login, exigem o token de uma sessão (cabeçalho "Authorization: Bearer <token>")
+e cada requisição enxerga só os postos visíveis ao cargo do funcionário logado (sessoes.py). As
+escritas seguem o mesmo escopo (403 para registros ou postos fora dele), e hospitais, postos,
+medicamentos e funcionários, que valem para todos os postos, só são alterados pelo cargo Administrativo.
+
+Rotas:
+    POST   /api/sessao                   login (corpo JSON com email e senha); devolve o token da sessão
+    GET    /api/sessao                   funcionário da sessão
+    DELETE /api/sessao                   logout
+    GET    /api/<entidade>               listagem com filtros, fields=a,b e paginação (after_id, limit)
+    POST   /api/<entidade>               cadastro (corpo JSON com os parâmetros da função create_*)
+    GET    /api/<entidade>/<id>          registro pelo ID
+    PUT    /api/<entidade>/<id>          atualização (corpo JSON com os parâmetros da função update_*)
+    DELETE /api/<entidade>/<id>          exclusão
+    GET    /api/relatorios/<relatorio>   relatórios (start_date, end_date, limit...)
+    GET    /api/alteracoes               log de alterações após after_seq (tabela, operação e ID; tabelas=a,b, limit); só Administrativo
+    GET    /api/pacientes/<id>/prontuario  atendimentos com prescrições e distribuições (since, limit, before_id)
+
+As respostas de GET levam ETag e respondem 304 quando o cliente envia If-None-Match igual.
+Em listagens e relatórios o ETag carrega a versão das tabelas consultadas, então o 304 sai
+sem executar a consulta (o mesmo vale para o parâmetro if_version=<versão>). As listagens
+são enviadas em blocos (streaming) e comprimidas com gzip quando o cliente aceita.
+
+Uso:
+    python api_server.py --port 8888 --db hospital_db.sqlite --pool 8
+    python api_server.py --fragmentos fragmentos
+    curl -X POST localhost:8888/api/sessao -d '{"email": "admin@hospital.com", "senha": "..."}'
+    curl -H "Authorization: Bearer <token>" localhost:8888/api/pacientes
+"""
+import argparse
+import hashlib
+import inspect
+import json
+import re
+
+import tornado.ioloop
+import tornado.web
+
+import autenticacao
+import open_crud
+import sessoes
+from async_crud import AsyncCrud
+
+TAMANHO_PAGINA_PADRAO = 100
+TAMANHO_PAGINA_MAXIMO = 1000
+REGISTROS_POR_BLOCO = 200
+
+ENTIDADES = {
+    "hospitais": {"chave": "id_hospital", "listar": "get_all_hospitals", "obter": "get_hospital_by_id",
+                  "criar": "create_hospital", "atualizar": "update_hospital", "excluir": "delete_hospital",
+                  "cargos_escrita": ("Administrativo",)},
+    "postos": {"chave": "id_posto", "listar": "get_all_postos_saude", "obter": "get_posto_saude_by_id",
+               "criar": "create_posto_saude", "atualizar": "update_posto_saude", "excluir": "delete_posto_saude",
+               "cargos_escrita": ("Administrativo",)},
+    "funcionarios": {"chave": "id_funcionario", "listar": "get_all_funcionarios", "obter": "get_funcionario_by_id",
+                     "criar": "create_funcionario", "atualizar": "update_funcionario", "excluir": "delete_funcionario",
+                     "cargos_escrita": ("Administrativo",)},
+    "pacientes": {"chave": "id_paciente", "listar": "get_all_pacientes", "obter": "get_paciente_by_id",
+                  "criar": "create_paciente", "atualizar": "update_paciente", "excluir": "delete_paciente"},
+    "medicamentos": {"chave": "id_medicamento", "listar": "get_all_medicamentos", "obter": "get_medicamento_by_id",
+                     "criar": "create_medicamento", "atualizar": "update_medicamento", "excluir": "delete_medicamento",
+                     "cargos_escrita": ("Administrativo",)},
+    "estoque": {"chave": "id_estoque", "listar": "get_all_estoque_medicamento_posto", "obter": "get_estoque_medicamento_posto_by_id",
+                "criar": "create_estoque_medicamento_posto", "atualizar": "update_estoque_medicamento_posto", "excluir": "delete_estoque_medicamento_posto"},
+    "atendimentos": {"chave": "id_atendimento", "listar": "get_all_atendimentos", "obter": "get_atendimento_by_id",
+                     "criar": "create_atendimento", "atualizar": "update_atendimento", "excluir": "delete_atendimento"},
+    "prescricoes": {"chave": "id_prescricao", "listar": "get_all_prescricoes", "obter": "get_prescricao_by_id",
+                    "criar": "create_prescricao", "atualizar": "update_prescricao", "excluir": "delete_prescricao"},
+    "distribuicoes": {"chave": "id_distribuicao", "listar": "get_all_distribuicoes_medicamento", "obter": "get_distribuicao_medicamento_by_id",
+                      "criar": "create_distribuicao_medicamento"},
+    "movimentacoes": {"chave": "id_movimentacao", "listar": "get_movimentacoes_estoque", "criar": "registrar_movimentacao_estoque"},
+}
+
+RELATORIOS = {
+    "atendimentos-por-tipo": "get_atendimentos_by_type",
+    "atendimentos-por-posto": "get_atendimentos_by_posto",
+    "pacientes-por-genero": "get_pacientes_by_genero",
+    "pacientes-por-faixa-etaria": "get_pacientes_by_idade_group",
+    "medicamentos-mais-distribuidos": "get_top_distribui_medicamentos",
+    "diagnosticos-mais-comuns": "get_top_diagnosticos",
+    "estoque-na-data": "get_estoque_na_data",
+    "alertas-estoque": "get_alertas_estoque",
+    "serie-temporal": "get_serie_temporal",
+}
+
+# Escritas: o registro alterado e os registros apontados pelo corpo precisam estar nos postos visíveis
+# à sessão. Campos com o posto são conferidos direto; os demais, pela busca por ID (que já aplica o escopo).
+CAMPOS_POSTO = ("id_posto", "id_posto_referencia", "id_posto_atendimento", "id_posto_lotacao")
+REFERENCIAS_ESCOPO = {
+    "id_paciente": "get_paciente_by_id",
+    "id_funcionario_responsavel": "get_funcionario_by_id",
+    "id_funcionario_distribuidor": "get_funcionario_by_id",
+    "id_atendimento": "get_atendimento_by_id",
+    "id_prescricao": "get_prescricao_by_id",
+    "id_medicamento_estoque": "get_estoque_medicamento_posto_by_id",
+    "estoque_id": "get_estoque_medicamento_posto_by_id",
+}
+
+# Cargos com acesso ao log de alterações (que cobre todos os postos, sem filtro de escopo)
+CARGOS_ALTERACOES = ("Administrativo",)
+
+# Campos que nunca saem pela API
+CAMPOS_SENSIVEIS = {"senha_hash"}
+
+# Parâmetros de consulta tratados pelo próprio serviço
+PARAMETROS_PAGINACAO = {"after_id", "limit"}
+
+
+def _converter_parametro(nome, valor, padrao):
+    """Converte um parâmetro de query string para o tipo esperado pela função do open_crud."""
+    if nome in ("fields", "tabelas", "dimensoes"):
+        return [campo.strip() for campo in valor.split(",") if campo.strip()]
+    if isinstance(padrao, bool):
+        return valor.lower() in ("1", "true", "sim", "s")
+    if nome.startswith("id_") or nome in ("limit", "after_id", "before_id", "after_seq", "validade_proxima_dias", "if_version"):
+        return int(valor)
+    return valor
+
+
+def _sem_campos_sensiveis(registro):
+    return {k: v for k, v in registro.items() if k not in CAMPOS_SENSIVEIS}
+
+
+class BaseHandler(tornado.web.RequestHandler):
+    def initialize(self, crud):
+        self.crud = crud
+        self.principal = None
+
+    def set_default_headers(self):
+        self.set_header("Content-Type", "application/json; charset=utf-8")
+        self.set_header("Cache-Control", "private") # Respostas dependem do escopo de quem pediu
+
+    def write_error(self, status_code, **kwargs):
+        if status_code == 401:
+            self.set_header("WWW-Authenticate", 'Bearer realm="api"')
+        self.finish(json.dumps({"success": False, "message": self._reason}, ensure_ascii=False))
+
+    def token_sessao(self):
+        tipo, _, token = self.request.headers.get("Authorization", "").partition(" ")
+        return token.strip() if tipo.lower() == "bearer" else None
+
+    def prepare(self):
+        """Toda requisição precisa de uma sessão válida; o principal define o escopo das consultas."""
+        self.principal = sessoes.obter_principal(self.token_sessao()) # Consulta a um dicionário em memória
+        if self.principal is None:
+            raise tornado.web.HTTPError(401, reason="Sessão inválida ou expirada. Faça login em /api/sessao.")
+
+    def exigir_cargo(self, cargos):
+        if self.principal.cargo not in cargos:
+            raise tornado.web.HTTPError(403, reason="Operação não permitida para o seu cargo.")
+
+    async def chamar(self, nome_funcao, *args, **kwargs):
+        """Executa a função do open_crud no pool, restrita aos postos visíveis ao funcionário da sessão."""
+        with self.principal.escopo(): # O AsyncCrud leva o contexto para a thread do pool
+            return await self.crud.chamar(nome_funcao, *args, **kwargs)
+
+    async def exigir_escopo_escrita(self, entidade, id_registro=None, corpo=None):
+        """403 se a escrita alcança um registro ou posto fora do escopo da sessão."""
+        if self.principal.postos_visiveis is None:
+            return
+        if id_registro is not None and await self._fora_do_escopo(entidade["obter"], id_registro):
+            raise tornado.web.HTTPError(403, reason="Registro fora dos postos visíveis ao seu cargo.")
+        for campo, valor in (corpo or {}).items():
+            if valor is None:
+                continue
+            if campo in CAMPOS_POSTO and valor not in self.principal.postos_visiveis:
+                raise tornado.web.HTTPError(403, reason="Posto fora dos postos visíveis ao seu cargo.")
+            if campo in REFERENCIAS_ESCOPO and await self._fora_do_escopo(REFERENCIAS_ESCOPO[campo], valor):
+                raise tornado.web.HTTPError(403, reason=f"Registro de '{campo}' fora dos postos visíveis ao seu cargo.")
+
+    async def _fora_do_escopo(self, funcao, id_registro):
+        """True se o registro existe mas não é visível à sessão (um ID inexistente fica para o open_crud responder)."""
+        if (await self.chamar(funcao, id_registro))["success"]:
+            return False
+        return (await self.crud.chamar(funcao, id_registro))["success"] # Sem o escopo da sessão
+
+    def corpo_json(self):
+        try:
+            corpo = json.loads(self.request.body or b"{}")
+        except ValueError:
+            raise tornado.web.HTTPError(400, reason="Corpo da requisição não é um JSON válido.")
+        if not isinstance(corpo, dict):
+            raise tornado.web.HTTPError(400, reason="O corpo da requisição deve ser um objeto JSON.")
+        return corpo
+
+    def kwargs_da_query(self, nome_funcao, ignorar=()):
+        """Monta os argumentos da função a partir da query string, só com os parâmetros que ela aceita."""
+        assinatura = inspect.signature(getattr(open_crud, nome_funcao))
+        kwargs = {}
+        for nome, parametro in assinatura.parameters.items():
+            valor = self.get_query_argument(nome, None)
+            if valor in (None, "") or nome in ignorar:
+                continue
+            try:
+                kwargs[nome] = _converter_parametro(nome, valor, parametro.default)
+            except ValueError:
+                raise tornado.web.HTTPError(400, reason=f"Valor inválido para '{nome}'.")
+        return kwargs
+
+    def kwargs_do_corpo(self, nome_funcao, *args):
+        """Lê o corpo JSON e valida os campos contra a assinatura da função."""
+        corpo = self.corpo_json()
+        try:
+            inspect.signature(getattr(open_crud, nome_funcao)).bind(*args, **corpo)
+        except TypeError as e:
+            raise tornado.web.HTTPError(400, reason=f"Campos inválidos: {e}")
+        return corpo
+
+    def responder(self, resultado, status_sucesso=200):
+        """Envia o dicionário de resultado do open_crud com o status HTTP correspondente."""
+        if resultado["success"]:
+            self.set_status(status_sucesso)
+            if isinstance(resultado.get("data"), dict):
+                resultado = dict(resultado, data=_sem_campos_sensiveis(resultado["data"]))
+        elif "não encontrad" in resultado.get("message", "").lower():
+            self.set_status(404)
+        else:
+            self.set_status(400)
+        corpo = json.dumps(resultado, ensure_ascii=False, default=str).encode("utf-8")
+        if self.request.method == "GET" and resultado["success"]:
+            self.set_header("Etag", f'"{hashlib.sha1(corpo).hexdigest()}"')
+            if self.check_etag_header():
+                self.set_status(304)
+                return
+        self.finish(corpo)
+
+    def _assinatura_url(self):
+        return hashlib.sha1(self.request.uri.encode("utf-8")).hexdigest()[:16]
+
+    def versao_do_cliente(self):
+        """Extrai a versão do If-None-Match, quando o ETag foi emitido para esta mesma URL."""
+        etag = re.fullmatch(r'(?:W/)?"v(\d+)-([0-9a-f]{16})"', self.request.headers.get("If-None-Match", "").strip())
+        if etag and etag.group(2) == self._assinatura_url():
+            return int(etag.group(1))
+        return None
+
+    async def chamar_condicional(self, nome_funcao, **kwargs):
+        """Chama uma listagem/relatório repassando a versão conhecida pelo cliente (If-None-Match)."""
+        versao = self.versao_do_cliente()
+        if versao is not None:
+            kwargs.setdefault("if_version", versao)
+        return await self.chamar(nome_funcao, **kwargs)
+
+    async def responder_lista(self, resultado, **extras):
+        """Envia uma lista de registros em blocos; o ETag vem da versão das tabelas (ou do conteúdo)."""
+        if not resultado["success"]:
+            self.responder(resultado)
+            return
+        if "version" in resultado:
+            self.set_header("Etag", f'"v{resultado["version"]}-{self._assinatura_url()}"')
+            if resultado.get("not_modified"):
+                self.set_status(304)
+                return
+            extras["version"] = resultado["version"]
+        cabecalho = json.dumps({"success": True, **extras}, ensure_ascii=False)[:-1] + ', "data": ['
+        registros = [
+            json.dumps(_sem_campos_sensiveis(registro), ensure_ascii=False, default=str)
+            for registro in resultado["data"]
+        ]
+        if "version" not in resultado:
+            etag = hashlib.sha1(cabecalho.encode("utf-8"))
+            for registro in registros:
+                etag.update(registro.encode("utf-8"))
+            self.set_header("Etag", f'"{etag.hexdigest()}"')
+            if self.check_etag_header():
+                self.set_status(304)
+                return
+
+        self.write(cabecalho)
+        for inicio in range(0, len(registros), REGISTROS_POR_BLOCO):
+            bloco = ",".join(registros[inicio:inicio + REGISTROS_POR_BLOCO])
+            self.write(bloco if inicio == 0 else "," + bloco)
+            await self.flush()
+        self.finish("]}")
+
+
+class SessaoHandler(BaseHandler):
+    def prepare(self):
+        if self.request.method != "POST": # O login é a única rota sem sessão
+            super().prepare()
+
+    async def post(self):
+        corpo = self.corpo_json()
+        loop = tornado.ioloop.IOLoop.current()
+        # bcrypt e limite de tentativas por conta e por IP ficam no autenticacao.py, fora do loop de eventos
+        resultado = await autenticacao.autenticar_async(corpo.get("email"), corpo.get("senha"), self.request.remote_ip)
+        if not resultado["success"]:
+            self.set_status(429 if resultado.get("motivo") in ("limite", "ocupado") else 401)
+            self.finish(json.dumps({"success": False, "message": resultado["message"]}, ensure_ascii=False))
+            return
+        token = await loop.run_in_executor(None, sessoes.criar_sessao, resultado["data"]["id_funcionario"])
+        if token is None:
+            raise tornado.web.HTTPError(401, reason=autenticacao.MENSAGEM_CREDENCIAIS)
+        self.principal = sessoes.obter_principal(token)
+        self.set_status(201)
+        self.finish(json.dumps({"success": True, "token": token, "data": self._dados_principal()}, ensure_ascii=False))
+
+    def get(self):
+        self.finish(json.dumps({"success": True, "data": self._dados_principal()}, ensure_ascii=False))
+
+    def delete(self):
+        sessoes.encerrar_sessao(self.token_sessao())
+        self.finish(json.dumps({"success": True, "message": "Sessão encerrada."}, ensure_ascii=False))
+
+    def _dados_principal(self):
+        p = self.principal
+        return {"id_funcionario": p.id_funcionario, "nome": p.nome, "cargo": p.cargo, "id_posto": p.id_posto,
+                "postos_visiveis": p.postos_visiveis}
+
+
+class ListaHandler(BaseHandler):
+    def entidade(self, nome, escrita=False):
+        if nome not in ENTIDADES:
+            raise tornado.web.HTTPError(404, reason="Entidade não encontrada.")
+        if escrita and "cargos_escrita" in ENTIDADES[nome]:
+            self.exigir_cargo(ENTIDADES[nome]["cargos_escrita"])
+        return ENTIDADES[nome]
+
+    async def get(self, nome):
+        entidade = self.entidade(nome)
+        kwargs = self.kwargs_da_query(entidade["listar"], ignorar=PARAMETROS_PAGINACAO)
+        try:
+            limite = min(int(self.get_query_argument("limit", TAMANHO_PAGINA_PADRAO)), TAMANHO_PAGINA_MAXIMO)
+            after_id = self.get_query_argument("after_id", None)
+            after_id = int(after_id) if after_id else None
+        except ValueError:
+            raise tornado.web.HTTPError(400, reason="Parâmetros de paginação inválidos.")
+        if "fields" in kwargs and entidade["chave"] not in kwargs["fields"]:
+            kwargs["fields"].insert(0, entidade["chave"])
+
+        resultado = await self.chamar_condicional(entidade["listar"], after_id=after_id, limit=limite, **kwargs)
+        proximo = None
+        if resultado["success"] and not resultado.get("not_modified") and len(resultado["data"]) == limite:
+            proximo = resultado["data"][-1][entidade["chave"]]
+        await self.responder_lista(resultado, next_after_id=proximo)
+
+    async def post(self, nome):
+        entidade = self.entidade(nome, escrita=True)
+        if "criar" not in entidade:
+            raise tornado.web.HTTPError(405, reason="Operação não suportada para esta entidade.")
+        kwargs = self.kwargs_do_corpo(entidade["criar"])
+        await self.exigir_escopo_escrita(entidade, corpo=kwargs)
+        self.responder(await self.chamar(entidade["criar"], **kwargs), status_sucesso=201)
+
+
+class ItemHandler(ListaHandler):
+    def operacao(self, nome, operacao):
+        entidade = self.entidade(nome, escrita=operacao != "obter")
+        if operacao not in entidade:
+            raise tornado.web.HTTPError(405, reason="Operação não suportada para esta entidade.")
+        return entidade, entidade[operacao]
+
+    async def get(self, nome, id_registro):
+        _, funcao = self.operacao(nome, "obter")
+        self.responder(await self.chamar(funcao, int(id_registro)))
+
+    async def put(self, nome, id_registro):
+        entidade, funcao = self.operacao(nome, "atualizar")
+        kwargs = self.kwargs_do_corpo(funcao, int(id_registro))
+        await self.exigir_escopo_escrita(entidade, int(id_registro), kwargs)
+        self.responder(await self.chamar(funcao, int(id_registro), **kwargs))
+
+    async def delete(self, nome, id_registro):
+        entidade, funcao = self.operacao(nome, "excluir")
+        await self.exigir_escopo_escrita(entidade, int(id_registro))
+        self.responder(await self.chamar(funcao, int(id_registro)))
+
+
+class RelatorioHandler(BaseHandler):
+    async def get(self, nome):
+        if nome not in RELATORIOS:
+            raise tornado.web.HTTPError(404, reason="Relatório não encontrado.")
+        kwargs = self.kwargs_da_query(RELATORIOS[nome])
+        try:
+            inspect.signature(getattr(open_crud, RELATORIOS[nome])).bind(**kwargs)
+        except TypeError as e:
+            raise tornado.web.HTTPError(400, reason=f"Parâmetros inválidos: {e}")
+        resultado = await self.chamar_condicional(RELATORIOS[nome], **kwargs)
+        await self.responder_lista(resultado, **({"periodos": resultado["periodos"]} if "periodos" in resultado else {}))
+
+
+class ProntuarioHandler(BaseHandler):
+    async def get(self, id_paciente):
+        kwargs = self.kwargs_da_query("get_patient_timeline", ignorar={"id_paciente"})
+        resultado = await self.chamar_condicional("get_patient_timeline", id_paciente=int(id_paciente), **kwargs)
+        await self.responder_lista(resultado, next_before_id=resultado.get("next_before_id"))
+
+
+class AlteracoesHandler(BaseHandler):
+    async def get(self):
+        self.exigir_cargo(CARGOS_ALTERACOES)
+        kwargs = self.kwargs_da_query("get_alteracoes")
+        kwargs["limit"] = min(kwargs.get("limit", TAMANHO_PAGINA_PADRAO), TAMANHO_PAGINA_MAXIMO)
+        resultado = await self.chamar("get_alteracoes", **kwargs)
+        await self.responder_lista(resultado, last_seq=resultado.get("last_seq"))
+
+
+def make_app(crud=None):
+    """Cria a aplicação tornado; `crud` permite compartilhar um AsyncCrud já configurado."""
+    crud = crud or AsyncCrud()
+    rotas = [
+        (r"/api/sessao", SessaoHandler, {"crud": crud}),
+        (r"/api/relatorios/([\w-]+)", RelatorioHandler, {"crud": crud}),
+        (r"/api/alteracoes", AlteracoesHandler, {"crud": crud}),
+        (r"/api/pacientes/(\d+)/prontuario", ProntuarioHandler, {"crud": crud}),
+        (r"/api/(\w+)", ListaHandler, {"crud": crud}),
+        (r"/api/(\w+)/(\d+)", ItemHandler, {"crud": crud}),
+    ]
+    return tornado.web.Application(rotas, compress_response=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serviço HTTP/JSON do Gerenciador de Postos de Saúde.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8888)
+    parser.add_argument("--db", default=open_crud.DATABASE_NAME, help="Arquivo SQLite do banco de dados.")
+    parser.add_argument("--pool", type=int, default=8, help="Conexões reutilizadas e threads de banco (0 desativa o pool).")
+    parser.add_argument("--motor-relatorios", choices=("sqlite", "colunar"), default="sqlite",
+                        help="'colunar' calcula os relatórios sobre o espelho Parquet (espelho_analitico.py).")
+    parser.add_argument("--fragmentos", help="Diretório do banco fragmentado (fragmentacao.py); substitui --db.")
+    parser.add_argument("--manutencao", metavar="JANELA", help="Roda a manutenção do banco (manutencao.py) nessa janela, ex.: 02:00-05:00.")
+    parser.add_argument("--replica", metavar="INTERVALO", help="Serve relatórios e listagens de uma réplica renovada a cada INTERVALO segundos (replica_leitura.py), ex.: 30 ou 30,120.")
+    args = parser.parse_args()
+
+    open_crud.DATABASE_NAME = args.db
+    if args.fragmentos:
+        import fragmentacao
+        fragmentacao.ativar(args.fragmentos)
+    open_crud.configurar_pool_conexoes(args.pool)
+    import coordenacao
+    coordenacao.iniciar_monitor() # Mapa da fragmentação e caches em memória acompanham as escritas de outros processos
+    if args.manutencao:
+        import manutencao
+        manutencao.iniciar_agendador(manutencao.janela_de_texto(args.manutencao))
+    if args.replica:
+        import replica_leitura
+        replica_leitura.ativar_com_atualizador(*replica_leitura.configuracao_de_texto(args.replica))
+    if args.motor_relatorios == "colunar":
+        import espelho_analitico # pyarrow só é exigido quando o motor colunar é usado
+        espelho_analitico.ativar()
+    app = make_app(AsyncCrud(max_workers=max(args.pool, 1)))
+    app.listen(args.port, address=args.host)
+    print(f"Servidor da API em http://{args.host}:{args.port}/api/ (banco: {args.fragmentos or args.db})", flush=True)
+    tornado.ioloop.IOLoop.current().start()
+
+
+if __name__ == "__main__":
+    main()
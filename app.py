@@ -1,9 +1,17 @@
 import streamlit as st
 #from database import create_tables # Presumo que create_tables está em database.py
+import fragmentacao
+fragmentacao.ativar_se_configurado() # Antes de importar do open_crud: com HOSPITAL_FRAGMENTOS definido as funções já vêm roteadas
+import manutencao
+manutencao.iniciar_se_configurado() # Com HOSPITAL_MANUTENCAO=02:00-05:00 a manutenção do banco roda nessa janela
+import replica_leitura
+replica_leitura.ativar_se_configurado() # Com HOSPITAL_REPLICA=30 relatórios e listagens leem uma réplica renovada a cada 30 s
+import coordenacao
+coordenacao.iniciar_monitor() # Alterações de funcionários e postos feitas por outros processos (API, outros servidores) invalidam os caches deste
 from open_crud import (
     create_hospital, get_all_hospitals, get_hospital_by_id, update_hospital, delete_hospital,
     create_posto_saude, get_all_postos_saude, get_posto_saude_by_id, update_posto_saude, delete_posto_saude,
-    create_funcionario, get_all_funcionarios, get_funcionario_by_id, update_funcionario, delete_funcionario, check_password, get_funcionario_by_email,
+    create_funcionario, get_all_funcionarios, get_funcionario_by_id, update_funcionario, delete_funcionario,
     create_paciente, get_all_pacientes, get_paciente_by_id, update_paciente, delete_paciente,
     create_medicamento, get_all_medicamentos, get_medicamento_by_id, update_medicamento, delete_medicamento,
     create_estoque_medicamento_posto, get_all_estoque_medicamento_posto, get_estoque_medicamento_posto_by_id, update_estoque_medicamento_posto, delete_estoque_medicamento_posto,
@@ -11,8 +19,13 @@ from open_crud import (
     create_prescricao, get_all_prescricoes, get_prescricao_by_id, update_prescricao, delete_prescricao,
     create_distribuicao_medicamento, get_all_distribuicoes_medicamento, get_distribuicao_medicamento_by_id,
     get_atendimentos_by_type, get_atendimentos_by_posto, get_pacientes_by_genero, get_pacientes_by_idade_group,
-    get_top_distribui_medicamentos, get_top_diagnosticos
+    get_top_distribui_medicamentos, get_top_diagnosticos, get_alertas_estoque, get_resumo_alertas, get_serie_temporal,
+    get_patient_timeline, escopo_atual
 )
+from transferencia_estoque import gerar_transferencias, get_transferencias_sugeridas
+from autenticacao import autenticar
+from sessoes import criar_sessao, obter_principal, encerrar_sessao
+from backup import criar_backups, listar_backups, restaurar_backups
 from datetime import datetime, date
 import pandas as pd
 import matplotlib.pyplot as plt
@@ -58,11 +71,32 @@ st.markdown(footer,unsafe_allow_html=True)
                 # Se for para usar com o script generate_data.py, execute generate_data.py uma vez.
 
 
-# Inicializa o estado da sessão para login
-if 'logged_in' not in st.session_state:
-    st.session_state.logged_in = False
-if 'current_user' not in st.session_state:
-    st.session_state.current_user = None
+# Inicializa o estado da sessão para login (só o token; o principal fica no armazém de sessões)
+if 'token_sessao' not in st.session_state:
+    st.session_state.token_sessao = None
+
+# --- Campos usados nas listas de seleção (projeção nas listagens do open_crud) --- #
+CAMPOS_SELECAO_HOSPITAL = ["id_hospital", "nome_hospital"]
+CAMPOS_SELECAO_POSTO = ["id_posto", "nome_posto"]
+CAMPOS_SELECAO_FUNCIONARIO = ["id_funcionario", "nome_funcionario"]
+CAMPOS_SELECAO_PACIENTE = ["id_paciente", "nome_paciente"]
+CAMPOS_SELECAO_MEDICAMENTO = ["id_medicamento", "nome_comercial_medicamento"]
+CAMPOS_SELECAO_ESTOQUE = ["id_estoque", "nome_comercial_medicamento", "lote", "quantidade_atual", "nome_posto"]
+CAMPOS_SELECAO_ATENDIMENTO = ["id_atendimento", "nome_paciente", "data_hora_inicio_atendimento"]
+CAMPOS_SELECAO_PRESCRICAO = ["id_prescricao", "nome_comercial_medicamento", "nome_paciente", "quantidade_prescrita", "status_distribuicao"]
+
+# --- Cache de Listagens por Versão das Tabelas --- #
+def listar_com_versao(funcao, **kwargs):
+    """Chama uma listagem/relatório do open_crud reaproveitando o último resultado da sessão enquanto as tabelas não mudarem."""
+    cache = st.session_state.setdefault("cache_listagens", {})
+    chave = (funcao.__name__, repr(sorted(kwargs.items())), repr(escopo_atual()))
+    anterior = cache.get(chave)
+    resultado = funcao(if_version=anterior["version"] if anterior else None, **kwargs)
+    if resultado.get("not_modified"):
+        return anterior
+    if resultado["success"]:
+        cache[chave] = resultado
+    return resultado
 
 # --- Funções Auxiliares para Exibição de Mensagens --- #
 def show_success(message):
@@ -82,21 +116,14 @@ def login_page():
     password = st.text_input("Senha", type="password")
 
     if st.button("Entrar"):
-        if email and password:
-            user_data = get_funcionario_by_email(email)
-            if user_data["success"] and user_data["data"]:
-                user = user_data["data"]
-                if check_password(password, user["senha_hash"]):
-                    st.session_state.logged_in = True
-                    st.session_state.current_user = user
-                    show_success(f"Bem-vindo, {user["nome_funcionario"]}!")
-                    st.rerun() # Usar st.rerun()
-                else:
-                    show_error("Senha incorreta.")
-            else:
-                show_error("E-mail não encontrado.")
+        result = autenticar(email, password, ip=getattr(st.context, "ip_address", None))
+        if result["success"]:
+            user = result["data"]
+            st.session_state.token_sessao = criar_sessao(user["id_funcionario"])
+            show_success(f"Bem-vindo, {user["nome_funcionario"]}!")
+            st.rerun() # Usar st.rerun()
         else:
-            show_error("Por favor, insira seu e-mail e senha.")
+            show_error(result["message"])
     st.write("Email: admin@hospital.com  Senha: admin123")
 
 # --- Seção de Gerenciamento de Hospitais --- #
@@ -179,7 +206,7 @@ def posto_saude_management_section():
 
     with tab1:
         st.subheader("Cadastrar Novo Posto de Saúde")
-        hospitais_disponiveis = get_all_hospitals()
+        hospitais_disponiveis = listar_com_versao(get_all_hospitals, fields=CAMPOS_SELECAO_HOSPITAL)
         if hospitais_disponiveis["success"] and hospitais_disponiveis["data"]:
             hospital_options = {h["nome_hospital"]: h["id_hospital"] for h in hospitais_disponiveis["data"]}
             selected_hospital_name = st.selectbox("Vincular ao Hospital *", list(hospital_options.keys()), key="ps_hospital_c")
@@ -211,7 +238,7 @@ def posto_saude_management_section():
         with col1:
             search_term_posto = st.text_input("Buscar Posto por Nome ou Endereço", key="search_posto")
         with col2:
-            hospitais_disponiveis_filter = get_all_hospitals()
+            hospitais_disponiveis_filter = listar_com_versao(get_all_hospitals, fields=CAMPOS_SELECAO_HOSPITAL)
             hospital_filter_options = {"Todos os Hospitais": None}
             if hospitais_disponiveis_filter["success"] and hospitais_disponiveis_filter["data"]:
                 hospital_filter_options.update({h["nome_hospital"]: h["id_hospital"] for h in hospitais_disponiveis_filter["data"]})
@@ -237,7 +264,7 @@ def posto_saude_management_section():
                     upd_telefone = st.text_input("Telefone", value=posto_info["telefone_posto"], key="ps_telefone_u")
                     upd_email = st.text_input("E-mail", value=posto_info["email_posto"], key="ps_email_u")
 
-                    hospitais_disponiveis_upd = get_all_hospitals()
+                    hospitais_disponiveis_upd = listar_com_versao(get_all_hospitals, fields=CAMPOS_SELECAO_HOSPITAL)
                     hospital_options_upd = {h["nome_hospital"]: h["id_hospital"] for h in hospitais_disponiveis_upd["data"]}
                     current_hospital_name = posto_info["nome_hospital"]
                     current_hospital_index = list(hospital_options_upd.keys()).index(current_hospital_name) if current_hospital_name in hospital_options_upd else 0
@@ -280,7 +307,7 @@ def funcionario_management_section():
 
     with tab1:
         st.subheader("Cadastrar Novo Funcionário")
-        postos_disponiveis = get_all_postos_saude()
+        postos_disponiveis = listar_com_versao(get_all_postos_saude, fields=CAMPOS_SELECAO_POSTO)
         posto_options = {"Selecione um Posto": None}
         if postos_disponiveis["success"] and postos_disponiveis["data"]:
             posto_options.update({ps["nome_posto"]: ps["id_posto"] for ps in postos_disponiveis["data"]})
@@ -321,7 +348,7 @@ def funcionario_management_section():
             if cargo_filter == "Todos os Cargos":
                 cargo_filter = None
         with col3:
-            postos_disponiveis_filter = get_all_postos_saude()
+            postos_disponiveis_filter = listar_com_versao(get_all_postos_saude, fields=CAMPOS_SELECAO_POSTO)
             posto_filter_options = {"Todos os Postos": None}
             if postos_disponiveis_filter["success"] and postos_disponiveis_filter["data"]:
                 posto_filter_options.update({ps["nome_posto"]: ps["id_posto"] for ps in postos_disponiveis_filter["data"]})
@@ -351,7 +378,7 @@ def funcionario_management_section():
                     upd_email = st.text_input("E-mail *", value=funcionario_info["email_funcionario"], key="f_email_u")
                     upd_senha = st.text_input("Nova Senha (deixe em branco para não alterar)", type="password", key="f_senha_u")
 
-                    postos_disponiveis_upd = get_all_postos_saude()
+                    postos_disponiveis_upd = listar_com_versao(get_all_postos_saude, fields=CAMPOS_SELECAO_POSTO)
                     posto_options_upd = {ps["nome_posto"]: ps["id_posto"] for ps in postos_disponiveis_upd["data"]}
                     current_posto_name = funcionario_info["nome_posto"]
                     current_posto_index = list(posto_options_upd.keys()).index(current_posto_name) if current_posto_name in posto_options_upd else 0
@@ -390,11 +417,11 @@ def funcionario_management_section():
 def paciente_management_section():
     st.header("Gerenciamento de Pacientes")
 
-    tab1, tab2 = st.tabs(["Cadastrar Novo Paciente", "Visualizar / Editar / Excluir Pacientes"])
+    tab1, tab2, tab3 = st.tabs(["Cadastrar Novo Paciente", "Visualizar / Editar / Excluir Pacientes", "Prontuário"])
 
     with tab1:
         st.subheader("Cadastrar Novo Paciente")
-        postos_disponiveis = get_all_postos_saude()
+        postos_disponiveis = listar_com_versao(get_all_postos_saude, fields=CAMPOS_SELECAO_POSTO)
         posto_options = {"Selecione um Posto": None}
         if postos_disponiveis["success"] and postos_disponiveis["data"]:
             posto_options.update({ps["nome_posto"]: ps["id_posto"] for ps in postos_disponiveis["data"]})
@@ -435,7 +462,7 @@ def paciente_management_section():
             if genero_filter == "Todos os Gêneros":
                 genero_filter = None
         with col3:
-            postos_disponiveis_filter = get_all_postos_saude()
+            postos_disponiveis_filter = listar_com_versao(get_all_postos_saude, fields=CAMPOS_SELECAO_POSTO)
             posto_filter_options = {"Todos os Postos": None}
             if postos_disponiveis_filter["success"] and postos_disponiveis_filter["data"]:
                 posto_filter_options.update({ps["nome_posto"]: ps["id_posto"] for ps in postos_disponiveis_filter["data"]})
@@ -465,7 +492,7 @@ def paciente_management_section():
                     upd_telefone = st.text_input("Telefone", value=paciente_info["telefone_paciente"], key="p_telefone_u")
                     upd_email = st.text_input("E-mail", value=paciente_info["email_paciente"], key="p_email_u")
 
-                    postos_disponiveis_upd = get_all_postos_saude()
+                    postos_disponiveis_upd = listar_com_versao(get_all_postos_saude, fields=CAMPOS_SELECAO_POSTO)
                     posto_options_upd = {ps["nome_posto"]: ps["id_posto"] for ps in postos_disponiveis_upd["data"]}
                     current_posto_name = paciente_info["nome_posto"]
                     current_posto_index = list(posto_options_upd.keys()).index(current_posto_name) if current_posto_name in posto_options_upd else 0
@@ -500,6 +527,59 @@ def paciente_management_section():
         else:
             show_info("Nenhum paciente cadastrado ainda.")
 
+    with tab3:
+        st.subheader("Prontuário do Paciente")
+        pacientes_prontuario = listar_com_versao(get_all_pacientes, fields=CAMPOS_SELECAO_PACIENTE)
+        paciente_options = {"Selecione um Paciente": None}
+        if pacientes_prontuario["success"] and pacientes_prontuario["data"]:
+            paciente_options.update({f"{p['nome_paciente']} (ID: {p['id_paciente']})": p["id_paciente"] for p in pacientes_prontuario["data"]})
+
+        col_paciente, col_desde = st.columns([2, 1])
+        with col_paciente:
+            selected_paciente_prontuario = st.selectbox("Paciente", list(paciente_options.keys()), key="prontuario_paciente")
+        with col_desde:
+            desde_prontuario = st.date_input("Atendimentos a partir de", value=None, key="prontuario_desde")
+        id_paciente_prontuario = paciente_options[selected_paciente_prontuario]
+
+        # Pilha de cursores (before_id) das páginas já visitadas; recomeça ao trocar de paciente ou de data
+        filtro_prontuario = (id_paciente_prontuario, desde_prontuario)
+        if st.session_state.get("prontuario_filtro") != filtro_prontuario:
+            st.session_state.prontuario_filtro = filtro_prontuario
+            st.session_state.prontuario_cursores = [None]
+
+        if id_paciente_prontuario:
+            pagina = get_patient_timeline(id_paciente_prontuario, since=desde_prontuario.strftime("%Y-%m-%d") if desde_prontuario else None,
+                                          before_id=st.session_state.prontuario_cursores[-1])
+            if pagina["success"] and pagina["data"]:
+                for atendimento in pagina["data"]:
+                    titulo = f"{atendimento['data_hora_inicio_atendimento']} — {atendimento['tipo_atendimento']} — {atendimento['nome_posto']}"
+                    with st.expander(titulo):
+                        st.write(f"**Responsável:** {atendimento['nome_funcionario']}")
+                        st.write(f"**Sintomas/Queixa:** {atendimento['descricao_sintomas_queixa']}")
+                        st.write(f"**Diagnóstico:** {atendimento['diagnostico'] or '-'} (CID-10: {atendimento['cid10'] or '-'}, grau: {atendimento['grau_doenca_observado'] or '-'})")
+                        if atendimento["observacoes_gerais"]:
+                            st.write(f"**Observações:** {atendimento['observacoes_gerais']}")
+                        for prescricao in atendimento["prescricoes"]:
+                            st.markdown(f"- **{prescricao['nome_comercial_medicamento']}** (lote {prescricao['lote']}): {prescricao['quantidade_prescrita']} un., "
+                                        f"{prescricao['posologia']} — {prescricao['status_distribuicao']}")
+                            for distribuicao in prescricao["distribuicoes"]:
+                                st.markdown(f"    - Distribuído em {distribuicao['data_hora_distribuicao']}: {distribuicao['quantidade_distribuida']} un. "
+                                            f"por {distribuicao['nome_funcionario']}")
+
+                col_recentes, col_anteriores = st.columns(2)
+                with col_recentes:
+                    if len(st.session_state.prontuario_cursores) > 1 and st.button("« Mais recentes", key="prontuario_recentes"):
+                        st.session_state.prontuario_cursores.pop()
+                        st.rerun()
+                with col_anteriores:
+                    if pagina["next_before_id"] and st.button("Anteriores »", key="prontuario_anteriores"):
+                        st.session_state.prontuario_cursores.append(pagina["next_before_id"])
+                        st.rerun()
+            elif pagina["success"]:
+                show_info("Nenhum atendimento registrado para este paciente no período.")
+            else:
+                show_error(pagina["message"])
+
 # --- Seção de Gerenciamento de Medicamentos --- #
 def medicamento_management_section():
     st.header("Gerenciamento de Medicamentos")
@@ -584,12 +664,14 @@ def medicamento_management_section():
 def estoque_medicamento_management_section():
     st.header("Gerenciamento de Estoque de Medicamentos")
 
-    tab1, tab2 = st.tabs(["Adicionar/Atualizar Estoque", "Visualizar / Excluir Estoque"])
+    resumo_alertas = get_resumo_alertas()
+    total_alertas = sum(resumo_alertas["data"].values()) if resumo_alertas["success"] else 0
+    tab1, tab2, tab3, tab4 = st.tabs(["Adicionar/Atualizar Estoque", "Visualizar / Excluir Estoque", f"Alertas ({total_alertas})", "Transferências Sugeridas"])
 
     with tab1:
         st.subheader("Adicionar/Atualizar Estoque de Medicamento")
-        medicamentos_disponiveis = get_all_medicamentos()
-        postos_disponiveis = get_all_postos_saude()
+        medicamentos_disponiveis = listar_com_versao(get_all_medicamentos, fields=CAMPOS_SELECAO_MEDICAMENTO)
+        postos_disponiveis = listar_com_versao(get_all_postos_saude, fields=CAMPOS_SELECAO_POSTO)
 
         medicamento_options = {"Selecione um Medicamento": None}
         if medicamentos_disponiveis["success"] and medicamentos_disponiveis["data"]:
@@ -661,14 +743,14 @@ def estoque_medicamento_management_section():
         with col1:
             search_term_estoque = st.text_input("Buscar Estoque por Medicamento ou Lote", key="search_estoque")
         with col2:
-            medicamentos_disponiveis_filter = get_all_medicamentos()
+            medicamentos_disponiveis_filter = listar_com_versao(get_all_medicamentos, fields=CAMPOS_SELECAO_MEDICAMENTO)
             medicamento_filter_options = {"Todos os Medicamentos": None}
             if medicamentos_disponiveis_filter["success"] and medicamentos_disponiveis_filter["data"]:
                 medicamento_filter_options.update({m["nome_comercial_medicamento"]: m["id_medicamento"] for m in medicamentos_disponiveis_filter["data"]})
             selected_medicamento_filter = st.selectbox("Filtrar por Medicamento", list(medicamento_filter_options.keys()), key="filter_estoque_medicamento")
             id_medicamento_filter = medicamento_filter_options[selected_medicamento_filter]
         with col3:
-            postos_disponiveis_filter = get_all_postos_saude()
+            postos_disponiveis_filter = listar_com_versao(get_all_postos_saude, fields=CAMPOS_SELECAO_POSTO)
             posto_filter_options = {"Todos os Postos": None}
             if postos_disponiveis_filter["success"] and postos_disponiveis_filter["data"]:
                 posto_filter_options.update({ps["nome_posto"]: ps["id_posto"] for ps in postos_disponiveis_filter["data"]})
@@ -707,6 +789,39 @@ def estoque_medicamento_management_section():
         else:
             show_info("Nenhum registro de estoque cadastrado ainda.")
 
+    with tab3:
+        st.subheader("Alertas de Estoque")
+        tipos_alerta = {"Todos os Alertas": None, "Vencidos": "vencido", "Validade Próxima": "validade_proxima", "Estoque Baixo": "estoque_baixo"}
+        selected_tipo_alerta = st.selectbox("Filtrar por Tipo de Alerta", list(tipos_alerta.keys()), key="filter_alerta_tipo")
+
+        alertas_data = get_alertas_estoque(tipo_alerta=tipos_alerta[selected_tipo_alerta])
+        if alertas_data["success"] and alertas_data["data"]:
+            colunas_alerta = ["tipo_alerta", "nome_comercial_medicamento", "lote", "nome_posto", "data_validade", "quantidade_atual", "quantidade_minima_alerta", "data_hora_alerta"]
+            st.dataframe([{c: a[c] for c in colunas_alerta} for a in alertas_data["data"]], use_container_width=True, hide_index=True)
+        elif alertas_data["success"]:
+            show_info("Nenhum alerta de estoque ativo.")
+        else:
+            show_error(alertas_data["message"])
+
+    with tab4:
+        st.subheader("Transferências Sugeridas entre Postos do Mesmo Hospital")
+        horizonte_transferencia = st.number_input("Dias de demanda a cobrir", min_value=7, max_value=180, value=30, step=1, key="transferencia_horizonte")
+        if st.button("Calcular Sugestões", key="btn_calcular_transferencias"):
+            result = gerar_transferencias(horizonte=int(horizonte_transferencia))
+            if result["success"]:
+                show_success(result["message"])
+            else:
+                show_error(result["message"])
+
+        transferencias_data = get_transferencias_sugeridas()
+        if transferencias_data["success"] and transferencias_data["data"]:
+            colunas_transferencia = ["nome_comercial_medicamento", "lote", "data_validade", "quantidade", "nome_posto_origem", "nome_posto_destino", "motivo", "data_geracao"]
+            st.dataframe([{c: t[c] for c in colunas_transferencia} for t in transferencias_data["data"]], use_container_width=True, hide_index=True)
+        elif transferencias_data["success"]:
+            show_info("Nenhuma transferência sugerida. Clique em 'Calcular Sugestões' para analisar o estoque.")
+        else:
+            show_error(transferencias_data["message"])
+
 # --- Seção de Gerenciamento de Atendimentos --- #
 def atendimento_management_section():
     st.header("Gerenciamento de Atendimentos")
@@ -715,9 +830,9 @@ def atendimento_management_section():
 
     with tab1:
         st.subheader("Registrar Novo Atendimento")
-        pacientes_disponiveis = get_all_pacientes()
-        funcionarios_disponiveis = get_all_funcionarios()
-        postos_disponiveis = get_all_postos_saude()
+        pacientes_disponiveis = listar_com_versao(get_all_pacientes, fields=CAMPOS_SELECAO_PACIENTE)
+        funcionarios_disponiveis = listar_com_versao(get_all_funcionarios, fields=CAMPOS_SELECAO_FUNCIONARIO)
+        postos_disponiveis = listar_com_versao(get_all_postos_saude, fields=CAMPOS_SELECAO_POSTO)
 
         paciente_options = {"Selecione um Paciente": None}
         if pacientes_disponiveis["success"] and pacientes_disponiveis["data"]:
@@ -784,14 +899,14 @@ def atendimento_management_section():
         with col1:
             search_term_atendimento = st.text_input("Buscar Atendimento por Paciente, Funcionário, Sintomas ou Diagnóstico", key="search_atendimento")
         with col2:
-            pacientes_disponiveis_filter = get_all_pacientes()
+            pacientes_disponiveis_filter = listar_com_versao(get_all_pacientes, fields=CAMPOS_SELECAO_PACIENTE)
             paciente_filter_options = {"Todos os Pacientes": None}
             if pacientes_disponiveis_filter["success"] and pacientes_disponiveis_filter["data"]:
                 paciente_filter_options.update({p["nome_paciente"]: p["id_paciente"] for p in pacientes_disponiveis_filter["data"]})
             selected_paciente_filter = st.selectbox("Filtrar por Paciente", list(paciente_filter_options.keys()), key="filter_atendimento_paciente")
             id_paciente_filter = paciente_filter_options[selected_paciente_filter]
         with col3:
-            funcionarios_disponiveis_filter = get_all_funcionarios()
+            funcionarios_disponiveis_filter = listar_com_versao(get_all_funcionarios, fields=CAMPOS_SELECAO_FUNCIONARIO)
             funcionario_filter_options = {"Todos os Funcionários": None}
             if funcionarios_disponiveis_filter["success"] and funcionarios_disponiveis_filter["data"]:
                 funcionario_filter_options.update({f["nome_funcionario"]: f["id_funcionario"] for f in funcionarios_disponiveis_filter["data"]})
@@ -801,7 +916,7 @@ def atendimento_management_section():
         col4, col5, col6 = st.columns(3)
         with col4:
             posto_filter_options = {"Todos os Postos": None}
-            postos_disponiveis_filter = get_all_postos_saude()
+            postos_disponiveis_filter = listar_com_versao(get_all_postos_saude, fields=CAMPOS_SELECAO_POSTO)
             if postos_disponiveis_filter["success"] and postos_disponiveis_filter["data"]:
                 posto_filter_options.update({ps["nome_posto"]: ps["id_posto"] for ps in postos_disponiveis_filter["data"]})
             selected_posto_filter = st.selectbox("Filtrar por Posto de Atendimento", list(posto_filter_options.keys()), key="filter_atendimento_posto")
@@ -852,21 +967,21 @@ def atendimento_management_section():
                 with st.form("form_update_atendimento", clear_on_submit=False):
                     st.write(f"Editando Atendimento: **ID {atendimento_info["id_atendimento"]} - {atendimento_info["nome_paciente"]}**")
 
-                    pacientes_disponiveis_upd = get_all_pacientes()
+                    pacientes_disponiveis_upd = listar_com_versao(get_all_pacientes, fields=CAMPOS_SELECAO_PACIENTE)
                     paciente_options_upd = {p["nome_paciente"]: p["id_paciente"] for p in pacientes_disponiveis_upd["data"]}
                     current_paciente_name = atendimento_info["nome_paciente"]
                     current_paciente_index = list(paciente_options_upd.keys()).index(current_paciente_name) if current_paciente_name in paciente_options_upd else 0
                     upd_id_paciente = st.selectbox("Paciente *", list(paciente_options_upd.keys()), index=current_paciente_index, key="at_paciente_u")
                     upd_id_paciente = paciente_options_upd[upd_id_paciente]
 
-                    funcionarios_disponiveis_upd = get_all_funcionarios()
+                    funcionarios_disponiveis_upd = listar_com_versao(get_all_funcionarios, fields=CAMPOS_SELECAO_FUNCIONARIO)
                     funcionario_options_upd = {f["nome_funcionario"]: f["id_funcionario"] for f in funcionarios_disponiveis_upd["data"]}
                     current_funcionario_name = atendimento_info["nome_funcionario"]
                     current_funcionario_index = list(funcionario_options_upd.keys()).index(current_funcionario_name) if current_funcionario_name in funcionario_options_upd else 0
                     upd_id_funcionario_responsavel = st.selectbox("Funcionário Responsável *", list(funcionario_options_upd.keys()), index=current_funcionario_index, key="at_funcionario_u")
                     upd_id_funcionario_responsavel = funcionario_options_upd[upd_id_funcionario_responsavel]
 
-                    postos_disponiveis_upd = get_all_postos_saude()
+                    postos_disponiveis_upd = listar_com_versao(get_all_postos_saude, fields=CAMPOS_SELECAO_POSTO)
                     posto_options_upd = {ps["nome_posto"]: ps["id_posto"] for ps in postos_disponiveis_upd["data"]}
                     current_posto_name = atendimento_info["nome_posto"]
                     current_posto_index = list(posto_options_upd.keys()).index(current_posto_name) if current_posto_name in posto_options_upd else 0
@@ -931,8 +1046,8 @@ def prescricao_management_section():
 
     with tab1:
         st.subheader("Registrar Nova Prescrição")
-        atendimentos_disponiveis = get_all_atendimentos()
-        estoque_disponivel = get_all_estoque_medicamento_posto()
+        atendimentos_disponiveis = listar_com_versao(get_all_atendimentos, fields=CAMPOS_SELECAO_ATENDIMENTO)
+        estoque_disponivel = listar_com_versao(get_all_estoque_medicamento_posto, fields=CAMPOS_SELECAO_ESTOQUE)
 
         atendimento_options = {"Selecione um Atendimento": None}
         if atendimentos_disponiveis["success"] and atendimentos_disponiveis["data"]:
@@ -974,14 +1089,14 @@ def prescricao_management_section():
         with col1:
             search_term_prescricao = st.text_input("Buscar Prescrição por Paciente, Medicamento ou Posologia", key="search_prescricao")
         with col2:
-            atendimentos_disponiveis_filter = get_all_atendimentos()
+            atendimentos_disponiveis_filter = listar_com_versao(get_all_atendimentos, fields=CAMPOS_SELECAO_ATENDIMENTO)
             atendimento_filter_options = {"Todos os Atendimentos": None}
             if atendimentos_disponiveis_filter["success"] and atendimentos_disponiveis_filter["data"]:
                 atendimento_filter_options.update({f"ID: {a["id_atendimento"]} - {a["nome_paciente"]}": a["id_atendimento"] for a in atendimentos_disponiveis_filter["data"]})
             selected_atendimento_filter = st.selectbox("Filtrar por Atendimento", list(atendimento_filter_options.keys()), key="filter_prescricao_atendimento")
             id_atendimento_filter = atendimento_filter_options[selected_atendimento_filter]
         with col3:
-            medicamentos_disponiveis_filter = get_all_medicamentos()
+            medicamentos_disponiveis_filter = listar_com_versao(get_all_medicamentos, fields=CAMPOS_SELECAO_MEDICAMENTO)
             medicamento_filter_options = {"Todos os Medicamentos": None}
             if medicamentos_disponiveis_filter["success"] and medicamentos_disponiveis_filter["data"]:
                 medicamento_filter_options.update({m["nome_comercial_medicamento"]: m["id_medicamento"] for m in medicamentos_disponiveis_filter["data"]})
@@ -1012,14 +1127,14 @@ def prescricao_management_section():
                 with st.form("form_update_prescricao", clear_on_submit=False):
                     st.write(f"Editando Prescrição: **ID {prescricao_info["id_prescricao"]}**")
 
-                    atendimentos_disponiveis_upd = get_all_atendimentos()
+                    atendimentos_disponiveis_upd = listar_com_versao(get_all_atendimentos, fields=CAMPOS_SELECAO_ATENDIMENTO)
                     atendimento_options_upd = {f"ID: {a["id_atendimento"]} - {a["nome_paciente"]} ({a["data_hora_inicio_atendimento"]})": a["id_atendimento"] for a in atendimentos_disponiveis_upd["data"]}
                     current_atendimento_display = f"ID: {prescricao_info["id_atendimento"]} - {prescricao_info["nome_paciente"]} ({prescricao_info["data_hora_inicio_atendimento"]})"
                     current_atendimento_index = list(atendimento_options_upd.keys()).index(current_atendimento_display) if current_atendimento_display in atendimento_options_upd else 0
                     upd_id_atendimento = st.selectbox("Atendimento *", list(atendimento_options_upd.keys()), index=current_atendimento_index, key="pr_atendimento_u")
                     upd_id_atendimento = atendimento_options_upd[upd_id_atendimento]
 
-                    estoque_disponivel_upd = get_all_estoque_medicamento_posto()
+                    estoque_disponivel_upd = listar_com_versao(get_all_estoque_medicamento_posto, fields=CAMPOS_SELECAO_ESTOQUE)
                     medicamento_estoque_options_upd = {f"{e["nome_comercial_medicamento"]} (Lote: {e["lote"]}) - Qtd: {e["quantidade_atual"]} ({e["nome_posto"]})": e["id_estoque"] for e in estoque_disponivel_upd["data"]}
                     
                     # Crie a string de exibição para o medicamento em estoque atual da prescrição
@@ -1076,8 +1191,8 @@ def distribuicao_medicamento_management_section():
 
     with tab1:
         st.subheader("Registrar Nova Distribuição")
-        prescricoes_pendentes = get_all_prescricoes()
-        funcionarios_disponiveis = get_all_funcionarios()
+        prescricoes_pendentes = listar_com_versao(get_all_prescricoes, fields=CAMPOS_SELECAO_PRESCRICAO)
+        funcionarios_disponiveis = listar_com_versao(get_all_funcionarios, fields=CAMPOS_SELECAO_FUNCIONARIO + ["cargo_funcionario"])
 
         prescricao_options = {"Selecione uma Prescrição Pendente": None}
         if prescricoes_pendentes["success"] and prescricoes_pendentes["data"]:
@@ -1117,6 +1232,8 @@ def distribuicao_medicamento_management_section():
                     result = create_distribuicao_medicamento(id_prescricao, id_funcionario_distribuidor, quantidade_distribuida, observacao)
                     if result["success"]:
                         show_success(result["message"])
+                        lotes_usados = ", ".join(f"{lote["lote"]} (val. {lote["data_validade"]}): {lote["quantidade"]}" for lote in result["lotes"])
+                        show_info(f"Lotes utilizados (validade mais próxima primeiro): {lotes_usados}")
                     else:
                         show_error(result["message"])
 
@@ -1127,14 +1244,14 @@ def distribuicao_medicamento_management_section():
         with col1:
             search_term_distribuicao = st.text_input("Buscar Distribuição por Paciente, Medicamento ou Funcionário", key="search_distribuicao")
         with col2:
-            prescricoes_disponiveis_filter = get_all_prescricoes()
+            prescricoes_disponiveis_filter = listar_com_versao(get_all_prescricoes, fields=CAMPOS_SELECAO_PRESCRICAO)
             prescricao_filter_options = {"Todas as Prescrições": None}
             if prescricoes_disponiveis_filter["success"] and prescricoes_disponiveis_filter["data"]:
                 prescricao_filter_options.update({f"ID: {pr["id_prescricao"]} - {pr["nome_comercial_medicamento"]} para {pr["nome_paciente"]}": pr["id_prescricao"] for pr in prescricoes_disponiveis_filter["data"]})
             selected_prescricao_filter = st.selectbox("Filtrar por Prescrição", list(prescricao_filter_options.keys()), key="filter_distribuicao_prescricao")
             id_prescricao_filter = prescricao_filter_options[selected_prescricao_filter]
         with col3:
-            funcionarios_disponiveis_filter = get_all_funcionarios()
+            funcionarios_disponiveis_filter = listar_com_versao(get_all_funcionarios, fields=CAMPOS_SELECAO_FUNCIONARIO)
             funcionario_filter_options = {"Todos os Funcionários": None}
             if funcionarios_disponiveis_filter["success"] and funcionarios_disponiveis_filter["data"]:
                 funcionario_filter_options.update({f["nome_funcionario"]: f["id_funcionario"] for f in funcionarios_disponiveis_filter["data"]})
@@ -1178,10 +1295,14 @@ def reports_section():
         if report_end_date:
             report_end_date = report_end_date.strftime("%Y-%m-%d")
 
+    idade_replica = replica_leitura.idade_replica() if replica_leitura.ativa() else None
+    if idade_replica is not None:
+        st.caption(f"Relatórios calculados sobre a réplica de leitura, copiada há {idade_replica:.0f} s.")
+
     st.markdown("--- ")
 
     st.subheader("1. Atendimentos por Tipo")
-    atendimentos_tipo_data = get_atendimentos_by_type(report_start_date, report_end_date)
+    atendimentos_tipo_data = listar_com_versao(get_atendimentos_by_type, start_date=report_start_date, end_date=report_end_date)
     if atendimentos_tipo_data["success"] and atendimentos_tipo_data["data"]:
         df_atendimentos_tipo = pd.DataFrame(atendimentos_tipo_data["data"])
         st.dataframe(df_atendimentos_tipo, use_container_width=True, hide_index=True)
@@ -1192,7 +1313,7 @@ def reports_section():
     st.markdown("--- ")
 
     st.subheader("2. Atendimentos por Posto de Saúde")
-    atendimentos_posto_data = get_atendimentos_by_posto(report_start_date, report_end_date)
+    atendimentos_posto_data = listar_com_versao(get_atendimentos_by_posto, start_date=report_start_date, end_date=report_end_date)
     if atendimentos_posto_data["success"] and atendimentos_posto_data["data"]:
         df_atendimentos_posto = pd.DataFrame(atendimentos_posto_data["data"])
         st.dataframe(df_atendimentos_posto, use_container_width=True, hide_index=True)
@@ -1203,7 +1324,7 @@ def reports_section():
     st.markdown("--- ")
 
     st.subheader("3. Pacientes por Gênero")
-    pacientes_genero_data = get_pacientes_by_genero()
+    pacientes_genero_data = listar_com_versao(get_pacientes_by_genero)
     if pacientes_genero_data["success"] and pacientes_genero_data["data"]:
         df_pacientes_genero = pd.DataFrame(pacientes_genero_data["data"])
         st.dataframe(df_pacientes_genero, use_container_width=True, hide_index=True)
@@ -1217,7 +1338,7 @@ def reports_section():
     st.markdown("--- ")
 
     st.subheader("4. Pacientes por Faixa Etária")
-    pacientes_idade_data = get_pacientes_by_idade_group()
+    pacientes_idade_data = listar_com_versao(get_pacientes_by_idade_group)
     if pacientes_idade_data["success"] and pacientes_idade_data["data"]:
         df_pacientes_idade = pd.DataFrame(pacientes_idade_data["data"])
         st.dataframe(df_pacientes_idade, use_container_width=True, hide_index=True)
@@ -1228,7 +1349,7 @@ def reports_section():
     st.markdown("--- ")
 
     st.subheader("5. Medicamentos Mais Distribuidos")
-    top_medicamentos_data = get_top_distribui_medicamentos(report_start_date, report_end_date, limit=10)
+    top_medicamentos_data = listar_com_versao(get_top_distribui_medicamentos, start_date=report_start_date, end_date=report_end_date, limit=10)
     if top_medicamentos_data["success"] and top_medicamentos_data["data"]:
         df_top_medicamentos = pd.DataFrame(top_medicamentos_data["data"])
         st.dataframe(df_top_medicamentos, use_container_width=True, hide_index=True)
@@ -1239,7 +1360,7 @@ def reports_section():
     st.markdown("--- ")
 
     st.subheader("6. Diagnósticos Mais Comuns (CID-10)")
-    top_diagnosticos_data = get_top_diagnosticos(report_start_date, report_end_date, limit=10)
+    top_diagnosticos_data = listar_com_versao(get_top_diagnosticos, start_date=report_start_date, end_date=report_end_date, limit=10)
     if top_diagnosticos_data["success"] and top_diagnosticos_data["data"]:
         df_top_diagnosticos = pd.DataFrame(top_diagnosticos_data["data"])
         st.dataframe(df_top_diagnosticos, use_container_width=True, hide_index=True)
@@ -1247,20 +1368,91 @@ def reports_section():
     else:
         show_info("Nenhum dado de diagnósticos para o período selecionado.")
 
+    st.markdown("--- ")
+
+    st.subheader("7. Tendências no Tempo")
+    col_metrica, col_periodo, col_dimensao = st.columns(3)
+    with col_metrica:
+        metricas_serie = {"Atendimentos": "atendimentos", "Prescrições (unidades)": "prescricoes", "Distribuições (unidades)": "distribuicoes"}
+        selected_metrica = st.selectbox("Métrica", list(metricas_serie.keys()), key="serie_metrica")
+    with col_periodo:
+        periodos_serie = {"Mês": "mes", "Semana": "semana", "Dia": "dia"}
+        selected_periodo = st.selectbox("Agrupar por", list(periodos_serie.keys()), key="serie_periodo")
+    with col_dimensao:
+        dimensoes_serie = {"Total": None, "Posto": "posto", "Tipo de Atendimento": "tipo_atendimento", "CID-10": "cid10", "Grau da Doença": "grau_doenca_observado"}
+        if metricas_serie[selected_metrica] != "atendimentos":
+            dimensoes_serie["Medicamento"] = "medicamento"
+        selected_dimensao = st.selectbox("Separar por", list(dimensoes_serie.keys()), key="serie_dimensao")
+
+    dimensao = dimensoes_serie[selected_dimensao]
+    serie_data = listar_com_versao(get_serie_temporal, metrica=metricas_serie[selected_metrica], periodo=periodos_serie[selected_periodo],
+                                   dimensoes=[dimensao] if dimensao else None, start_date=report_start_date, end_date=report_end_date)
+    if serie_data["success"] and serie_data["data"]:
+        df_serie = pd.DataFrame(
+            {(serie["grupo"][dimensao] if dimensao else selected_metrica): serie["valores"] for serie in serie_data["data"]},
+            index=pd.to_datetime(serie_data["periodos"])
+        )
+        if len(df_serie.columns) > 10: # Mantém as 10 séries com maior total para o gráfico continuar legível
+            df_serie = df_serie[df_serie.sum().nlargest(10).index]
+        st.line_chart(df_serie)
+    elif serie_data["success"]:
+        show_info("Nenhum dado para a série temporal no período selecionado.")
+    else:
+        show_error(serie_data["message"])
+
+# --- Seção de Backups (somente Administrativo) --- #
+def backup_section():
+    st.header("Backups do Banco de Dados")
+
+    st.subheader("Criar Backup")
+    st.write("A cópia é feita com o sistema em uso, em pequenos passos, e só é guardada depois de verificada.")
+    if st.button("Criar Backup Agora", key="btn_criar_backup"):
+        with st.spinner("Copiando e verificando o banco..."):
+            result = criar_backups()
+        if result["success"]:
+            show_success(result["message"])
+        else:
+            show_error(result["message"])
+
+    st.markdown("--- ")
+    st.subheader("Backups Disponíveis")
+    backups_data = listar_backups()
+    if backups_data["success"] and backups_data["data"]:
+        colunas_backup = ["nome", "criado_em", "motivo", "bytes", "segundos_copia", "verificacao"]
+        st.dataframe([{c: b.get(c) for c in colunas_backup} for b in backups_data["data"]], use_container_width=True, hide_index=True)
+
+        st.subheader("Restaurar Backup")
+        nome_backup = st.selectbox("Backup", [b["nome"] for b in backups_data["data"]], key="restaurar_backup_nome")
+        confirmar = st.checkbox("Confirmo que os dados atuais serão substituídos (um backup do estado atual é criado antes).", key="restaurar_backup_confirmar")
+        if st.button("Restaurar", key="btn_restaurar_backup", disabled=not confirmar):
+            with st.spinner("Restaurando o banco..."):
+                result = restaurar_backups(nome_backup)
+            if result["success"]:
+                st.session_state.pop("cache_listagens", None) # Versões das tabelas voltaram às do backup
+                show_success(result["message"])
+            else:
+                show_error(result["message"])
+    elif backups_data["success"]:
+        show_info("Nenhum backup encontrado.")
+    else:
+        show_error(backups_data["message"])
+
 # --- Navegação Principal --- #
 def main():
     st.sidebar.title("Navegação")
 
-    if not st.session_state.logged_in:
+    principal = obter_principal(st.session_state.token_sessao) # Sem consulta ao banco
+    if principal is None: # Não logado, sessão expirada ou funcionário excluído
+        st.session_state.token_sessao = None
         login_page()
     else:
-        st.sidebar.write(f"Logado como: {st.session_state.current_user["nome_funcionario"]}")
+        st.sidebar.write(f"Logado como: {principal.nome} ({principal.cargo} - {principal.nome_posto})")
         if st.sidebar.button("Sair"):
-            st.session_state.logged_in = False
-            st.session_state.current_user = None
+            encerrar_sessao(st.session_state.token_sessao)
+            st.session_state.token_sessao = None
             st.rerun() # Usar st.rerun()
 
-        selection = st.sidebar.radio("Ir para", [
+        paginas = [
             "Hospitais",
             "Postos de Saúde",
             "Funcionários",
@@ -1271,28 +1463,36 @@ def main():
             "Prescrições",
             "Distribuição de Medicamentos",
             "Relatórios"
-        ])
-
-        if selection == "Hospitais":
-            hospital_management_section()
-        elif selection == "Postos de Saúde":
-            posto_saude_management_section()
-        elif selection == "Funcionários":
-            funcionario_management_section()
-        elif selection == "Pacientes":
-            paciente_management_section()
-        elif selection == "Medicamentos":
-            medicamento_management_section()
-        elif selection == "Estoque de Medicamentos":
-            estoque_medicamento_management_section()
-        elif selection == "Atendimentos":
-            atendimento_management_section()
-        elif selection == "Prescrições":
-            prescricao_management_section()
-        elif selection == "Distribuição de Medicamentos":
-            distribuicao_medicamento_management_section()
-        elif selection == "Relatórios":
-            reports_section()
+        ]
+        if principal.cargo == "Administrativo":
+            paginas.append("Backups")
+        selection = st.sidebar.radio("Ir para", paginas)
+
+        # Listagens e relatórios só com os postos visíveis ao cargo; com a réplica de leitura ativa, a sessão
+        # lê do banco principal até a réplica alcançar as escritas que ela mesma fez
+        with principal.escopo(), replica_leitura.sessao(st.session_state):
+            if selection == "Hospitais":
+                hospital_management_section()
+            elif selection == "Postos de Saúde":
+                posto_saude_management_section()
+            elif selection == "Funcionários":
+                funcionario_management_section()
+            elif selection == "Pacientes":
+                paciente_management_section()
+            elif selection == "Medicamentos":
+                medicamento_management_section()
+            elif selection == "Estoque de Medicamentos":
+                estoque_medicamento_management_section()
+            elif selection == "Atendimentos":
+                atendimento_management_section()
+            elif selection == "Prescrições":
+                prescricao_management_section()
+            elif selection == "Distribuição de Medicamentos":
+                distribuicao_medicamento_management_section()
+            elif selection == "Relatórios":
+                reports_section()
+            elif selection == "Backups":
+                backup_section()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,233 @@
+"""
+Arquivo histórico de atendimentos.
+
+Atendimentos encerrados há mais de `meses` meses saem das tabelas quentes (Atendimento, Prescricao
+e DistribuicaoMedicamento) e vão, junto com suas prescrições e distribuições, para um arquivo
+SQLite por ano (<banco>_arquivo/arquivo_AAAA.sqlite). Cada ano fica registrado em
+ArquivoHistorico com o intervalo de datas que guarda, e o open_crud inclui o arquivo nas
+listagens, relatórios e prontuário só quando a data inicial pedida alcança esse intervalo. As
+tabelas quentes ficam com o período em uso, o que mantém pequenos os índices, as varreduras e os
+backups do dia a dia.
+
+Um atendimento é considerado encerrado quando tem data de fim e nenhuma prescrição pendente ou
+distribuída parcialmente. A movimentação é feita em lotes, cada um em uma transação que cobre o
+banco e o arquivo do ano, então o bloqueio de escrita dura pouco e uma interrupção não deixa
+registro duplicado nem perdido. A saída das tabelas quentes aparece no log de alterações como
+exclusão.
+
+Uso:
+    python arquivamento.py --meses 24
+    python arquivamento.py --mostrar
+    python arquivamento.py --fragmentos fragmentos --meses 24
+"""
+import argparse
+import os
+import sqlite3
+import time
+from datetime import date
+
+import open_crud
+
+MESES_EM_USO = 24 # Meses mantidos nas tabelas quentes
+TAMANHO_LOTE = 5000 # Atendimentos por transação
+STATUS_ABERTOS = ("Pendente", "Distribuido Parcialmente")
+
+# Atendimento encerrado: com data de fim e sem prescrição em aberto
+_ENCERRADO = f"""a.data_hora_fim_atendimento IS NOT NULL
+    AND NOT EXISTS (SELECT 1 FROM main.Prescricao pr WHERE pr.id_atendimento = a.id_atendimento
+                    AND pr.status_distribuicao IN ({', '.join(repr(s) for s in STATUS_ABERTOS)}))"""
+
+
+def _data_corte(meses, hoje=None):
+    """Primeiro dia do mês `meses` meses antes de hoje: atendimentos iniciados antes dele podem ser arquivados."""
+    hoje = hoje or date.today()
+    total = hoje.year * 12 + hoje.month - 1 - meses
+    return date(total // 12, total % 12 + 1, 1)
+
+
+def _pasta_arquivo(banco):
+    return os.path.splitext(os.path.basename(banco))[0] + "_arquivo"
+
+
+def _criar_arquivo(conn, caminho):
+    """Cria o arquivo do ano com o esquema (tabelas e índices) das tabelas arquiváveis do banco atual."""
+    objetos = conn.execute(
+        f"""SELECT sql FROM main.sqlite_master WHERE sql IS NOT NULL AND tbl_name IN ({', '.join('?' * len(open_crud.TABELAS_ARQUIVAVEIS))})
+            AND type IN ('table', 'index') ORDER BY type DESC""",
+        open_crud.TABELAS_ARQUIVAVEIS
+    ).fetchall()
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    arquivo = sqlite3.connect(caminho)
+    try:
+        for (sql,) in objetos:
+            arquivo.execute(sql.replace("CREATE TABLE ", "CREATE TABLE IF NOT EXISTS ", 1).replace("CREATE INDEX ", "CREATE INDEX IF NOT EXISTS ", 1))
+        arquivo.commit()
+    finally:
+        arquivo.close()
+
+
+def _mover_lote(conn, ano, ids, pasta):
+    """Move um lote de atendimentos (com prescrições e distribuições) para o arquivo do ano, em uma transação."""
+    esquema = f"arquivo_{ano}"
+    relativo = os.path.join(pasta, f"arquivo_{ano}.sqlite")
+    banco = conn.execute("PRAGMA database_list").fetchone()[2]
+    caminho = os.path.join(os.path.dirname(banco), relativo)
+    if not os.path.exists(caminho):
+        _criar_arquivo(conn, caminho)
+    if conn.execute("SELECT 1 FROM pragma_database_list WHERE name = ?", (esquema,)).fetchone() is None:
+        conn.execute(f"ATTACH DATABASE ? AS {esquema}", (caminho,))
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS lote_arquivo (id_atendimento INTEGER PRIMARY KEY)")
+        conn.execute("DELETE FROM temp.lote_arquivo")
+        conn.executemany("INSERT INTO temp.lote_arquivo (id_atendimento) VALUES (?)", [(i,) for i in ids])
+        # Revalida dentro da transação: o atendimento pode ter ganhado prescrição desde a seleção
+        conn.execute(f"""DELETE FROM temp.lote_arquivo WHERE id_atendimento NOT IN
+                         (SELECT a.id_atendimento FROM main.Atendimento a
+                          WHERE a.id_atendimento IN (SELECT id_atendimento FROM temp.lote_arquivo) AND {_ENCERRADO})""")
+        if conn.execute("SELECT 1 FROM temp.lote_arquivo LIMIT 1").fetchone() is None:
+            conn.execute("COMMIT")
+            return [0, 0, 0]
+        do_lote = "SELECT id_atendimento FROM temp.lote_arquivo"
+        prescricoes_do_lote = f"SELECT id_prescricao FROM main.Prescricao WHERE id_atendimento IN ({do_lote})"
+
+        datas = conn.execute(f"""SELECT
+                (SELECT MIN(data_hora_inicio_atendimento) FROM main.Atendimento WHERE id_atendimento IN ({do_lote})),
+                (SELECT MAX(data_hora_inicio_atendimento) FROM main.Atendimento WHERE id_atendimento IN ({do_lote})),
+                (SELECT MAX(data_hora_prescricao) FROM main.Prescricao WHERE id_atendimento IN ({do_lote})),
+                (SELECT MAX(data_hora_distribuicao) FROM main.DistribuicaoMedicamento WHERE id_prescricao IN ({prescricoes_do_lote}))""").fetchone()
+        totais = [
+            conn.execute(f"INSERT INTO {esquema}.Atendimento SELECT * FROM main.Atendimento WHERE id_atendimento IN ({do_lote})").rowcount,
+            conn.execute(f"INSERT INTO {esquema}.Prescricao SELECT * FROM main.Prescricao WHERE id_atendimento IN ({do_lote})").rowcount,
+            conn.execute(f"INSERT INTO {esquema}.DistribuicaoMedicamento SELECT * FROM main.DistribuicaoMedicamento WHERE id_prescricao IN ({prescricoes_do_lote})").rowcount,
+        ]
+        conn.execute(f"DELETE FROM main.DistribuicaoMedicamento WHERE id_prescricao IN ({prescricoes_do_lote})")
+        conn.execute(f"DELETE FROM main.Prescricao WHERE id_atendimento IN ({do_lote})")
+        conn.execute(f"DELETE FROM main.Atendimento WHERE id_atendimento IN ({do_lote})")
+
+        # Prescrições e distribuições podem ser posteriores ao atendimento: o intervalo delas fica à parte
+        data_maxima_distribuicao = max(d for d in datas[1:] if d is not None)
+        conn.execute(
+            """INSERT INTO ArquivoHistorico (ano, arquivo, data_minima, data_maxima, data_maxima_distribuicao,
+                                             atendimentos, prescricoes, distribuicoes, data_arquivamento)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, datetime('now', 'localtime'))
+               ON CONFLICT(ano) DO UPDATE SET
+                   data_minima = MIN(data_minima, excluded.data_minima),
+                   data_maxima = MAX(data_maxima, excluded.data_maxima),
+                   data_maxima_distribuicao = MAX(data_maxima_distribuicao, excluded.data_maxima_distribuicao),
+                   atendimentos = atendimentos + excluded.atendimentos,
+                   prescricoes = prescricoes + excluded.prescricoes,
+                   distribuicoes = distribuicoes + excluded.distribuicoes,
+                   data_arquivamento = excluded.data_arquivamento""",
+            (ano, relativo, datas[0], datas[1], data_maxima_distribuicao, *totais)
+        )
+        conn.execute("COMMIT")
+        return totais
+    except sqlite3.Error:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def arquivar(meses=MESES_EM_USO, tamanho_lote=TAMANHO_LOTE, hoje=None):
+    """Move para o arquivo do ano os atendimentos encerrados iniciados antes do corte de `meses` meses."""
+    if meses < 1:
+        return {"success": False, "message": "Mantenha ao menos 1 mês nas tabelas quentes."}
+    corte = _data_corte(meses, hoje).isoformat()
+    conn = open_crud.get_db_connection()
+    conn.isolation_level = None # Transações explícitas por lote
+    inicio = time.perf_counter()
+    resumo = {}
+    try:
+        banco = conn.execute("PRAGMA database_list").fetchone()[2]
+        pasta = _pasta_arquivo(banco)
+        # Candidatos separados em uma única varredura, na ordem das datas. Um índice só na data não é
+        # criado para isso: ele levaria o planejador a trocar varreduras de períodos longos por buscas
+        # mais lentas nos relatórios.
+        conn.execute("DROP TABLE IF EXISTS temp.candidatos_arquivo")
+        conn.execute(
+            f"""CREATE TEMP TABLE candidatos_arquivo AS
+                SELECT a.id_atendimento, CAST(strftime('%Y', a.data_hora_inicio_atendimento) AS INTEGER) AS ano
+                FROM main.Atendimento a
+                WHERE a.data_hora_inicio_atendimento < ? AND strftime('%Y', a.data_hora_inicio_atendimento) IS NOT NULL
+                  AND {_ENCERRADO}
+                ORDER BY a.data_hora_inicio_atendimento""",
+            (corte,)
+        )
+        ultimo = 0
+        while True:
+            # Lotes do mesmo ano
+            candidatos = conn.execute(
+                "SELECT rowid, id_atendimento, ano FROM temp.candidatos_arquivo WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                (ultimo, tamanho_lote)
+            ).fetchall()
+            if not candidatos:
+                break
+            ano = candidatos[0]["ano"]
+            lote = [c for c in candidatos if c["ano"] == ano]
+            ultimo = lote[-1]["rowid"]
+            totais = _mover_lote(conn, ano, [c["id_atendimento"] for c in lote], pasta)
+            acumulado = resumo.setdefault(ano, [0, 0, 0])
+            for i, total in enumerate(totais):
+                acumulado[i] += total
+        segundos = time.perf_counter() - inicio
+        dados = {ano: dict(zip(("atendimentos", "prescricoes", "distribuicoes"), t)) for ano, t in resumo.items()}
+        total = sum(t[0] for t in resumo.values())
+        return {"success": True, "message": f"{total} atendimento(s) anteriores a {corte} arquivados em {segundos:.1f}s.", "data": dados}
+    except (sqlite3.Error, OSError) as e:
+        return {"success": False, "message": f"Erro ao arquivar atendimentos: {e}", "data": {ano: dict(zip(("atendimentos", "prescricoes", "distribuicoes"), t)) for ano, t in resumo.items()}}
+    finally:
+        conn.execute("DROP TABLE IF EXISTS temp.candidatos_arquivo")
+        conn.isolation_level = ""
+        conn.close()
+
+
+def get_arquivos():
+    """Lista os anos arquivados com o intervalo de datas e a quantidade de registros de cada um."""
+    conn = open_crud.get_db_connection()
+    try:
+        rows = conn.execute("SELECT * FROM ArquivoHistorico ORDER BY ano").fetchall()
+        return {"success": True, "data": [dict(row) for row in rows]}
+    except sqlite3.Error as e:
+        return {"success": False, "message": f"Erro ao listar o arquivo histórico: {e}"}
+    finally:
+        conn.close()
+
+
+def _bancos_alvo(fragmentos):
+    """Caminhos em que o arquivamento roda: o banco atual ou cada fragmento de um banco fragmentado."""
+    if not fragmentos:
+        return [None]
+    import fragmentacao
+    roteador = fragmentacao.Roteador(fragmentos)
+    try:
+        return [roteador.caminho(numero) for numero in roteador.fragmentos()]
+    finally:
+        roteador.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Arquiva atendimentos encerrados antigos em arquivos SQLite por ano.")
+    parser.add_argument("--db", default=open_crud.DATABASE_NAME, help="Arquivo SQLite do banco de dados.")
+    parser.add_argument("--fragmentos", help="Diretório de um banco fragmentado: arquiva cada fragmento.")
+    parser.add_argument("--meses", type=int, default=MESES_EM_USO, help="Meses mantidos nas tabelas quentes.")
+    parser.add_argument("--lote", type=int, default=TAMANHO_LOTE, help="Atendimentos movidos por transação.")
+    parser.add_argument("--mostrar", action="store_true", help="Só lista os anos já arquivados.")
+    args = parser.parse_args()
+    open_crud.DATABASE_NAME = args.db
+
+    for banco in _bancos_alvo(args.fragmentos):
+        with open_crud.usando_banco(banco):
+            if banco:
+                print(f"[{os.path.basename(banco)}]")
+            if not args.mostrar:
+                resultado = arquivar(args.meses, args.lote)
+                print(resultado["message"])
+            arquivos = get_arquivos()
+            for arquivo in arquivos.get("data", []):
+                print(f"  {arquivo['ano']}: {arquivo['atendimentos']} atendimentos, {arquivo['prescricoes']} prescrições, "
+                      f"{arquivo['distribuicoes']} distribuições ({arquivo['data_minima'][:10]} a {arquivo['data_maxima'][:10]}) em {arquivo['arquivo']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Fachada assíncrona (asyncio) sobre as funções do open_crud.
+
+As funções do open_crud são bloqueantes (sqlite3 + bcrypt). Aqui elas são executadas em um
+pool de threads dedicado ao banco, com limite de concorrência, para que servidores asyncio
+possam atender muitos clientes e disparar várias consultas em paralelo sem uma thread por
+requisição.
+
+Exemplo:
+
+    async with AsyncCrud(max_workers=4) as crud:
+        pacientes, postos = await asyncio.gather(
+            crud.get_all_pacientes(fields=["id_paciente", "nome_paciente"]),
+            crud.get_all_postos_saude(),
+        )
+"""
+import asyncio
+import contextvars
+import functools
+import inspect
+from concurrent.futures import ThreadPoolExecutor
+
+import open_crud
+
+MAX_WORKERS_DB = 8
+
+# Funções que não fazem sentido fora da thread que as chamou (ex.: devolvem a conexão ou um
+# gerador que consultaria o banco no loop de eventos; use get_alteracoes no lugar de changes_since).
+# escopo_acesso e usando_banco são gerenciadores de contexto: use-os em volta das chamadas, no próprio loop.
+_NAO_EXPOSTAS = {"get_db_connection", "changes_since", "escopo_acesso", "usando_banco"}
+
+
+def _funcoes_expostas():
+    """Retorna as funções públicas do open_crud que podem ser chamadas de forma assíncrona."""
+    return {
+        nome: func for nome, func in inspect.getmembers(open_crud, inspect.isfunction)
+        if not nome.startswith("_") and func.__module__ == open_crud.__name__ and nome not in _NAO_EXPOSTAS
+    }
+
+
+class AsyncCrud:
+    """Executa as funções do open_crud em um pool de threads, com concorrência limitada e cancelamento.
+
+    Qualquer função pública do open_crud fica disponível como corrotina com o mesmo nome
+    e a mesma assinatura, mais o argumento opcional `timeout` (segundos).
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS_DB, max_concorrencia=None):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="open_crud")
+        self._max_concorrencia = max_concorrencia or max_workers
+        self._semaforo = None
+        self._funcoes = _funcoes_expostas()
+
+    async def chamar(self, nome_funcao, *args, timeout=None, **kwargs):
+        """Executa `open_crud.<nome_funcao>(*args, **kwargs)` no pool e aguarda o resultado.
+
+        Se a corrotina for cancelada (ou estourar o `timeout`) antes de a chamada começar,
+        ela é retirada da fila e não chega a tocar no banco. Uma chamada já em execução
+        termina na sua thread, mas o resultado é descartado.
+        """
+        func = self._funcoes.get(nome_funcao)
+        if func is None:
+            raise AttributeError(f"open_crud não possui a função pública '{nome_funcao}'.")
+        if self._semaforo is None:
+            self._semaforo = asyncio.Semaphore(self._max_concorrencia)
+
+        async def executar():
+            async with self._semaforo:
+                loop = asyncio.get_running_loop()
+                # Leva o contexto da tarefa (ex.: escopo_acesso do open_crud) para a thread do pool
+                contexto = contextvars.copy_context()
+                return await loop.run_in_executor(self._executor, functools.partial(contexto.run, func, *args, **kwargs))
+
+        return await asyncio.wait_for(executar(), timeout)
+
+    async def em_lote(self, chamadas, timeout=None):
+        """Executa várias chamadas [(nome_funcao, args, kwargs), ...] concorrentemente, na ordem recebida."""
+        return await asyncio.gather(*(
+            self.chamar(nome, *args, timeout=timeout, **kwargs) for nome, args, kwargs in chamadas
+        ))
+
+    def __getattr__(self, nome):
+        if nome.startswith("_") or nome not in self._funcoes:
+            raise AttributeError(nome)
+
+        @functools.wraps(self._funcoes[nome])
+        async def corrotina(*args, timeout=None, **kwargs):
+            return await self.chamar(nome, *args, timeout=timeout, **kwargs)
+
+        return corrotina
+
+    def close(self, aguardar=True):
+        """Encerra o pool de threads; chamadas ainda na fila são canceladas."""
+        self._executor.shutdown(wait=aguardar, cancel_futures=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        # Espera as chamadas em execução numa thread à parte, sem travar o loop de eventos
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
@@ -0,0 +1,337 @@
+"""
+Serviço de autenticação de funcionários.
+
+O login passa por três barreiras baratas antes de qualquer trabalho de bcrypt:
+
+  * limite de tentativas por conta e por IP (token bucket): rajadas de força bruta são recusadas
+    sem consultar o banco nem calcular hash;
+  * cache negativo de e-mails inexistentes: e-mails já vistos como desconhecidos são recusados
+    sem ir ao banco por CACHE_NEGATIVO_TTL segundos;
+  * pool limitado de threads para o bcrypt.checkpw, com fila máxima: picos de login (troca de
+    turno) usam no máximo WORKERS_BCRYPT núcleos e o excesso recebe "tente novamente" na hora,
+    em vez de enfileirar indefinidamente.
+
+Toda falha de credencial (e-mail inexistente ou senha errada) devolve a mesma mensagem e leva
+pelo menos o tempo de uma verificação bcrypt (medido ao criar o serviço e acompanhado a cada
+verificação), para o tempo de resposta não revelar quais e-mails existem. O serviço não espera:
+ele devolve em "espera" o tempo que falta, e quem responde ao usuário completa a espera fora das
+threads de trabalho (autenticar_async com asyncio.sleep no loop de eventos; autenticar na thread
+do próprio chamador, como o script da sessão do Streamlit). O e-mail é comparado sem diferenciar maiúsculas, no banco, no limite por conta e
+no cache negativo.
+
+Após um login bem-sucedido com hash de custo diferente do definido em politica_senha, um hash novo
+é gerado em segundo plano no mesmo pool (rehash no login), sem atrasar a resposta.
+
+Uso:
+    resultado = autenticacao.autenticar(email, senha, ip=endereco_do_cliente)
+    resultado = await autenticacao.autenticar_async(email, senha, ip=endereco_do_cliente)
+    python autenticacao.py --benchmark --logins 200 --concorrencia 20
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+
+import bcrypt
+
+import open_crud
+import politica_senha
+
+WORKERS_BCRYPT = min(4, os.cpu_count() or 1)
+MAX_VERIFICACOES_PENDENTES = 64 # Verificações na fila + em execução; acima disso o login é recusado na hora
+TIMEOUT_VERIFICACAO = 10.0
+
+# Token buckets: capacidade (rajada) e reposição (tokens por segundo)
+CAPACIDADE_CONTA, REPOSICAO_CONTA = 5, 1 / 30 # 5 tentativas, depois 1 a cada 30 s
+CAPACIDADE_IP, REPOSICAO_IP = 30, 1 / 2 # 30 tentativas, depois 1 a cada 2 s
+MAX_BALDES = 10000
+
+CACHE_NEGATIVO_TTL = 60.0
+CACHE_NEGATIVO_MAX = 10000
+
+MENSAGEM_CREDENCIAIS = "E-mail ou senha inválidos."
+
+
+def _normalizar_email(email):
+    return email.strip().lower()
+
+
+class TokenBucket:
+    """Baldes de fichas por chave (conta ou IP), com reposição contínua e limite de chaves em memória."""
+
+    def __init__(self, capacidade, reposicao_por_segundo, max_chaves=MAX_BALDES):
+        self.capacidade = capacidade
+        self.reposicao = reposicao_por_segundo
+        self.max_chaves = max_chaves
+        self._baldes = OrderedDict() # chave -> (fichas, instante da última atualização)
+        self._trava = threading.Lock()
+
+    def consumir(self, chave):
+        """Retira uma ficha; retorna 0 se havia ficha ou os segundos até a próxima, se não havia."""
+        agora = time.monotonic()
+        with self._trava:
+            fichas, instante = self._baldes.pop(chave, (self.capacidade, agora))
+            fichas = min(self.capacidade, fichas + (agora - instante) * self.reposicao)
+            espera = 0.0
+            if fichas >= 1:
+                fichas -= 1
+            else:
+                espera = (1 - fichas) / self.reposicao
+            self._baldes[chave] = (fichas, agora)
+            while len(self._baldes) > self.max_chaves: # Esquece as chaves usadas há mais tempo
+                self._baldes.popitem(last=False)
+            return espera
+
+    def reiniciar(self, chave):
+        with self._trava:
+            self._baldes.pop(chave, None)
+
+
+class CacheNegativo:
+    """Conjunto de chaves com validade (TTL) e tamanho máximo."""
+
+    def __init__(self, ttl=CACHE_NEGATIVO_TTL, max_chaves=CACHE_NEGATIVO_MAX):
+        self.ttl = ttl
+        self.max_chaves = max_chaves
+        self._expira_em = OrderedDict()
+        self._trava = threading.Lock()
+
+    def contem(self, chave):
+        with self._trava:
+            expira_em = self._expira_em.get(chave)
+            if expira_em is None:
+                return False
+            if expira_em < time.monotonic():
+                del self._expira_em[chave]
+                return False
+            return True
+
+    def adicionar(self, chave):
+        with self._trava:
+            self._expira_em.pop(chave, None)
+            self._expira_em[chave] = time.monotonic() + self.ttl
+            while len(self._expira_em) > self.max_chaves:
+                self._expira_em.popitem(last=False)
+
+    def limpar(self):
+        with self._trava:
+            self._expira_em.clear()
+
+
+class ServicoAutenticacao:
+    """Autenticação com bcrypt em pool limitado, limite de tentativas e cache negativo."""
+
+    def __init__(self, workers=WORKERS_BCRYPT, max_pendentes=MAX_VERIFICACOES_PENDENTES):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._vagas = threading.BoundedSemaphore(max_pendentes)
+        self.limite_conta = TokenBucket(CAPACIDADE_CONTA, REPOSICAO_CONTA)
+        self.limite_ip = TokenBucket(CAPACIDADE_IP, REPOSICAO_IP)
+        self.emails_desconhecidos = CacheNegativo()
+        # Média móvel do tempo de um checkpw, usada para igualar as falhas; medida já na criação para
+        # as falhas anteriores à primeira verificação não responderem mais rápido
+        self._tempo_bcrypt = self._medir_bcrypt()
+
+    @staticmethod
+    def _medir_bcrypt():
+        """Tempo de um hash com o custo em vigor (as mesmas rodadas de um checkpw)."""
+        inicio = time.perf_counter()
+        politica_senha.hash_senha(os.urandom(16).hex())
+        return time.perf_counter() - inicio
+
+    def _verificar_senha(self, senha, senha_hash):
+        inicio = time.perf_counter()
+        try:
+            return bcrypt.checkpw(senha.encode("utf-8"), senha_hash.encode("utf-8"))
+        except ValueError: # Hash corrompido/fora do formato bcrypt
+            return False
+        finally:
+            duracao = time.perf_counter() - inicio
+            self._tempo_bcrypt = duracao if self._tempo_bcrypt is None else 0.9 * self._tempo_bcrypt + 0.1 * duracao
+
+    def _falha(self, inicio, motivo=None, mensagem=MENSAGEM_CREDENCIAIS):
+        resultado = {"success": False, "message": mensagem}
+        if motivo:
+            resultado["motivo"] = motivo
+        elif self._tempo_bcrypt:
+            # Falhas de credencial levam o mesmo tempo que uma verificação bcrypt; a espera fica com quem responde
+            resultado["espera"] = max(self._tempo_bcrypt - (time.perf_counter() - inicio), 0.0)
+        return resultado
+
+    def autenticar(self, email, senha, ip=None):
+        """Valida e-mail e senha; em caso de sucesso retorna os dados do funcionário (sem o hash da senha)."""
+        inicio = time.perf_counter()
+        if not email or not senha:
+            return {"success": False, "message": "Por favor, insira seu e-mail e senha."}
+        conta = _normalizar_email(email) # Variações de maiúsculas são a mesma conta em todas as barreiras
+
+        espera = max(self.limite_ip.consumir(ip) if ip else 0.0, self.limite_conta.consumir(conta))
+        if espera:
+            return self._falha(inicio, "limite", f"Muitas tentativas de login. Tente novamente em {int(espera) + 1} segundos.")
+        if self.emails_desconhecidos.contem(conta):
+            return self._falha(inicio)
+
+        resultado = open_crud.get_funcionario_by_email(email.strip())
+        if not resultado["success"]:
+            if "não encontrado" in resultado["message"]:
+                self.emails_desconhecidos.adicionar(conta)
+                return self._falha(inicio)
+            return resultado # Erro de banco: não é falha de credencial
+        funcionario = resultado["data"]
+
+        if not self._vagas.acquire(blocking=False):
+            return self._falha(inicio, "ocupado", "Sistema ocupado com outros logins. Tente novamente em instantes.")
+        try:
+            futuro = self._executor.submit(self._verificar_senha, senha, funcionario["senha_hash"])
+            futuro.add_done_callback(lambda _: self._vagas.release())
+        except RuntimeError: # Pool encerrado
+            self._vagas.release()
+            raise
+        try:
+            senha_correta = futuro.result(timeout=TIMEOUT_VERIFICACAO)
+        except FuturesTimeoutError:
+            futuro.cancel()
+            return self._falha(inicio, "ocupado", "Sistema ocupado com outros logins. Tente novamente em instantes.")
+
+        if not senha_correta:
+            return self._falha(inicio)
+        self.limite_conta.reiniciar(conta)
+        if politica_senha.precisa_rehash(funcionario["senha_hash"]):
+            self._agendar_rehash(funcionario["id_funcionario"], senha, funcionario["senha_hash"])
+        funcionario.pop("senha_hash", None)
+        return {"success": True, "data": funcionario}
+
+    def _rehash(self, id_funcionario, senha, hash_antigo):
+        politica_senha.atualizar_hash(id_funcionario, hash_antigo, politica_senha.hash_senha(senha))
+
+    def _agendar_rehash(self, id_funcionario, senha, hash_antigo):
+        """Gera o hash com o custo atual em segundo plano; com o pool cheio, fica para o próximo login."""
+        if not self._vagas.acquire(blocking=False):
+            return
+        try:
+            futuro = self._executor.submit(self._rehash, id_funcionario, senha, hash_antigo)
+        except RuntimeError:
+            self._vagas.release()
+            return
+        futuro.add_done_callback(lambda _: self._vagas.release())
+
+    def close(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+_servico = None
+_trava_servico = threading.Lock()
+
+
+def servico():
+    """Instância compartilhada do serviço (criada no primeiro uso)."""
+    global _servico
+    with _trava_servico:
+        if _servico is None:
+            _servico = ServicoAutenticacao()
+        return _servico
+
+
+def _esquecer_emails_desconhecidos(_):
+    # Funcionários cadastrados ou alterados (também por outro processo, ver coordenacao.py):
+    # um e-mail recusado como desconhecido pode ter acabado de ser cadastrado
+    if _servico is not None:
+        _servico.emails_desconhecidos.limpar()
+
+
+open_crud.registrar_ouvinte_funcionario(_esquecer_emails_desconhecidos)
+
+
+def autenticar(email, senha, ip=None):
+    """Login com a espera das falhas na thread do chamador (ex.: o script de uma sessão do Streamlit)."""
+    resultado = servico().autenticar(email, senha, ip)
+    time.sleep(resultado.pop("espera", 0))
+    return resultado
+
+
+async def autenticar_async(email, senha, ip=None, executor=None):
+    """Login para servidores asyncio: consulta e bcrypt no `executor`, e a espera das falhas no loop de
+    eventos, sem segurar uma thread do executor (uma rajada de logins errados não o esgota)."""
+    loop = asyncio.get_running_loop()
+    resultado = await loop.run_in_executor(executor, servico().autenticar, email, senha, ip)
+    await asyncio.sleep(resultado.pop("espera", 0))
+    return resultado
+
+
+# --- Benchmark ---
+
+def _disparar(funcao, chamadas, concorrencia):
+    """Executa `funcao(*args)` para cada item de `chamadas` com `concorrencia` threads; retorna (segundos, latências, resultados)."""
+    latencias = []
+    def medir(args):
+        inicio = time.perf_counter()
+        resultado = funcao(*args)
+        latencias.append(time.perf_counter() - inicio)
+        return resultado
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+        resultados = list(executor.map(medir, chamadas))
+    return time.perf_counter() - inicio, sorted(latencias), resultados
+
+
+def _imprimir(nome, total, segundos, latencias, resultados):
+    sucesso = sum(1 for r in resultados if r is True or (isinstance(r, dict) and r.get("success")))
+    p = lambda q: latencias[min(len(latencias) - 1, int(q * len(latencias)))] * 1000
+    print(f"{nome:<44} {total / segundos:>8.0f}/s  p50 {p(0.5):>7.1f} ms  p99 {p(0.99):>7.1f} ms  sucesso {sucesso}/{total}")
+
+
+def executar_benchmark(db, logins, concorrencia, workers):
+    """Compara o login antigo (busca + checkpw na thread do chamador) com o serviço, numa cópia do banco."""
+    pasta = tempfile.mkdtemp()
+    try:
+        copia = os.path.join(pasta, "bench_login.sqlite")
+        shutil.copy(db, copia)
+        open_crud.DATABASE_NAME = copia
+        usuarios = [(f"bench{i}@hospital.com", f"senha-bench-{i}") for i in range(concorrencia)]
+        conn = open_crud.get_db_connection()
+        posto = conn.execute("SELECT MIN(id_posto) FROM PostoSaude").fetchone()[0]
+        conn.close()
+        for i, (email, senha) in enumerate(usuarios):
+            open_crud.create_funcionario(f"Bench {i}", f"999{i:08d}", "Enfermeiro", email, senha, posto)
+
+        def login_antigo(email, senha):
+            dados = open_crud.get_funcionario_by_email(email)
+            return bool(dados["success"] and dados["data"] and open_crud.check_password(senha, dados["data"]["senha_hash"]))
+
+        validos = [usuarios[i % len(usuarios)] for i in range(logins)]
+        print(f"{logins} logins, concorrência {concorrencia}, workers bcrypt {workers}\n")
+        _imprimir("login antigo (checkpw na thread da sessão)", logins, *_disparar(login_antigo, validos, concorrencia))
+        servico_bench = ServicoAutenticacao(workers=workers)
+        _imprimir("serviço: logins válidos", logins, *_disparar(servico_bench.autenticar, validos, concorrencia))
+
+        # Força bruta contra uma conta a partir de um IP: só as primeiras tentativas chegam ao bcrypt
+        ataque = [(usuarios[0][0], f"errada{i}", "10.0.0.1") for i in range(logins)]
+        _imprimir("serviço: força bruta (1 conta, 1 IP)", logins, *_disparar(servico_bench.autenticar, ataque, concorrencia))
+        desconhecidos = [(f"nao{i % 10}@x.com", "x", f"10.0.1.{i}") for i in range(logins)]
+        _imprimir("serviço: e-mails inexistentes (cache negativo)", logins, *_disparar(servico_bench.autenticar, desconhecidos, concorrencia))
+        servico_bench.close()
+    finally:
+        shutil.rmtree(pasta, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do login (bcrypt em pool, limite de tentativas e cache negativo).")
+    parser.add_argument("--db", default=open_crud.DATABASE_NAME, help="Banco copiado para o teste (o original não é alterado).")
+    parser.add_argument("--benchmark", action="store_true")
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concorrencia", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=WORKERS_BCRYPT)
+    args = parser.parse_args()
+    if args.benchmark:
+        executar_benchmark(args.db, args.logins, args.concorrencia, args.workers)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,557 @@
+"""
+Backups online do banco com a API de backup do SQLite.
+
+A cópia é feita com `Connection.backup` em passos de `paginas_por_passo` páginas, com uma pausa
+entre eles: cada passo segura a leitura do banco por poucos milissegundos e as escritas do
+Streamlit seguem entre um passo e outro, em vez de esperarem a cópia inteira (ou de copiarem um
+arquivo pela metade, como acontece com uma cópia simples do arquivo). Se uma escrita de outra
+conexão alterar o banco no meio da cópia, o SQLite recomeça do início; a cada recomeço o passo
+é aumentado, até a cópia ser feita em um passo só. Com o banco em WAL (journal_mode=WAL) a cópia
+já é feita em um passo só: a leitura não bloqueia as escritas e o backup é um retrato consistente.
+
+Cada backup é um diretório <banco>_backups/backup_AAAAMMDD_HHMMSS/ com a cópia do banco, a dos
+arquivos históricos registrados nele (ver arquivamento.py) e um backup.json com os dados da
+cópia. Antes de ser publicado o backup passa por PRAGMA integrity_check (ou quick_check) e pela
+conferência dos totais do arquivo histórico; só então o diretório perde o sufixo .parcial e os
+backups mais antigos que os `manter` mais recentes são removidos.
+
+A restauração é feita em duas fases. Na primeira, sem alterar o banco, ela confere o backup,
+guarda um backup do estado atual e copia o banco e os arquivos históricos do backup para
+temporários (<arquivo>.restauracao) ao lado dos de destino. Na segunda, cada temporário passa para
+o lugar do arquivo pela API de backup, em um passo só (as outras conexões passam a ver o conteúdo
+restaurado na próxima transação). Com fragmentação, todos os bancos do conjunto passam pela
+primeira fase antes de qualquer um ser trocado; se uma troca falhar, os já trocados voltam ao
+estado salvo. Os caches em memória que dependem do banco
+(tabelas auxiliares conferidas, principais das sessões, réplica de leitura e espelho colunar) são
+descartados.
+
+Uso:
+    python backup.py                              # cria um backup e aplica a rotação
+    python backup.py --listar
+    python backup.py --restaurar backup_20261019_030000
+    python backup.py --fragmentos fragmentos      # um backup do catálogo e de cada fragmento
+    python backup.py --benchmark
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import fragmentacao
+import open_crud
+
+PAGINAS_POR_PASSO = 1024 # 4 MB por passo com páginas de 4 KB
+PAUSA_ENTRE_PASSOS = 0.005 # Segundos livres para as escritas entre um passo e outro
+MANTER_BACKUPS = 7
+MAX_REINICIOS = 2 # Recomeços por escrita concorrente antes de copiar o restante em um passo só
+FATOR_REINICIO = 4 # Quanto o passo cresce a cada recomeço
+
+
+class _CopiaReiniciada(Exception):
+    """O banco de origem foi alterado por outra conexão e a API de backup recomeçou a cópia."""
+
+
+def diretorio_backups(banco=None):
+    banco = banco or _banco_atual()
+    return os.path.splitext(banco)[0] + "_backups"
+
+
+def _banco_atual():
+    """Caminho absoluto do banco em uso (o de DATABASE_NAME ou o escolhido por open_crud.usando_banco)."""
+    conn = open_crud.get_db_connection()
+    try:
+        return conn.execute("PRAGMA database_list").fetchone()[2]
+    finally:
+        conn.close()
+
+
+def _copiar(origem, destino, paginas_por_passo=PAGINAS_POR_PASSO, pausa=PAUSA_ENTRE_PASSOS):
+    """Copia o arquivo SQLite `origem` para `destino` em passos pausados; retorna {"paginas", "passos", "reinicios"}."""
+    reinicios = passos = 0
+    paginas = paginas_por_passo
+    while True:
+        conn_origem = sqlite3.connect(origem)
+        conn_destino = sqlite3.connect(destino)
+        if conn_origem.execute("PRAGMA journal_mode").fetchone()[0] == "wal":
+            paginas = -1 # Em WAL as escritas seguem durante a leitura; em passos, cada uma recomeçaria a cópia
+        restante_anterior = None
+
+        def progresso(status, restante, total):
+            nonlocal restante_anterior, passos
+            if restante_anterior is not None and restante > restante_anterior:
+                raise _CopiaReiniciada()
+            restante_anterior = restante
+            passos += 1
+            if restante and pausa:
+                time.sleep(pausa) # Nenhuma trava do banco é mantida entre os passos
+
+        try:
+            conn_origem.backup(conn_destino, pages=paginas, progress=progresso)
+            total = conn_destino.execute("PRAGMA page_count").fetchone()[0]
+            return {"paginas": total, "passos": passos, "reinicios": reinicios}
+        except _CopiaReiniciada:
+            reinicios += 1
+            paginas = -1 if reinicios >= MAX_REINICIOS or paginas < 0 else paginas * FATOR_REINICIO
+        finally:
+            conn_destino.close()
+            conn_origem.close()
+
+
+def _verificar(caminho, completa=True):
+    """Roda integrity_check (ou quick_check) no arquivo; retorna a lista de problemas (vazia se íntegro)."""
+    conn = sqlite3.connect(f"file:{caminho}?mode=ro", uri=True)
+    try:
+        pragma = "integrity_check" if completa else "quick_check"
+        resultado = [row[0] for row in conn.execute(f"PRAGMA {pragma}")]
+        return [] if resultado == ["ok"] else resultado
+    except sqlite3.DatabaseError as e: # Cabeçalho ou esquema ilegível
+        return [str(e)]
+    finally:
+        conn.close()
+
+
+def _arquivos_historicos(caminho):
+    """[(ano, caminho relativo, atendimentos)] registrados no ArquivoHistorico do banco (vazio se não houver)."""
+    conn = sqlite3.connect(f"file:{caminho}?mode=ro", uri=True)
+    try:
+        return conn.execute("SELECT ano, arquivo, atendimentos FROM ArquivoHistorico ORDER BY ano").fetchall()
+    except sqlite3.OperationalError: # Banco ainda sem o registro do arquivo histórico
+        return []
+    finally:
+        conn.close()
+
+
+def _problemas_do_arquivo_historico(pasta, banco_copiado):
+    """Confere se cada arquivo histórico copiado tem os atendimentos que o banco copiado registra para ele."""
+    problemas = []
+    for ano, relativo, atendimentos in _arquivos_historicos(banco_copiado):
+        caminho = os.path.join(pasta, relativo)
+        if not os.path.exists(caminho):
+            problemas.append(f"Arquivo histórico de {ano} ausente.")
+            continue
+        conn = sqlite3.connect(f"file:{caminho}?mode=ro", uri=True)
+        try:
+            copiados = conn.execute("SELECT COUNT(*) FROM Atendimento").fetchone()[0]
+        finally:
+            conn.close()
+        if copiados != atendimentos: # Um arquivamento rodou durante a cópia
+            problemas.append(f"Arquivo histórico de {ano} com {copiados} atendimento(s); o banco registra {atendimentos}.")
+    return problemas
+
+
+def _ler_manifesto(pasta):
+    try:
+        with open(os.path.join(pasta, "backup.json"), encoding="utf-8") as arquivo:
+            return json.load(arquivo)
+    except (OSError, ValueError):
+        return None
+
+
+def _nome_livre(diretorio, nome=None):
+    nome = nome or datetime.now().strftime("backup_%Y%m%d_%H%M%S")
+    candidato, sufixo = nome, 1
+    while os.path.exists(os.path.join(diretorio, candidato)) or os.path.exists(os.path.join(diretorio, candidato + ".parcial")):
+        sufixo += 1
+        candidato = f"{nome}_{sufixo}"
+    return candidato
+
+
+def _rotacionar(diretorio, manter):
+    """Remove os backups além dos `manter` mais recentes; retorna os nomes removidos."""
+    backups = sorted(
+        (nome for nome in os.listdir(diretorio) if nome.startswith("backup_") and not nome.endswith(".parcial")),
+        reverse=True
+    )
+    removidos = backups[manter:]
+    for nome in removidos:
+        shutil.rmtree(os.path.join(diretorio, nome), ignore_errors=True)
+    return removidos
+
+
+def criar_backup(paginas_por_passo=PAGINAS_POR_PASSO, pausa=PAUSA_ENTRE_PASSOS, manter=MANTER_BACKUPS, completa=True, motivo=None, nome=None):
+    """Cria um backup verificado do banco atual (e dos seus arquivos históricos) e aplica a rotação.
+
+    `nome` (backup_...) permite dar o mesmo nome aos backups do catálogo e dos fragmentos (ver criar_backups).
+    """
+    inicio = time.perf_counter()
+    parcial = None
+    try:
+        banco = _banco_atual()
+        diretorio = diretorio_backups(banco)
+        os.makedirs(diretorio, exist_ok=True)
+        nome = _nome_livre(diretorio, nome)
+        parcial = os.path.join(diretorio, nome + ".parcial")
+        os.makedirs(parcial)
+
+        # Banco antes dos arquivos históricos: um arquivamento concorrente é apontado pela conferência abaixo
+        copia = os.path.join(parcial, os.path.basename(banco))
+        estatisticas = _copiar(banco, copia, paginas_por_passo, pausa)
+        segundos_copia = time.perf_counter() - inicio
+        arquivos = []
+        for _, relativo, _ in _arquivos_historicos(copia):
+            origem = os.path.join(os.path.dirname(banco), relativo)
+            destino = os.path.join(parcial, relativo)
+            os.makedirs(os.path.dirname(destino), exist_ok=True)
+            _copiar(origem, destino, paginas_por_passo, pausa)
+            arquivos.append(relativo)
+
+        inicio_verificacao = time.perf_counter()
+        problemas = []
+        for caminho in [copia] + [os.path.join(parcial, relativo) for relativo in arquivos]:
+            problemas += [f"{os.path.basename(caminho)}: {p}" for p in _verificar(caminho, completa)[:5]]
+        problemas += _problemas_do_arquivo_historico(parcial, copia)
+        if problemas:
+            shutil.rmtree(parcial, ignore_errors=True)
+            return {"success": False, "message": "Backup descartado na verificação: " + " ".join(problemas)}
+        segundos_verificacao = time.perf_counter() - inicio_verificacao
+
+        manifesto = {
+            "nome": nome,
+            "banco": banco,
+            "arquivo": os.path.basename(banco),
+            "arquivos_historicos": arquivos,
+            "criado_em": datetime.now().isoformat(timespec="seconds"),
+            "motivo": motivo,
+            "bytes": sum(os.path.getsize(os.path.join(parcial, r)) for r in [os.path.basename(banco)] + arquivos),
+            **estatisticas,
+            "segundos_copia": round(segundos_copia, 3),
+            "verificacao": "integrity_check" if completa else "quick_check",
+            "segundos_verificacao": round(segundos_verificacao, 3),
+        }
+        with open(os.path.join(parcial, "backup.json"), "w", encoding="utf-8") as arquivo:
+            json.dump(manifesto, arquivo, ensure_ascii=False, indent=2)
+        os.replace(parcial, os.path.join(diretorio, nome))
+        parcial = None
+        removidos = _rotacionar(diretorio, manter) if manter else []
+
+        mensagem = (f"Backup {nome} criado: {manifesto['bytes'] / 2**20:.1f} MB em {segundos_copia:.1f}s "
+                    f"({estatisticas['passos']} passo(s), {estatisticas['reinicios']} recomeço(s)), verificado em {segundos_verificacao:.1f}s.")
+        if removidos:
+            mensagem += f" {len(removidos)} backup(s) antigo(s) removido(s)."
+        return {"success": True, "message": mensagem, "data": manifesto}
+    except (sqlite3.Error, OSError) as e:
+        return {"success": False, "message": f"Erro ao criar backup: {e}"}
+    finally:
+        if parcial is not None:
+            shutil.rmtree(parcial, ignore_errors=True)
+
+
+def listar_backups():
+    """Lista os backups do banco atual, do mais recente para o mais antigo."""
+    try:
+        diretorio = diretorio_backups()
+        if not os.path.isdir(diretorio):
+            return {"success": True, "data": []}
+        backups = []
+        for nome in sorted(os.listdir(diretorio), reverse=True):
+            manifesto = _ler_manifesto(os.path.join(diretorio, nome)) if nome.startswith("backup_") else None
+            if manifesto is not None:
+                backups.append(manifesto)
+        return {"success": True, "data": backups}
+    except (sqlite3.Error, OSError) as e:
+        return {"success": False, "message": f"Erro ao listar backups: {e}"}
+
+
+def _descartar_caches(banco):
+    """Esquece o que os módulos guardam em memória sobre o conteúdo do banco restaurado."""
+    open_crud._bancos_preparados.discard(banco)
+    open_crud.notificar_funcionario() # Principais das sessões são relidos no próximo acesso
+    import replica_leitura # Import local: replica_leitura usa a cópia deste módulo
+    replica_leitura.descartar(banco) # A réplica é do conteúdo anterior à restauração
+    try:
+        import espelho_analitico
+    except ImportError: # Sem pyarrow não há espelho colunar
+        return
+    with open_crud.usando_banco(banco):
+        espelho_analitico.descartar_estado() # A posição do log salva no espelho não vale para o banco restaurado
+
+
+SUFIXO_RESTAURACAO = ".restauracao" # Cópias temporárias preparadas ao lado dos arquivos a restaurar
+
+
+def _preparar_restauracao(nome, salvar_atual=True, completa=True):
+    """Primeira fase da restauração do banco atual, sem alterá-lo: confere o backup, salva o estado atual
+    e copia o banco e os arquivos históricos do backup para temporários ao lado dos de destino."""
+    banco = _banco_atual()
+    pasta = os.path.join(diretorio_backups(banco), os.path.basename(nome))
+    manifesto = _ler_manifesto(pasta)
+    if manifesto is None:
+        return {"success": False, "message": f"Backup '{nome}' não encontrado."}
+    copia = os.path.join(pasta, manifesto["arquivo"])
+    problemas = []
+    for caminho in [copia] + [os.path.join(pasta, relativo) for relativo in manifesto["arquivos_historicos"]]:
+        problemas += [f"{os.path.basename(caminho)}: {p}" for p in _verificar(caminho, completa)[:5]]
+    if problemas:
+        return {"success": False, "message": "Backup corrompido, restauração cancelada: " + " ".join(problemas)}
+
+    anterior = None
+    if salvar_atual:
+        resultado = criar_backup(paginas_por_passo=-1, manter=None, completa=False, motivo=f"antes de restaurar {manifesto['nome']}")
+        if not resultado["success"]:
+            return {"success": False, "message": f"Restauração cancelada: não foi possível salvar o estado atual. {resultado['message']}"}
+        anterior = resultado["data"]["nome"]
+
+    pasta_banco = os.path.dirname(banco)
+    copias = [(os.path.join(pasta, relativo), os.path.join(pasta_banco, relativo)) for relativo in manifesto["arquivos_historicos"]]
+    copias.append((copia, banco)) # O banco por último: ele só passa a apontar para os arquivos históricos no fim
+    preparo = {"banco": banco, "manifesto": manifesto, "anterior": anterior, "destinos": [destino for _, destino in copias]}
+    try:
+        for origem, destino in copias:
+            os.makedirs(os.path.dirname(destino), exist_ok=True)
+            _copiar(origem, destino + SUFIXO_RESTAURACAO, -1, 0)
+    except (sqlite3.Error, OSError):
+        _descartar_preparo(preparo)
+        raise
+    return {"success": True, "data": preparo}
+
+
+def _descartar_preparo(preparo):
+    for destino in preparo["destinos"]:
+        if os.path.exists(destino + SUFIXO_RESTAURACAO):
+            os.remove(destino + SUFIXO_RESTAURACAO)
+
+
+def _aplicar_restauracao(preparo):
+    """Segunda fase: passa os temporários para o lugar dos arquivos, cada um em um passo só da API de backup
+    (conexões abertas passam a ver o conteúdo restaurado na próxima transação)."""
+    banco = preparo["banco"]
+    pasta_banco = os.path.dirname(banco)
+    historicos = [relativo for _, relativo, _ in _arquivos_historicos(banco)]
+    try:
+        for destino in preparo["destinos"]:
+            _copiar(destino + SUFIXO_RESTAURACAO, destino, -1, 0)
+        for relativo in historicos:
+            if relativo not in preparo["manifesto"]["arquivos_historicos"]: # Ano arquivado depois do backup: já está no backup do estado atual
+                os.remove(os.path.join(pasta_banco, relativo))
+    finally:
+        _descartar_preparo(preparo)
+        _descartar_caches(banco)
+
+
+def restaurar(nome, salvar_atual=True, completa=True):
+    """Restaura o banco atual (e seus arquivos históricos) a partir do backup `nome`."""
+    inicio = time.perf_counter()
+    try:
+        preparo = _preparar_restauracao(nome, salvar_atual, completa)
+        if not preparo["success"]:
+            return preparo
+        preparo = preparo["data"]
+        _aplicar_restauracao(preparo)
+        return _resultado_restauracao(preparo, inicio)
+    except (sqlite3.Error, OSError, KeyError) as e:
+        return {"success": False, "message": f"Erro ao restaurar backup: {e}"}
+
+
+def _resultado_restauracao(preparo, inicio):
+    mensagem = f"Banco restaurado a partir de {preparo['manifesto']['nome']} em {time.perf_counter() - inicio:.1f}s."
+    if preparo["anterior"]:
+        mensagem += f" Estado anterior salvo em {preparo['anterior']}."
+    return {"success": True, "message": mensagem, "data": {"restaurado": preparo["manifesto"]["nome"], "anterior": preparo["anterior"]}}
+
+
+# --- Conjunto de Bancos (banco único ou catálogo e fragmentos) ---
+
+def _em_cada_banco(fragmentos, funcao):
+    """Executa `funcao` em cada banco do conjunto, parando na primeira falha; junta os resultados."""
+    bancos = fragmentacao.bancos_do_conjunto(fragmentos)
+    if bancos == [None]:
+        return funcao()
+    mensagens, dados = [], []
+    for banco in bancos:
+        with open_crud.usando_banco(banco):
+            resultado = funcao()
+        mensagens.append(f"[{os.path.basename(banco)}] {resultado['message']}")
+        dados.append(resultado.get("data"))
+        if not resultado["success"]:
+            return {"success": False, "message": " ".join(mensagens), "data": dados}
+    return {"success": True, "message": " ".join(mensagens), "data": dados}
+
+
+def criar_backups(fragmentos=None, **opcoes):
+    """criar_backup no banco atual ou, com fragmentação, no catálogo e em cada fragmento (com o mesmo nome)."""
+    opcoes.setdefault("nome", datetime.now().strftime("backup_%Y%m%d_%H%M%S"))
+    return _em_cada_banco(fragmentos, lambda: criar_backup(**opcoes))
+
+
+def restaurar_backups(nome, fragmentos=None, salvar_atual=True, completa=True):
+    """restaurar no banco atual ou, com fragmentação, no catálogo e em cada fragmento, como um conjunto.
+
+    Cada banco é conferido e preparado em temporários antes de qualquer um ser alterado; se a troca
+    falhar no meio, os bancos já trocados voltam ao estado salvo antes da restauração.
+    """
+    bancos = fragmentacao.bancos_do_conjunto(fragmentos)
+    if bancos == [None]:
+        return restaurar(nome, salvar_atual, completa)
+    inicio = time.perf_counter()
+    preparos = []
+    try:
+        for banco in bancos:
+            with open_crud.usando_banco(banco):
+                resultado = _preparar_restauracao(nome, salvar_atual, completa)
+            if not resultado["success"]: # Nada é restaurado se algum banco (ex.: fragmento criado depois) não tiver o backup
+                for preparo in preparos:
+                    _descartar_preparo(preparo)
+                return {"success": False, "message": f"[{os.path.basename(banco)}] {resultado['message']}"}
+            preparos.append(resultado["data"])
+    except (sqlite3.Error, OSError, KeyError) as e:
+        for preparo in preparos:
+            _descartar_preparo(preparo)
+        return {"success": False, "message": f"Erro ao preparar a restauração: {e}"}
+
+    aplicados = []
+    try:
+        for preparo in preparos:
+            with open_crud.usando_banco(preparo["banco"]):
+                _aplicar_restauracao(preparo)
+            aplicados.append(preparo)
+    except (sqlite3.Error, OSError, KeyError) as e:
+        for preparo in preparos[len(aplicados):]:
+            _descartar_preparo(preparo)
+        mensagem = f"Erro ao restaurar {os.path.basename(preparos[len(aplicados)]['banco'])}: {e}."
+        for preparo in aplicados + [preparos[len(aplicados)]]:
+            if preparo["anterior"]: # Desfaz também o banco em que a troca falhou, que pode ter ficado pela metade
+                with open_crud.usando_banco(preparo["banco"]):
+                    desfeito = restaurar(preparo["anterior"], salvar_atual=False, completa=False)
+                if not desfeito["success"]:
+                    mensagem += f" [{os.path.basename(preparo['banco'])}] {desfeito['message']}"
+        return {"success": False, "message": mensagem + (" Bancos já trocados voltaram ao estado anterior." if salvar_atual else "")}
+    finally:
+        if fragmentacao._roteador is not None and not fragmentos:
+            fragmentacao._roteador.recarregar() # Mapa posto -> fragmento volta ao do catálogo restaurado
+    resultados = [_resultado_restauracao(preparo, inicio) for preparo in preparos]
+    mensagens = [f"[{os.path.basename(preparo['banco'])}] {resultado['message']}" for preparo, resultado in zip(preparos, resultados)]
+    return {"success": True, "message": " ".join(mensagens), "data": [resultado["data"] for resultado in resultados]}
+
+
+# --- Benchmark ---
+
+def _escritor(caminho, parar, latencias, intervalo):
+    """Faz escritas curtas a cada `intervalo` segundos, anotando a latência de cada uma, até `parar` ser sinalizado."""
+    conn = sqlite3.connect(caminho, timeout=30)
+    try:
+        conn.execute("CREATE TABLE IF NOT EXISTS BenchmarkEscrita (id INTEGER PRIMARY KEY, valor TEXT)")
+        conn.commit()
+        while not parar.is_set():
+            inicio = time.perf_counter()
+            conn.execute("INSERT INTO BenchmarkEscrita (valor) VALUES (?)", ("x" * 100,))
+            conn.commit()
+            latencias.append(time.perf_counter() - inicio)
+            parar.wait(intervalo)
+    finally:
+        conn.close()
+
+
+def _resumo_latencias(latencias):
+    if not latencias:
+        return "sem escritas"
+    ordenadas = sorted(latencias)
+    p99 = ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * 0.99))]
+    return (f"{len(ordenadas)} escritas, p50 {statistics.median(ordenadas) * 1000:.1f} ms, "
+            f"p99 {p99 * 1000:.1f} ms, máx {ordenadas[-1] * 1000:.1f} ms")
+
+
+def _medir_backup(origem, destino, paginas, intervalo):
+    """Faz um backup de `origem` com escritas concorrentes; retorna (segundos, estatísticas, latências das escritas)."""
+    latencias = []
+    parar = threading.Event()
+    escritor = threading.Thread(target=_escritor, args=(origem, parar, latencias, intervalo))
+    escritor.start()
+    inicio = time.perf_counter()
+    estatisticas = _copiar(origem, destino, paginas, PAUSA_ENTRE_PASSOS if paginas > 0 else 0)
+    segundos = time.perf_counter() - inicio
+    parar.set()
+    escritor.join()
+    os.remove(destino)
+    return segundos, estatisticas, latencias
+
+
+def executar_benchmark(db, escritas_por_segundo=20, passos=(-1, 4096, 1024, 256)):
+    """Mede cópia, verificação e restauração de `db`, e a latência de escritas concorrentes durante a cópia."""
+    tamanho = os.path.getsize(db)
+    print(f"Banco: {db} ({tamanho / 2**30:.2f} GB)")
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(db))) as temporario:
+        # As escritas do teste vão para uma cópia, nunca para o banco informado
+        origem = os.path.join(temporario, "origem.sqlite")
+        inicio = time.perf_counter()
+        _copiar(db, origem, -1, 0)
+        segundos = time.perf_counter() - inicio
+        print(f"Cópia em um passo, sem escritas: {segundos:.1f}s ({tamanho / 2**20 / segundos:.0f} MB/s)")
+
+        for completa in (False, True):
+            inicio = time.perf_counter()
+            _verificar(origem, completa)
+            print(f"{'integrity_check' if completa else 'quick_check'}: {time.perf_counter() - inicio:.1f}s")
+
+        intervalo = 1 / escritas_por_segundo
+        latencias = []
+        parar = threading.Event()
+        escritor = threading.Thread(target=_escritor, args=(origem, parar, latencias, intervalo))
+        escritor.start()
+        time.sleep(3)
+        parar.set()
+        escritor.join()
+        print(f"Escritas sem backup ({escritas_por_segundo}/s): {_resumo_latencias(latencias)}")
+
+        destino = os.path.join(temporario, "destino.sqlite")
+        for paginas in passos:
+            segundos, estatisticas, latencias = _medir_backup(origem, destino, paginas, intervalo)
+            print(f"Backup com {'um passo' if paginas < 0 else f'{paginas} páginas/passo'}: {segundos:.1f}s, "
+                  f"{estatisticas['passos']} passo(s), {estatisticas['reinicios']} recomeço(s); escritas: {_resumo_latencias(latencias)}")
+
+        modo_original = sqlite3.connect(origem).execute("PRAGMA journal_mode").fetchone()[0]
+        if modo_original != "wal":
+            conn = sqlite3.connect(origem)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.close()
+            segundos, estatisticas, latencias = _medir_backup(origem, destino, PAGINAS_POR_PASSO, intervalo)
+            print(f"Backup com o banco em WAL: {segundos:.1f}s, {estatisticas['passos']} passo(s); escritas: {_resumo_latencias(latencias)}")
+            conn = sqlite3.connect(origem)
+            conn.execute(f"PRAGMA journal_mode={modo_original}")
+            conn.close()
+
+        destino = os.path.join(temporario, "restaurado.sqlite")
+        shutil.copyfile(origem, destino)
+        inicio = time.perf_counter()
+        _copiar(origem, destino, -1, 0)
+        print(f"Restauração (sobre um banco existente): {time.perf_counter() - inicio:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backups online do banco com a API de backup do SQLite.")
+    parser.add_argument("--db", default=open_crud.DATABASE_NAME, help="Arquivo SQLite do banco de dados.")
+    parser.add_argument("--fragmentos", help="Diretório de um banco fragmentado: um backup do catálogo e de cada fragmento.")
+    parser.add_argument("--paginas", type=int, default=PAGINAS_POR_PASSO, help="Páginas copiadas por passo (-1 = tudo de uma vez).")
+    parser.add_argument("--pausa", type=float, default=PAUSA_ENTRE_PASSOS, help="Segundos de pausa entre os passos.")
+    parser.add_argument("--manter", type=int, default=MANTER_BACKUPS, help="Backups mantidos na rotação.")
+    parser.add_argument("--rapida", action="store_true", help="Verifica com quick_check em vez de integrity_check.")
+    parser.add_argument("--listar", action="store_true", help="Só lista os backups existentes.")
+    parser.add_argument("--restaurar", metavar="NOME", help="Restaura o backup indicado.")
+    parser.add_argument("--benchmark", action="store_true", help="Mede cópia, verificação e restauração sobre uma cópia do banco.")
+    parser.add_argument("--escritas", type=int, default=20, help="Escritas por segundo concorrentes no benchmark.")
+    args = parser.parse_args()
+    open_crud.DATABASE_NAME = args.db
+
+    if args.benchmark:
+        executar_benchmark(args.db, args.escritas)
+        return
+    if args.restaurar:
+        print(restaurar_backups(args.restaurar, args.fragmentos, completa=not args.rapida)["message"])
+    elif not args.listar:
+        print(criar_backups(args.fragmentos, paginas_por_passo=args.paginas, pausa=args.pausa, manter=args.manter, completa=not args.rapida)["message"])
+    for banco in fragmentacao.bancos_do_conjunto(args.fragmentos):
+        with open_crud.usando_banco(banco):
+            if banco:
+                print(f"[{os.path.basename(banco)}]")
+            for item in listar_backups().get("data", []):
+                motivo = f" ({item['motivo']})" if item.get("motivo") else ""
+                print(f"  {item['nome']}: {item['bytes'] / 2**20:.1f} MB, {item['criado_em']}{motivo}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Teste de carga local para o api_server.py.
+
+Sobe o servidor em um subprocesso apontando para o banco informado, dispara requisições
+concorrentes contra um conjunto de rotas e mostra vazão e latências (p50/p95/p99) por rota.
+
+As requisições usam a sessão aberta com --email/--senha (padrão: o administrador dos dados fictícios).
+
+Uso:
+    python bench_api.py --db hospital_db.sqlite --requisicoes 2000 --concorrencia 50
+    python bench_api.py --url http://127.0.0.1:8888   # usa um servidor já em execução
+"""
+import argparse
+import asyncio
+import json
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+from tornado.httpclient import AsyncHTTPClient, HTTPClientError, HTTPRequest
+
+ROTAS_PADRAO = [
+    "/api/hospitais",
+    "/api/postos?fields=id_posto,nome_posto",
+    "/api/pacientes?limit=100",
+    "/api/pacientes?fields=id_paciente,nome_paciente&limit=500",
+    "/api/atendimentos?limit=100",
+    "/api/estoque?estoque_baixo=true",
+    "/api/pacientes/1",
+    "/api/relatorios/atendimentos-por-tipo",
+    "/api/relatorios/diagnosticos-mais-comuns?limit=10",
+]
+
+
+def _porta_livre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def _aguardar_servidor(url, tentativas=50):
+    cliente = AsyncHTTPClient()
+    for _ in range(tentativas):
+        try:
+            await cliente.fetch(url + "/api/sessao", raise_error=False)
+            return
+        except (ConnectionError, OSError):
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"Servidor não respondeu em {url}.")
+
+
+async def abrir_sessao(url, email, senha):
+    """Faz login na API e retorna o token da sessão."""
+    try:
+        resposta = await AsyncHTTPClient().fetch(url + "/api/sessao", method="POST",
+                                                 body=json.dumps({"email": email, "senha": senha}))
+    except HTTPClientError as e:
+        raise RuntimeError(f"Login na API falhou ({e.code}): {e.response.body.decode('utf-8') if e.response else e}")
+    return json.loads(resposta.body)["token"]
+
+
+def _percentil(valores, p):
+    if not valores:
+        return 0.0
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(round(p / 100 * (len(valores) - 1))))]
+
+
+async def executar_carga(url, rotas, requisicoes, concorrencia, token, gzip=True, usar_etag=False):
+    """Executa `requisicoes` GETs distribuídos entre as rotas, com até `concorrencia` em paralelo."""
+    AsyncHTTPClient.configure(None, max_clients=concorrencia)
+    cliente = AsyncHTTPClient()
+    latencias = {rota: [] for rota in rotas}
+    erros = {rota: 0 for rota in rotas}
+    bytes_recebidos = {rota: 0 for rota in rotas}
+    etags = {}
+    fila = asyncio.Queue()
+    for i in range(requisicoes):
+        fila.put_nowait(rotas[i % len(rotas)])
+
+    async def trabalhador():
+        while not fila.empty():
+            rota = fila.get_nowait()
+            cabecalhos = {"Authorization": f"Bearer {token}"}
+            if usar_etag and rota in etags:
+                cabecalhos["If-None-Match"] = etags[rota]
+            inicio = time.perf_counter()
+            try:
+                resposta = await cliente.fetch(HTTPRequest(url + rota, headers=cabecalhos, decompress_response=gzip,
+                                                           use_gzip=gzip), raise_error=False)
+                if resposta.code not in (200, 304):
+                    erros[rota] += 1
+                    continue
+                if "Etag" in resposta.headers:
+                    etags[rota] = resposta.headers["Etag"]
+                bytes_recebidos[rota] += len(resposta.body or b"")
+            except (ConnectionError, OSError):
+                erros[rota] += 1
+                continue
+            latencias[rota].append((time.perf_counter() - inicio) * 1000)
+
+    inicio_total = time.perf_counter()
+    await asyncio.gather(*(trabalhador() for _ in range(concorrencia)))
+    duracao = time.perf_counter() - inicio_total
+
+    print(f"\n{requisicoes} requisições, concorrência {concorrencia}, gzip={'sim' if gzip else 'não'}, "
+          f"ETag={'sim' if usar_etag else 'não'}: {duracao:.2f}s ({requisicoes / duracao:.0f} req/s)\n")
+    print(f"{'rota':<58} {'ok':>6} {'erros':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'KB/req':>8}")
+    for rota in rotas:
+        amostras = latencias[rota]
+        kb = bytes_recebidos[rota] / 1024 / max(len(amostras), 1)
+        print(f"{rota[:58]:<58} {len(amostras):>6} {erros[rota]:>6} {statistics.median(amostras) if amostras else 0:>8.1f} "
+              f"{_percentil(amostras, 95):>8.1f} {_percentil(amostras, 99):>8.1f} {kb:>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga local do api_server.py.")
+    parser.add_argument("--db", default="hospital_db.sqlite", help="Banco usado pelo servidor iniciado pelo benchmark.")
+    parser.add_argument("--url", help="URL de um servidor já em execução (não inicia subprocesso).")
+    parser.add_argument("--pool", type=int, default=8)
+    parser.add_argument("--requisicoes", type=int, default=2000)
+    parser.add_argument("--concorrencia", type=int, default=50)
+    parser.add_argument("--sem-gzip", action="store_true")
+    parser.add_argument("--etag", action="store_true", help="Reenvia o ETag recebido (If-None-Match).")
+    parser.add_argument("--rota", action="append", help="Rota a testar (pode repetir); padrão: conjunto de rotas típicas.")
+    parser.add_argument("--email", default="admin@hospital.com", help="Funcionário usado no login da API.")
+    parser.add_argument("--senha", default="admin123")
+    args = parser.parse_args()
+
+    servidor = None
+    url = args.url
+    if not url:
+        porta = _porta_livre()
+        url = f"http://127.0.0.1:{porta}"
+        servidor = subprocess.Popen([sys.executable, "api_server.py", "--port", str(porta), "--db", args.db,
+                                     "--pool", str(args.pool)])
+    try:
+        asyncio.run(_aguardar_servidor(url))
+        token = asyncio.run(abrir_sessao(url, args.email, args.senha))
+        asyncio.run(executar_carga(url, args.rota or ROTAS_PADRAO, args.requisicoes, args.concorrencia, token,
+                                   gzip=not args.sem_gzip, usar_etag=args.etag))
+    finally:
+        if servidor:
+            servidor.terminate()
+            servidor.wait()
+
+
+if __name__ == "__main__":
+    main()
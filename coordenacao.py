@@ -0,0 +1,331 @@
+"""
+Coordenação entre processos: vários servidores (Streamlit e API) sobre o mesmo banco SQLite.
+
+Cada processo guarda em memória dados derivados do banco: os principais das sessões (sessoes.py),
+o cache negativo de e-mails do login (autenticacao.py) e o mapa de postos da fragmentação
+(fragmentacao.py). Dentro de um processo eles são descartados pelos avisos do open_crud
+(registrar_ouvinte_funcionario), mas uma escrita feita por outro processo não gera aviso nenhum.
+
+  * Invalidação: o MonitorVersoes lê, a cada INTERVALO_VERIFICACAO segundos, os contadores da
+    VersaoTabela. Eles são mantidos por triggers na mesma transação da escrita, então mudam para
+    todos os processos, sem arquivo ou serviço extra. Quando o contador de uma tabela observada
+    muda, o monitor chama localmente as mesmas invalidações de uma escrita feita no próprio processo.
+    O cache de listagens do app (listar_com_versao) e a réplica de leitura já usam versões e
+    arquivos do banco e não dependem do monitor.
+  * Escritas concorrentes: as funções de escrita do open_crud (e dos módulos de previsão,
+    transferência, vigilância e política de senha) são marcadas com open_crud.repetir_se_ocupado.
+    Quando uma delas falha com "database is locked", a transação inteira é repetida após uma
+    espera exponencial com variação aleatória.
+
+Modo multiprocesso:
+    python coordenacao.py --workers 4 --porta 8501 [--replica 30]
+sobe 4 servidores Streamlit (portas 8501 a 8504) no diretório do app e, com --replica, um único
+processo que renova a réplica de leitura (os servidores só a leem). Na frente deles vai um
+balanceador com afinidade de sessão (ex.: ip_hash no nginx, com o upgrade de websocket), porque a
+sessão do Streamlit e o login ficam na memória do processo que atendeu o navegador. Todos os
+processos precisam estar na mesma máquina: o SQLite depende das travas de arquivo do sistema
+operacional, que não são confiáveis em sistemas de arquivos de rede.
+
+Uso:
+    python coordenacao.py --workers 4
+    python coordenacao.py --estresse --processos 4 --segundos 20
+    python coordenacao.py --estresse --sem-repeticao      # compara com as escritas sem repetição
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import backup
+import fragmentacao
+import open_crud
+
+INTERVALO_VERIFICACAO = 1.0 # segundos entre leituras da VersaoTabela
+# Tabelas cujas alterações mudam os principais das sessões (cargo, lotação, nome do posto e postos
+# visíveis pelo hospital) e, na fragmentação, o mapa posto -> fragmento
+TABELAS_SESSOES = ("Funcionario", "PostoSaude", "Hospital")
+TABELAS_FRAGMENTACAO = ("PostoSaude", "Hospital")
+PORTA_INICIAL = 8501
+
+
+class MonitorVersoes:
+    """Thread de fundo que chama os observadores das tabelas cujo contador na VersaoTabela mudou."""
+
+    def __init__(self, intervalo=INTERVALO_VERIFICACAO):
+        self.intervalo = intervalo
+        self._observadores = {} # tabela -> [funcao]
+        self._versoes = None
+        self._trava = threading.Lock()
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._executar, name="coordenacao", daemon=True)
+
+    def observar(self, tabelas, funcao):
+        """Registra `funcao()`, chamada (uma vez por verificação) quando alguma das `tabelas` mudar."""
+        with self._trava:
+            for tabela in tabelas:
+                self._observadores.setdefault(tabela, []).append(funcao)
+            self._versoes = None # A próxima leitura só registra as versões das tabelas novas
+
+    def verificar(self):
+        """Lê as versões e chama os observadores das tabelas alteradas desde a última leitura; retorna essas tabelas."""
+        with self._trava:
+            tabelas = tuple(self._observadores)
+        if not tabelas:
+            return []
+        resultado = open_crud.get_table_versions(tabelas)
+        if not resultado["success"]:
+            return []
+        versoes = resultado["data"]
+        with self._trava:
+            anteriores, self._versoes = self._versoes, versoes
+            if anteriores is None:
+                return []
+            # Diferente, não só maior: uma restauração de backup pode voltar os contadores
+            alteradas = [tabela for tabela, versao in versoes.items() if versao != anteriores.get(tabela)]
+            funcoes = dict.fromkeys(funcao for tabela in alteradas for funcao in self._observadores[tabela])
+        for funcao in funcoes:
+            funcao()
+        return alteradas
+
+    def iniciar(self):
+        self.verificar() # Versões de referência
+        self._thread.start()
+        return self
+
+    def parar(self):
+        self._parar.set()
+        self._thread.join()
+
+    def _executar(self):
+        while not self._parar.wait(self.intervalo):
+            try:
+                self.verificar()
+            except sqlite3.Error as e: # Banco momentaneamente indisponível: tenta de novo no próximo ciclo
+                print(f"[coordenação] {e}", flush=True)
+
+
+def _recarregar_fragmentacao():
+    if fragmentacao._roteador is not None:
+        fragmentacao._roteador.recarregar()
+
+
+_monitor = None
+_trava_monitor = threading.Lock()
+
+
+def iniciar_monitor(intervalo=INTERVALO_VERIFICACAO):
+    """Inicia (uma vez por processo) o monitor com as invalidações dos caches do projeto."""
+    global _monitor
+    with _trava_monitor:
+        if _monitor is None:
+            monitor = MonitorVersoes(intervalo)
+            monitor.observar(TABELAS_SESSOES, open_crud.notificar_funcionario)
+            monitor.observar(TABELAS_FRAGMENTACAO, _recarregar_fragmentacao)
+            _monitor = monitor.iniciar()
+        return _monitor
+
+
+# --- Modo multiprocesso ---
+
+def executar_workers(workers, porta=PORTA_INICIAL, replica=None, atraso_replica=None):
+    """Sobe `workers` servidores Streamlit (e o renovador da réplica, se `replica` for o intervalo) e espera por eles."""
+    diretorio = os.path.dirname(os.path.abspath(__file__))
+    ambiente = dict(os.environ)
+    processos = []
+    if replica:
+        atraso = atraso_replica or max(120, 4 * replica)
+        ambiente["HOSPITAL_REPLICA"] = f"0,{atraso:g}" # Os servidores só leem a réplica
+        processos.append(subprocess.Popen([sys.executable, "replica_leitura.py", "--servir", "--intervalo", f"{replica:g}"],
+                                          cwd=diretorio, env=ambiente))
+    for numero in range(workers):
+        processos.append(subprocess.Popen(
+            [sys.executable, "-m", "streamlit", "run", "app.py", "--server.port", str(porta + numero), "--server.headless", "true"],
+            cwd=diretorio, env=ambiente,
+        ))
+    print(f"{workers} servidor(es) Streamlit nas portas {porta} a {porta + workers - 1}" + (" e renovador da réplica." if replica else "."), flush=True)
+    try:
+        while all(processo.poll() is None for processo in processos):
+            time.sleep(1)
+        print("Um dos processos terminou; encerrando os demais.", flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for processo in processos:
+            if processo.poll() is None:
+                processo.send_signal(signal.SIGINT)
+        for processo in processos:
+            try:
+                processo.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                processo.kill()
+
+
+# --- Teste de estresse ---
+
+DESCRICAO_ESTRESSE = "Estresse multiprocesso"
+
+
+def _trabalhador_estresse(caminho, indice, ids, inicio_em, segundos, repetir):
+    """Um processo do teste: escritas e leituras misturadas até o fim do tempo; retorna as contagens."""
+    import sessoes
+    open_crud.DATABASE_NAME = caminho
+    if not repetir:
+        open_crud.TENTATIVAS_BANCO_OCUPADO = 1
+    token = sessoes.criar_sessao(ids["funcionario_alvo"])
+    deteccoes = []
+    iniciar_monitor().observar(("Funcionario",), lambda: deteccoes.append(time.time()))
+    aleatorio = random.Random(indice)
+    contagens = {tipo: {"ok": 0, "ocupado": 0, "outras": 0} for tipo in ("atendimento", "entrada", "leitura")}
+    latencias = []
+
+    time.sleep(max(inicio_em - time.time(), 0))
+    fim = inicio_em + segundos
+    while time.time() < fim:
+        sorteio = aleatorio.random()
+        inicio = time.perf_counter()
+        if sorteio < 0.45:
+            tipo = "atendimento"
+            resultado = open_crud.create_atendimento(ids["paciente"], ids["funcionario"], ids["posto"], "Consulta", f"{DESCRICAO_ESTRESSE} {indice}")
+        elif sorteio < 0.7:
+            tipo = "entrada"
+            resultado = open_crud.registrar_movimentacao_estoque(ids["estoque"], "entrada", 1, DESCRICAO_ESTRESSE)
+        else:
+            tipo = "leitura"
+            if sorteio < 0.85:
+                resultado = open_crud.get_all_atendimentos(limit=50)
+            else:
+                resultado = open_crud.get_top_diagnosticos()
+        if tipo != "leitura":
+            latencias.append(time.perf_counter() - inicio)
+        if resultado["success"]:
+            contagens[tipo]["ok"] += 1
+        elif "locked" in resultado.get("message", ""):
+            contagens[tipo]["ocupado"] += 1
+        else:
+            contagens[tipo]["outras"] += 1
+
+    time.sleep(3 * INTERVALO_VERIFICACAO) # Tempo para o monitor ver a última renomeação
+    principal = sessoes.obter_principal(token)
+    return {"contagens": contagens, "latencias": latencias, "deteccoes": deteccoes, "nome_principal": principal.nome if principal else None}
+
+
+@open_crud.repetir_se_ocupado
+def _renomear(id_funcionario, nome):
+    conn = open_crud.get_db_connection()
+    try:
+        conn.execute("UPDATE Funcionario SET nome_funcionario = ? WHERE id_funcionario = ?", (nome, id_funcionario))
+        conn.commit()
+        return {"success": True}
+    except sqlite3.Error as e:
+        return {"success": False, "message": str(e)}
+    finally:
+        conn.close()
+
+
+def _ids_do_estresse(caminho):
+    conn = sqlite3.connect(caminho)
+    try:
+        id_funcionario, id_posto = conn.execute("SELECT id_funcionario, id_posto_lotacao FROM Funcionario ORDER BY id_funcionario LIMIT 1").fetchone()
+        return {
+            "paciente": conn.execute("SELECT MIN(id_paciente) FROM Paciente").fetchone()[0],
+            "funcionario": id_funcionario,
+            "posto": id_posto,
+            "estoque": conn.execute("SELECT MIN(id_estoque) FROM EstoqueMedicamentoPosto").fetchone()[0],
+            "funcionario_alvo": conn.execute("SELECT MAX(id_funcionario) FROM Funcionario").fetchone()[0],
+        }
+    finally:
+        conn.close()
+
+
+def _somar(resultados, tipo, chave):
+    return sum(resultado["contagens"][tipo][chave] for resultado in resultados)
+
+
+def executar_estresse(db, processos=4, segundos=20, repetir=True):
+    """Roda `processos` processos escrevendo e lendo uma cópia de `db` ao mesmo tempo e confere o resultado."""
+    print(f"Banco: {db}; {processos} processos por {segundos}s; escritas {'com' if repetir else 'sem'} repetição quando ocupado.")
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(db))) as temporario:
+        # As escritas do teste vão para uma cópia, nunca para o banco informado
+        caminho = os.path.join(temporario, "estresse.sqlite")
+        backup._copiar(db, caminho, -1, 0)
+        ids = _ids_do_estresse(caminho)
+        conn = sqlite3.connect(caminho)
+        quantidade_inicial = conn.execute("SELECT quantidade_atual FROM EstoqueMedicamentoPosto WHERE id_estoque = ?", (ids["estoque"],)).fetchone()[0]
+        conn.close()
+        open_crud.DATABASE_NAME = caminho
+
+        contexto = multiprocessing.get_context("spawn") # Processos independentes, como servidores separados
+        inicio_em = time.time() + 5 # Tempo para os processos importarem os módulos
+        with contexto.Pool(processos) as pool:
+            pendente = pool.starmap_async(_trabalhador_estresse, [(caminho, indice, ids, inicio_em, segundos, repetir) for indice in range(processos)])
+            # Enquanto isso, outro "processo" renomeia um funcionário de tempos em tempos
+            renomeacoes = []
+            time.sleep(max(inicio_em - time.time(), 0) + 1)
+            while time.time() < inicio_em + segundos - 1:
+                nome = f"Funcionário renomeado {len(renomeacoes) + 1}"
+                pedido = time.time()
+                if _renomear(ids["funcionario_alvo"], nome)["success"]:
+                    renomeacoes.append((pedido, time.time(), nome))
+                time.sleep(2)
+            resultados = pendente.get()
+
+        for tipo, rotulo in (("atendimento", "Atendimentos criados"), ("entrada", "Entradas de estoque"), ("leitura", "Leituras")):
+            print(f"{rotulo}: {_somar(resultados, tipo, 'ok')} ok, {_somar(resultados, tipo, 'ocupado')} falha(s) por banco ocupado, "
+                  f"{_somar(resultados, tipo, 'outras')} outra(s) falha(s)")
+        escritas = _somar(resultados, "atendimento", "ok") + _somar(resultados, "entrada", "ok")
+        print(f"Escritas: {escritas / segundos:.0f}/s; {backup._resumo_latencias([l for r in resultados for l in r['latencias']])}")
+
+        atrasos = []
+        for pedido, gravada, _ in renomeacoes:
+            for resultado in resultados:
+                vistas = [deteccao for deteccao in resultado["deteccoes"] if deteccao >= pedido]
+                if vistas: # Atraso contado a partir da gravação (a escrita pode ter esperado pela trava)
+                    atrasos.append(max(min(vistas) - gravada, 0))
+        esperadas = len(renomeacoes) * processos
+        if atrasos:
+            print(f"Invalidação entre processos: {len(atrasos)}/{esperadas} renomeações percebidas, "
+                  f"atraso médio {sum(atrasos) / len(atrasos):.2f}s, máximo {max(atrasos):.2f}s")
+        nome_final = renomeacoes[-1][2] if renomeacoes else None
+        atualizados = sum(resultado["nome_principal"] == nome_final for resultado in resultados)
+        print(f"Principais das sessões com o nome final: {atualizados}/{processos}")
+
+        # Conferência: cada escrita contada como ok está no banco, e nenhuma a mais
+        conn = sqlite3.connect(caminho)
+        try:
+            atendimentos = conn.execute("SELECT COUNT(*) FROM Atendimento WHERE descricao_sintomas_queixa LIKE ?", (f"{DESCRICAO_ESTRESSE}%",)).fetchone()[0]
+            quantidade = conn.execute("SELECT quantidade_atual FROM EstoqueMedicamentoPosto WHERE id_estoque = ?", (ids["estoque"],)).fetchone()[0]
+            integridade = conn.execute("PRAGMA quick_check").fetchone()[0]
+        finally:
+            conn.close()
+        consistente = atendimentos == _somar(resultados, "atendimento", "ok") and quantidade - quantidade_inicial == _somar(resultados, "entrada", "ok")
+        print(f"Conferência: {atendimentos} atendimentos e +{quantidade - quantidade_inicial} no estoque gravados; "
+              f"{'batem' if consistente else 'NÃO batem'} com as escritas bem-sucedidas; quick_check: {integridade}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Coordenação entre processos: modo multiprocesso e teste de estresse.")
+    parser.add_argument("--db", default=open_crud.DATABASE_NAME, help="Arquivo SQLite do banco de dados (teste de estresse).")
+    parser.add_argument("--workers", type=int, default=2, help="Servidores Streamlit do modo multiprocesso.")
+    parser.add_argument("--porta", type=int, default=PORTA_INICIAL, help="Porta do primeiro servidor (os demais usam as seguintes).")
+    parser.add_argument("--replica", type=float, help="Renova a réplica de leitura a cada REPLICA segundos, em um processo só.")
+    parser.add_argument("--estresse", action="store_true", help="Roda o teste de estresse multiprocesso sobre uma cópia do banco.")
+    parser.add_argument("--processos", type=int, default=4, help="Processos do teste de estresse.")
+    parser.add_argument("--segundos", type=int, default=20, help="Duração do teste de estresse.")
+    parser.add_argument("--sem-repeticao", action="store_true", help="No teste de estresse, não repete as escritas com o banco ocupado.")
+    args = parser.parse_args()
+
+    if args.estresse:
+        executar_estresse(args.db, args.processos, args.segundos, repetir=not args.sem_repeticao)
+    else:
+        executar_workers(args.workers, args.porta, args.replica)
+
+
+if __name__ == "__main__":
+    main()
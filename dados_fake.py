@@ -3,7 +3,7 @@ import hashlib
 from faker import Faker
 from datetime import datetime, timedelta
 import random
-import bcrypt # Importa a biblioteca bcrypt
+import politica_senha # Custo do bcrypt configurável
 
 # Inicializa o Faker para o Brasil
 fake = Faker('pt_BR')
@@ -154,10 +154,9 @@ def create_tables(conn):
 def generate_hashed_password(password):
     """
     Gera um hash bcrypt para a senha.
-    O salt é gerado automaticamente pelo bcrypt.gensalt().
+    O custo vem da política de senhas (politica_senha.py); o salt é gerado pelo bcrypt.gensalt().
     """
-    hashed = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
-    return hashed.decode('utf-8') # Decodifica para string para salvar no banco
+    return politica_senha.hash_senha(password)
 
 def generate_and_insert_data(conn, num_hospitals=3, num_postos_per_hospital=5,
                              num_funcionarios_per_posto=10, num_pacientes_per_posto=30,
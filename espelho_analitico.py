@@ -0,0 +1,478 @@
+"""
+Espelho colunar (Parquet) das tabelas de movimento e motor de relatórios sobre ele.
+
+Atendimento, Prescricao, DistribuicaoMedicamento e DistribuicaoLote (lotes de cada distribuição)
+são copiadas para arquivos Parquet em um diretório ao lado do banco (<banco>_analitico/). A cópia
+é atualizada de forma incremental pelo log de alterações do open_crud (LogAlteracao): só as
+linhas alteradas desde o último `seq` são lidas do SQLite. Cada tabela fica em partes de até
+LINHAS_POR_PARTE linhas: inserções viram partes novas, e atualizações/exclusões reescrevem só as
+partes que guardam as versões antigas das linhas (localizadas pelas estatísticas de mínimo e máximo
+da chave em cada row group), com as versões atuais indo para uma parte nova; partes pequenas são
+juntadas quando passam de MAXIMO_PARTES. Uma trava de arquivo (<diretório>.lock) serializa as
+atualizações e as leituras das partes entre processos. O espelho registra no log até onde leu, para
+a manutenção poder podar o que ele já processou. Os relatórios são calculados com pyarrow.compute
+sobre as tabelas em memória, sem disputar o arquivo SQLite com as escritas do dia a dia; só as
+tabelas pequenas de nomes (postos, medicamentos, lotes) são lidas do SQLite.
+
+Para os relatórios do open_crud passarem a usar o espelho:
+
+    import espelho_analitico
+    espelho_analitico.ativar()
+
+Uso:
+    python espelho_analitico.py --db hospital_db.sqlite              # cria/atualiza o espelho
+    python espelho_analitico.py --db hospital_db.sqlite --benchmark  # compara SQLite x colunar
+"""
+import argparse
+import bisect
+import contextlib
+import glob
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+    import msvcrt
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+import fragmentacao
+import open_crud
+
+TABELAS_ESPELHADAS = ("Atendimento", "Prescricao", "DistribuicaoMedicamento", "DistribuicaoLote")
+# Coluna de data usada nos filtros de período de cada tabela (guardada também como "_dia", AAAA-MM-DD)
+COLUNAS_DATA = {
+    "Atendimento": "data_hora_inicio_atendimento",
+    "Prescricao": "data_hora_prescricao",
+    "DistribuicaoMedicamento": "data_hora_distribuicao",
+}
+CONSUMIDOR_LOG = "espelho_analitico" # Nome no registro de consumidores do log (ConsumidorLog)
+INTERVALO_REGISTRO_LOG = 600 # Segundos entre registros da posição (a poda preserva sempre as últimas horas do log)
+INTERVALO_ATUALIZACAO = 2.0 # Segundos entre verificações do log ao atender relatórios
+LINHAS_POR_LOTE = 50000
+LINHAS_POR_PARTE = 250000 # Uma atualização ou exclusão reescreve no máximo as partes com as linhas alteradas
+MAXIMO_PARTES = 20 # Partes pequenas (das inserções) acima disso são juntadas em partes de LINHAS_POR_PARTE
+
+_TIPOS_ARROW = {"INTEGER": pa.int64(), "REAL": pa.float64()}
+
+_trava = threading.Lock()
+_cache = {"diretorio": None, "versao": None, "tabelas": {}, "verificado_em": 0.0}
+_registro_log = {} # banco -> (seq registrado em ConsumidorLog, instante do registro)
+
+
+def diretorio_espelho():
+    return os.path.splitext(os.path.abspath(open_crud.DATABASE_NAME))[0] + "_analitico"
+
+
+def _esquema(conn, tabela):
+    colunas = conn.execute(f"PRAGMA table_info({tabela})").fetchall()
+    chave = next(coluna[1] for coluna in colunas if coluna[5])
+    campos = [pa.field(coluna[1], _TIPOS_ARROW.get(coluna[2].upper(), pa.string())) for coluna in colunas]
+    return pa.schema(campos), chave
+
+
+def _lotes_arrow(cursor, esquema):
+    """Converte o resultado de um cursor em RecordBatches, LINHAS_POR_LOTE linhas por vez."""
+    while True:
+        linhas = cursor.fetchmany(LINHAS_POR_LOTE)
+        if not linhas:
+            return
+        colunas = list(zip(*linhas))
+        yield pa.record_batch([pa.array(valores, type=campo.type) for valores, campo in zip(colunas, esquema)], schema=esquema)
+
+
+@contextlib.contextmanager
+def _trava_processos(diretorio, compartilhada=False):
+    """Trava entre processos sobre o espelho, no arquivo <diretório>.lock (fora do diretório, que a cópia completa recria).
+
+    Atualizações pedem a trava exclusiva; a leitura das partes, a compartilhada (no Windows, exclusiva também).
+    """
+    with open(diretorio + ".lock", "a+b") as arquivo:
+        if fcntl:
+            fcntl.flock(arquivo, fcntl.LOCK_SH if compartilhada else fcntl.LOCK_EX)
+        else:
+            arquivo.seek(0)
+            msvcrt.locking(arquivo.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(arquivo, fcntl.LOCK_UN)
+            else:
+                arquivo.seek(0)
+                msvcrt.locking(arquivo.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _partes(diretorio, tabela):
+    return sorted(glob.glob(os.path.join(diretorio, tabela, "parte-*.parquet")))
+
+
+def _proximo_numero(partes):
+    return int(os.path.basename(partes[-1])[6:11]) + 1 if partes else 0
+
+
+def _caminho_parte(diretorio, tabela, numero):
+    os.makedirs(os.path.join(diretorio, tabela), exist_ok=True)
+    return os.path.join(diretorio, tabela, f"parte-{numero:05d}.parquet")
+
+
+def _gravar_parte(caminho, esquema, lotes):
+    """Grava os lotes em `caminho` (arquivo temporário + rename, para leitores nunca verem arquivo pela metade)."""
+    with pq.ParquetWriter(caminho + ".tmp", esquema) as escritor:
+        for lote in lotes:
+            escritor.write_batch(lote)
+    os.replace(caminho + ".tmp", caminho)
+
+
+def _gravar_partes(diretorio, tabela, esquema, lotes, numero):
+    """Grava os lotes em partes novas de cerca de LINHAS_POR_PARTE linhas a partir de `numero` (ao menos uma)."""
+    pendentes, linhas, inicial = [], 0, numero
+    for lote in lotes:
+        pendentes.append(lote)
+        linhas += lote.num_rows
+        if linhas >= LINHAS_POR_PARTE:
+            _gravar_parte(_caminho_parte(diretorio, tabela, numero), esquema, pendentes)
+            pendentes, linhas, numero = [], 0, numero + 1
+    if pendentes or numero == inicial:
+        _gravar_parte(_caminho_parte(diretorio, tabela, numero), esquema, pendentes)
+
+
+def _pode_ter_ids(metadados, chave, ids):
+    """False se as estatísticas da chave garantem que nenhum row group da parte tem um dos `ids` (ordenados)."""
+    coluna = metadados.schema.to_arrow_schema().get_field_index(chave)
+    for indice in range(metadados.num_row_groups):
+        estatisticas = metadados.row_group(indice).column(coluna).statistics
+        if estatisticas is None or not estatisticas.has_min_max:
+            return True
+        posicao = bisect.bisect_left(ids, estatisticas.min)
+        if posicao < len(ids) and ids[posicao] <= estatisticas.max:
+            return True
+    return False
+
+
+def _remover_ids(partes, esquema, chave, ids):
+    """Tira os `ids` das partes que os guardam, reescrevendo só essas (ou apagando as que ficam vazias)."""
+    valores = pa.array(ids, pa.int64())
+    for caminho in partes:
+        if not _pode_ter_ids(pq.ParquetFile(caminho).metadata, chave, ids):
+            continue
+        parte = pq.read_table(caminho, schema=esquema)
+        mascara = pc.is_in(parte[chave], value_set=valores)
+        if not pc.any(mascara).as_py():
+            continue
+        mantidas = parte.filter(pc.invert(mascara))
+        if mantidas.num_rows:
+            _gravar_parte(caminho, esquema, mantidas.to_batches(LINHAS_POR_LOTE))
+        else:
+            os.remove(caminho)
+
+
+def _compactar(diretorio, tabela, esquema):
+    """Junta as partes com menos de meia LINHAS_POR_PARTE em partes de LINHAS_POR_PARTE quando passam de MAXIMO_PARTES."""
+    partes = _partes(diretorio, tabela)
+    pequenas = [caminho for caminho in partes if pq.ParquetFile(caminho).metadata.num_rows < LINHAS_POR_PARTE // 2]
+    if len(pequenas) < MAXIMO_PARTES:
+        return
+    juntas = pq.read_table(pequenas, schema=esquema)
+    _gravar_partes(diretorio, tabela, esquema, juntas.to_batches(LINHAS_POR_LOTE), _proximo_numero(partes))
+    for caminho in pequenas:
+        os.remove(caminho)
+
+
+def _ler_estado(diretorio):
+    try:
+        with open(os.path.join(diretorio, "estado.json"), encoding="utf-8") as arquivo:
+            return json.load(arquivo)
+    except (OSError, ValueError):
+        return None
+
+
+def _gravar_estado(diretorio, seq, versao):
+    """`seq` é a posição no log; `versao` só muda quando o conteúdo do espelho muda."""
+    caminho = os.path.join(diretorio, "estado.json")
+    with open(caminho + ".tmp", "w", encoding="utf-8") as arquivo:
+        json.dump({"seq": seq, "versao": versao, "banco": os.path.abspath(open_crud.DATABASE_NAME)}, arquivo)
+    os.replace(caminho + ".tmp", caminho)
+
+
+def descartar_estado():
+    """Esquece a posição do log salva no espelho do banco atual; a próxima atualização copia tudo de novo."""
+    diretorio = diretorio_espelho()
+    if not os.path.isdir(diretorio):
+        return
+    with _trava_processos(diretorio):
+        caminho = os.path.join(diretorio, "estado.json")
+        if os.path.exists(caminho):
+            os.remove(caminho)
+
+
+def _log_tem_lacuna(conn, seq):
+    """True se alterações após `seq` já foram removidas do log (delete_alteracoes_ate), exigindo cópia completa."""
+    menor = conn.execute("SELECT MIN(seq) FROM LogAlteracao").fetchone()[0]
+    if menor is not None:
+        return menor > seq + 1
+    maior = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'LogAlteracao'").fetchone()
+    return bool(maior and maior[0] > seq)
+
+
+def _copiar_tudo(conn, diretorio):
+    shutil.rmtree(diretorio, ignore_errors=True)
+    for tabela in TABELAS_ESPELHADAS:
+        esquema, _ = _esquema(conn, tabela)
+        _gravar_partes(diretorio, tabela, esquema, _lotes_arrow(conn.execute(f"SELECT * FROM {tabela}"), esquema), 0)
+
+
+def _aplicar_alteracoes(conn, diretorio, seq, ate_seq):
+    """Aplica ao espelho as alterações do log com seq em (seq, ate_seq]; retorna True se alguma tabela mudou."""
+    marcadores = ", ".join("?" * len(TABELAS_ESPELHADAS))
+    alteracoes = conn.execute(
+        f"SELECT tabela, operacao, id_registro FROM LogAlteracao WHERE seq > ? AND seq <= ? AND tabela IN ({marcadores})",
+        (seq, ate_seq, *TABELAS_ESPELHADAS)
+    ).fetchall()
+    for tabela in TABELAS_ESPELHADAS:
+        ids = {row[2] for row in alteracoes if row[0] == tabela}
+        if not ids:
+            continue
+        esquema, chave = _esquema(conn, tabela)
+        ids = sorted(ids)
+        novas = pa.Table.from_batches(list(_lotes_arrow(conn.execute(
+            f"SELECT * FROM {tabela} WHERE {chave} IN (SELECT value FROM json_each(?))", (json.dumps(ids),)
+        ), esquema)), schema=esquema)
+        partes = _partes(diretorio, tabela)
+        if any(row[1] != "INSERT" for row in alteracoes if row[0] == tabela):
+            # Versões antigas das linhas atualizadas ou excluídas saem só das partes que as guardam
+            _remover_ids(partes, esquema, chave, ids)
+        if novas.num_rows or not _partes(diretorio, tabela):
+            _gravar_partes(diretorio, tabela, esquema, novas.to_batches(LINHAS_POR_LOTE), _proximo_numero(partes))
+        _compactar(diretorio, tabela, esquema)
+    return bool(alteracoes)
+
+
+def atualizar_espelho(completo=False):
+    """Cria o espelho ou aplica as alterações pendentes do log; retorna {"seq", "versao"} do espelho."""
+    if fragmentacao.consultas_no_catalogo():
+        return {"success": False, "message": fragmentacao.MENSAGEM_SO_BANCO_UNICO}
+    resultado = _atualizar(completo)
+    if resultado["success"]:
+        _registrar_posicao(resultado["data"]["seq"])
+    return resultado
+
+
+def _registrar_posicao(seq):
+    """Informa ao log até onde o espelho leu (no máximo a cada INTERVALO_REGISTRO_LOG), liberando a poda do que veio antes."""
+    banco = os.path.abspath(open_crud.DATABASE_NAME)
+    anterior = _registro_log.get(banco)
+    if anterior and (anterior[0] == seq or time.monotonic() - anterior[1] < INTERVALO_REGISTRO_LOG):
+        return
+    if open_crud.registrar_posicao_log(CONSUMIDOR_LOG, seq)["success"]:
+        _registro_log[banco] = (seq, time.monotonic())
+
+
+def _atualizar(completo):
+    diretorio = diretorio_espelho()
+    conn = open_crud.get_db_connection()
+    try:
+        with _trava_processos(diretorio): # Um processo por vez atualiza o espelho
+            return _atualizar_travado(conn, diretorio, completo)
+    except (sqlite3.Error, OSError, pa.ArrowException) as e:
+        return {"success": False, "message": f"Erro ao atualizar o espelho colunar: {e}"}
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+def _atualizar_travado(conn, diretorio, completo):
+    """Corpo de _atualizar, já com a trava exclusiva do espelho."""
+    conn.execute("BEGIN") # Log e linhas lidos do mesmo instante do banco
+    ate_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM LogAlteracao").fetchone()[0]
+    estado = _ler_estado(diretorio)
+    valido = estado and estado.get("banco") == os.path.abspath(open_crud.DATABASE_NAME)
+    versao = estado.get("versao", 0) if estado else 0
+    incompleto = valido and not all(_partes(diretorio, tabela) for tabela in TABELAS_ESPELHADAS) # Tabela nova no espelho
+    if completo or not valido or incompleto or _log_tem_lacuna(conn, estado["seq"]):
+        _copiar_tudo(conn, diretorio)
+        versao += 1
+        mensagem = "Espelho colunar criado."
+    elif ate_seq > estado["seq"]:
+        if _aplicar_alteracoes(conn, diretorio, estado["seq"], ate_seq):
+            versao += 1
+        mensagem = f"{ate_seq - estado['seq']} alteração(ões) do log lida(s) para o espelho."
+    else:
+        return {"success": True, "message": "Espelho colunar já está atualizado.", "data": {"seq": ate_seq, "versao": versao}}
+    _gravar_estado(diretorio, ate_seq, versao)
+    return {"success": True, "message": mensagem, "data": {"seq": ate_seq, "versao": versao}}
+
+
+def _tabelas():
+    """Tabelas do espelho em memória (com a coluna _dia), atualizando-as no máximo a cada INTERVALO_ATUALIZACAO."""
+    with _trava:
+        diretorio = diretorio_espelho()
+        if _cache["diretorio"] == diretorio and time.monotonic() - _cache["verificado_em"] < INTERVALO_ATUALIZACAO:
+            return _cache["versao"], _cache["tabelas"]
+        resultado = atualizar_espelho()
+        if not resultado["success"]:
+            raise RuntimeError(resultado["message"])
+        if _cache["diretorio"] != diretorio or _cache["versao"] != resultado["data"]["versao"]:
+            tabelas = {}
+            with _trava_processos(diretorio, compartilhada=True): # Outro processo não troca as partes no meio da leitura
+                versao = (_ler_estado(diretorio) or resultado["data"])["versao"]
+                for tabela in TABELAS_ESPELHADAS:
+                    dados = pq.read_table(_partes(diretorio, tabela))
+                    if tabela in COLUNAS_DATA:
+                        dados = dados.append_column("_dia", pc.utf8_slice_codeunits(dados[COLUNAS_DATA[tabela]], 0, 10))
+                    tabelas[tabela] = dados
+            _cache.update(diretorio=diretorio, versao=versao, tabelas=tabelas)
+        _cache["verificado_em"] = time.monotonic()
+        return _cache["versao"], _cache["tabelas"]
+
+
+def _no_periodo(tabela, start_date, end_date):
+    mascara = pc.is_valid(tabela["_dia"])
+    if start_date:
+        mascara = pc.and_(mascara, pc.greater_equal(tabela["_dia"], str(start_date)))
+    if end_date:
+        mascara = pc.and_(mascara, pc.less_equal(tabela["_dia"], str(end_date)))
+    return tabela.filter(mascara)
+
+
+def _contagem(tabela, coluna):
+    """Tabela (coluna, total) ordenada do maior para o menor total."""
+    agrupado = tabela.group_by(coluna).aggregate([([], "count_all")])
+    return pa.table({coluna: agrupado[coluna], "total": agrupado["count_all"]}).sort_by([("total", "descending")])
+
+
+def _dimensao(conn, query, esquema):
+    """Lê uma tabela pequena (nomes de postos, medicamentos...) do SQLite para juntar ao espelho."""
+    return pa.Table.from_pylist([dict(row) for row in conn.execute(query)], schema=esquema)
+
+
+def _executar(nome_relatorio, if_version, calcular, tabelas_dimensao=()):
+    """Roda `calcular(tabelas, conn)` sobre o espelho; a versão combina a do espelho com a das dimensões."""
+    try:
+        versao_espelho, tabelas = _tabelas()
+    except RuntimeError as e:
+        return {"success": False, "message": str(e)}
+    conn = open_crud.get_db_connection()
+    try:
+        versoes = conn.execute(
+            f"SELECT COALESCE(SUM(versao), 0) FROM VersaoTabela WHERE tabela IN ({', '.join('?' * len(tabelas_dimensao))})",
+            tabelas_dimensao
+        ).fetchone()[0]
+        versao = versao_espelho * 1000000 + versoes
+        if versao == if_version:
+            return {"success": True, "not_modified": True, "version": versao}
+        return {"success": True, "data": calcular(tabelas, conn).to_pylist(), "version": versao}
+    except (sqlite3.Error, pa.ArrowException) as e:
+        return {"success": False, "message": f"Erro ao calcular {nome_relatorio} no espelho colunar: {e}"}
+    finally:
+        conn.close()
+
+
+# --- Relatórios (mesma assinatura e formato de resposta das funções do open_crud) ---
+
+def get_atendimentos_by_type(start_date=None, end_date=None, if_version=None):
+    def calcular(tabelas, conn):
+        return _contagem(_no_periodo(tabelas["Atendimento"], start_date, end_date), "tipo_atendimento")
+    return _executar("atendimentos por tipo", if_version, calcular)
+
+
+def get_atendimentos_by_posto(start_date=None, end_date=None, if_version=None):
+    def calcular(tabelas, conn):
+        postos = _dimensao(conn, "SELECT id_posto AS id_posto_atendimento, nome_posto FROM PostoSaude",
+                           pa.schema([("id_posto_atendimento", pa.int64()), ("nome_posto", pa.string())]))
+        atendimentos = _no_periodo(tabelas["Atendimento"], start_date, end_date).select(["id_posto_atendimento"])
+        return _contagem(atendimentos.join(postos, "id_posto_atendimento"), "nome_posto")
+    return _executar("atendimentos por posto", if_version, calcular, ("PostoSaude",))
+
+
+def get_top_diagnosticos(start_date=None, end_date=None, limit=10, if_version=None):
+    def calcular(tabelas, conn):
+        atendimentos = _no_periodo(tabelas["Atendimento"], start_date, end_date)
+        atendimentos = atendimentos.filter(pc.and_(pc.is_valid(atendimentos["cid10"]), pc.not_equal(atendimentos["cid10"], "")))
+        return _contagem(atendimentos, "cid10").slice(0, limit)
+    return _executar("diagnósticos mais comuns", if_version, calcular)
+
+
+def get_top_distribui_medicamentos(start_date=None, end_date=None, limit=10, if_version=None):
+    def calcular(tabelas, conn):
+        lotes = _dimensao(conn, """SELECT emp.id_estoque, m.nome_comercial_medicamento
+            FROM EstoqueMedicamentoPosto emp JOIN Medicamento m ON emp.id_medicamento = m.id_medicamento""",
+            pa.schema([("id_estoque", pa.int64()), ("nome_comercial_medicamento", pa.string())]))
+        distribuicoes = _no_periodo(tabelas["DistribuicaoMedicamento"], start_date, end_date).select(
+            ["id_distribuicao", "id_prescricao", "quantidade_distribuida"])
+        # Quantidade por lote de onde saiu cada distribuição; sem registro em DistribuicaoLote, o lote da prescrição
+        por_lote = distribuicoes.join(tabelas["DistribuicaoLote"].select(["id_distribuicao", "id_estoque", "quantidade"]),
+                                      "id_distribuicao", join_type="inner").select(["id_estoque", "quantidade"])
+        sem_lote = distribuicoes.join(tabelas["DistribuicaoLote"].select(["id_distribuicao"]), "id_distribuicao", join_type="left anti")
+        sem_lote = sem_lote.join(tabelas["Prescricao"].select(["id_prescricao", "id_medicamento_estoque"]), "id_prescricao")
+        sem_lote = pa.table({"id_estoque": sem_lote["id_medicamento_estoque"], "quantidade": sem_lote["quantidade_distribuida"]})
+        combinado = pa.concat_tables([por_lote, sem_lote.cast(por_lote.schema)]).join(lotes, "id_estoque")
+        agrupado = combinado.group_by("nome_comercial_medicamento").aggregate([("quantidade", "sum")])
+        agrupado = pa.table({"nome_comercial_medicamento": agrupado["nome_comercial_medicamento"],
+                             "total_distribuido": agrupado["quantidade_sum"]})
+        return agrupado.sort_by([("total_distribuido", "descending")]).slice(0, limit)
+    return _executar("medicamentos mais distribuídos", if_version, calcular, ("EstoqueMedicamentoPosto", "Medicamento"))
+
+
+RELATORIOS = {
+    "get_atendimentos_by_type": get_atendimentos_by_type,
+    "get_atendimentos_by_posto": get_atendimentos_by_posto,
+    "get_top_diagnosticos": get_top_diagnosticos,
+    "get_top_distribui_medicamentos": get_top_distribui_medicamentos,
+}
+
+
+def ativar():
+    """Passa os relatórios do open_crud cobertos pelo espelho a usar o motor colunar."""
+    open_crud.configurar_motor_relatorios(RELATORIOS)
+
+
+def desativar():
+    open_crud.configurar_motor_relatorios(None)
+
+
+def _comparar(repeticoes):
+    """Mede cada relatório no SQLite e no espelho e confere se os resultados coincidem."""
+    print(f"{'relatório':<34} {'SQLite ms':>10} {'colunar ms':>11}  resultado")
+    for nome, funcao_colunar in RELATORIOS.items():
+        tempos = {}
+        for motor in ("sqlite", "colunar"):
+            ativar() if motor == "colunar" else desativar()
+            funcao = getattr(open_crud, nome)
+            funcao() # Aquece caches (e o espelho em memória)
+            inicio = time.perf_counter()
+            for _ in range(repeticoes):
+                resultado = funcao()
+            tempos[motor] = ((time.perf_counter() - inicio) / repeticoes * 1000, resultado)
+        desativar()
+        chave = lambda r: sorted(tuple(d.values()) for d in r.get("data", []))
+        igual = tempos["sqlite"][1]["success"] and chave(tempos["sqlite"][1]) == chave(tempos["colunar"][1])
+        print(f"{nome:<34} {tempos['sqlite'][0]:>10.1f} {tempos['colunar'][0]:>11.1f}  {'igual' if igual else 'DIFERENTE'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cria/atualiza o espelho colunar (Parquet) usado pelos relatórios.")
+    parser.add_argument("--db", default=open_crud.DATABASE_NAME, help="Arquivo SQLite do banco de dados.")
+    parser.add_argument("--completo", action="store_true", help="Descarta o espelho e copia tudo de novo.")
+    parser.add_argument("--benchmark", action="store_true", help="Compara o tempo dos relatórios no SQLite e no espelho.")
+    parser.add_argument("--repeticoes", type=int, default=5)
+    args = parser.parse_args()
+
+    open_crud.DATABASE_NAME = args.db
+    inicio = time.perf_counter()
+    resultado = atualizar_espelho(completo=args.completo)
+    print(f"{resultado['message']} ({time.perf_counter() - inicio:.2f}s, diretório {diretorio_espelho()})")
+    if resultado["success"] and args.benchmark:
+        _comparar(args.repeticoes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1120 @@
+"""
+Fragmentação do banco por hospital (ou por posto), com roteamento transparente no open_crud.
+
+Com um único arquivo SQLite, todas as escritas de todos os postos disputam a mesma trava. Aqui os
+dados operacionais (estoque e seu livro, atendimentos, prescrições e distribuições) são divididos
+em fragmentos, um arquivo por hospital (padrão) ou por posto, e as escritas de postos em
+fragmentos diferentes não competem entre si.
+
+  * O catálogo (catalogo.sqlite) guarda as tabelas globais (Hospital, PostoSaude, Medicamento,
+    Funcionario e Paciente), o mapa posto -> fragmento e as tabelas dos demais módulos. As tabelas
+    globais são replicadas nos fragmentos, então os JOINs do open_crud não mudam. Cada escrita global
+    deixa uma réplica pendente registrada no próprio catálogo (na mesma transação), refeita até chegar
+    a todos os fragmentos; pacientes novos só são copiados para um fragmento no primeiro atendimento lá.
+  * ativar(diretorio) troca as funções públicas do open_crud por versões roteadas: cadastros e
+    buscas por ID vão para o fragmento do posto (ou do registro), e listagens e relatórios sem
+    posto definido consultam em paralelo só os fragmentos visíveis no escopo e juntam os resultados.
+  * Os IDs novos de cada fragmento começam em numero * PASSO_ID, então o fragmento de um registro
+    sai do próprio ID; IDs anteriores à fragmentação são localizados uma vez e guardados em cache.
+
+O log de alterações (get_alteracoes/changes_since), o motor de relatórios colunar e os módulos de
+análise que leem o banco direto (previsao_estoque, transferencia_estoque, vigilancia_epidemiologica,
+espelho_analitico) não estão disponíveis no modo fragmentado: eles recusam a execução em vez de ler o
+catálogo, onde as tabelas fragmentadas estão vazias.
+
+Uso:
+    python fragmentacao.py --db hospital_db.sqlite --destino fragmentos --por hospital
+    HOSPITAL_FRAGMENTOS=fragmentos streamlit run app.py
+    python api_server.py --fragmentos fragmentos
+    python fragmentacao.py --benchmark --escritas 200 --por posto
+"""
+import argparse
+import contextvars
+import functools
+import inspect
+import multiprocessing
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+import open_crud
+
+ARQUIVO_CATALOGO = "catalogo.sqlite"
+VARIAVEL_AMBIENTE = "HOSPITAL_FRAGMENTOS"
+PASSO_ID = 10 ** 12 # IDs novos do fragmento N começam em N * PASSO_ID
+WORKERS_FRAGMENTOS = 8
+MAX_IDS_EM_CACHE = 100000
+
+# Tabelas globais: inteiras no catálogo e replicadas em todos os fragmentos (tabela -> chave)
+TABELAS_CATALOGO = {
+    "Hospital": "id_hospital",
+    "PostoSaude": "id_posto",
+    "Medicamento": "id_medicamento",
+    "Funcionario": "id_funcionario",
+    "Paciente": "id_paciente",
+}
+# Tabelas divididas entre os fragmentos, na ordem de cópia, com o filtro das linhas de cada
+# fragmento ("main" é o fragmento em construção): prescrições acompanham o atendimento,
+# distribuições acompanham a prescrição e os lotes de cada distribuição acompanham a distribuição
+FILTROS_FRAGMENTO = {
+    "EstoqueMedicamentoPosto": "id_posto IN ({postos})",
+    "Atendimento": "id_posto_atendimento IN ({postos})",
+    "Prescricao": "id_atendimento IN (SELECT id_atendimento FROM main.Atendimento)",
+    "DistribuicaoMedicamento": "id_prescricao IN (SELECT id_prescricao FROM main.Prescricao)",
+    "DistribuicaoLote": "id_distribuicao IN (SELECT id_distribuicao FROM main.DistribuicaoMedicamento)",
+    "MovimentacaoEstoque": "id_posto IN ({postos})",
+    "SnapshotEstoqueItem": "id_posto IN ({postos})",
+    "AlertaEstoque": "id_posto IN ({postos})",
+}
+# Tabelas auxiliares do open_crud copiadas inteiras em cada fragmento
+TABELAS_AUXILIARES_REPLICADAS = ("VersaoTabela", "SnapshotEstoque", "ConfiguracaoAlerta")
+# Tabelas que não são copiadas (o log de alterações e seus consumidores recomeçam vazios em cada arquivo)
+TABELAS_SEM_COPIA = ("LogAlteracao", "ConsumidorLog")
+# Tabelas globais copiadas para um fragmento só quando um registro dele passa a referenciar a linha
+# (um paciente novo é gravado no catálogo e só vai ao fragmento no primeiro atendimento lá)
+TABELAS_SOB_DEMANDA = ("Paciente",)
+# Tabelas só do catálogo
+TABELAS_SO_CATALOGO = ("MapaFragmento", "ConfiguracaoFragmentacao", "ReplicaPendente")
+PREFIXO_TRIGGER_REPLICA = "trg_replica_" # Triggers do catálogo que registram as réplicas pendentes
+# Chave das tabelas fragmentadas cujo ID indica o fragmento
+CHAVES_FRAGMENTADAS = {
+    "EstoqueMedicamentoPosto": "id_estoque",
+    "Atendimento": "id_atendimento",
+    "Prescricao": "id_prescricao",
+    "DistribuicaoMedicamento": "id_distribuicao",
+    "MovimentacaoEstoque": "id_movimentacao",
+    "DistribuicaoLote": "id_distribuicao_lote",
+}
+
+MENSAGEM_OUTRO_FRAGMENTO = "Os registros informados pertencem a fragmentos diferentes (postos de hospitais distintos)."
+MENSAGEM_INDISPONIVEL = "O log de alterações não está disponível no modo fragmentado."
+MENSAGEM_SO_BANCO_UNICO = "Indisponível no modo fragmentado: atendimentos, prescrições e estoque ficam nos fragmentos, não no catálogo."
+
+
+def caminho_fragmento(diretorio, numero):
+    return os.path.join(diretorio, f"fragmento_{numero:03d}.sqlite")
+
+
+# --- Criação dos Fragmentos ---
+
+def _copiar_banco(origem, destino, postos=None, numero=None):
+    """Cria `destino` com o esquema de `origem` e copia as linhas.
+
+    postos=None monta o catálogo (tudo, menos as tabelas fragmentadas, que ficam vazias); com postos
+    monta um fragmento (tabelas globais e auxiliares inteiras, fragmentadas só desses postos, demais
+    vazias) e posiciona as sequências AUTOINCREMENT das fragmentadas em numero * PASSO_ID.
+    Índices e triggers são criados depois da carga, para não dispararem na cópia.
+    """
+    conn = sqlite3.connect(destino)
+    try:
+        conn.execute("ATTACH DATABASE ? AS origem", (origem,))
+        objetos = conn.execute(
+            "SELECT type, name, tbl_name, sql FROM origem.sqlite_master WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%' ORDER BY rowid"
+        ).fetchall()
+        tabelas = [nome for tipo, nome, _, _ in objetos if tipo == "table" and nome not in TABELAS_SO_CATALOGO]
+        ordem = [t for t in FILTROS_FRAGMENTO if t in tabelas] + [t for t in tabelas if t not in FILTROS_FRAGMENTO]
+        lista_postos = ", ".join(str(int(p)) for p in postos or ()) or "NULL"
+        for tipo, nome, _, sql in objetos:
+            if tipo == "table" and nome in tabelas:
+                conn.execute(sql)
+        for tabela in ordem:
+            if tabela in TABELAS_SEM_COPIA:
+                continue
+            if tabela in FILTROS_FRAGMENTO:
+                if postos is None:
+                    continue
+                filtro = FILTROS_FRAGMENTO[tabela].format(postos=lista_postos)
+            elif postos is None or tabela in TABELAS_CATALOGO or tabela in TABELAS_AUXILIARES_REPLICADAS:
+                filtro = "1"
+            else:
+                continue # Tabelas dos demais módulos ficam só no catálogo
+            conn.execute(f'INSERT INTO main."{tabela}" SELECT * FROM origem."{tabela}" WHERE {filtro}')
+        # A sqlite_sequence existe nos dois bancos quando há tabelas AUTOINCREMENT (todas as do open_crud são)
+        if conn.execute("SELECT 1 FROM origem.sqlite_master WHERE name = 'sqlite_sequence'").fetchone():
+            conn.execute("INSERT INTO main.sqlite_sequence (name, seq) SELECT name, seq FROM origem.sqlite_sequence")
+        if numero is not None:
+            for tabela in CHAVES_FRAGMENTADAS:
+                semente = numero * PASSO_ID
+                if conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?", (semente, tabela)).rowcount == 0:
+                    conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (tabela, semente))
+        for tipo, nome, tabela, sql in objetos:
+            if tipo != "table" and tabela in tabelas and not nome.startswith(PREFIXO_TRIGGER_REPLICA):
+                conn.execute(sql)
+        conn.commit()
+        conn.execute("DETACH DATABASE origem")
+    finally:
+        conn.close()
+
+
+def _criar_tabelas_catalogo(conn):
+    conn.execute("""CREATE TABLE IF NOT EXISTS MapaFragmento (
+        id_posto INTEGER PRIMARY KEY,
+        id_hospital INTEGER,
+        numero_fragmento INTEGER NOT NULL
+    )""")
+    conn.execute("""CREATE TABLE IF NOT EXISTS ConfiguracaoFragmentacao (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        modo TEXT NOT NULL
+    )""")
+    conn.execute("""CREATE TABLE IF NOT EXISTS ReplicaPendente (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        tabela TEXT NOT NULL,
+        id_registro INTEGER NOT NULL
+    )""")
+    _criar_triggers_replica(conn)
+
+
+def fragmentar(origem, destino, por="hospital"):
+    """Divide o banco `origem` em um catálogo e um fragmento por hospital (ou por posto) no diretório `destino`."""
+    if por not in ("hospital", "posto"):
+        return {"success": False, "message": "Use por='hospital' ou por='posto'."}
+    if not os.path.exists(origem):
+        return {"success": False, "message": f"Banco de origem não encontrado: {origem}"}
+    catalogo = os.path.join(destino, ARQUIVO_CATALOGO)
+    if os.path.exists(catalogo):
+        return {"success": False, "message": f"O diretório {destino} já contém um banco fragmentado."}
+    os.makedirs(destino, exist_ok=True)
+
+    # Garante que a origem já tem as tabelas auxiliares do open_crud (livro de estoque, alertas...)
+    with open_crud.usando_banco(origem):
+        open_crud.get_db_connection().close()
+    conn = sqlite3.connect(origem)
+    try:
+        postos = conn.execute("SELECT id_posto, id_hospital_vinculado FROM PostoSaude ORDER BY id_posto").fetchall()
+        cruzadas = conn.execute(
+            """SELECT a.id_posto_atendimento, emp.id_posto, COUNT(*)
+               FROM Prescricao pr
+               JOIN Atendimento a ON pr.id_atendimento = a.id_atendimento
+               JOIN EstoqueMedicamentoPosto emp ON pr.id_medicamento_estoque = emp.id_estoque
+               WHERE a.id_posto_atendimento != emp.id_posto
+               GROUP BY a.id_posto_atendimento, emp.id_posto"""
+        ).fetchall()
+    finally:
+        conn.close()
+
+    numeros = {}
+    mapa = {}
+    for id_posto, id_hospital in postos:
+        chave = id_hospital if por == "hospital" else id_posto
+        mapa[id_posto] = (id_hospital, numeros.setdefault(chave, len(numeros) + 1))
+
+    _copiar_banco(origem, catalogo)
+    conn = sqlite3.connect(catalogo)
+    try:
+        _criar_tabelas_catalogo(conn)
+        conn.execute("INSERT INTO ConfiguracaoFragmentacao (id, modo) VALUES (1, ?)", (por,))
+        conn.executemany("INSERT INTO MapaFragmento (id_posto, id_hospital, numero_fragmento) VALUES (?, ?, ?)",
+                         [(id_posto, id_hospital, numero) for id_posto, (id_hospital, numero) in mapa.items()])
+        conn.commit()
+    finally:
+        conn.close()
+    for numero in sorted(set(numeros.values())):
+        ids = [id_posto for id_posto, (_, n) in mapa.items() if n == numero]
+        _copiar_banco(origem, caminho_fragmento(destino, numero), ids, numero)
+
+    avisos = []
+    fora = sum(total for posto_a, posto_e, total in cruzadas if mapa.get(posto_a, (0, 0))[1] != mapa.get(posto_e, (0, 0))[1])
+    if fora:
+        avisos.append(f"{fora} prescrição(ões) usam lotes de outro fragmento e ficam sem o lote no fragmento do atendimento.")
+    return {
+        "success": True,
+        "message": f"Banco dividido em {len(numeros)} fragmento(s) por {por}.",
+        "data": {"fragmentos": len(numeros), "postos": len(mapa), "avisos": avisos},
+    }
+
+
+# --- Roteamento ---
+
+class Roteador:
+    """Mapa posto -> fragmento e execução de funções do open_crud em um ou vários fragmentos."""
+
+    def __init__(self, diretorio):
+        self.diretorio = diretorio
+        self.catalogo = os.path.join(diretorio, ARQUIVO_CATALOGO)
+        if not os.path.exists(self.catalogo):
+            raise FileNotFoundError(f"Catálogo não encontrado em {diretorio}. Rode fragmentacao.py --destino {diretorio} antes.")
+        self.modo = "hospital"
+        self._mapa = {} # id_posto -> numero do fragmento
+        self._hospitais = {} # id_hospital -> numero do fragmento (modo hospital)
+        self._ids_antigos = {} # (tabela, id) -> numero, para IDs anteriores à fragmentação
+        self.replicas_presentes = set() # (numero, tabela, id) de tabelas sob demanda já copiadas para o fragmento
+        self._trava = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=WORKERS_FRAGMENTOS, thread_name_prefix="fragmento")
+        self.recarregar()
+
+    def recarregar(self):
+        conn = sqlite3.connect(self.catalogo)
+        try:
+            _criar_tabelas_catalogo(conn)
+            row = conn.execute("SELECT modo FROM ConfiguracaoFragmentacao WHERE id = 1").fetchone()
+            linhas = conn.execute("SELECT id_posto, id_hospital, numero_fragmento FROM MapaFragmento").fetchall()
+        finally:
+            conn.close()
+        with self._trava:
+            self.modo = row[0] if row else "hospital"
+            self._mapa = {id_posto: numero for id_posto, _, numero in linhas}
+            self._hospitais = {id_hospital: numero for _, id_hospital, numero in linhas}
+
+    def caminho(self, numero):
+        return caminho_fragmento(self.diretorio, numero)
+
+    def fragmentos(self):
+        return sorted(set(self._mapa.values()))
+
+    def fragmento_do_posto(self, id_posto):
+        try:
+            id_posto = int(id_posto)
+        except (TypeError, ValueError):
+            return None
+        if id_posto not in self._mapa:
+            self.recarregar() # Posto criado por outro processo
+        return self._mapa.get(id_posto)
+
+    def fragmento_do_hospital(self, id_hospital):
+        try:
+            return self._hospitais.get(int(id_hospital))
+        except (TypeError, ValueError):
+            return None
+
+    def fragmentos_visiveis(self):
+        """Fragmentos com postos visíveis no escopo de acesso ativo (todos sem escopo)."""
+        escopo = open_crud.escopo_atual()
+        if escopo is None:
+            return self.fragmentos()
+        return sorted({self._mapa[p] for p in escopo["postos"] if p in self._mapa})
+
+    def fragmento_do_registro(self, tabela, id_registro):
+        """Fragmento que guarda o registro: pelo próprio ID ou, para IDs antigos, procurando uma vez em cada fragmento."""
+        try:
+            id_registro = int(id_registro)
+        except (TypeError, ValueError):
+            return None
+        if id_registro >= PASSO_ID:
+            numero = id_registro // PASSO_ID
+            return numero if os.path.exists(self.caminho(numero)) else None
+        chave = (tabela, id_registro)
+        numero = self._ids_antigos.get(chave)
+        if numero is None:
+            for numero_candidato in self.fragmentos():
+                if self.executar(numero_candidato, _existe, tabela, id_registro):
+                    numero = numero_candidato
+                    break
+            else:
+                return None
+            if len(self._ids_antigos) >= MAX_IDS_EM_CACHE:
+                self._ids_antigos.clear()
+            self._ids_antigos[chave] = numero
+        return numero
+
+    def executar(self, numero, funcao, *args, **kwargs):
+        with open_crud.usando_banco(self.caminho(numero)):
+            return funcao(*args, **kwargs)
+
+    def espalhar(self, numeros, funcao, *args, **kwargs):
+        """Executa a função em cada fragmento (em paralelo) e retorna os resultados na ordem de `numeros`."""
+        if len(numeros) == 1:
+            return [self.executar(numeros[0], funcao, *args, **kwargs)]
+        # Cada tarefa leva uma cópia do contexto do chamador (escopo de acesso)
+        futuros = [
+            self._executor.submit(contextvars.copy_context().run, self.executar, numero, funcao, *args, **kwargs)
+            for numero in numeros
+        ]
+        return [futuro.result() for futuro in futuros]
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+def _existe(tabela, id_registro):
+    chave = CHAVES_FRAGMENTADAS.get(tabela) or TABELAS_CATALOGO[tabela]
+    conn = open_crud.get_db_connection()
+    try:
+        query = f"SELECT 1 FROM {tabela} WHERE {chave} = ?"
+        if conn.execute(query, (id_registro,)).fetchone() is not None:
+            return True
+        return tabela in open_crud.TABELAS_ARQUIVAVEIS and open_crud._buscar_no_historico(conn, query, (id_registro,)) is not None
+    finally:
+        conn.close()
+
+
+def _versao_fragmentos(numeros, tabelas):
+    """Versão combinada das tabelas em vários fragmentos (soma; só cresce a cada escrita)."""
+    total = 0
+    for resultado in _roteador.espalhar(numeros, _originais["get_table_versions"], tabelas):
+        if not resultado["success"]:
+            return None
+        total += sum(resultado["data"].values())
+    return total
+
+
+def _primeira_falha(resultados):
+    return next((r for r in resultados if not r["success"]), None)
+
+
+def _sem_fragmentos(com_versao=True):
+    resultado = {"success": True, "data": []}
+    if com_versao:
+        resultado["version"] = 0
+    return resultado
+
+
+def _chave_ordem(campo):
+    # Mesma ordem do SQLite: NULL antes de qualquer valor
+    return lambda linha: (linha.get(campo) is not None, linha.get(campo))
+
+
+# --- Réplicas das Tabelas Globais ---
+# Cada escrita em uma tabela global do catálogo grava, pela trigger e na mesma transação, uma linha
+# em ReplicaPendente; ela só sai de lá depois que o estado atual da linha foi gravado em todos os
+# fragmentos. Uma falha (ou a queda do processo) entre o catálogo e os fragmentos fica registrada e
+# é refeita na próxima escrita global, por este ou por outro processo.
+
+def _criar_triggers_replica(conn):
+    for tabela, chave in TABELAS_CATALOGO.items():
+        for evento, linha in (("insert", "NEW"), ("update", "NEW"), ("delete", "OLD")):
+            conn.execute(f"""CREATE TRIGGER IF NOT EXISTS {PREFIXO_TRIGGER_REPLICA}{tabela}_{evento}
+                AFTER {evento.upper()} ON {tabela}
+                BEGIN INSERT INTO ReplicaPendente (tabela, id_registro) VALUES ('{tabela}', {linha}.{chave}); END""")
+
+
+def _conectar_catalogo():
+    conn = sqlite3.connect(_roteador.catalogo)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _ler_linha_catalogo(tabela, id_registro):
+    conn = open_crud.get_db_connection()
+    try:
+        row = conn.execute(f"SELECT * FROM {tabela} WHERE {TABELAS_CATALOGO[tabela]} = ?", (id_registro,)).fetchone()
+        return dict(row) if row else None
+    finally:
+        conn.close()
+
+
+def _gravar_replica(tabela, id_registro, linha, so_existente=False):
+    """Grava (upsert) ou remove (linha=None) a réplica de uma linha global no banco atual.
+
+    so_existente=True só atualiza a linha se o fragmento já a tiver (tabelas replicadas sob demanda).
+    """
+    chave = TABELAS_CATALOGO[tabela]
+    conn = open_crud.get_db_connection()
+    try:
+        if linha is None:
+            conn.execute(f"DELETE FROM {tabela} WHERE {chave} = ?", (id_registro,))
+        elif so_existente:
+            colunas = [c for c in linha if c != chave]
+            conn.execute(f"UPDATE {tabela} SET {', '.join(f'{c} = ?' for c in colunas)} WHERE {chave} = ?",
+                         (*(linha[c] for c in colunas), id_registro))
+        else:
+            colunas = list(linha)
+            atualizacao = ", ".join(f"{c} = excluded.{c}" for c in colunas if c != chave)
+            conn.execute(
+                f"INSERT INTO {tabela} ({', '.join(colunas)}) VALUES ({', '.join('?' * len(colunas))}) ON CONFLICT({chave}) DO UPDATE SET {atualizacao}",
+                tuple(linha.values()),
+            )
+        conn.commit()
+        return True
+    except sqlite3.Error:
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+
+
+def _replicar_pendentes():
+    """Grava nos fragmentos o estado atual (no catálogo) das linhas globais com réplica pendente.
+
+    Roda com a trava de escrita do catálogo: as escritas globais de todos os processos esperam, e
+    uma réplica mais antiga nunca sobrescreve uma mais nova em um fragmento.
+    """
+    conn = _conectar_catalogo()
+    try:
+        if conn.execute("SELECT 1 FROM ReplicaPendente LIMIT 1").fetchone() is None:
+            return True
+        conn.execute("BEGIN IMMEDIATE")
+        pendentes = conn.execute("SELECT tabela, id_registro, MAX(seq) FROM ReplicaPendente GROUP BY tabela, id_registro").fetchall()
+        numeros = _roteador.fragmentos()
+        gravadas = []
+        for tabela, id_registro, seq in pendentes:
+            row = conn.execute(f"SELECT * FROM {tabela} WHERE {TABELAS_CATALOGO[tabela]} = ?", (id_registro,)).fetchone()
+            linha = dict(row) if row else None
+            if all(_roteador.espalhar(numeros, _gravar_replica, tabela, id_registro, linha, tabela in TABELAS_SOB_DEMANDA)):
+                gravadas.append((tabela, id_registro, seq))
+        # Alterações feitas enquanto isso têm seq maior e continuam pendentes
+        conn.executemany("DELETE FROM ReplicaPendente WHERE tabela = ? AND id_registro = ? AND seq <= ?", gravadas)
+        conn.commit()
+        return len(gravadas) == len(pendentes)
+    except sqlite3.Error:
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+
+
+def _marcar_pendente(tabela, id_registro):
+    conn = _conectar_catalogo()
+    try:
+        conn.execute("INSERT INTO ReplicaPendente (tabela, id_registro) VALUES (?, ?)", (tabela, id_registro))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _garantir_replica(numero, tabela, id_registro):
+    """Copia para o fragmento uma linha de tabela replicada sob demanda, na primeira vez que ele a referencia."""
+    if id_registro is None or (numero, tabela, id_registro) in _roteador.replicas_presentes:
+        return
+    if not _roteador.executar(numero, _existe, tabela, id_registro) and not _copiar_replica(numero, tabela, id_registro):
+        return # Não existe no catálogo: o open_crud responde como no banco único
+    if len(_roteador.replicas_presentes) >= MAX_IDS_EM_CACHE:
+        _roteador.replicas_presentes.clear()
+    _roteador.replicas_presentes.add((numero, tabela, id_registro))
+
+
+def _copiar_replica(numero, tabela, id_registro):
+    conn = _conectar_catalogo()
+    try:
+        conn.execute("BEGIN IMMEDIATE") # Como em _replicar_pendentes: nenhuma alteração do catálogo passa no meio da cópia
+        row = conn.execute(f"SELECT * FROM {tabela} WHERE {TABELAS_CATALOGO[tabela]} = ?", (id_registro,)).fetchone()
+        copiada = row is not None and _roteador.executar(numero, _gravar_replica, tabela, id_registro, dict(row))
+        conn.commit()
+        return copiada
+    finally:
+        conn.close()
+
+
+def _registrar_posto(id_posto, id_hospital):
+    """Define o fragmento de um posto novo, criando o arquivo do fragmento a partir do catálogo se necessário.
+
+    O número do fragmento é escolhido com a trava de escrita do catálogo: dois processos criando postos
+    ao mesmo tempo não alocam o mesmo número nem dois fragmentos para o mesmo hospital.
+    """
+    conn = _conectar_catalogo()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        numero = None
+        if _roteador.modo == "hospital":
+            row = conn.execute("SELECT numero_fragmento FROM MapaFragmento WHERE id_hospital = ? LIMIT 1", (id_hospital,)).fetchone()
+            numero = row[0] if row else None
+        if numero is None:
+            numero = conn.execute("SELECT COALESCE(MAX(numero_fragmento), 0) + 1 FROM MapaFragmento").fetchone()[0]
+            destino = _roteador.caminho(numero)
+            for sobra in (destino, destino + "-wal", destino + "-shm"): # Arquivo de uma tentativa que não chegou ao mapa
+                if os.path.exists(sobra):
+                    os.remove(sobra)
+            _copiar_banco(_roteador.catalogo, destino, (id_posto,), numero)
+        conn.execute("INSERT OR REPLACE INTO MapaFragmento (id_posto, id_hospital, numero_fragmento) VALUES (?, ?, ?)",
+                     (id_posto, id_hospital, numero))
+        conn.commit()
+    finally:
+        conn.close()
+    _roteador.recarregar()
+
+
+# --- Rotas ---
+# Cada rota recebe a função original do open_crud e os argumentos já nomeados (com os padrões).
+
+def _rota_criar_global(tabela):
+    def rota(original, argumentos):
+        resultado = original(**argumentos)
+        if resultado["success"] and tabela == "PostoSaude":
+            _registrar_posto(resultado["id"], argumentos["id_hospital_vinculado"])
+        _replicar_pendentes()
+        return resultado
+    return rota
+
+
+def _rota_atualizar_global(tabela, campo_id):
+    def rota(original, argumentos):
+        id_registro = argumentos[campo_id]
+        novo_hospital = argumentos.get("id_hospital_vinculado") if tabela == "PostoSaude" else None
+        if novo_hospital is not None and _roteador.modo == "hospital":
+            atual = _roteador.fragmento_do_posto(id_registro)
+            if atual is not None and _roteador.fragmento_do_hospital(novo_hospital) != atual:
+                return {"success": False, "message": "Não é possível mudar o posto de hospital no modo fragmentado: os dados dele ficariam em outro fragmento."}
+        resultado = original(**argumentos)
+        _replicar_pendentes()
+        if resultado["success"]:
+            if novo_hospital is not None:
+                conn = sqlite3.connect(_roteador.catalogo)
+                try:
+                    conn.execute("UPDATE MapaFragmento SET id_hospital = ? WHERE id_posto = ?", (novo_hospital, id_registro))
+                    conn.commit()
+                finally:
+                    conn.close()
+                _roteador.recarregar()
+        return resultado
+    return rota
+
+
+def _rota_excluir_global(tabela, campo_id):
+    def rota(original, argumentos):
+        """Exclui primeiro nas réplicas (cada uma confere os registros dependentes do seu fragmento) e por último no catálogo."""
+        _replicar_pendentes()
+        id_registro = argumentos[campo_id]
+        linha = _ler_linha_catalogo(tabela, id_registro)
+        if linha is None:
+            return original(**argumentos) # Mensagem de "não encontrado" do próprio open_crud
+        numeros = _roteador.fragmentos()
+        if tabela in TABELAS_SOB_DEMANDA:
+            numeros = [n for n in numeros if _roteador.executar(n, _existe, tabela, id_registro)]
+        excluidos = []
+        for numero in numeros:
+            resultado = _roteador.executar(numero, original, **argumentos)
+            if not resultado["success"]:
+                _restaurar_replicas(tabela, id_registro, excluidos, linha)
+                return resultado
+            excluidos.append(numero)
+        resultado = original(**argumentos)
+        _replicar_pendentes()
+        if not resultado["success"]:
+            _restaurar_replicas(tabela, id_registro, excluidos, linha)
+            return resultado
+        if tabela == "PostoSaude":
+            conn = sqlite3.connect(_roteador.catalogo)
+            try:
+                conn.execute("DELETE FROM MapaFragmento WHERE id_posto = ?", (id_registro,))
+                conn.commit()
+            finally:
+                conn.close()
+            _roteador.recarregar()
+        return resultado
+    return rota
+
+
+def _restaurar_replicas(tabela, id_registro, numeros, linha):
+    """Desfaz nas réplicas já excluídas uma exclusão global que falhou adiante; o que não voltar fica pendente."""
+    if numeros and not all(_roteador.espalhar(numeros, _gravar_replica, tabela, id_registro, linha)):
+        _marcar_pendente(tabela, id_registro)
+
+
+def _fragmento_de(referencia, valor):
+    """Fragmento de um valor: referencia "posto" (ID de posto) ou o nome de uma tabela fragmentada (ID do registro)."""
+    if referencia == "posto":
+        return _roteador.fragmento_do_posto(valor)
+    return _roteador.fragmento_do_registro(referencia, valor)
+
+
+def _rota_unica(campo, referencia, mesmos=(), replicas=()):
+    """Executa no fragmento de argumentos[campo]; `mesmos` lista outros (campo, referencia) que precisam estar no mesmo
+    fragmento e `replicas` os (campo, tabela) de tabelas sob demanda que o registro passa a referenciar."""
+    def rota(original, argumentos):
+        numero = _fragmento_de(referencia, argumentos[campo])
+        if numero is None:
+            mensagem = "Posto de saúde não encontrado." if referencia == "posto" else "Registro não encontrado."
+            return {"success": False, "message": mensagem}
+        for outro_campo, outra_referencia in mesmos:
+            if argumentos.get(outro_campo) is not None and _fragmento_de(outra_referencia, argumentos[outro_campo]) != numero:
+                return {"success": False, "message": MENSAGEM_OUTRO_FRAGMENTO}
+        for outro_campo, tabela in replicas:
+            _garantir_replica(numero, tabela, argumentos.get(outro_campo))
+        return _roteador.executar(numero, original, **argumentos)
+    return rota
+
+
+def _rota_listagem(listagem, ordem_padrao, filtros=()):
+    """Listagem de tabela fragmentada: um fragmento quando um filtro o define, senão todos os visíveis, com merge ordenado."""
+    tabelas = open_crud._tabelas_da_listagem(listagem)
+    chave = listagem["chave"].split(".")[-1]
+
+    def rota(original, argumentos):
+        numeros = None
+        for campo, referencia in filtros:
+            if argumentos.get(campo):
+                numero = _fragmento_de(referencia, argumentos[campo])
+                numeros = [numero] if numero is not None else []
+                break
+        if numeros is None:
+            numeros = _roteador.fragmentos_visiveis()
+        com_versao = "if_version" in argumentos
+        if not numeros:
+            return _sem_fragmentos(com_versao)
+        if com_versao and argumentos["if_version"] is not None:
+            versao = _versao_fragmentos(numeros, tabelas)
+            if versao == argumentos["if_version"]:
+                return open_crud._nao_modificado(versao)
+            argumentos["if_version"] = None
+
+        paginada = argumentos.get("after_id") is not None or argumentos.get("limit") is not None
+        campo_ordem, decrescente = (chave, False) if paginada else ordem_padrao
+        fields = argumentos.get("fields")
+        campo_extra = fields is not None and campo_ordem not in fields
+        if campo_extra:
+            argumentos["fields"] = list(fields) + [campo_ordem]
+
+        resultados = _roteador.espalhar(numeros, original, **argumentos)
+        falha = _primeira_falha(resultados)
+        if falha:
+            return falha
+        linhas = [linha for resultado in resultados for linha in resultado["data"]]
+        if len(resultados) > 1:
+            linhas.sort(key=_chave_ordem(campo_ordem), reverse=decrescente)
+            if argumentos.get("limit") is not None:
+                linhas = linhas[:max(int(argumentos["limit"]), 0)]
+        if campo_extra:
+            for linha in linhas:
+                del linha[campo_ordem]
+        resultado = {"success": True, "data": linhas}
+        if com_versao:
+            resultado["version"] = sum(r["version"] for r in resultados)
+        return resultado
+    return rota
+
+
+def _rota_relatorio(rotulo, valor, tabelas, com_limite=False):
+    """Relatório agregado por rótulo: soma os totais de cada fragmento (e corta o top-N depois da soma)."""
+    def rota(original, argumentos):
+        numeros = _roteador.fragmentos_visiveis()
+        if not numeros:
+            return _sem_fragmentos()
+        if argumentos.get("if_version") is not None:
+            versao = _versao_fragmentos(numeros, tabelas)
+            if versao == argumentos["if_version"]:
+                return open_crud._nao_modificado(versao)
+            argumentos["if_version"] = None
+        limite = argumentos.get("limit") if com_limite else None
+        if com_limite:
+            argumentos["limit"] = -1 # Cada fragmento devolve todos os grupos; o corte é feito no total
+        resultados = _roteador.espalhar(numeros, original, **argumentos)
+        falha = _primeira_falha(resultados)
+        if falha:
+            return falha
+        totais = {}
+        for resultado in resultados:
+            for linha in resultado["data"]:
+                totais[linha[rotulo]] = totais.get(linha[rotulo], 0) + (linha[valor] or 0)
+        dados = [{rotulo: r, valor: t} for r, t in sorted(totais.items(), key=lambda item: item[1], reverse=True)]
+        if limite is not None and int(limite) >= 0:
+            dados = dados[:int(limite)]
+        return {"success": True, "data": dados, "version": sum(r["version"] for r in resultados)}
+    return rota
+
+
+def _rota_serie_temporal(original, argumentos):
+    numeros = _roteador.fragmentos_visiveis()
+    metrica = open_crud._METRICAS_SERIE.get(argumentos["metrica"])
+    if metrica is not None and argumentos.get("if_version") is not None and numeros:
+        versao = _versao_fragmentos(numeros, (metrica["from"].split()[0], *re.findall(r"\bJOIN\s+(\w+)", metrica["from"])))
+        if versao == argumentos["if_version"]:
+            return open_crud._nao_modificado(versao)
+    argumentos["if_version"] = None
+    if not numeros: # Sem fragmentos visíveis: um fragmento qualquer valida os argumentos e devolve vazio
+        with open_crud.escopo_acesso(()):
+            return _roteador.executar(_roteador.fragmentos()[0], original, **argumentos)
+    resultados = _roteador.espalhar(numeros, original, **argumentos)
+    falha = _primeira_falha(resultados)
+    if falha:
+        return falha
+    dimensoes = list(argumentos.get("dimensoes") or [])
+    com_periodos = [r["periodos"] for r in resultados if r["periodos"]]
+    periodos = []
+    if com_periodos:
+        inicio = date.fromisoformat(min(p[0] for p in com_periodos))
+        fim = date.fromisoformat(max(p[-1] for p in com_periodos))
+        periodos = open_crud._periodos_entre(inicio, fim, argumentos["periodo"])
+    posicao = {p: i for i, p in enumerate(periodos)}
+    series = {}
+    for resultado in resultados:
+        for item in resultado["data"]:
+            grupo = tuple(item["grupo"][d] for d in dimensoes)
+            valores = series.setdefault(grupo, [0] * len(periodos))
+            for periodo, valor in zip(resultado["periodos"], item["valores"]):
+                valores[posicao[periodo]] += valor
+    data = [{"grupo": dict(zip(dimensoes, grupo)), "valores": valores} for grupo, valores in sorted(series.items())]
+    return {"success": True, "data": data, "periodos": periodos, "version": sum(r["version"] for r in resultados)}
+
+
+def _rota_estoque_na_data(original, argumentos):
+    if argumentos.get("id_posto"):
+        return _rota_unica("id_posto", "posto")(original, argumentos)
+    numeros = _roteador.fragmentos_visiveis()
+    if not numeros:
+        return _sem_fragmentos()
+    if argumentos.get("if_version") is not None:
+        versao = _versao_fragmentos(numeros, ("EstoqueMedicamentoPosto", "Medicamento", "PostoSaude"))
+        if versao == argumentos["if_version"]:
+            return open_crud._nao_modificado(versao)
+        argumentos["if_version"] = None
+    resultados = _roteador.espalhar(numeros, original, **argumentos)
+    falha = _primeira_falha(resultados)
+    if falha:
+        return falha
+    saldos = sorted((s for r in resultados for s in r["data"]), key=lambda s: (s["nome_posto"], s["nome_comercial_medicamento"]))
+    return {"success": True, "data": saldos, "version": sum(r["version"] for r in resultados)}
+
+
+_ORDEM_ALERTA = {"vencido": 0, "validade_proxima": 1}
+
+
+def _rota_alertas(original, argumentos):
+    if argumentos.get("id_posto"):
+        return _rota_unica("id_posto", "posto")(original, argumentos)
+    numeros = _roteador.fragmentos_visiveis()
+    if not numeros:
+        return {"success": True, "data": []}
+    resultados = _roteador.espalhar(numeros, original, **argumentos)
+    falha = _primeira_falha(resultados)
+    if falha:
+        return falha
+    alertas = sorted((a for r in resultados for a in r["data"]), key=lambda a: (_ORDEM_ALERTA.get(a["tipo_alerta"], 2), a["data_validade"]))
+    return {"success": True, "data": alertas}
+
+
+def _rota_resumo_alertas(original, argumentos):
+    numeros = _roteador.fragmentos_visiveis()
+    resultados = _roteador.espalhar(numeros, original, **argumentos) if numeros else []
+    falha = _primeira_falha(resultados)
+    if falha:
+        return falha
+    resumo = {}
+    for resultado in resultados:
+        for tipo, total in resultado["data"].items():
+            resumo[tipo] = resumo.get(tipo, 0) + total
+    return {"success": True, "data": resumo}
+
+
+def _rota_todos(com_catalogo=False):
+    """Manutenção: executa em todos os fragmentos (e no catálogo, se pedido) e junta as mensagens."""
+    def rota(original, argumentos):
+        resultados = _roteador.espalhar(_roteador.fragmentos(), original, **argumentos)
+        if com_catalogo:
+            resultados.append(original(**argumentos))
+        falha = _primeira_falha(resultados)
+        if falha:
+            return falha
+        mensagens = list(dict.fromkeys(r.get("message") for r in resultados if r.get("message")))
+        return {"success": True, "message": " ".join(mensagens)}
+    return rota
+
+
+def _rota_versoes(original, argumentos):
+    tabelas = tuple(argumentos.get("tabelas") or open_crud.TABELAS_VERSIONADAS)
+    globais = tuple(t for t in tabelas if t in TABELAS_CATALOGO)
+    fragmentadas = tuple(t for t in tabelas if t not in TABELAS_CATALOGO)
+    versoes = {}
+    if globais:
+        resultado = original(globais)
+        if not resultado["success"]:
+            return resultado
+        versoes.update(resultado["data"])
+    if fragmentadas:
+        resultados = _roteador.espalhar(_roteador.fragmentos(), original, fragmentadas)
+        falha = _primeira_falha(resultados)
+        if falha:
+            return falha
+        for resultado in resultados:
+            for tabela, versao in resultado["data"].items():
+                versoes[tabela] = versoes.get(tabela, 0) + versao
+    return {"success": True, "data": versoes}
+
+
+def _pagina_prontuario(original, argumentos, cursor):
+    """Página do prontuário em um fragmento, convertendo o cursor global (data, id) em um before_id local."""
+    argumentos = dict(argumentos, before_id=None, if_version=None)
+    if cursor is not None:
+        consulta = """SELECT data_hora_inicio_atendimento, id_atendimento FROM Atendimento
+            WHERE id_paciente = ? AND (data_hora_inicio_atendimento, id_atendimento) >= (?, ?)
+            ORDER BY data_hora_inicio_atendimento, id_atendimento LIMIT 1"""
+        parametros = (argumentos["id_paciente"], *cursor)
+        conn = open_crud.get_db_connection()
+        try:
+            # Menor atendimento local (quente ou arquivado) em (data, id) >= cursor: os anteriores a ele são os anteriores ao cursor
+            linhas = [conn.execute(consulta, parametros).fetchone()]
+            for ano, arquivo in open_crud._anos_arquivados(conn):
+                fontes = open_crud._fontes_do_ano(open_crud._anexar_arquivo(conn, ano, arquivo))
+                linhas.append(conn.execute(open_crud._com_fontes(consulta, fontes), parametros).fetchone())
+        finally:
+            conn.close()
+        menor = min((tuple(linha) for linha in linhas if linha is not None), default=None)
+        argumentos["before_id"] = menor[1] if menor else None
+    return original(**argumentos)
+
+
+def _rota_prontuario(original, argumentos):
+    if not argumentos.get("id_paciente"):
+        return original(**argumentos)
+    numeros = _roteador.fragmentos()
+    if argumentos.get("if_version") is not None:
+        versao = _versao_fragmentos(numeros, ("Atendimento", "Prescricao", "DistribuicaoMedicamento", "Funcionario", "PostoSaude", "EstoqueMedicamentoPosto", "Medicamento"))
+        if versao == argumentos["if_version"]:
+            return open_crud._nao_modificado(versao)
+    limite = max(1, min(int(argumentos.get("limit") or open_crud.TAMANHO_PAGINA_PRONTUARIO), open_crud.MAX_PAGINA_PRONTUARIO))
+    cursor = None
+    if argumentos.get("before_id"):
+        numero = _roteador.fragmento_do_registro("Atendimento", argumentos["before_id"])
+        anterior = _roteador.executar(numero, _originais["get_atendimento_by_id"], argumentos["before_id"]) if numero else None
+        if not anterior or not anterior["success"]:
+            return {"success": True, "data": [], "next_before_id": None, "version": 0}
+        cursor = (anterior["data"]["data_hora_inicio_atendimento"], anterior["data"]["id_atendimento"])
+    resultados = _roteador.espalhar(numeros, _pagina_prontuario, original, argumentos, cursor)
+    falha = _primeira_falha(resultados)
+    if falha:
+        return falha
+    atendimentos = sorted((a for r in resultados for a in r["data"]),
+                          key=lambda a: (a["data_hora_inicio_atendimento"] or "", a["id_atendimento"]), reverse=True)
+    tem_mais = len(atendimentos) > limite or any(r["next_before_id"] for r in resultados)
+    atendimentos = atendimentos[:limite]
+    return {
+        "success": True,
+        "data": atendimentos,
+        "next_before_id": atendimentos[-1]["id_atendimento"] if tem_mais and atendimentos else None,
+        "version": sum(r["version"] for r in resultados),
+    }
+
+
+def _rota_indisponivel(original, argumentos):
+    return {"success": False, "message": MENSAGEM_INDISPONIVEL}
+
+
+def _rota_changes_since(original, argumentos):
+    raise RuntimeError(MENSAGEM_INDISPONIVEL)
+
+
+def _rota_motor_relatorios(original, argumentos):
+    if argumentos.get("implementacoes"):
+        raise RuntimeError("O motor de relatórios alternativo não está disponível no modo fragmentado.")
+    return original(**argumentos)
+
+
+def _rotas():
+    """Função do open_crud -> rota. As que não aparecem aqui rodam no catálogo (banco padrão)."""
+    rotas = {
+        "get_table_versions": _rota_versoes,
+        "get_alteracoes": _rota_indisponivel,
+        "get_ultimo_seq_alteracao": _rota_indisponivel,
+        "changes_since": _rota_changes_since,
+        "delete_alteracoes_ate": _rota_todos(com_catalogo=True),
+        "podar_log_alteracoes": _rota_todos(com_catalogo=True),
+        "registrar_posicao_log": _rota_indisponivel,
+        "remover_consumidor_log": _rota_indisponivel,
+        "get_consumidores_log": _rota_indisponivel,
+        "configurar_motor_relatorios": _rota_motor_relatorios,
+        # Estoque
+        "create_estoque_medicamento_posto": _rota_unica("id_posto", "posto"),
+        "get_all_estoque_medicamento_posto": _rota_listagem(open_crud._LISTAGEM_ESTOQUE, ("id_estoque", False), [("id_posto", "posto")]),
+        "get_estoque_medicamento_posto_by_id": _rota_unica("estoque_id", "EstoqueMedicamentoPosto"),
+        "update_estoque_medicamento_posto": _rota_unica("estoque_id", "EstoqueMedicamentoPosto"),
+        "delete_estoque_medicamento_posto": _rota_unica("estoque_id", "EstoqueMedicamentoPosto"),
+        "registrar_movimentacao_estoque": _rota_unica("estoque_id", "EstoqueMedicamentoPosto"),
+        "get_movimentacoes_estoque": _rota_listagem(open_crud._LISTAGEM_MOVIMENTACOES, ("id_movimentacao", True),
+                                                    [("id_estoque", "EstoqueMedicamentoPosto"), ("id_posto", "posto")]),
+        "get_estoque_na_data": _rota_estoque_na_data,
+        "compactar_estoque": _rota_todos(),
+        "compactar_estoque_se_necessario": _rota_todos(),
+        "alocar_lotes_fefo": _rota_unica("id_posto", "posto"),
+        "varrer_alertas_validade": _rota_todos(),
+        "configurar_alertas": _rota_todos(com_catalogo=True),
+        "get_alertas_estoque": _rota_alertas,
+        "get_resumo_alertas": _rota_resumo_alertas,
+        # Atendimentos, prescrições e distribuições
+        "create_atendimento": _rota_unica("id_posto_atendimento", "posto", replicas=[("id_paciente", "Paciente")]),
+        "get_all_atendimentos": _rota_listagem(open_crud._LISTAGEM_ATENDIMENTOS, ("data_hora_inicio_atendimento", True), [("id_posto", "posto")]),
+        "get_atendimento_by_id": _rota_unica("atendimento_id", "Atendimento"),
+        "update_atendimento": _rota_unica("atendimento_id", "Atendimento", [("id_posto_atendimento", "posto")], [("id_paciente", "Paciente")]),
+        "delete_atendimento": _rota_unica("atendimento_id", "Atendimento"),
+        "create_prescricao": _rota_unica("id_atendimento", "Atendimento", [("id_medicamento_estoque", "EstoqueMedicamentoPosto")]),
+        "get_all_prescricoes": _rota_listagem(open_crud._LISTAGEM_PRESCRICOES, ("data_hora_prescricao", True), [("id_atendimento", "Atendimento")]),
+        "get_prescricao_by_id": _rota_unica("prescricao_id", "Prescricao"),
+        "update_prescricao": _rota_unica("prescricao_id", "Prescricao", [("id_atendimento", "Atendimento"), ("id_medicamento_estoque", "EstoqueMedicamentoPosto")]),
+        "delete_prescricao": _rota_unica("prescricao_id", "Prescricao"),
+        "create_distribuicao_medicamento": _rota_unica("id_prescricao", "Prescricao"),
+        "get_all_distribuicoes_medicamento": _rota_listagem(open_crud._LISTAGEM_DISTRIBUICOES, ("data_hora_distribuicao", True), [("id_prescricao", "Prescricao")]),
+        "get_distribuicao_medicamento_by_id": _rota_unica("distribuicao_id", "DistribuicaoMedicamento"),
+        "get_patient_timeline": _rota_prontuario,
+        # Relatórios (os de pacientes rodam no catálogo)
+        "get_atendimentos_by_type": _rota_relatorio("tipo_atendimento", "total", ("Atendimento",)),
+        "get_atendimentos_by_posto": _rota_relatorio("nome_posto", "total", ("Atendimento", "PostoSaude")),
+        "get_top_distribui_medicamentos": _rota_relatorio("nome_comercial_medicamento", "total_distribuido",
+                                                          ("DistribuicaoMedicamento", "Prescricao", "EstoqueMedicamentoPosto", "Medicamento"), com_limite=True),
+        "get_top_diagnosticos": _rota_relatorio("cid10", "total", ("Atendimento",), com_limite=True),
+        "get_serie_temporal": _rota_serie_temporal,
+    }
+    # Tabelas globais: escrita no catálogo e réplica nos fragmentos
+    for sufixo, tabela, campo_id in (
+        ("hospital", "Hospital", "hospital_id"),
+        ("posto_saude", "PostoSaude", "posto_id"),
+        ("funcionario", "Funcionario", "funcionario_id"),
+        ("paciente", "Paciente", "paciente_id"),
+        ("medicamento", "Medicamento", "medicamento_id"),
+    ):
+        rotas[f"create_{sufixo}"] = _rota_criar_global(tabela)
+        rotas[f"update_{sufixo}"] = _rota_atualizar_global(tabela, campo_id)
+        rotas[f"delete_{sufixo}"] = _rota_excluir_global(tabela, campo_id)
+    return rotas
+
+
+# --- Ativação ---
+
+_roteador = None
+_originais = {} # nome -> função original do open_crud
+_banco_anterior = None
+
+
+def _envolver(nome, rota):
+    original = getattr(open_crud, nome)
+    assinatura = inspect.signature(original)
+    _originais[nome] = original
+
+    @functools.wraps(original)
+    def roteada(*args, **kwargs):
+        # Dentro de um fragmento (ex.: compactar_estoque_se_necessario chamando compactar_estoque) não há o que rotear
+        if open_crud._banco_roteado.get() is not None:
+            return original(*args, **kwargs)
+        try:
+            argumentos = assinatura.bind(*args, **kwargs)
+        except TypeError:
+            return original(*args, **kwargs) # Mesmo erro de argumentos da função original
+        argumentos.apply_defaults()
+        return rota(original, dict(argumentos.arguments))
+    return roteada
+
+
+def ativar(diretorio):
+    """Passa o open_crud para o banco fragmentado em `diretorio`.
+
+    Deve ser chamado antes de `from open_crud import ...` nos módulos que usam as funções
+    (app.py, api_server.py), para que eles já recebam as versões roteadas.
+    """
+    global _roteador, _banco_anterior
+    desativar()
+    roteador = Roteador(diretorio)
+    _banco_anterior = open_crud.DATABASE_NAME
+    open_crud.DATABASE_NAME = roteador.catalogo
+    if open_crud._pool_conexoes is not None: # Descarta conexões do banco anterior
+        open_crud.configurar_pool_conexoes(open_crud._pool_conexoes.maxsize)
+    _roteador = roteador
+    for nome, rota in _rotas().items():
+        setattr(open_crud, nome, _envolver(nome, rota))
+    return roteador
+
+
+def desativar():
+    """Restaura as funções originais do open_crud e o banco anterior."""
+    global _roteador
+    if _roteador is None:
+        return
+    for nome, original in _originais.items():
+        setattr(open_crud, nome, original)
+    _originais.clear()
+    open_crud.DATABASE_NAME = _banco_anterior
+    if open_crud._pool_conexoes is not None:
+        open_crud.configurar_pool_conexoes(open_crud._pool_conexoes.maxsize)
+    _roteador.close()
+    _roteador = None
+
+
+def ativar_se_configurado():
+    """Ativa a fragmentação se a variável de ambiente HOSPITAL_FRAGMENTOS apontar para um diretório."""
+    diretorio = os.environ.get(VARIAVEL_AMBIENTE)
+    if diretorio and _roteador is None:
+        ativar(diretorio)
+    return _roteador
+
+
+def consultas_no_catalogo():
+    """True com a fragmentação ativa fora de um fragmento: get_db_connection() abre o catálogo, sem as tabelas fragmentadas."""
+    return _roteador is not None and open_crud._banco_roteado.get() is None
+
+
+def bancos_do_conjunto(diretorio=None):
+    """Arquivos para tarefas que rodam banco a banco (backup, manutenção): [None] (o banco do
+    open_crud) sem fragmentação, ou o catálogo e cada fragmento de `diretorio` (ou da fragmentação ativa)."""
+    roteador = Roteador(diretorio) if diretorio else _roteador
+    if roteador is None:
+        return [None]
+    try:
+        return [roteador.catalogo] + [roteador.caminho(numero) for numero in roteador.fragmentos()]
+    finally:
+        if diretorio:
+            roteador.close()
+
+
+# --- Benchmark ---
+
+def _escritor(banco, fragmentos, id_posto, id_paciente, id_funcionario, escritas, inicio_em):
+    """Um processo escritor do benchmark: grava `escritas` atendimentos no posto; retorna (fim, falhas)."""
+    if fragmentos:
+        ativar(fragmentos)
+    else:
+        open_crud.DATABASE_NAME = banco
+    open_crud.get_db_connection().close() # Prepara o banco (e abre o fragmento) fora da medição
+    time.sleep(max(0.0, inicio_em - time.time()))
+    falhas = 0
+    for i in range(escritas):
+        resultado = open_crud.create_atendimento(id_paciente, id_funcionario, id_posto, "Consulta", f"Benchmark {i}")
+        falhas += not resultado["success"]
+    return time.time(), falhas
+
+
+def _medir_escritas(banco, fragmentos, postos, id_paciente, id_funcionario, escritas):
+    """Um processo escritor por posto, todos ao mesmo tempo (como servidores separados); retorna (segundos, falhas)."""
+    contexto = multiprocessing.get_context("spawn")
+    inicio_em = time.time() + 3 # Tempo para os processos importarem os módulos
+    with contexto.Pool(len(postos)) as pool:
+        resultados = pool.starmap(_escritor, [(banco, fragmentos, posto, id_paciente, id_funcionario, escritas, inicio_em) for posto in postos])
+    return max(fim for fim, _ in resultados) - inicio_em, sum(falhas for _, falhas in resultados)
+
+
+def executar_benchmark(db, escritas, por):
+    """Compara a vazão de escritas concorrentes (um processo por posto) no banco único e fragmentado, em cópias.
+
+    Com um processo por posto as escritas do banco único disputam a mesma trava (e esperam pelo
+    busy timeout), enquanto no fragmentado só disputam os postos do mesmo fragmento. O ganho depende
+    de haver núcleos e disco para as escritas paralelas: em uma máquina de um núcleo só a espera pela
+    trava some, a vazão fica limitada pela CPU.
+    """
+    pasta = tempfile.mkdtemp()
+    try:
+        copia = os.path.join(pasta, "bench_unico.sqlite")
+        origem = os.path.join(pasta, "bench_origem.sqlite")
+        shutil.copy(db, copia)
+        shutil.copy(db, origem)
+        conn = sqlite3.connect(copia)
+        postos = [r[0] for r in conn.execute("SELECT id_posto FROM PostoSaude ORDER BY id_posto")]
+        id_paciente = conn.execute("SELECT MIN(id_paciente) FROM Paciente").fetchone()[0]
+        id_funcionario = conn.execute("SELECT MIN(id_funcionario) FROM Funcionario").fetchone()[0]
+        conn.close()
+        total = escritas * len(postos)
+        print(f"{len(postos)} processos escritores (um por posto), {escritas} atendimentos cada, {os.cpu_count()} núcleo(s)\n")
+
+        with open_crud.usando_banco(copia):
+            open_crud.get_db_connection().close() # Tabelas auxiliares criadas antes da medição
+        segundos, falhas = _medir_escritas(copia, None, postos, id_paciente, id_funcionario, escritas)
+        print(f"{'banco único':<28} {total / segundos:>8.0f} escritas/s  falhas {falhas}/{total}")
+
+        destino = os.path.join(pasta, "fragmentos")
+        resultado = fragmentar(origem, destino, por)
+        print(resultado["message"])
+        segundos, falhas = _medir_escritas(None, destino, postos, id_paciente, id_funcionario, escritas)
+        print(f"{'fragmentado por ' + por:<28} {total / segundos:>8.0f} escritas/s  falhas {falhas}/{total}")
+    finally:
+        shutil.rmtree(pasta, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Divide o banco em fragmentos por hospital ou por posto.")
+    parser.add_argument("--db", default=open_crud.DATABASE_NAME, help="Banco de origem (não é alterado, exceto pelas tabelas auxiliares do open_crud).")
+    parser.add_argument("--destino", default="fragmentos", help="Diretório do catálogo e dos fragmentos.")
+    parser.add_argument("--por", choices=("hospital", "posto"), default="hospital")
+    parser.add_argument("--benchmark", action="store_true", help="Compara a vazão de escritas concorrentes em cópias do banco.")
+    parser.add_argument("--escritas", type=int, default=200, help="Atendimentos por escritor no benchmark.")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        executar_benchmark(args.db, args.escritas, args.por)
+        return
+    resultado = fragmentar(args.db, args.destino, args.por)
+    print(resultado["message"])
+    for aviso in resultado.get("data", {}).get("avisos", []):
+        print(f"Aviso: {aviso}")
+
+
+if __name__ == "__main__":
+    main()
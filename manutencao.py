@@ -0,0 +1,461 @@
+"""
+Manutenção periódica do banco: estatísticas do planejador, espaço livre e checkpoints do WAL.
+
+Depois de cargas e exclusões em massa (dados_fake.py, arquivamento.py) o planejador de consultas
+fica sem estatísticas, ou com estatísticas de um banco que não existe mais, e o arquivo não
+diminui. Uma execução de manutenção faz, em ordem:
+
+  * alertas e estoque: varredura diária de validade dos alertas (a leitura dos alertas não escreve)
+    e snapshot do livro de estoque, quando necessário;
+  * analyze: ANALYZE só nas tabelas alteradas desde a última análise acima de LIMIAR_ANALYZE das
+    linhas registradas em sqlite_stat1, medidas sem contar linhas: pelas alterações no log (somadas
+    a cada execução a partir do seq lido na anterior) ou, nas tabelas fora do log, pelo avanço da
+    sequência AUTOINCREMENT (ou do maior rowid);
+  * log: poda do log de alterações até a menor posição registrada pelos consumidores
+    (open_crud.podar_log_alteracoes), preservando as últimas horas;
+  * optimize: PRAGMA optimize;
+  * vacuum: PRAGMA incremental_vacuum, devolvendo ao sistema até PAGINAS_VACUO_POR_EXECUCAO
+    páginas livres (exige auto_vacuum=INCREMENTAL, habilitado uma vez com converter_auto_vacuum);
+  * checkpoint: PRAGMA wal_checkpoint, PASSIVE ou TRUNCATE se o WAL passou de WAL_MAXIMO_MB
+    (só com o banco em WAL).
+
+Cada tarefa fica registrada em LogManutencao com a duração, o tamanho do arquivo antes e depois
+e os detalhes (tabelas analisadas com as linhas estimadas antes e depois, páginas liberadas,
+frames do WAL). O agendador roda dentro do processo (app ou API) ou pela linha de comando e só
+executa na janela de pouco movimento (JANELA_MANUTENCAO) quando o log de alterações mostra poucas
+escritas nos últimos minutos, no máximo uma vez por janela mesmo com vários processos.
+
+Uso:
+    python manutencao.py                          # executa agora
+    python manutencao.py --agendar                # fica rodando e executa na janela
+    python manutencao.py --converter-auto-vacuum  # uma vez, fora do horário de uso (VACUUM completo)
+    python manutencao.py --historico
+    HOSPITAL_MANUTENCAO=02:00-05:00 streamlit run app.py
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+import fragmentacao
+import open_crud
+
+JANELA_MANUTENCAO = ("02:00", "05:00")
+VARIAVEL_AMBIENTE = "HOSPITAL_MANUTENCAO" # Janela (ex.: 02:00-05:00) que liga o agendador no processo
+INTERVALO_VERIFICACAO = 300 # Segundos entre verificações do agendador
+HORAS_ENTRE_EXECUCOES = 12 # Uma execução por janela, mesmo com vários processos
+MINUTOS_SEM_MOVIMENTO = 10
+MAX_ALTERACOES_RECENTES = 20 # Alterações no log nesses minutos acima das quais a execução fica para depois
+LIMIAR_ANALYZE = 0.10 # Fração das linhas (inseridas, removidas ou alteradas) que justifica novo ANALYZE
+MIN_ALTERACOES_ANALYZE = 100
+LIMITE_ANALISE = 0 # PRAGMA analysis_limit (0 = ANALYZE completo; ex.: 1000 para análise aproximada e rápida)
+PAGINAS_VACUO_POR_EXECUCAO = 25600 # 100 MB com páginas de 4 KB
+WAL_MAXIMO_MB = 64
+
+TAREFAS = ("alertas", "estoque", "analyze", "log", "optimize", "vacuum", "checkpoint")
+CONSUMIDOR_LOG = "manutencao_analyze" # O analyze soma as alterações do log a partir do seq lido na execução anterior
+
+
+def _criar_tabelas(conn):
+    conn.execute("""CREATE TABLE IF NOT EXISTS LogManutencao (
+        id_execucao INTEGER PRIMARY KEY AUTOINCREMENT,
+        data_hora TEXT NOT NULL,
+        tarefa TEXT NOT NULL,
+        segundos REAL,
+        bytes_antes INTEGER,
+        bytes_depois INTEGER,
+        detalhes TEXT
+    )""")
+    conn.execute("""CREATE TABLE IF NOT EXISTS EstatisticaTabela (
+        tabela TEXT PRIMARY KEY,
+        linhas INTEGER NOT NULL,
+        seq_log INTEGER NOT NULL,
+        data_analise TEXT NOT NULL
+    )""")
+    colunas = {row[1] for row in conn.execute("PRAGMA table_info(EstatisticaTabela)")}
+    if "marcador" not in colunas:
+        conn.execute("ALTER TABLE EstatisticaTabela ADD COLUMN marcador INTEGER") # Sequência/maior rowid na última análise
+    if "alteracoes" not in colunas:
+        conn.execute("ALTER TABLE EstatisticaTabela ADD COLUMN alteracoes INTEGER NOT NULL DEFAULT 0") # Do log, desde a análise
+
+
+def _tamanho(banco):
+    """Bytes do arquivo do banco mais o do WAL, se houver."""
+    return sum(os.path.getsize(caminho) for caminho in (banco, banco + "-wal") if os.path.exists(caminho))
+
+
+# --- Tarefas ---
+
+def _sequencias(conn):
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_sequence'").fetchone() is None:
+        return {}
+    return dict(conn.execute("SELECT name, seq FROM sqlite_sequence").fetchall())
+
+
+def _marcador(conn, tabela, sequencias):
+    """Valor da sequência AUTOINCREMENT da tabela (ou o maior rowid): avança com as inserções sem contar linhas."""
+    if tabela in sequencias:
+        return sequencias[tabela]
+    try:
+        return conn.execute(f'SELECT COALESCE(MAX(rowid), 0) FROM "{tabela}"').fetchone()[0]
+    except sqlite3.OperationalError: # Tabela WITHOUT ROWID
+        return None
+
+
+def _somar_alteracoes_do_log(conn):
+    """Soma em EstatisticaTabela as alterações do log desde a execução anterior; retorna o seq lido."""
+    seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM LogAlteracao").fetchone()[0]
+    anterior = conn.execute("SELECT seq FROM ConsumidorLog WHERE consumidor = ?", (CONSUMIDOR_LOG,)).fetchone()
+    if anterior is None: # Primeira execução: não há ponto de partida, as contagens começam agora
+        return seq
+    for tabela, alteracoes in conn.execute(
+        "SELECT tabela, COUNT(*) FROM LogAlteracao WHERE seq > ? AND seq <= ? GROUP BY tabela", (anterior[0], seq)
+    ).fetchall():
+        conn.execute("UPDATE EstatisticaTabela SET alteracoes = alteracoes + ? WHERE tabela = ?", (alteracoes, tabela))
+    return seq
+
+
+def _tabelas_alteradas(conn):
+    """{tabela: (linhas em sqlite_stat1 ou None, alterações desde a última análise)} das tabelas que pedem novo ANALYZE."""
+    estatisticas = {}
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone():
+        for tabela, stat in conn.execute("SELECT tbl, stat FROM sqlite_stat1"):
+            estatisticas.setdefault(tabela, int(stat.split()[0]))
+    analisadas = {row[0]: (row[1], row[2]) for row in conn.execute("SELECT tabela, marcador, alteracoes FROM EstatisticaTabela")}
+    sequencias = _sequencias(conn)
+    tabelas = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")]
+
+    alteradas = {}
+    for tabela in tabelas:
+        anteriores = estatisticas.get(tabela)
+        if anteriores is None or tabela not in analisadas:
+            if conn.execute(f'SELECT 1 FROM "{tabela}" LIMIT 1').fetchone():
+                alteradas[tabela] = (anteriores, None) # Sem estatística ou sem ponto de partida: analisa uma vez
+            continue
+        marcador, alteracoes = analisadas[tabela]
+        if tabela not in open_crud.TABELAS_VERSIONADAS: # Fora do log: pelo avanço da sequência
+            atual = _marcador(conn, tabela, sequencias)
+            alteracoes = abs(atual - marcador) if atual is not None and marcador is not None else 0
+        if alteracoes >= max(MIN_ALTERACOES_ANALYZE, LIMIAR_ANALYZE * anteriores):
+            alteradas[tabela] = (anteriores, alteracoes)
+    return alteradas
+
+
+def _analyze(conn):
+    com_log = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'LogAlteracao'").fetchone() is not None
+    seq = _somar_alteracoes_do_log(conn) if com_log else 0
+    alteradas = _tabelas_alteradas(conn)
+    conn.execute(f"PRAGMA analysis_limit = {int(LIMITE_ANALISE)}")
+    sequencias = _sequencias(conn)
+    detalhes = {}
+    for tabela, (anteriores, alteracoes) in alteradas.items():
+        conn.execute(f'ANALYZE "{tabela}"')
+        depois = conn.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = ?", (tabela,)).fetchone()
+        linhas = int(depois[0].split()[0]) if depois else 0
+        conn.execute(
+            """INSERT INTO EstatisticaTabela (tabela, linhas, seq_log, data_analise, marcador, alteracoes)
+               VALUES (?, ?, ?, datetime('now', 'localtime'), ?, 0)
+               ON CONFLICT(tabela) DO UPDATE SET linhas = excluded.linhas, seq_log = excluded.seq_log, data_analise = excluded.data_analise,
+                   marcador = excluded.marcador, alteracoes = 0""",
+            (tabela, linhas, seq, _marcador(conn, tabela, sequencias))
+        )
+        detalhes[tabela] = {"linhas_estimadas_antes": anteriores, "linhas_estimadas_depois": linhas if depois else None,
+                            "alteracoes": alteracoes}
+    conn.commit()
+    if com_log: # As alterações até aqui já estão somadas: o log anterior pode ser podado
+        open_crud.registrar_posicao_log(CONSUMIDOR_LOG, seq)
+    return {"tabelas": detalhes}
+
+
+def _log(conn):
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'LogAlteracao'").fetchone() is None:
+        return {"aviso": "Banco sem log de alterações."}
+    resultado = open_crud.podar_log_alteracoes()
+    if not resultado["success"]:
+        raise sqlite3.OperationalError(resultado["message"])
+    return {"mensagem": resultado["message"]}
+
+
+def _optimize(conn):
+    conn.execute("PRAGMA optimize")
+    return {}
+
+
+def _vacuum(conn):
+    modo = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+    livres = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    if modo != 2:
+        return {"paginas_livres": livres, "aviso": "auto_vacuum não é INCREMENTAL; rode converter_auto_vacuum uma vez para liberar espaço."}
+    conn.execute(f"PRAGMA incremental_vacuum({PAGINAS_VACUO_POR_EXECUCAO})").fetchall()
+    conn.commit()
+    return {"paginas_livres_antes": livres, "paginas_livres_depois": conn.execute("PRAGMA freelist_count").fetchone()[0]}
+
+
+def _checkpoint(conn):
+    if conn.execute("PRAGMA journal_mode").fetchone()[0] != "wal":
+        return {"aviso": "Banco fora do modo WAL; nada a fazer."}
+    banco = conn.execute("PRAGMA database_list").fetchone()[2]
+    wal = os.path.getsize(banco + "-wal") if os.path.exists(banco + "-wal") else 0
+    modo = "TRUNCATE" if wal > WAL_MAXIMO_MB * 2**20 else "PASSIVE"
+    ocupado, frames, copiados = conn.execute(f"PRAGMA wal_checkpoint({modo})").fetchone()
+    return {"modo": modo, "bytes_wal_antes": wal, "ocupado": bool(ocupado), "frames_wal": frames, "frames_copiados": copiados}
+
+
+def _tarefa_crud(nome):
+    """Tarefa que chama uma função periódica do open_crud (a versão roteada, com fragmentação)."""
+    def tarefa(conn):
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'EstoqueMedicamentoPosto'").fetchone() is None:
+            return {"aviso": "Banco sem estoque (catálogo de um banco fragmentado)."}
+        resultado = getattr(open_crud, nome)()
+        if not resultado["success"]:
+            raise sqlite3.OperationalError(resultado["message"])
+        return {"mensagem": resultado["message"]}
+    return tarefa
+
+
+_FUNCOES = {
+    "alertas": _tarefa_crud("varrer_alertas_validade"),
+    "estoque": _tarefa_crud("compactar_estoque_se_necessario"),
+    "analyze": _analyze,
+    "log": _log,
+    "optimize": _optimize,
+    "vacuum": _vacuum,
+    "checkpoint": _checkpoint,
+}
+
+
+def executar_manutencao(tarefas=TAREFAS):
+    """Executa as tarefas de manutenção no banco atual, registrando cada uma em LogManutencao."""
+    invalidas = [t for t in tarefas if t not in _FUNCOES]
+    if invalidas:
+        return {"success": False, "message": f"Tarefas inválidas: {', '.join(invalidas)}. Use: {', '.join(TAREFAS)}."}
+    conn = open_crud.get_db_connection()
+    registros = []
+    try:
+        _criar_tabelas(conn)
+        conn.commit()
+        banco = conn.execute("PRAGMA database_list").fetchone()[2]
+        for tarefa in tarefas:
+            bytes_antes = _tamanho(banco)
+            inicio = time.perf_counter()
+            try:
+                detalhes = _FUNCOES[tarefa](conn)
+            except sqlite3.Error as e:
+                conn.rollback()
+                detalhes = {"erro": str(e)}
+            registro = {
+                "data_hora": datetime.now().isoformat(sep=" ", timespec="seconds"),
+                "tarefa": tarefa,
+                "segundos": round(time.perf_counter() - inicio, 3),
+                "bytes_antes": bytes_antes,
+                "bytes_depois": _tamanho(banco),
+                "detalhes": detalhes,
+            }
+            conn.execute(
+                "INSERT INTO LogManutencao (data_hora, tarefa, segundos, bytes_antes, bytes_depois, detalhes) VALUES (?, ?, ?, ?, ?, ?)",
+                (registro["data_hora"], tarefa, registro["segundos"], registro["bytes_antes"], registro["bytes_depois"],
+                 json.dumps(detalhes, ensure_ascii=False))
+            )
+            conn.commit()
+            registros.append(registro)
+        erros = [r["tarefa"] for r in registros if "erro" in r["detalhes"]]
+        segundos = sum(r["segundos"] for r in registros)
+        mensagem = f"Manutenção concluída em {segundos:.1f}s."
+        if erros:
+            mensagem = f"Manutenção concluída em {segundos:.1f}s com erro em: {', '.join(erros)}."
+        return {"success": not erros, "message": mensagem, "data": registros}
+    except (sqlite3.Error, OSError) as e:
+        return {"success": False, "message": f"Erro na manutenção: {e}", "data": registros}
+    finally:
+        conn.close()
+
+
+def converter_auto_vacuum():
+    """Habilita auto_vacuum=INCREMENTAL com um VACUUM completo (reescreve o arquivo e bloqueia o banco enquanto roda)."""
+    conn = open_crud.get_db_connection()
+    try:
+        banco = conn.execute("PRAGMA database_list").fetchone()[2]
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            return {"success": True, "message": "auto_vacuum já é INCREMENTAL."}
+        bytes_antes = _tamanho(banco)
+        inicio = time.perf_counter()
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        return {"success": True, "message": f"auto_vacuum=INCREMENTAL habilitado em {time.perf_counter() - inicio:.1f}s: "
+                                            f"{bytes_antes / 2**20:.1f} MB -> {_tamanho(banco) / 2**20:.1f} MB."}
+    except sqlite3.Error as e:
+        return {"success": False, "message": f"Erro ao converter auto_vacuum: {e}"}
+    finally:
+        conn.close()
+
+
+def get_historico(limite=50):
+    """Últimos registros de manutenção do banco atual, do mais recente para o mais antigo."""
+    conn = open_crud.get_db_connection()
+    try:
+        _criar_tabelas(conn)
+        rows = conn.execute("SELECT * FROM LogManutencao ORDER BY id_execucao DESC LIMIT ?", (limite,)).fetchall()
+        return {"success": True, "data": [{**dict(row), "detalhes": json.loads(row["detalhes"] or "{}")} for row in rows]}
+    except sqlite3.Error as e:
+        return {"success": False, "message": f"Erro ao ler o histórico de manutenção: {e}"}
+    finally:
+        conn.close()
+
+
+# --- Agendamento ---
+
+def _na_janela(janela, agora):
+    inicio, fim = janela
+    hora = agora.strftime("%H:%M")
+    return inicio <= hora < fim if inicio <= fim else hora >= inicio or hora < fim # Janela pode virar a meia-noite
+
+
+def _periodo_calmo(conn, agora):
+    """True se o log de alterações tem no máximo MAX_ALTERACOES_RECENTES nos últimos MINUTOS_SEM_MOVIMENTO minutos."""
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'LogAlteracao'").fetchone() is None:
+        return True
+    desde = (agora - timedelta(minutes=MINUTOS_SEM_MOVIMENTO)).strftime("%Y-%m-%d %H:%M:%S")
+    # Só o fim do log é lido (ordem de seq); basta saber se passa do limite
+    recentes = conn.execute(
+        "SELECT COUNT(*) FROM (SELECT data_hora FROM LogAlteracao ORDER BY seq DESC LIMIT ?) WHERE data_hora >= ?",
+        (MAX_ALTERACOES_RECENTES + 1, desde)
+    ).fetchone()[0]
+    return recentes <= MAX_ALTERACOES_RECENTES
+
+
+def _reservar_execucao(conn, agora):
+    """Registra o início de uma execução se não houver outra nas últimas HORAS_ENTRE_EXECUCOES (atômico entre processos)."""
+    limite = (agora - timedelta(hours=HORAS_ENTRE_EXECUCOES)).isoformat(sep=" ", timespec="seconds")
+    cursor = conn.execute(
+        """INSERT INTO LogManutencao (data_hora, tarefa)
+           SELECT ?, 'execucao' WHERE NOT EXISTS (SELECT 1 FROM LogManutencao WHERE tarefa = 'execucao' AND data_hora >= ?)""",
+        (agora.isoformat(sep=" ", timespec="seconds"), limite)
+    )
+    conn.commit()
+    return cursor.rowcount == 1
+
+
+def executar_se_oportuno(janela=JANELA_MANUTENCAO, agora=None):
+    """Executa a manutenção em cada banco do conjunto se estiver na janela, com pouco movimento e sem execução recente."""
+    agora = agora or datetime.now()
+    if not _na_janela(janela, agora):
+        return None
+    resultados = []
+    for banco in fragmentacao.bancos_do_conjunto():
+        with open_crud.usando_banco(banco):
+            conn = open_crud.get_db_connection()
+            try:
+                _criar_tabelas(conn)
+                if not _periodo_calmo(conn, agora) or not _reservar_execucao(conn, agora):
+                    continue
+            except sqlite3.Error:
+                continue
+            finally:
+                conn.close()
+            resultados.append(executar_manutencao())
+    return resultados
+
+
+class AgendadorManutencao:
+    """Thread de fundo que chama executar_se_oportuno a cada `intervalo` segundos."""
+
+    def __init__(self, janela=JANELA_MANUTENCAO, intervalo=INTERVALO_VERIFICACAO):
+        self.janela = janela
+        self.intervalo = intervalo
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._executar, name="manutencao", daemon=True)
+
+    def iniciar(self):
+        self._thread.start()
+        return self
+
+    def parar(self):
+        self._parar.set()
+        self._thread.join()
+
+    def _executar(self):
+        while not self._parar.wait(self.intervalo):
+            for resultado in executar_se_oportuno(self.janela) or []:
+                print(f"[manutenção] {resultado['message']}", flush=True)
+
+
+_agendador = None
+_trava_agendador = threading.Lock()
+
+
+def iniciar_agendador(janela=JANELA_MANUTENCAO, intervalo=INTERVALO_VERIFICACAO):
+    """Inicia (uma vez por processo) o agendador de manutenção."""
+    global _agendador
+    with _trava_agendador:
+        if _agendador is None:
+            _agendador = AgendadorManutencao(janela, intervalo).iniciar()
+        return _agendador
+
+
+def janela_de_texto(texto):
+    """'02:00-05:00' -> ("02:00", "05:00")."""
+    inicio, fim = (parte.strip().zfill(5) for parte in texto.split("-"))
+    return inicio, fim
+
+
+def iniciar_se_configurado():
+    """Inicia o agendador se a variável de ambiente HOSPITAL_MANUTENCAO definir a janela (ex.: 02:00-05:00)."""
+    texto = os.environ.get(VARIAVEL_AMBIENTE)
+    return iniciar_agendador(janela_de_texto(texto)) if texto else None
+
+
+def _imprimir(registro):
+    detalhes = registro["detalhes"]
+    tamanho = f"{registro['bytes_antes'] / 2**20:.1f} -> {registro['bytes_depois'] / 2**20:.1f} MB" if registro["bytes_antes"] is not None else ""
+    print(f"  {registro['data_hora']} {registro['tarefa']:<10} {registro['segundos'] or 0:>7.2f}s  {tamanho}")
+    for tabela, estatistica in detalhes.get("tabelas", {}).items():
+        print(f"      {tabela}: {estatistica['linhas_estimadas_antes']} -> {estatistica['linhas_estimadas_depois']} linhas estimadas")
+    for chave, valor in detalhes.items():
+        if chave != "tabelas":
+            print(f"      {chave}: {valor}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manutenção do banco: ANALYZE, poda do log de alterações, optimize, incremental_vacuum e checkpoints do WAL.")
+    parser.add_argument("--db", default=open_crud.DATABASE_NAME, help="Arquivo SQLite do banco de dados.")
+    parser.add_argument("--fragmentos", help="Diretório de um banco fragmentado: mantém o catálogo e cada fragmento.")
+    parser.add_argument("--tarefas", default=",".join(TAREFAS), help=f"Tarefas separadas por vírgula ({', '.join(TAREFAS)}).")
+    parser.add_argument("--agendar", action="store_true", help="Fica rodando e executa na janela de pouco movimento.")
+    parser.add_argument("--janela", default="-".join(JANELA_MANUTENCAO), help="Janela de manutenção do --agendar (ex.: 02:00-05:00).")
+    parser.add_argument("--converter-auto-vacuum", action="store_true", help="Habilita auto_vacuum=INCREMENTAL (VACUUM completo, uma vez).")
+    parser.add_argument("--historico", action="store_true", help="Só mostra os últimos registros de manutenção.")
+    args = parser.parse_args()
+    open_crud.DATABASE_NAME = args.db
+    if args.fragmentos:
+        fragmentacao.ativar(args.fragmentos)
+
+    if args.agendar:
+        print(f"Agendador de manutenção ativo (janela {args.janela}).", flush=True)
+        agendador = iniciar_agendador(janela_de_texto(args.janela))
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            agendador.parar()
+        return
+    for banco in fragmentacao.bancos_do_conjunto():
+        with open_crud.usando_banco(banco):
+            if banco:
+                print(f"[{os.path.basename(banco)}]")
+            if args.converter_auto_vacuum:
+                print(converter_auto_vacuum()["message"])
+            elif not args.historico:
+                resultado = executar_manutencao([t.strip() for t in args.tarefas.split(",") if t.strip()])
+                print(resultado["message"])
+                for registro in resultado.get("data", []):
+                    _imprimir(registro)
+                continue
+            for registro in get_historico().get("data", []):
+                _imprimir(registro)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,622 @@
+import contextlib
+import contextvars
+import functools
+import inspect
+import os
+import queue
+import random
+import re
 import sqlite3
+import time
 import bcrypt
 from datetime import datetime, date, timedelta
 
 DATABASE_NAME = 'hospital_db.sqlite'
 
+# Pool opcional de conexões (ver configurar_pool_conexoes); None = uma conexão nova por chamada
+_pool_conexoes = None
+
+# Erros de banco ocupado (SQLITE_BUSY/SQLITE_LOCKED) vistos dentro de uma escrita com repetir_se_ocupado
+_erros_ocupado = contextvars.ContextVar("erros_ocupado", default=None)
+
+def _anotar_se_ocupado(erro):
+    erros = _erros_ocupado.get()
+    if erros is not None and (getattr(erro, "sqlite_errorcode", 0) & 0xFF) in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED):
+        erros.append(erro)
+
+class _Cursor(sqlite3.Cursor):
+    """Cursor que anota os erros de banco ocupado para repetir_se_ocupado."""
+
+    def execute(self, *args):
+        try:
+            return super().execute(*args)
+        except sqlite3.OperationalError as e:
+            _anotar_se_ocupado(e)
+            raise
+
+    def executemany(self, *args):
+        try:
+            return super().executemany(*args)
+        except sqlite3.OperationalError as e:
+            _anotar_se_ocupado(e)
+            raise
+
+class _Conexao(sqlite3.Connection):
+    """Conexão do open_crud: usa _Cursor e anota os erros de banco ocupado também no commit."""
+
+    def cursor(self, factory=_Cursor):
+        return super().cursor(factory)
+
+    def execute(self, *args):
+        return self.cursor().execute(*args)
+
+    def executemany(self, *args):
+        return self.cursor().executemany(*args)
+
+    def commit(self):
+        try:
+            super().commit()
+        except sqlite3.OperationalError as e:
+            _anotar_se_ocupado(e)
+            raise
+
+class _ConexaoDoPool(_Conexao):
+    """Conexão que, ao ser fechada, volta para o pool em vez de ser encerrada."""
+
+    def close(self):
+        pool = _pool_conexoes
+        if pool is not None and self.database == DATABASE_NAME:
+            try:
+                self.rollback() # Descarta transações não confirmadas antes de reutilizar
+                pool.put_nowait(self)
+                return
+            except (queue.Full, sqlite3.Error):
+                pass
+        sqlite3.Connection.close(self)
+
+def configurar_pool_conexoes(tamanho):
+    """Ativa (tamanho > 0) ou desativa (tamanho = 0) o reuso de conexões entre chamadas."""
+    global _pool_conexoes
+    pool_antigo = _pool_conexoes
+    _pool_conexoes = queue.LifoQueue(maxsize=tamanho) if tamanho > 0 else None
+    while pool_antigo is not None and not pool_antigo.empty():
+        sqlite3.Connection.close(pool_antigo.get_nowait())
+
+# Banco escolhido para o contexto atual (ver usando_banco); None = DATABASE_NAME
+_banco_roteado = contextvars.ContextVar("banco_roteado", default=None)
+
+@contextlib.contextmanager
+def usando_banco(caminho):
+    """Faz as funções chamadas dentro do bloco usarem outro arquivo SQLite (ex.: um fragmento, em fragmentacao.py)."""
+    token = _banco_roteado.set(caminho)
+    try:
+        yield
+    finally:
+        _banco_roteado.reset(token)
+
 def get_db_connection():
-    conn = sqlite3.connect(DATABASE_NAME)
+    banco = _banco_roteado.get()
+    if banco is None and _pool_conexoes is not None:
+        try:
+            return _pool_conexoes.get_nowait()
+        except queue.Empty:
+            conn = sqlite3.connect(DATABASE_NAME, factory=_ConexaoDoPool, check_same_thread=False)
+            conn.database = DATABASE_NAME
+    else:
+        conn = sqlite3.connect(banco or DATABASE_NAME, factory=_Conexao)
     conn.row_factory = sqlite3.Row # Permite acessar colunas por nome
+    banco = banco or DATABASE_NAME
+    if banco not in _bancos_preparados:
+        _preparar_banco(conn, banco)
     return conn
 
+# --- Escritas com o banco ocupado ---
+# Com vários processos escrevendo no mesmo arquivo, uma escrita pode falhar com "database is locked"
+# mesmo com a espera do SQLite (timeout da conexão): a trava passou do tempo ou o SQLite desistiu na
+# hora para evitar um impasse. Cada função de escrita faz uma única transação, então ela pode ser
+# repetida inteira: repetir_se_ocupado tenta de novo após uma espera que dobra a cada tentativa,
+# com variação aleatória para que os processos que colidiram não voltem todos ao mesmo tempo.
+TENTATIVAS_BANCO_OCUPADO = 6
+ESPERA_BANCO_OCUPADO = 0.05 # segundos antes da 2ª tentativa
+ESPERA_MAXIMA_BANCO_OCUPADO = 2.0
+
+def repetir_se_ocupado(func):
+    """Repete a escrita `func` (que retorna {"success", ...}) quando ela falha com o banco ocupado."""
+    @functools.wraps(func)
+    def executar(*args, **kwargs):
+        if _erros_ocupado.get() is not None: # Chamada de dentro de outra escrita: a de fora repete tudo
+            return func(*args, **kwargs)
+        tentativa = 1
+        while True:
+            erros = []
+            token = _erros_ocupado.set(erros)
+            try:
+                resultado = func(*args, **kwargs)
+            finally:
+                _erros_ocupado.reset(token)
+            if not erros or resultado.get("success") or tentativa >= TENTATIVAS_BANCO_OCUPADO:
+                return resultado
+            espera = min(ESPERA_BANCO_OCUPADO * 2 ** (tentativa - 1), ESPERA_MAXIMA_BANCO_OCUPADO)
+            time.sleep(espera * random.uniform(0.5, 1.5))
+            tentativa += 1
+    executar.repete_se_ocupado = True
+    return executar
+
+# Bancos (caminhos) em que as tabelas auxiliares e os triggers já foram conferidos
+_bancos_preparados = set()
+
+def _preparar_banco(conn, banco):
+    """Cria, uma vez por banco, as tabelas e índices auxiliares do open_crud (versões, log de alterações, livro, lotes das distribuições e alertas de estoque, índices do prontuário, por posto e de e-mail, registro do arquivo histórico)."""
+    try:
+        _criar_livro_estoque(conn)
+        _criar_distribuicao_lote(conn) # Antes dos triggers de versão e do log, que a incluem
+        _criar_versionamento(conn)
+        _criar_log_alteracoes(conn)
+        _criar_indices_estoque(conn)
+        _criar_indices_prontuario(conn)
+        _criar_indices_escopo(conn)
+        _criar_indice_email(conn)
+        _criar_alertas_estoque(conn)
+        _criar_arquivo_historico(conn)
+        conn.commit()
+        _bancos_preparados.add(banco)
+    except sqlite3.Error:
+        conn.rollback() # Tenta de novo na próxima conexão (ex.: banco bloqueado no momento)
+
 # --- Funções de Hashing de Senha ---
 
 def hash_password(password):
-    """Gera o hash de uma senha usando bcrypt."""
-    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+    """Gera o hash de uma senha usando bcrypt, com o custo definido na política de senhas."""
+    import politica_senha # Importação tardia: politica_senha depende deste módulo
+    return politica_senha.hash_senha(password)
 
 def check_password(password, hashed_password):
     """Verifica se uma senha corresponde ao hash armazenado."""
     return bcrypt.checkpw(password.encode("utf-8"), hashed_password.encode("utf-8"))
 
+# --- Projeção de Colunas nas Listagens ---
+# Cada listagem descreve sua tabela base, os JOINs possíveis (com as dependências entre eles)
+# e os campos que podem ser pedidos em `fields=`. Com `fields` informado, apenas as colunas
+# pedidas são selecionadas e só entram os JOINs exigidos por elas e pelos filtros usados.
+
+def _aliases_usados(*trechos_sql):
+    """Retorna os aliases de tabela (prefixos 'x.') referenciados nos trechos SQL."""
+    aliases = set()
+    for trecho in trechos_sql:
+        aliases.update(re.findall(r"\b([a-z_]+)\.[a-z_]+", trecho))
+    return aliases
+
+def _montar_select(listagem, fields=None, conditions=()):
+    """Monta o 'SELECT ... FROM ... WHERE 1=1' de uma listagem, aplicando a projeção de colunas."""
+    if fields is None:
+        colunas = listagem["padrao"]
+        aliases = {alias for alias, _, _ in listagem["joins"]}
+    else:
+        invalidos = [f for f in fields if f not in listagem["campos"]]
+        if invalidos or not fields:
+            raise ValueError(f"Campos inválidos para a listagem: {', '.join(invalidos) or '(vazio)'}")
+        expressoes = [listagem["campos"][f] for f in fields]
+        colunas = ", ".join(f"{expr} AS {campo}" for campo, expr in zip(fields, expressoes))
+        aliases = _aliases_usados(*expressoes, *conditions)
+
+    # Inclui as dependências dos JOINs necessários (ex.: Medicamento depende de EstoqueMedicamentoPosto)
+    dependencias = {alias: deps for alias, _, deps in listagem["joins"]}
+    pendentes = list(aliases)
+    while pendentes:
+        alias = pendentes.pop()
+        for dep in dependencias.get(alias, ()):
+            if dep not in aliases:
+                aliases.add(dep)
+                pendentes.append(dep)
+
+    joins = [sql for alias, sql, _ in listagem["joins"] if alias in aliases]
+    return f"SELECT {colunas} FROM {listagem['tabela']} {' '.join(joins)} WHERE 1=1"
+
+def _aplicar_paginacao(listagem, conditions, params, after_id=None, limit=None, ordem_padrao=""):
+    """Acrescenta a condição de keyset (chave > after_id) e retorna a cláusula ORDER BY/LIMIT da listagem.
+
+    Sem after_id/limit a listagem mantém a ordenação original; com eles os registros vêm
+    ordenados pela chave primária, e a próxima página começa após a última chave recebida.
+    """
+    if after_id is None and limit is None:
+        return ordem_padrao
+    if after_id is not None:
+        conditions.append(f"{listagem['chave']} > ?")
+        params.append(after_id)
+    return f" ORDER BY {listagem['chave']} LIMIT {int(limit) if limit is not None else -1}"
+
+# --- Escopo de Acesso (postos visíveis ao usuário) ---
+# Dentro de `with escopo_acesso(postos, hospitais):` as listagens get_all_* e os relatórios só
+# leem os registros desses postos: cada listagem declara em "escopo" a coluna de posto (ou de
+# hospital) que recebe o filtro, e os relatórios acrescentam o filtro na coluna de posto da sua
+# consulta. As buscas por ID e o prontuário aplicam o mesmo filtro: um registro fora do escopo
+# é tratado como não encontrado. O escopo vale para o contexto atual (thread/tarefa), então sessões concorrentes não
+# interferem umas nas outras. Sem escopo ativo nada muda.
+_escopo_acesso = contextvars.ContextVar("escopo_acesso", default=None)
+
+@contextlib.contextmanager
+def escopo_acesso(postos=None, hospitais=None):
+    """Restringe as listagens e relatórios do bloco aos postos (e hospitais) informados; postos=None não restringe."""
+    escopo = None if postos is None else {"postos": tuple(postos), "hospitais": tuple(hospitais or ())}
+    token = _escopo_acesso.set(escopo)
+    try:
+        yield
+    finally:
+        _escopo_acesso.reset(token)
+
+def escopo_atual():
+    """Escopo ativo ({"postos": (...), "hospitais": (...)}) ou None."""
+    return _escopo_acesso.get()
+
+def _filtro_in(coluna, ids):
+    if not ids:
+        return "0", [] # Escopo vazio: nenhum registro visível
+    return f"{coluna} IN ({', '.join('?' * len(ids))})", list(ids)
+
+def _condicoes_escopo(listagem):
+    """Condições e parâmetros iniciais de uma listagem: o filtro do escopo ativo, se houver."""
+    escopo = _escopo_acesso.get()
+    if escopo is None or "escopo" not in listagem:
+        return [], []
+    tipo, coluna = listagem["escopo"]
+    condicao, params = _filtro_in(coluna, escopo[tipo])
+    return [condicao], params
+
+def _filtro_escopo(coluna_posto):
+    """Trecho ' AND coluna IN (...)' e parâmetros para os relatórios ('' sem escopo ativo)."""
+    escopo = _escopo_acesso.get()
+    if escopo is None:
+        return "", []
+    condicao, params = _filtro_in(coluna_posto, escopo["postos"])
+    return f" AND {condicao}", params
+
+def _posto_fora_do_escopo(id_posto):
+    """True se há escopo ativo e o posto não está nele."""
+    escopo = _escopo_acesso.get()
+    return escopo is not None and id_posto not in escopo["postos"]
+
+def _escopo_por_id(listagem):
+    """Trecho ' AND ...' e parâmetros do escopo ativo para a busca por ID de uma listagem ('' sem escopo ativo)."""
+    conditions, params = _condicoes_escopo(listagem)
+    return "".join(f" AND {c}" for c in conditions), params
+
+def _criar_indices_escopo(conn):
+    """Índices por posto usados pelos filtros de escopo."""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_posto_hospital ON PostoSaude (id_hospital_vinculado)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_funcionario_posto ON Funcionario (id_posto_lotacao)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_paciente_posto ON Paciente (id_posto_referencia)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_estoque_posto ON EstoqueMedicamentoPosto (id_posto)")
+    # Por posto em ordem de id (paginação por keyset) e por posto e data (listagem padrão e relatórios por período)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_atendimento_posto ON Atendimento (id_posto_atendimento, id_atendimento)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_atendimento_posto_data ON Atendimento (id_posto_atendimento, data_hora_inicio_atendimento)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_prescricao_estoque ON Prescricao (id_medicamento_estoque)")
+
+# --- Arquivo Histórico (atendimentos antigos fora das tabelas quentes) ---
+# O arquivamento.py move atendimentos encerrados antigos, com suas prescrições e distribuições,
+# para um arquivo SQLite por ano, registrado em ArquivoHistorico com o intervalo de datas que ele
+# guarda (dos atendimentos e, à parte, a última data de prescrição/distribuição). Listagens e
+# relatórios com data inicial incluem (UNION ALL) só os arquivos cujo intervalo o período alcança;
+# sem data inicial, leem apenas as tabelas quentes. Buscas por ID, o prontuário e a conferência de
+# registros vinculados antes de uma exclusão sempre percorrem também os anos arquivados, um por vez.
+TABELAS_ARQUIVAVEIS = ("Atendimento", "Prescricao", "DistribuicaoMedicamento")
+MAX_ARQUIVOS_POR_CONSULTA = 9 # O SQLite anexa no máximo 10 bancos por conexão
+
+def _criar_arquivo_historico(conn):
+    conn.execute("""CREATE TABLE IF NOT EXISTS ArquivoHistorico (
+        ano INTEGER PRIMARY KEY,
+        arquivo TEXT NOT NULL,
+        data_minima TEXT NOT NULL,
+        data_maxima TEXT NOT NULL,
+        data_maxima_distribuicao TEXT NOT NULL,
+        atendimentos INTEGER NOT NULL DEFAULT 0,
+        prescricoes INTEGER NOT NULL DEFAULT 0,
+        distribuicoes INTEGER NOT NULL DEFAULT 0,
+        data_arquivamento TEXT
+    )""")
+
+def _arquivos_no_periodo(conn, start_date=None, end_date=None, por_distribuicao=False):
+    """Anos arquivados ([(ano, arquivo)]) cujo intervalo de datas o período alcança; nenhum sem data inicial.
+
+    Com por_distribuicao=True o período é de datas de prescrição/distribuição, que podem ser
+    posteriores às do atendimento arquivado.
+    """
+    if not start_date:
+        return []
+    fim = f"{end_date} 23:59:59" if end_date and len(str(end_date)) <= 10 else str(end_date or "9999-12-31")
+    coluna_maxima = "data_maxima_distribuicao" if por_distribuicao else "data_maxima"
+    return conn.execute(
+        f"SELECT ano, arquivo FROM ArquivoHistorico WHERE {coluna_maxima} >= ? AND data_minima <= ? ORDER BY ano",
+        (str(start_date), fim)
+    ).fetchall()
+
+def _fontes_arquivadas(conn, start_date=None, end_date=None, por_distribuicao=False):
+    """Anexa à conexão os arquivos alcançados pelo período e retorna {tabela: subconsulta com UNION ALL} ({} se nenhum)."""
+    arquivos = _arquivos_no_periodo(conn, start_date, end_date, por_distribuicao)
+    if not arquivos:
+        return {}
+    if len(arquivos) > MAX_ARQUIVOS_POR_CONSULTA:
+        raise sqlite3.OperationalError(f"O período alcança {len(arquivos)} anos arquivados; consulte no máximo {MAX_ARQUIVOS_POR_CONSULTA} anos por vez.")
+    esquemas = [_anexar_arquivo(conn, ano, arquivo, [f"arquivo_{a}" for a, _ in arquivos]) for ano, arquivo in arquivos]
+    return {
+        tabela: "(" + " UNION ALL ".join([f"SELECT * FROM main.{tabela}"] + [f"SELECT * FROM {e}.{tabela}" for e in esquemas]) + ")"
+        for tabela in TABELAS_ARQUIVAVEIS
+    }
+
+def _anexar_arquivo(conn, ano, arquivo, manter=()):
+    """Anexa o arquivo do ano à conexão (se ainda não estiver) e retorna o nome do esquema.
+
+    Conexões do pool guardam os anexos de consultas anteriores; os de outros anos (exceto os de
+    `manter`) são desanexados antes, para não passar do limite de bancos anexados do SQLite.
+    """
+    esquema = f"arquivo_{ano}"
+    anexados = {row[1]: row[2] for row in conn.execute("PRAGMA database_list")}
+    if esquema not in anexados:
+        for outro in anexados:
+            if outro.startswith("arquivo_") and outro not in manter:
+                conn.execute(f"DETACH DATABASE {outro}")
+        conn.execute(f"ATTACH DATABASE ? AS {esquema}", (os.path.join(os.path.dirname(anexados["main"]), arquivo),))
+    return esquema
+
+def _anos_arquivados(conn, start_date=None):
+    """Todos os anos arquivados ([(ano, arquivo)], do mais recente ao mais antigo) com dados a partir de `start_date`."""
+    return conn.execute(
+        "SELECT ano, arquivo FROM ArquivoHistorico WHERE data_maxima_distribuicao >= ? ORDER BY ano DESC",
+        (str(start_date or ""),)
+    ).fetchall()
+
+def _fontes_do_ano(esquema):
+    """Fontes que leem as tabelas arquiváveis só do arquivo `esquema` (tudo de um atendimento arquivado fica no mesmo ano)."""
+    return {tabela: f"{esquema}.{tabela}" for tabela in TABELAS_ARQUIVAVEIS}
+
+def _buscar_no_historico(conn, query, params):
+    """Executa `query` (sobre as tabelas arquiváveis) em cada ano arquivado até encontrar uma linha; None se nenhum a tiver."""
+    for ano, arquivo in _anos_arquivados(conn):
+        row = conn.execute(_com_fontes(query, _fontes_do_ano(_anexar_arquivo(conn, ano, arquivo))), params).fetchone()
+        if row is not None:
+            return row
+    return None
+
+def _referenciado_no_historico(conn, tabela, coluna, valor):
+    """Indica se algum ano arquivado tem linha de `tabela` com `coluna` = valor (conferência antes de excluir o registro pai)."""
+    return _buscar_no_historico(conn, f"SELECT 1 FROM {tabela} WHERE {coluna} = ? LIMIT 1", (valor,)) is not None
+
+def _com_fontes(query, fontes):
+    """Troca as tabelas arquiváveis citadas após FROM/JOIN pelas fontes com os arquivos (sem fontes, a consulta não muda)."""
+    if not fontes:
+        return query
+    return re.sub(r"\b(FROM|JOIN)\s+(\w+)\b(?!\.)", lambda m: f"{m.group(1)} {fontes.get(m.group(2), m.group(2))}", query)
+
+def _alcanca_arquivos(start_date=None, end_date=None):
+    """Indica se o período pode incluir algum ano arquivado (consulta só o registro, sem anexar arquivos)."""
+    if not start_date:
+        return False
+    conn = get_db_connection()
+    try:
+        return bool(_arquivos_no_periodo(conn, start_date, end_date, por_distribuicao=True))
+    except sqlite3.Error:
+        return False
+    finally:
+        conn.close()
+
+# --- Versões por Tabela (Leituras Condicionais) ---
+# Cada tabela tem um contador em VersaoTabela, incrementado por triggers a cada INSERT/UPDATE/DELETE
+# (inclusive escritas feitas fora do open_crud, como as do dados_fake). Listagens e relatórios
+# aceitam `if_version`: se a versão das tabelas envolvidas ainda é a mesma, retornam
+# {"success": True, "not_modified": True, "version": v} sem executar a consulta.
+
+TABELAS_VERSIONADAS = (
+    "Hospital", "PostoSaude", "Funcionario", "Paciente", "Medicamento",
+    "EstoqueMedicamentoPosto", "Atendimento", "Prescricao", "DistribuicaoMedicamento", "DistribuicaoLote",
+)
+
+def _criar_versionamento(conn):
+    """Cria a tabela VersaoTabela e os triggers que mantêm os contadores."""
+    conn.execute("CREATE TABLE IF NOT EXISTS VersaoTabela (tabela TEXT PRIMARY KEY, versao INTEGER NOT NULL DEFAULT 0)")
+    for tabela in TABELAS_VERSIONADAS:
+        conn.execute("INSERT OR IGNORE INTO VersaoTabela (tabela, versao) VALUES (?, 0)", (tabela,))
+        for evento in ("INSERT", "UPDATE", "DELETE"):
+            conn.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_versao_{tabela}_{evento.lower()}
+                AFTER {evento} ON {tabela}
+                BEGIN UPDATE VersaoTabela SET versao = versao + 1 WHERE tabela = '{tabela}'; END""")
+
+def _tabelas_da_listagem(listagem):
+    """Retorna a tabela base e as tabelas dos JOINs de uma listagem."""
+    tabelas = [listagem["tabela"].split()[0]]
+    for _, sql, _ in listagem["joins"]:
+        tabelas.extend(re.findall(r"\bJOIN\s+(\w+)", sql))
+    return tuple(dict.fromkeys(tabelas))
+
+def _versao_tabelas(conn, tabelas):
+    """Retorna a versão combinada das tabelas (soma dos contadores; só cresce a cada escrita)."""
+    marcadores = ", ".join("?" * len(tabelas))
+    row = conn.execute(f"SELECT COALESCE(SUM(versao), 0) FROM VersaoTabela WHERE tabela IN ({marcadores})", tuple(tabelas)).fetchone()
+    return row[0]
+
+def _nao_modificado(versao):
+    return {"success": True, "not_modified": True, "version": versao}
+
+def get_table_versions(tabelas=None):
+    """Retorna as versões atuais das tabelas ({tabela: versao}), para caches de clientes."""
+    conn = get_db_connection()
+    try:
+        tabelas = tuple(tabelas or TABELAS_VERSIONADAS)
+        marcadores = ", ".join("?" * len(tabelas))
+        rows = conn.execute(f"SELECT tabela, versao FROM VersaoTabela WHERE tabela IN ({marcadores})", tabelas).fetchall()
+        return {"success": True, "data": {row["tabela"]: row["versao"] for row in rows}}
+    except sqlite3.Error as e:
+        return {"success": False, "message": f"Erro ao buscar versões das tabelas: {e}"}
+    finally:
+        conn.close()
+
+# --- Log de Alterações (Change Data Capture) ---
+# Toda escrita nas tabelas de TABELAS_VERSIONADAS gera uma linha em LogAlteracao (via triggers,
+# na mesma transação da escrita), com número de sequência crescente que nunca é reutilizado,
+# a tabela, a operação e o ID do registro; o conteúdo atual é lido da própria tabela.
+# Consumidores incrementais guardam o último `seq` processado, leem só o que
+# veio depois com changes_since(seq) e registram a posição em ConsumidorLog
+# (registrar_posicao_log). A manutenção periódica (podar_log_alteracoes) remove o que todos os
+# consumidores ativos já leram, preservando sempre as últimas RETENCAO_MINIMA_LOG_HORAS horas para
+# clientes que não se registram (ex.: /api/alteracoes).
+
+RETENCAO_MINIMA_LOG_HORAS = 24
+CONSUMIDOR_INATIVO_DIAS = 30 # Consumidores sem registrar posição há mais tempo não seguram a poda
+
+def _criar_log_alteracoes(conn):
+    """Cria a tabela LogAlteracao, o registro de consumidores e os triggers que alimentam o log."""
+    conn.execute("""CREATE TABLE IF NOT EXISTS LogAlteracao (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        tabela TEXT NOT NULL,
+        operacao TEXT NOT NULL,
+        id_registro INTEGER NOT NULL,
+        data_hora TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime'))
+    )""")
+    conn.execute("""CREATE TABLE IF NOT EXISTS ConsumidorLog (
+        consumidor TEXT PRIMARY KEY,
+        seq INTEGER NOT NULL,
+        data_hora TEXT NOT NULL
+    )""")
+    for tabela in TABELAS_VERSIONADAS:
+        colunas = conn.execute(f"PRAGMA table_info({tabela})").fetchall()
+        chave = next(coluna[1] for coluna in colunas if coluna[5])
+        for evento, ref in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+            conn.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_log_{tabela}_{evento.lower()}
+                AFTER {evento} ON {tabela}
+                BEGIN
+                    INSERT INTO LogAlteracao (tabela, operacao, id_registro) VALUES ('{tabela}', '{evento}', {ref}.{chave});
+                END""")
+
+def get_alteracoes(after_seq=0, limit=500, tabelas=None):
+    """Retorna até `limit` alterações com seq > after_seq, em ordem, e o último seq lido (last_seq)."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        query = "SELECT seq, tabela, operacao, id_registro, data_hora FROM LogAlteracao WHERE seq > ?"
+        params = [after_seq]
+        if tabelas:
+            query += f" AND tabela IN ({', '.join('?' * len(tabelas))})"
+            params.extend(tabelas)
+        query += " ORDER BY seq LIMIT ?"
+        params.append(limit)
+
+        cursor.execute(query, tuple(params))
+        alteracoes = [dict(row) for row in cursor.fetchall()]
+        last_seq = alteracoes[-1]["seq"] if alteracoes else after_seq
+        return {"success": True, "data": alteracoes, "last_seq": last_seq}
+    except sqlite3.Error as e:
+        return {"success": False, "message": f"Erro ao buscar alterações: {e}"}
+    finally:
+        conn.close()
+
+def changes_since(seq=0, tabelas=None, tamanho_bloco=500):
+    """Gera, em ordem, todas as alterações após `seq`, lendo o log em blocos (uma conexão curta por bloco).
+
+    Lança RuntimeError se a leitura de um bloco falhar, para o consumidor não avançar o seu `seq`.
+    """
+    while True:
+        resultado = get_alteracoes(seq, tamanho_bloco, tabelas)
+        if not resultado["success"]:
+            raise RuntimeError(resultado["message"])
+        yield from resultado["data"]
+        if len(resultado["data"]) < tamanho_bloco:
+            return
+        seq = resultado["last_seq"]
+
+def get_ultimo_seq_alteracao():
+    """Retorna o seq da alteração mais recente (0 se o log estiver vazio)."""
+    conn = get_db_connection()
+    try:
+        row = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM LogAlteracao").fetchone()
+        return {"success": True, "data": row[0]}
+    except sqlite3.Error as e:
+        return {"success": False, "message": f"Erro ao buscar a última alteração: {e}"}
+    finally:
+        conn.close()
+
+@repetir_se_ocupado
+def registrar_posicao_log(consumidor, seq):
+    """Registra que `consumidor` já processou o log até `seq` (as alterações anteriores podem ser podadas)."""
+    conn = get_db_connection()
+    try:
+        conn.execute(
+            """INSERT INTO ConsumidorLog (consumidor, seq, data_hora) VALUES (?, ?, datetime('now', 'localtime'))
+            ON CONFLICT (consumidor) DO UPDATE SET seq = excluded.seq, data_hora = excluded.data_hora""",
+            (consumidor, seq)
+        )
+        conn.commit()
+        return {"success": True, "message": f"Posição de {consumidor} no log registrada ({seq})."}
+    except sqlite3.Error as e:
+        return {"success": False, "message": f"Erro ao registrar a posição no log: {e}"}
+    finally:
+        conn.close()
+
+@repetir_se_ocupado
+def remover_consumidor_log(consumidor):
+    """Remove um consumidor do registro (ele deixa de segurar a poda do log)."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("DELETE FROM ConsumidorLog WHERE consumidor = ?", (consumidor,))
+        conn.commit()
+        if cursor.rowcount > 0:
+            return {"success": True, "message": "Consumidor removido do registro do log."}
+        return {"success": False, "message": "Consumidor não encontrado."}
+    except sqlite3.Error as e:
+        return {"success": False, "message": f"Erro ao remover consumidor do log: {e}"}
+    finally:
+        conn.close()
+
+def get_consumidores_log():
+    """Retorna os consumidores registrados, com o seq até onde leram e a data do último registro."""
+    conn = get_db_connection()
+    try:
+        rows = conn.execute("SELECT consumidor, seq, data_hora FROM ConsumidorLog ORDER BY consumidor").fetchall()
+        return {"success": True, "data": [dict(row) for row in rows]}
+    except sqlite3.Error as e:
+        return {"success": False, "message": f"Erro ao buscar os consumidores do log: {e}"}
+    finally:
+        conn.close()
+
+@repetir_se_ocupado
+def delete_alteracoes_ate(seq):
+    """Remove do log as alterações com seq <= `seq` (já processadas por todos os consumidores)."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("DELETE FROM LogAlteracao WHERE seq <= ?", (seq,))
+        conn.commit()
+        return {"success": True, "message": f"{cursor.rowcount} alteração(ões) removida(s) do log."}
+    except sqlite3.Error as e:
+        return {"success": False, "message": f"Erro ao limpar o log de alterações: {e}"}
+    finally:
+        conn.close()
+
+def podar_log_alteracoes():
+    """Remove do log o que todos os consumidores ativos já leram, mantendo as últimas RETENCAO_MINIMA_LOG_HORAS horas."""
+    conn = get_db_connection()
+    try:
+        ativos_desde = (datetime.now() - timedelta(days=CONSUMIDOR_INATIVO_DIAS)).strftime("%Y-%m-%d %H:%M:%S")
+        menor_posicao = conn.execute("SELECT MIN(seq) FROM ConsumidorLog WHERE data_hora >= ?", (ativos_desde,)).fetchone()[0]
+        recentes_desde = (datetime.now() - timedelta(hours=RETENCAO_MINIMA_LOG_HORAS)).strftime("%Y-%m-%d %H:%M:%S")
+        # Primeira alteração dentro da janela de retenção (o log está em ordem de data_hora)
+        primeira_recente = conn.execute(
+            "SELECT MIN(seq) FROM LogAlteracao WHERE seq > (SELECT COALESCE(MAX(seq), 0) FROM LogAlteracao WHERE data_hora < ?)",
+            (recentes_desde,)
+        ).fetchone()[0]
+        ultimo_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM LogAlteracao").fetchone()[0]
+    except sqlite3.Error as e:
+        return {"success": False, "message": f"Erro ao consultar os consumidores do log: {e}"}
+    finally:
+        conn.close()
+    limite = ultimo_seq if primeira_recente is None else primeira_recente - 1
+    if menor_posicao is not None:
+        limite = min(limite, menor_posicao)
+    if limite <= 0:
+        return {"success": True, "message": "Nenhuma alteração a remover do log."}
+    return delete_alteracoes_ate(limite)
+
 # --- Funções CRUD para Hospital ---
 
+@repetir_se_ocupado
 def create_hospital(nome, cnpj=None, endereco=None, telefone=None, email=None):
     """Cria um novo registro de hospital no banco de dados."""
     if not nome:
@@ -44,21 +640,43 @@ def create_hospital(nome, cnpj=None, endereco=None, telefone=None, email=None):
     finally:
         conn.close()
 
-def get_all_hospitals(search_term=None):
-    """Retorna todos os hospitais cadastrados, com opção de busca por nome ou CNPJ."""
+_LISTAGEM_HOSPITAIS = {
+    "tabela": "Hospital",
+    "chave": "id_hospital",
+    "escopo": ("hospitais", "id_hospital"),
+    "padrao": "*",
+    "joins": [],
+    "campos": {
+        "id_hospital": "id_hospital", "nome_hospital": "nome_hospital", "cnpj_hospital": "cnpj_hospital",
+        "endereco_hospital": "endereco_hospital", "telefone_hospital": "telefone_hospital", "email_hospital": "email_hospital",
+    },
+}
+
+def get_all_hospitals(search_term=None, fields=None, after_id=None, limit=None, if_version=None):
+    """Retorna todos os hospitais cadastrados, com opção de busca por nome ou CNPJ, projeção de colunas (fields), paginação por keyset (after_id/limit) e leitura condicional (if_version)."""
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
-        query = "SELECT * FROM Hospital"
-        params = []
+        versao = _versao_tabelas(conn, _tabelas_da_listagem(_LISTAGEM_HOSPITAIS))
+        if versao == if_version:
+            return _nao_modificado(versao)
+        conditions, params = _condicoes_escopo(_LISTAGEM_HOSPITAIS)
         if search_term:
-            query += " WHERE nome_hospital LIKE ? OR cnpj_hospital LIKE ?"
+            conditions.append("(nome_hospital LIKE ? OR cnpj_hospital LIKE ?)")
             params.append(f"%{search_term}%")
             params.append(f"%{search_term}%")
+
+        ordem = _aplicar_paginacao(_LISTAGEM_HOSPITAIS, conditions, params, after_id, limit)
+        query = _montar_select(_LISTAGEM_HOSPITAIS, fields, conditions)
+        if conditions:
+            query += " AND " + " AND ".join(conditions)
+        query += ordem
         
         cursor.execute(query, tuple(params))
         hospitais = cursor.fetchall()
-        return {"success": True, "data": [dict(row) for row in hospitais]}
+        return {"success": True, "data": [dict(row) for row in hospitais], "version": versao}
+    except ValueError as e:
+        return {"success": False, "message": str(e)}
     except sqlite3.Error as e:
         return {"success": False, "message": f"Erro ao buscar hospitais: {e}"}
     finally:
@@ -69,7 +687,8 @@ def get_hospital_by_id(hospital_id):
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
-        cursor.execute("SELECT * FROM Hospital WHERE id_hospital = ?", (hospital_id,))
+        filtro, params = _escopo_por_id(_LISTAGEM_HOSPITAIS)
+        cursor.execute(f"SELECT * FROM Hospital WHERE id_hospital = ?{filtro}", (hospital_id, *params))
         hospital = cursor.fetchone()
         if hospital:
             return {"success": True, "data": dict(hospital)}
@@ -79,6 +698,7 @@ def get_hospital_by_id(hospital_id):
     finally:
         conn.close()
 
+@repetir_se_ocupado
 def update_hospital(hospital_id, nome=None, cnpj=None, endereco=None, telefone=None, email=None):
     """Atualiza um registro de hospital."""
     if not hospital_id:
@@ -116,6 +736,7 @@ def update_hospital(hospital_id, nome=None, cnpj=None, endereco=None, telefone=N
     finally:
         conn.close()
 
+@repetir_se_ocupado
 def delete_hospital(hospital_id):
     """Deleta um registro de hospital."""
     conn = get_db_connection()
@@ -138,6 +759,7 @@ def delete_hospital(hospital_id):
 
 # --- Funções CRUD para PostoSaude ---
 
+@repetir_se_ocupado
 def create_posto_saude(nome, endereco, id_hospital_vinculado, telefone=None, email=None):
     """Cria um novo registro de posto de saúde."""
     if not all([nome, endereco, id_hospital_vinculado]):
@@ -151,20 +773,35 @@ def create_posto_saude(nome, endereco, id_hospital_vinculado, telefone=None, ema
             (nome, endereco, id_hospital_vinculado, telefone, email)
         )
         conn.commit()
+        notificar_funcionario(None) # Muda os postos visíveis de quem tem escopo de hospital
         return {"success": True, "message": "Posto de saúde cadastrado com sucesso!", "id": cursor.lastrowid}
     except sqlite3.Error as e:
         return {"success": False, "message": f"Erro ao cadastrar posto de saúde: {e}"}
     finally:
         conn.close()
 
-def get_all_postos_saude(search_term=None, id_hospital_vinculado=None):
-    """Retorna todos os postos de saúde, com opção de busca e filtro por hospital."""
+_LISTAGEM_POSTOS = {
+    "tabela": "PostoSaude ps",
+    "chave": "ps.id_posto",
+    "escopo": ("postos", "ps.id_posto"),
+    "padrao": "ps.*, h.nome_hospital",
+    "joins": [("h", "JOIN Hospital h ON ps.id_hospital_vinculado = h.id_hospital", ())],
+    "campos": {
+        "id_posto": "ps.id_posto", "nome_posto": "ps.nome_posto", "endereco_posto": "ps.endereco_posto",
+        "telefone_posto": "ps.telefone_posto", "email_posto": "ps.email_posto",
+        "id_hospital_vinculado": "ps.id_hospital_vinculado", "nome_hospital": "h.nome_hospital",
+    },
+}
+
+def get_all_postos_saude(search_term=None, id_hospital_vinculado=None, fields=None, after_id=None, limit=None, if_version=None):
+    """Retorna todos os postos de saúde, com opção de busca, filtro por hospital, projeção de colunas (fields), paginação por keyset (after_id/limit) e leitura condicional (if_version)."""
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
-        query = """SELECT ps.*, h.nome_hospital FROM PostoSaude ps JOIN Hospital h ON ps.id_hospital_vinculado = h.id_hospital WHERE 1=1"""
-        params = []
-        conditions = []
+        versao = _versao_tabelas(conn, _tabelas_da_listagem(_LISTAGEM_POSTOS))
+        if versao == if_version:
+            return _nao_modificado(versao)
+        conditions, params = _condicoes_escopo(_LISTAGEM_POSTOS)
 
         if search_term:
             conditions.append("(ps.nome_posto LIKE ? OR ps.endereco_posto LIKE ?)")
@@ -174,12 +811,17 @@ def get_all_postos_saude(search_term=None, id_hospital_vinculado=None):
             conditions.append("ps.id_hospital_vinculado = ?")
             params.append(id_hospital_vinculado)
         
+        ordem = _aplicar_paginacao(_LISTAGEM_POSTOS, conditions, params, after_id, limit)
+        query = _montar_select(_LISTAGEM_POSTOS, fields, conditions)
         if conditions:
             query += " AND " + " AND ".join(conditions)
+        query += ordem
 
         cursor.execute(query, tuple(params))
         postos = cursor.fetchall()
-        return {"success": True, "data": [dict(row) for row in postos]}
+        return {"success": True, "data": [dict(row) for row in postos], "version": versao}
+    except ValueError as e:
+        return {"success": False, "message": str(e)}
     except sqlite3.Error as e:
         return {"success": False, "message": f"Erro ao buscar postos de saúde: {e}"}
     finally:
@@ -190,7 +832,8 @@ def get_posto_saude_by_id(posto_id):
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
-        cursor.execute("SELECT ps.*, h.nome_hospital FROM PostoSaude ps JOIN Hospital h ON ps.id_hospital_vinculado = h.id_hospital WHERE ps.id_posto = ?", (posto_id,))
+        filtro, params = _escopo_por_id(_LISTAGEM_POSTOS)
+        cursor.execute(f"SELECT ps.*, h.nome_hospital FROM PostoSaude ps JOIN Hospital h ON ps.id_hospital_vinculado = h.id_hospital WHERE ps.id_posto = ?{filtro}", (posto_id, *params))
         posto = cursor.fetchone()
         if posto:
             return {"success": True, "data": dict(posto)}
@@ -200,6 +843,7 @@ def get_posto_saude_by_id(posto_id):
     finally:
         conn.close()
 
+@repetir_se_ocupado
 def update_posto_saude(posto_id, nome=None, endereco=None, id_hospital_vinculado=None, telefone=None, email=None):
     """Atualiza um registro de posto de saúde."""
     if not posto_id:
@@ -225,6 +869,7 @@ def update_posto_saude(posto_id, nome=None, endereco=None, id_hospital_vinculado
         cursor.execute(query, tuple(params))
         conn.commit()
         if cursor.rowcount > 0:
+            notificar_funcionario(None)
             return {"success": True, "message": "Posto de saúde atualizado com sucesso!"}
         return {"success": False, "message": "Posto de saúde não encontrado ou nenhum dado alterado."}
     except sqlite3.Error as e:
@@ -232,6 +877,7 @@ def update_posto_saude(posto_id, nome=None, endereco=None, id_hospital_vinculado
     finally:
         conn.close()
 
+@repetir_se_ocupado
 def delete_posto_saude(posto_id):
     """Deleta um registro de posto de saúde."""
     conn = get_db_connection()
@@ -245,7 +891,7 @@ def delete_posto_saude(posto_id):
         if cursor.fetchone()[0] > 0:
             return {"success": False, "message": "Não é possível excluir o posto. Existem pacientes vinculados a ele."}
         cursor.execute("SELECT COUNT(*) FROM Atendimento WHERE id_posto_atendimento = ?", (posto_id,))
-        if cursor.fetchone()[0] > 0:
+        if cursor.fetchone()[0] > 0 or _referenciado_no_historico(conn, "Atendimento", "id_posto_atendimento", posto_id):
             return {"success": False, "message": "Não é possível excluir o posto. Existem atendimentos vinculados a ele."}
         cursor.execute("SELECT COUNT(*) FROM EstoqueMedicamentoPosto WHERE id_posto = ?", (posto_id,))
         if cursor.fetchone()[0] > 0:
@@ -254,6 +900,7 @@ def delete_posto_saude(posto_id):
         cursor.execute("DELETE FROM PostoSaude WHERE id_posto = ?", (posto_id,))
         conn.commit()
         if cursor.rowcount > 0:
+            notificar_funcionario(None)
             return {"success": True, "message": "Posto de saúde excluído com sucesso!"}
         return {"success": False, "message": "Posto de saúde não encontrado."}
     except sqlite3.Error as e:
@@ -262,7 +909,23 @@ def delete_posto_saude(posto_id):
         conn.close()
 
 # --- Funções CRUD para Funcionario ---
-
+# Quem guarda dados de funcionários em memória (ex.: o armazém de sessões) registra um ouvinte,
+# chamado com o id após cada cadastro, alteração ou exclusão bem-sucedida, ou com None quando a mudança pode
+# afetar vários funcionários (postos criados, alterados ou excluídos).
+_ouvintes_funcionario = []
+
+def registrar_ouvinte_funcionario(funcao):
+    """Registra `funcao(id_funcionario)`, chamada quando um funcionário (None = qualquer um) é cadastrado, alterado ou excluído."""
+    if funcao not in _ouvintes_funcionario:
+        _ouvintes_funcionario.append(funcao)
+
+def notificar_funcionario(funcionario_id=None):
+    """Chama os ouvintes registrados; fora do open_crud, para mudanças que ele não vê (ex.: escrita de
+    outro processo ou banco restaurado), com None."""
+    for funcao in _ouvintes_funcionario:
+        funcao(funcionario_id)
+
+@repetir_se_ocupado
 def create_funcionario(nome, cpf, cargo, email, senha, id_posto_lotacao, especialidade=None, registro_profissional=None, telefone=None):
     """Cria um novo registro de funcionário."""
     if not all([nome, cpf, cargo, email, senha, id_posto_lotacao]):
@@ -277,6 +940,7 @@ def create_funcionario(nome, cpf, cargo, email, senha, id_posto_lotacao, especia
             (nome, cpf, cargo, email, hashed_password, id_posto_lotacao, especialidade, registro_profissional, telefone)
         )
         conn.commit()
+        notificar_funcionario(cursor.lastrowid) # Ex.: o e-mail pode estar no cache negativo do login
         return {"success": True, "message": "Funcionário cadastrado com sucesso!", "id": cursor.lastrowid}
     except sqlite3.IntegrityError as e:
         if "UNIQUE constraint failed: Funcionario.cpf_funcionario" in str(e):
@@ -289,14 +953,29 @@ def create_funcionario(nome, cpf, cargo, email, senha, id_posto_lotacao, especia
     finally:
         conn.close()
 
-def get_all_funcionarios(search_term=None, cargo=None, id_posto_lotacao=None):
-    """Retorna todos os funcionários, com opção de busca e filtros."""
+_LISTAGEM_FUNCIONARIOS = {
+    "tabela": "Funcionario f",
+    "chave": "f.id_funcionario",
+    "escopo": ("postos", "f.id_posto_lotacao"),
+    "padrao": "f.*, ps.nome_posto",
+    "joins": [("ps", "JOIN PostoSaude ps ON f.id_posto_lotacao = ps.id_posto", ())],
+    "campos": {
+        "id_funcionario": "f.id_funcionario", "nome_funcionario": "f.nome_funcionario", "cpf_funcionario": "f.cpf_funcionario",
+        "cargo_funcionario": "f.cargo_funcionario", "especialidade_medica": "f.especialidade_medica",
+        "registro_profissional": "f.registro_profissional", "telefone_funcionario": "f.telefone_funcionario",
+        "email_funcionario": "f.email_funcionario", "id_posto_lotacao": "f.id_posto_lotacao", "nome_posto": "ps.nome_posto",
+    },
+}
+
+def get_all_funcionarios(search_term=None, cargo=None, id_posto_lotacao=None, fields=None, after_id=None, limit=None, if_version=None):
+    """Retorna todos os funcionários, com opção de busca, filtros, projeção de colunas (fields), paginação por keyset (after_id/limit) e leitura condicional (if_version)."""
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
-        query = """SELECT f.*, ps.nome_posto FROM Funcionario f JOIN PostoSaude ps ON f.id_posto_lotacao = ps.id_posto WHERE 1=1"""
-        params = []
-        conditions = []
+        versao = _versao_tabelas(conn, _tabelas_da_listagem(_LISTAGEM_FUNCIONARIOS))
+        if versao == if_version:
+            return _nao_modificado(versao)
+        conditions, params = _condicoes_escopo(_LISTAGEM_FUNCIONARIOS)
 
         if search_term:
             conditions.append("(f.nome_funcionario LIKE ? OR f.cpf_funcionario LIKE ? OR f.email_funcionario LIKE ?)")
@@ -310,12 +989,17 @@ def get_all_funcionarios(search_term=None, cargo=None, id_posto_lotacao=None):
             conditions.append("f.id_posto_lotacao = ?")
             params.append(id_posto_lotacao)
         
+        ordem = _aplicar_paginacao(_LISTAGEM_FUNCIONARIOS, conditions, params, after_id, limit)
+        query = _montar_select(_LISTAGEM_FUNCIONARIOS, fields, conditions)
         if conditions:
             query += " AND " + " AND ".join(conditions)
+        query += ordem
 
         cursor.execute(query, tuple(params))
         funcionarios = cursor.fetchall()
-        return {"success": True, "data": [dict(row) for row in funcionarios]}
+        return {"success": True, "data": [dict(row) for row in funcionarios], "version": versao}
+    except ValueError as e:
+        return {"success": False, "message": str(e)}
     except sqlite3.Error as e:
         return {"success": False, "message": f"Erro ao buscar funcionários: {e}"}
     finally:
@@ -326,7 +1010,8 @@ def get_funcionario_by_id(funcionario_id):
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
-        cursor.execute("SELECT f.*, ps.nome_posto FROM Funcionario f JOIN PostoSaude ps ON f.id_posto_lotacao = ps.id_posto WHERE f.id_funcionario = ?", (funcionario_id,))
+        filtro, params = _escopo_por_id(_LISTAGEM_FUNCIONARIOS)
+        cursor.execute(f"SELECT f.*, ps.nome_posto FROM Funcionario f JOIN PostoSaude ps ON f.id_posto_lotacao = ps.id_posto WHERE f.id_funcionario = ?{filtro}", (funcionario_id, *params))
         funcionario = cursor.fetchone()
         if funcionario:
             return {"success": True, "data": dict(funcionario)}
@@ -336,12 +1021,16 @@ def get_funcionario_by_id(funcionario_id):
     finally:
         conn.close()
 
+def _criar_indice_email(conn):
+    """Índice do login, que compara o e-mail sem diferenciar maiúsculas."""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_funcionario_email_nocase ON Funcionario (email_funcionario COLLATE NOCASE)")
+
 def get_funcionario_by_email(email):
-    """Retorna um funcionário pelo email (para login)."""
+    """Retorna um funcionário pelo email (para login), sem diferenciar maiúsculas; a grafia exata tem preferência."""
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
-        cursor.execute("SELECT * FROM Funcionario WHERE email_funcionario = ?", (email,))
+        cursor.execute("SELECT * FROM Funcionario WHERE email_funcionario = ? COLLATE NOCASE ORDER BY email_funcionario = ? DESC LIMIT 1", (email, email))
         funcionario = cursor.fetchone()
         if funcionario:
             return {"success": True, "data": dict(funcionario)}
@@ -351,6 +1040,7 @@ def get_funcionario_by_email(email):
     finally:
         conn.close()
 
+@repetir_se_ocupado
 def update_funcionario(funcionario_id, nome=None, cpf=None, cargo=None, especialidade=None, registro_profissional=None, telefone=None, email=None, senha=None, id_posto_lotacao=None):
     """Atualiza um registro de funcionário."""
     if not funcionario_id:
@@ -380,6 +1070,7 @@ def update_funcionario(funcionario_id, nome=None, cpf=None, cargo=None, especial
         cursor.execute(query, tuple(params))
         conn.commit()
         if cursor.rowcount > 0:
+            notificar_funcionario(funcionario_id)
             return {"success": True, "message": "Funcionário atualizado com sucesso!"}
         return {"success": False, "message": "Funcionário não encontrado ou nenhum dado alterado."}
     except sqlite3.IntegrityError as e:
@@ -393,6 +1084,7 @@ def update_funcionario(funcionario_id, nome=None, cpf=None, cargo=None, especial
     finally:
         conn.close()
 
+@repetir_se_ocupado
 def delete_funcionario(funcionario_id):
     """Deleta um registro de funcionário."""
     conn = get_db_connection()
@@ -400,15 +1092,16 @@ def delete_funcionario(funcionario_id):
     try:
         # Verificar se existem atendimentos ou distribuições vinculadas
         cursor.execute("SELECT COUNT(*) FROM Atendimento WHERE id_funcionario_responsavel = ?", (funcionario_id,))
-        if cursor.fetchone()[0] > 0:
+        if cursor.fetchone()[0] > 0 or _referenciado_no_historico(conn, "Atendimento", "id_funcionario_responsavel", funcionario_id):
             return {"success": False, "message": "Não é possível excluir o funcionário. Existem atendimentos vinculados a ele."}
         cursor.execute("SELECT COUNT(*) FROM DistribuicaoMedicamento WHERE id_funcionario_distribuidor = ?", (funcionario_id,))
-        if cursor.fetchone()[0] > 0:
+        if cursor.fetchone()[0] > 0 or _referenciado_no_historico(conn, "DistribuicaoMedicamento", "id_funcionario_distribuidor", funcionario_id):
             return {"success": False, "message": "Não é possível excluir o funcionário. Existem distribuições de medicamento vinculadas a ele."}
 
         cursor.execute("DELETE FROM Funcionario WHERE id_funcionario = ?", (funcionario_id,))
         conn.commit()
         if cursor.rowcount > 0:
+            notificar_funcionario(funcionario_id)
             return {"success": True, "message": "Funcionário excluído com sucesso!"}
         return {"success": False, "message": "Funcionário não encontrado."}
     except sqlite3.Error as e:
@@ -418,6 +1111,7 @@ def delete_funcionario(funcionario_id):
 
 # --- Funções CRUD para Paciente ---
 
+@repetir_se_ocupado
 def create_paciente(nome, cpf, data_nascimento, genero, endereco, id_posto_referencia, cartao_sus=None, telefone=None, email=None):
     """Cria um novo registro de paciente."""
     if not all([nome, cpf, data_nascimento, genero, endereco, id_posto_referencia]):
@@ -443,14 +1137,30 @@ def create_paciente(nome, cpf, data_nascimento, genero, endereco, id_posto_refer
     finally:
         conn.close()
 
-def get_all_pacientes(search_term=None, genero=None, id_posto_referencia=None):
-    """Retorna todos os pacientes, com opção de busca e filtros."""
+_LISTAGEM_PACIENTES = {
+    "tabela": "Paciente p",
+    "chave": "p.id_paciente",
+    "escopo": ("postos", "p.id_posto_referencia"),
+    "padrao": "p.*, ps.nome_posto",
+    "joins": [("ps", "JOIN PostoSaude ps ON p.id_posto_referencia = ps.id_posto", ())],
+    "campos": {
+        "id_paciente": "p.id_paciente", "nome_paciente": "p.nome_paciente", "cpf_paciente": "p.cpf_paciente",
+        "cartao_sus": "p.cartao_sus", "data_nascimento_paciente": "p.data_nascimento_paciente",
+        "genero_paciente": "p.genero_paciente", "endereco_paciente": "p.endereco_paciente",
+        "telefone_paciente": "p.telefone_paciente", "email_paciente": "p.email_paciente",
+        "id_posto_referencia": "p.id_posto_referencia", "nome_posto": "ps.nome_posto",
+    },
+}
+
+def get_all_pacientes(search_term=None, genero=None, id_posto_referencia=None, fields=None, after_id=None, limit=None, if_version=None):
+    """Retorna todos os pacientes, com opção de busca, filtros, projeção de colunas (fields), paginação por keyset (after_id/limit) e leitura condicional (if_version)."""
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
-        query = """SELECT p.*, ps.nome_posto FROM Paciente p JOIN PostoSaude ps ON p.id_posto_referencia = ps.id_posto WHERE 1=1"""
-        params = []
-        conditions = []
+        versao = _versao_tabelas(conn, _tabelas_da_listagem(_LISTAGEM_PACIENTES))
+        if versao == if_version:
+            return _nao_modificado(versao)
+        conditions, params = _condicoes_escopo(_LISTAGEM_PACIENTES)
 
         if search_term:
             conditions.append("(p.nome_paciente LIKE ? OR p.cpf_paciente LIKE ? OR p.cartao_sus LIKE ?)")
@@ -464,12 +1174,17 @@ def get_all_pacientes(search_term=None, genero=None, id_posto_referencia=None):
             conditions.append("p.id_posto_referencia = ?")
             params.append(id_posto_referencia)
         
+        ordem = _aplicar_paginacao(_LISTAGEM_PACIENTES, conditions, params, after_id, limit)
+        query = _montar_select(_LISTAGEM_PACIENTES, fields, conditions)
         if conditions:
             query += " AND " + " AND ".join(conditions)
+        query += ordem
 
         cursor.execute(query, tuple(params))
         pacientes = cursor.fetchall()
-        return {"success": True, "data": [dict(row) for row in pacientes]}
+        return {"success": True, "data": [dict(row) for row in pacientes], "version": versao}
+    except ValueError as e:
+        return {"success": False, "message": str(e)}
     except sqlite3.Error as e:
         return {"success": False, "message": f"Erro ao buscar pacientes: {e}"}
     finally:
@@ -480,7 +1195,8 @@ def get_paciente_by_id(paciente_id):
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
-        cursor.execute("SELECT p.*, ps.nome_posto FROM Paciente p JOIN PostoSaude ps ON p.id_posto_referencia = ps.id_posto WHERE p.id_paciente = ?", (paciente_id,))
+        filtro, params = _escopo_por_id(_LISTAGEM_PACIENTES)
+        cursor.execute(f"SELECT p.*, ps.nome_posto FROM Paciente p JOIN PostoSaude ps ON p.id_posto_referencia = ps.id_posto WHERE p.id_paciente = ?{filtro}", (paciente_id, *params))
         paciente = cursor.fetchone()
         if paciente:
             return {"success": True, "data": dict(paciente)}
@@ -490,6 +1206,7 @@ def get_paciente_by_id(paciente_id):
     finally:
         conn.close()
 
+@repetir_se_ocupado
 def update_paciente(paciente_id, nome=None, cpf=None, cartao_sus=None, data_nascimento=None, genero=None, endereco=None, telefone=None, email=None, id_posto_referencia=None):
     """Atualiza um registro de paciente."""
     if not paciente_id:
@@ -532,6 +1249,7 @@ def update_paciente(paciente_id, nome=None, cpf=None, cartao_sus=None, data_nasc
     finally:
         conn.close()
 
+@repetir_se_ocupado
 def delete_paciente(paciente_id):
     """Deleta um registro de paciente."""
     conn = get_db_connection()
@@ -539,7 +1257,7 @@ def delete_paciente(paciente_id):
     try:
         # Verificar se existem atendimentos vinculados
         cursor.execute("SELECT COUNT(*) FROM Atendimento WHERE id_paciente = ?", (paciente_id,))
-        if cursor.fetchone()[0] > 0:
+        if cursor.fetchone()[0] > 0 or _referenciado_no_historico(conn, "Atendimento", "id_paciente", paciente_id):
             return {"success": False, "message": "Não é possível excluir o paciente. Existem atendimentos vinculados a ele."}
 
         cursor.execute("DELETE FROM Paciente WHERE id_paciente = ?", (paciente_id,))
@@ -554,6 +1272,7 @@ def delete_paciente(paciente_id):
 
 # --- Funções CRUD para Medicamento ---
 
+@repetir_se_ocupado
 def create_medicamento(nome_comercial, principio_ativo, apresentacao=None, fabricante=None, tipo_medicamento=None):
     """Cria um novo registro de medicamento."""
     if not all([nome_comercial, principio_ativo]):
@@ -573,12 +1292,26 @@ def create_medicamento(nome_comercial, principio_ativo, apresentacao=None, fabri
     finally:
         conn.close()
 
-def get_all_medicamentos(search_term=None, tipo_medicamento=None):
-    """Retorna todos os medicamentos, com opção de busca e filtro por tipo."""
+_LISTAGEM_MEDICAMENTOS = {
+    "tabela": "Medicamento",
+    "chave": "id_medicamento",
+    "padrao": "*",
+    "joins": [],
+    "campos": {
+        "id_medicamento": "id_medicamento", "nome_comercial_medicamento": "nome_comercial_medicamento",
+        "principio_ativo": "principio_ativo", "apresentacao": "apresentacao", "fabricante": "fabricante",
+        "tipo_medicamento": "tipo_medicamento",
+    },
+}
+
+def get_all_medicamentos(search_term=None, tipo_medicamento=None, fields=None, after_id=None, limit=None, if_version=None):
+    """Retorna todos os medicamentos, com opção de busca, filtro por tipo, projeção de colunas (fields), paginação por keyset (after_id/limit) e leitura condicional (if_version)."""
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
-        query = "SELECT * FROM Medicamento WHERE 1=1"
+        versao = _versao_tabelas(conn, _tabelas_da_listagem(_LISTAGEM_MEDICAMENTOS))
+        if versao == if_version:
+            return _nao_modificado(versao)
         params = []
         conditions = []
 
@@ -590,12 +1323,17 @@ def get_all_medicamentos(search_term=None, tipo_medicamento=None):
             conditions.append("tipo_medicamento = ?")
             params.append(tipo_medicamento)
         
+        ordem = _aplicar_paginacao(_LISTAGEM_MEDICAMENTOS, conditions, params, after_id, limit)
+        query = _montar_select(_LISTAGEM_MEDICAMENTOS, fields, conditions)
         if conditions:
             query += " AND " + " AND ".join(conditions)
+        query += ordem
 
         cursor.execute(query, tuple(params))
         medicamentos = cursor.fetchall()
-        return {"success": True, "data": [dict(row) for row in medicamentos]}
+        return {"success": True, "data": [dict(row) for row in medicamentos], "version": versao}
+    except ValueError as e:
+        return {"success": False, "message": str(e)}
     except sqlite3.Error as e:
         return {"success": False, "message": f"Erro ao buscar medicamentos: {e}"}
     finally:
@@ -616,6 +1354,7 @@ def get_medicamento_by_id(medicamento_id):
     finally:
         conn.close()
 
+@repetir_se_ocupado
 def update_medicamento(medicamento_id, nome_comercial=None, principio_ativo=None, apresentacao=None, fabricante=None, tipo_medicamento=None):
     """Atualiza um registro de medicamento."""
     if not medicamento_id:
@@ -648,6 +1387,7 @@ def update_medicamento(medicamento_id, nome_comercial=None, principio_ativo=None
     finally:
         conn.close()
 
+@repetir_se_ocupado
 def delete_medicamento(medicamento_id):
     """Deleta um registro de medicamento."""
     conn = get_db_connection()
@@ -670,6 +1410,7 @@ def delete_medicamento(medicamento_id):
 
 # --- Funções CRUD para EstoqueMedicamentoPosto ---
 
+@repetir_se_ocupado
 def create_estoque_medicamento_posto(id_medicamento, id_posto, lote, data_validade, quantidade_atual, quantidade_minima_alerta=0):
     """Cria um novo registro de estoque de medicamento por posto."""
     if not all([id_medicamento, id_posto, lote, data_validade, quantidade_atual is not None]):
@@ -682,8 +1423,11 @@ def create_estoque_medicamento_posto(id_medicamento, id_posto, lote, data_valida
             "INSERT INTO EstoqueMedicamentoPosto (id_medicamento, id_posto, lote, data_validade, quantidade_atual, quantidade_minima_alerta) VALUES (?, ?, ?, ?, ?, ?)",
             (id_medicamento, id_posto, lote, data_validade, quantidade_atual, quantidade_minima_alerta)
         )
+        estoque_id = cursor.lastrowid
+        if quantidade_atual:
+            _registrar_movimentacao(cursor, estoque_id, "entrada", quantidade_atual, observacao="Cadastro do lote")
         conn.commit()
-        return {"success": True, "message": "Estoque de medicamento cadastrado com sucesso!", "id": cursor.lastrowid}
+        return {"success": True, "message": "Estoque de medicamento cadastrado com sucesso!", "id": estoque_id}
     except sqlite3.IntegrityError as e:
         if "UNIQUE constraint failed: EstoqueMedicamentoPosto.id_medicamento, EstoqueMedicamentoPosto.id_posto, EstoqueMedicamentoPosto.lote" in str(e):
             return {"success": False, "message": "Já existe um registro de estoque para este medicamento, posto e lote. Considere atualizar o registro existente."}
@@ -693,19 +1437,33 @@ def create_estoque_medicamento_posto(id_medicamento, id_posto, lote, data_valida
     finally:
         conn.close()
 
-def get_all_estoque_medicamento_posto(search_term=None, id_medicamento=None, id_posto=None, validade_proxima_dias=None, estoque_baixo=False):
-    """Retorna todos os registros de estoque de medicamento por posto, com opções de busca e filtros."""
+_LISTAGEM_ESTOQUE = {
+    "tabela": "EstoqueMedicamentoPosto emp",
+    "chave": "emp.id_estoque",
+    "escopo": ("postos", "emp.id_posto"),
+    "padrao": "emp.*, m.nome_comercial_medicamento, m.principio_ativo, ps.nome_posto",
+    "joins": [
+        ("m", "JOIN Medicamento m ON emp.id_medicamento = m.id_medicamento", ()),
+        ("ps", "JOIN PostoSaude ps ON emp.id_posto = ps.id_posto", ()),
+    ],
+    "campos": {
+        "id_estoque": "emp.id_estoque", "id_medicamento": "emp.id_medicamento", "id_posto": "emp.id_posto",
+        "lote": "emp.lote", "data_validade": "emp.data_validade", "quantidade_atual": "emp.quantidade_atual",
+        "quantidade_minima_alerta": "emp.quantidade_minima_alerta",
+        "nome_comercial_medicamento": "m.nome_comercial_medicamento", "principio_ativo": "m.principio_ativo",
+        "nome_posto": "ps.nome_posto",
+    },
+}
+
+def get_all_estoque_medicamento_posto(search_term=None, id_medicamento=None, id_posto=None, validade_proxima_dias=None, estoque_baixo=False, fields=None, after_id=None, limit=None, if_version=None):
+    """Retorna todos os registros de estoque de medicamento por posto, com opções de busca, filtros, projeção de colunas (fields), paginação por keyset (after_id/limit) e leitura condicional (if_version)."""
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
-        query = """SELECT emp.*, m.nome_comercial_medicamento, m.principio_ativo, ps.nome_posto
-            FROM EstoqueMedicamentoPosto emp
-            JOIN Medicamento m ON emp.id_medicamento = m.id_medicamento
-            JOIN PostoSaude ps ON emp.id_posto = ps.id_posto
-            WHERE 1=1
-            """
-        params = []
-        conditions = []
+        versao = _versao_tabelas(conn, _tabelas_da_listagem(_LISTAGEM_ESTOQUE))
+        if versao == if_version:
+            return _nao_modificado(versao)
+        conditions, params = _condicoes_escopo(_LISTAGEM_ESTOQUE)
 
         if search_term:
             conditions.append("(m.nome_comercial_medicamento LIKE ? OR emp.lote LIKE ?)")
@@ -725,12 +1483,17 @@ def get_all_estoque_medicamento_posto(search_term=None, id_medicamento=None, id_
         if estoque_baixo:
             conditions.append("emp.quantidade_atual <= emp.quantidade_minima_alerta")
         
+        ordem = _aplicar_paginacao(_LISTAGEM_ESTOQUE, conditions, params, after_id, limit)
+        query = _montar_select(_LISTAGEM_ESTOQUE, fields, conditions)
         if conditions:
             query += " AND " + " AND ".join(conditions)
+        query += ordem
 
         cursor.execute(query, tuple(params))
         estoque = cursor.fetchall()
-        return {"success": True, "data": [dict(row) for row in estoque]}
+        return {"success": True, "data": [dict(row) for row in estoque], "version": versao}
+    except ValueError as e:
+        return {"success": False, "message": str(e)}
     except sqlite3.Error as e:
         return {"success": False, "message": f"Erro ao buscar estoque de medicamento: {e}"}
     finally:
@@ -741,7 +1504,8 @@ def get_estoque_medicamento_posto_by_id(estoque_id):
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
-        cursor.execute("SELECT emp.*, m.nome_comercial_medicamento, m.principio_ativo, ps.nome_posto FROM EstoqueMedicamentoPosto emp JOIN Medicamento m ON emp.id_medicamento = m.id_medicamento JOIN PostoSaude ps ON emp.id_posto = ps.id_posto WHERE emp.id_estoque = ?", (estoque_id,))
+        filtro, params = _escopo_por_id(_LISTAGEM_ESTOQUE)
+        cursor.execute(f"SELECT emp.*, m.nome_comercial_medicamento, m.principio_ativo, ps.nome_posto FROM EstoqueMedicamentoPosto emp JOIN Medicamento m ON emp.id_medicamento = m.id_medicamento JOIN PostoSaude ps ON emp.id_posto = ps.id_posto WHERE emp.id_estoque = ?{filtro}", (estoque_id, *params))
         estoque = cursor.fetchone()
         if estoque:
             return {"success": True, "data": dict(estoque)}
@@ -751,6 +1515,7 @@ def get_estoque_medicamento_posto_by_id(estoque_id):
     finally:
         conn.close()
 
+@repetir_se_ocupado
 def update_estoque_medicamento_posto(estoque_id, quantidade_atual=None, quantidade_minima_alerta=None, lote=None, data_validade=None):
     """Atualiza um registro de estoque de medicamento por posto."""
     if not estoque_id:
@@ -772,9 +1537,19 @@ def update_estoque_medicamento_posto(estoque_id, quantidade_atual=None, quantida
         query = f"UPDATE EstoqueMedicamentoPosto SET {', '.join(updates)} WHERE id_estoque = ?"
         params.append(estoque_id)
 
+        if quantidade_atual is not None:
+            # Saldo anterior lido já com a trava de escrita: o ajuste no livro é a diferença real
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("SELECT quantidade_atual FROM EstoqueMedicamentoPosto WHERE id_estoque = ?", (estoque_id,))
+            anterior = cursor.fetchone()
+
         cursor.execute(query, tuple(params))
-        conn.commit()
         if cursor.rowcount > 0:
+            # Alteração manual do saldo entra no livro como ajuste
+            if quantidade_atual is not None and anterior and quantidade_atual != anterior["quantidade_atual"]:
+                _registrar_movimentacao(cursor, estoque_id, "ajuste", quantidade_atual - anterior["quantidade_atual"],
+                                        observacao="Ajuste na edição do estoque")
+            conn.commit()
             return {"success": True, "message": "Estoque de medicamento atualizado com sucesso!"}
         return {"success": False, "message": "Registro de estoque não encontrado ou nenhum dado alterado."}
     except sqlite3.Error as e:
@@ -782,6 +1557,7 @@ def update_estoque_medicamento_posto(estoque_id, quantidade_atual=None, quantida
     finally:
         conn.close()
 
+@repetir_se_ocupado
 def delete_estoque_medicamento_posto(estoque_id):
     """Deleta um registro de estoque de medicamento por posto."""
     conn = get_db_connection()
@@ -789,8 +1565,18 @@ def delete_estoque_medicamento_posto(estoque_id):
     try:
         # Verificar se existem prescrições vinculadas a este item de estoque
         cursor.execute("SELECT COUNT(*) FROM Prescricao WHERE id_medicamento_estoque = ?", (estoque_id,))
-        if cursor.fetchone()[0] > 0:
+        if cursor.fetchone()[0] > 0 or _referenciado_no_historico(conn, "Prescricao", "id_medicamento_estoque", estoque_id):
             return {"success": False, "message": "Não é possível excluir o registro de estoque. Existem prescrições vinculadas a ele."}
+        # Nem lotes já usados em distribuições (pela alocação FEFO, sem ser o lote da prescrição)
+        cursor.execute("SELECT 1 FROM DistribuicaoLote WHERE id_estoque = ? LIMIT 1", (estoque_id,))
+        if cursor.fetchone():
+            return {"success": False, "message": "Não é possível excluir o registro de estoque. Existem distribuições que saíram deste lote."}
+
+        # O saldo restante do lote sai do livro antes de o registro ser removido
+        cursor.execute("SELECT quantidade_atual FROM EstoqueMedicamentoPosto WHERE id_estoque = ?", (estoque_id,))
+        estoque = cursor.fetchone()
+        if estoque and estoque["quantidade_atual"]:
+            _registrar_movimentacao(cursor, estoque_id, "ajuste", -estoque["quantidade_atual"], observacao="Exclusão do lote")
 
         cursor.execute("DELETE FROM EstoqueMedicamentoPosto WHERE id_estoque = ?", (estoque_id,))
         conn.commit()
@@ -802,8 +1588,560 @@ def delete_estoque_medicamento_posto(estoque_id):
     finally:
         conn.close()
 
+# --- Livro de Movimentações de Estoque ---
+# quantidade_atual guarda só o saldo corrente de cada lote. Toda alteração de saldo feita pelo
+# open_crud também entra (append-only) em MovimentacaoEstoque, com quantidade assinada:
+# entrada (+), saida_distribuicao (-), ajuste (+/-) e perda_validade (-). De tempos em tempos
+# compactar_estoque() grava em SnapshotEstoque o saldo de cada lote até a última movimentação;
+# o saldo em uma data sai do snapshot anterior mais próximo somado à cauda de movimentações.
+
+TIPOS_MOVIMENTACAO = ("entrada", "saida_distribuicao", "ajuste", "perda_validade")
+
+# Movimentações acumuladas após o último snapshot que justificam um novo (compactar_estoque_se_necessario)
+MOVIMENTACOES_POR_SNAPSHOT = 5000
+
+def _criar_livro_estoque(conn):
+    """Cria as tabelas do livro de movimentações e, no primeiro uso, o snapshot inicial com os saldos atuais."""
+    conn.execute("""CREATE TABLE IF NOT EXISTS MovimentacaoEstoque (
+        id_movimentacao INTEGER PRIMARY KEY AUTOINCREMENT,
+        id_estoque INTEGER NOT NULL,
+        id_medicamento INTEGER NOT NULL,
+        id_posto INTEGER NOT NULL,
+        tipo_movimentacao TEXT NOT NULL,
+        quantidade INTEGER NOT NULL,
+        data_hora_movimentacao TEXT NOT NULL DEFAULT (datetime('now', 'localtime')),
+        id_distribuicao INTEGER,
+        observacao TEXT
+    )""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_movimentacao_estoque_lote ON MovimentacaoEstoque (id_estoque, id_movimentacao)")
+    conn.execute("""CREATE TABLE IF NOT EXISTS SnapshotEstoque (
+        id_snapshot INTEGER PRIMARY KEY AUTOINCREMENT,
+        data_hora_snapshot TEXT NOT NULL,
+        id_ultima_movimentacao INTEGER NOT NULL
+    )""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_snapshot_estoque_data ON SnapshotEstoque (data_hora_snapshot)")
+    conn.execute("""CREATE TABLE IF NOT EXISTS SnapshotEstoqueItem (
+        id_snapshot INTEGER NOT NULL,
+        id_estoque INTEGER NOT NULL,
+        id_medicamento INTEGER NOT NULL,
+        id_posto INTEGER NOT NULL,
+        quantidade INTEGER NOT NULL,
+        PRIMARY KEY (id_snapshot, id_estoque)
+    )""")
+    if conn.execute("SELECT 1 FROM SnapshotEstoque LIMIT 1").fetchone() is None:
+        cursor = conn.execute(
+            """INSERT INTO SnapshotEstoque (data_hora_snapshot, id_ultima_movimentacao)
+            VALUES (datetime('now', 'localtime'), (SELECT COALESCE(MAX(id_movimentacao), 0) FROM MovimentacaoEstoque))"""
+        )
+        conn.execute(
+            """INSERT INTO SnapshotEstoqueItem (id_snapshot, id_estoque, id_medicamento, id_posto, quantidade)
+            SELECT ?, id_estoque, id_medicamento, id_posto, quantidade_atual FROM EstoqueMedicamentoPosto WHERE quantidade_atual != 0""",
+            (cursor.lastrowid,)
+        )
+
+def _registrar_movimentacao(cursor, estoque_id, tipo_movimentacao, quantidade, id_distribuicao=None, observacao=None):
+    """Grava uma movimentação (quantidade assinada) no livro, dentro da transação de quem chamou."""
+    cursor.execute(
+        """INSERT INTO MovimentacaoEstoque (id_estoque, id_medicamento, id_posto, tipo_movimentacao, quantidade, id_distribuicao, observacao)
+        SELECT id_estoque, id_medicamento, id_posto, ?, ?, ?, ? FROM EstoqueMedicamentoPosto WHERE id_estoque = ?""",
+        (tipo_movimentacao, quantidade, id_distribuicao, observacao, estoque_id)
+    )
+
+@repetir_se_ocupado
+def registrar_movimentacao_estoque(estoque_id, tipo_movimentacao, quantidade, observacao=None):
+    """Registra entrada, ajuste ou perda por validade em um lote e atualiza o saldo (quantidade_atual).
+
+    Para entrada e perda_validade a quantidade é informada em unidades (positiva); para ajuste, com sinal.
+    Saídas por distribuição são registradas por create_distribuicao_medicamento.
+    """
+    if tipo_movimentacao not in ("entrada", "ajuste", "perda_validade"):
+        return {"success": False, "message": "Tipo de movimentação inválido. Use entrada, ajuste ou perda_validade."}
+    if not quantidade or (tipo_movimentacao != "ajuste" and quantidade < 0):
+        return {"success": False, "message": "Quantidade da movimentação deve ser maior que zero (ou diferente de zero, para ajuste)."}
+    delta = -quantidade if tipo_movimentacao == "perda_validade" else quantidade
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        # Atualização condicional: o saldo nunca fica negativo, mesmo com escritas concorrentes
+        cursor.execute(
+            "UPDATE EstoqueMedicamentoPosto SET quantidade_atual = quantidade_atual + ? WHERE id_estoque = ? AND quantidade_atual + ? >= 0",
+            (delta, estoque_id, delta)
+        )
+        if cursor.rowcount == 0:
+            cursor.execute("SELECT 1 FROM EstoqueMedicamentoPosto WHERE id_estoque = ?", (estoque_id,))
+            if cursor.fetchone() is None:
+                return {"success": False, "message": "Registro de estoque não encontrado."}
+            return {"success": False, "message": "A movimentação deixaria o estoque do lote negativo."}
+        _registrar_movimentacao(cursor, estoque_id, tipo_movimentacao, delta, observacao=observacao)
+        conn.commit()
+        return {"success": True, "message": "Movimentação de estoque registrada com sucesso!", "id": cursor.lastrowid}
+    except sqlite3.Error as e:
+        conn.rollback()
+        return {"success": False, "message": f"Erro ao registrar movimentação de estoque: {e}"}
+    finally:
+        conn.close()
+
+_LISTAGEM_MOVIMENTACOES = {
+    "tabela": "MovimentacaoEstoque me",
+    "chave": "me.id_movimentacao",
+    "escopo": ("postos", "me.id_posto"),
+    "padrao": "me.*, m.nome_comercial_medicamento, ps.nome_posto",
+    "joins": [
+        ("m", "JOIN Medicamento m ON me.id_medicamento = m.id_medicamento", ()),
+        ("ps", "JOIN PostoSaude ps ON me.id_posto = ps.id_posto", ()),
+    ],
+    "campos": {
+        "id_movimentacao": "me.id_movimentacao", "id_estoque": "me.id_estoque", "id_medicamento": "me.id_medicamento",
+        "id_posto": "me.id_posto", "tipo_movimentacao": "me.tipo_movimentacao", "quantidade": "me.quantidade",
+        "data_hora_movimentacao": "me.data_hora_movimentacao", "id_distribuicao": "me.id_distribuicao",
+        "observacao": "me.observacao", "nome_comercial_medicamento": "m.nome_comercial_medicamento",
+        "nome_posto": "ps.nome_posto",
+    },
+}
+
+def get_movimentacoes_estoque(id_estoque=None, id_medicamento=None, id_posto=None, tipo_movimentacao=None, start_date=None, end_date=None, fields=None, after_id=None, limit=None):
+    """Retorna as movimentações do livro de estoque, com filtros, projeção de colunas (fields) e paginação por keyset (after_id/limit)."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        conditions, params = _condicoes_escopo(_LISTAGEM_MOVIMENTACOES)
+        if id_estoque:
+            conditions.append("me.id_estoque = ?")
+            params.append(id_estoque)
+        if id_medicamento:
+            conditions.append("me.id_medicamento = ?")
+            params.append(id_medicamento)
+        if id_posto:
+            conditions.append("me.id_posto = ?")
+            params.append(id_posto)
+        if tipo_movimentacao:
+            conditions.append("me.tipo_movimentacao = ?")
+            params.append(tipo_movimentacao)
+        if start_date:
+            conditions.append("DATE(me.data_hora_movimentacao) >= ?")
+            params.append(start_date)
+        if end_date:
+            conditions.append("DATE(me.data_hora_movimentacao) <= ?")
+            params.append(end_date)
+
+        ordem = _aplicar_paginacao(_LISTAGEM_MOVIMENTACOES, conditions, params, after_id, limit, " ORDER BY me.id_movimentacao DESC")
+        query = _montar_select(_LISTAGEM_MOVIMENTACOES, fields, conditions)
+        if conditions:
+            query += " AND " + " AND ".join(conditions)
+        query += ordem
+
+        cursor.execute(query, tuple(params))
+        movimentacoes = cursor.fetchall()
+        return {"success": True, "data": [dict(row) for row in movimentacoes]}
+    except ValueError as e:
+        return {"success": False, "message": str(e)}
+    except sqlite3.Error as e:
+        return {"success": False, "message": f"Erro ao buscar movimentações de estoque: {e}"}
+    finally:
+        conn.close()
+
+def get_estoque_na_data(data, id_posto=None, id_medicamento=None, por_lote=False, if_version=None):
+    """Retorna o saldo de estoque ao fim de uma data (AAAA-MM-DD), por posto e medicamento (ou por lote).
+
+    Parte do snapshot mais recente até a data e soma só as movimentações entre ele e a data,
+    limitadas pelo snapshot seguinte, então o custo não cresce com o tamanho do histórico.
+    """
+    limite = str(data) if len(str(data)) > 10 else f"{data} 23:59:59"
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        versao = _versao_tabelas(conn, ("EstoqueMedicamentoPosto", "Medicamento", "PostoSaude"))
+        if versao == if_version:
+            return _nao_modificado(versao)
+        cursor.execute(
+            "SELECT id_snapshot, id_ultima_movimentacao FROM SnapshotEstoque WHERE data_hora_snapshot <= ? ORDER BY data_hora_snapshot DESC LIMIT 1",
+            (limite,)
+        )
+        snapshot = cursor.fetchone()
+        if not snapshot:
+            cursor.execute("SELECT MIN(data_hora_snapshot) FROM SnapshotEstoque")
+            return {"success": False, "message": f"Não há histórico de estoque até {data}. O livro de movimentações começa em {cursor.fetchone()[0]}."}
+        cursor.execute(
+            "SELECT id_ultima_movimentacao FROM SnapshotEstoque WHERE data_hora_snapshot > ? ORDER BY data_hora_snapshot LIMIT 1",
+            (limite,)
+        )
+        proximo = cursor.fetchone()
+
+        filtros = ""
+        params_filtro = []
+        if id_posto:
+            filtros += " AND id_posto = ?"
+            params_filtro.append(id_posto)
+        if id_medicamento:
+            filtros += " AND id_medicamento = ?"
+            params_filtro.append(id_medicamento)
+        filtro_escopo, params_escopo = _filtro_escopo("id_posto")
+        filtros += filtro_escopo
+        params_filtro += params_escopo
+
+        chave = "id_estoque, id_medicamento, id_posto" if por_lote else "id_medicamento, id_posto"
+        lote = ", emp.lote, emp.data_validade" if por_lote else ""
+        join_lote = "LEFT JOIN EstoqueMedicamentoPosto emp ON emp.id_estoque = s.id_estoque" if por_lote else ""
+        query = f"""SELECT s.*{lote}, m.nome_comercial_medicamento, ps.nome_posto
+            FROM (
+                SELECT {chave}, SUM(quantidade) AS quantidade FROM (
+                    SELECT id_estoque, id_medicamento, id_posto, quantidade FROM SnapshotEstoqueItem
+                    WHERE id_snapshot = ?{filtros}
+                    UNION ALL
+                    SELECT id_estoque, id_medicamento, id_posto, quantidade FROM MovimentacaoEstoque
+                    WHERE id_movimentacao > ? AND id_movimentacao <= ? AND data_hora_movimentacao <= ?{filtros}
+                ) GROUP BY {chave} HAVING SUM(quantidade) != 0
+            ) s
+            JOIN Medicamento m ON s.id_medicamento = m.id_medicamento
+            JOIN PostoSaude ps ON s.id_posto = ps.id_posto
+            {join_lote}
+            ORDER BY ps.nome_posto, m.nome_comercial_medicamento"""
+        params = [snapshot["id_snapshot"], *params_filtro,
+                  snapshot["id_ultima_movimentacao"], proximo[0] if proximo else 2 ** 62, limite, *params_filtro]
+
+        cursor.execute(query, tuple(params))
+        saldos = cursor.fetchall()
+        return {"success": True, "data": [dict(row) for row in saldos], "version": versao}
+    except sqlite3.Error as e:
+        return {"success": False, "message": f"Erro ao calcular estoque na data: {e}"}
+    finally:
+        conn.close()
+
+@repetir_se_ocupado
+def compactar_estoque():
+    """Grava um novo snapshot com o saldo de cada lote (último snapshot + movimentações posteriores)."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT id_snapshot, id_ultima_movimentacao FROM SnapshotEstoque ORDER BY id_snapshot DESC LIMIT 1")
+        anterior = cursor.fetchone()
+        cursor.execute("SELECT COALESCE(MAX(id_movimentacao), 0) FROM MovimentacaoEstoque")
+        id_ultima = cursor.fetchone()[0]
+        if id_ultima == anterior["id_ultima_movimentacao"]:
+            return {"success": True, "message": "Nenhuma movimentação nova desde o último snapshot."}
+
+        cursor.execute(
+            "INSERT INTO SnapshotEstoque (data_hora_snapshot, id_ultima_movimentacao) VALUES (datetime('now', 'localtime'), ?)",
+            (id_ultima,)
+        )
+        snapshot_id = cursor.lastrowid
+        cursor.execute(
+            """INSERT INTO SnapshotEstoqueItem (id_snapshot, id_estoque, id_medicamento, id_posto, quantidade)
+            SELECT ?, id_estoque, id_medicamento, id_posto, SUM(quantidade) FROM (
+                SELECT id_estoque, id_medicamento, id_posto, quantidade FROM SnapshotEstoqueItem WHERE id_snapshot = ?
+                UNION ALL
+                SELECT id_estoque, id_medicamento, id_posto, quantidade FROM MovimentacaoEstoque
+                WHERE id_movimentacao > ? AND id_movimentacao <= ?
+            ) GROUP BY id_estoque HAVING SUM(quantidade) != 0""",
+            (snapshot_id, anterior["id_snapshot"], anterior["id_ultima_movimentacao"], id_ultima)
+        )
+        conn.commit()
+        return {"success": True, "message": "Snapshot de estoque gravado com sucesso!", "id": snapshot_id}
+    except sqlite3.Error as e:
+        conn.rollback()
+        return {"success": False, "message": f"Erro ao compactar o livro de estoque: {e}"}
+    finally:
+        conn.close()
+
+@repetir_se_ocupado
+def compactar_estoque_se_necessario(intervalo=MOVIMENTACOES_POR_SNAPSHOT):
+    """Chama compactar_estoque() quando já há `intervalo` movimentações após o último snapshot (uso periódico)."""
+    conn = get_db_connection()
+    try:
+        row = conn.execute(
+            """SELECT (SELECT COALESCE(MAX(id_movimentacao), 0) FROM MovimentacaoEstoque)
+                - (SELECT id_ultima_movimentacao FROM SnapshotEstoque ORDER BY id_snapshot DESC LIMIT 1)"""
+        ).fetchone()
+    except sqlite3.Error as e:
+        return {"success": False, "message": f"Erro ao verificar o livro de estoque: {e}"}
+    finally:
+        conn.close()
+    if (row[0] or 0) < intervalo:
+        return {"success": True, "message": "Compactação ainda não necessária."}
+    return compactar_estoque()
+
+# --- Alocação de Lotes (FEFO) ---
+# A quantidade dispensada sai dos lotes com validade mais próxima primeiro (first-expired-first-out),
+# ignorando lotes vencidos ou zerados. O índice em (id_medicamento, id_posto, data_validade) entrega
+# os lotes já na ordem de consumo, então só são lidos os lotes necessários para cobrir a quantidade.
+
+#
+# Cada distribuição guarda em DistribuicaoLote a quantidade que saiu de cada lote (rastreabilidade:
+# quais pacientes receberam um lote). Listagens, prontuário e relatórios leem os lotes dali, e não do
+# lote indicado na prescrição, que com FEFO pode nem ter sido usado. Todos os lotes de uma distribuição
+# são do medicamento e do posto da prescrição. As linhas ficam nas tabelas quentes mesmo quando a
+# distribuição vai para o arquivo histórico; distribuições anteriores à tabela sem movimentação no
+# livro (e as já arquivadas) contam como saídas do lote da prescrição.
+
+def _criar_indices_estoque(conn):
+    """Cria os índices de consulta do estoque usados pela alocação FEFO."""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_estoque_fefo ON EstoqueMedicamentoPosto (id_medicamento, id_posto, data_validade)")
+
+def _criar_distribuicao_lote(conn):
+    """Cria a tabela DistribuicaoLote e, no primeiro uso, a preenche pelo livro de movimentações (ou pelo lote da prescrição)."""
+    nova = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'DistribuicaoLote'").fetchone() is None
+    conn.execute("""CREATE TABLE IF NOT EXISTS DistribuicaoLote (
+        id_distribuicao_lote INTEGER PRIMARY KEY AUTOINCREMENT,
+        id_distribuicao INTEGER NOT NULL,
+        id_estoque INTEGER NOT NULL,
+        quantidade INTEGER NOT NULL,
+        UNIQUE (id_distribuicao, id_estoque)
+    )""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_distribuicao_lote_estoque ON DistribuicaoLote (id_estoque)")
+    if nova:
+        conn.execute(
+            """INSERT INTO DistribuicaoLote (id_distribuicao, id_estoque, quantidade)
+            SELECT id_distribuicao, id_estoque, -SUM(quantidade) FROM MovimentacaoEstoque
+            WHERE tipo_movimentacao = 'saida_distribuicao' AND id_distribuicao IS NOT NULL
+            GROUP BY id_distribuicao, id_estoque ORDER BY MIN(id_movimentacao)"""
+        )
+        conn.execute(
+            """INSERT INTO DistribuicaoLote (id_distribuicao, id_estoque, quantidade)
+            SELECT dm.id_distribuicao, pr.id_medicamento_estoque, dm.quantidade_distribuida
+            FROM DistribuicaoMedicamento dm JOIN Prescricao pr ON dm.id_prescricao = pr.id_prescricao
+            WHERE NOT EXISTS (SELECT 1 FROM DistribuicaoLote dl WHERE dl.id_distribuicao = dm.id_distribuicao)"""
+        )
+
+# Lote de onde saiu a distribuição `dm` (o primeiro alocado; sem registro, o da prescrição `pr`)
+_LOTE_DA_DISTRIBUICAO = """COALESCE((SELECT dl.id_estoque FROM DistribuicaoLote dl WHERE dl.id_distribuicao = dm.id_distribuicao
+    ORDER BY dl.id_distribuicao_lote LIMIT 1), pr.id_medicamento_estoque)"""
+# Lotes (separados por vírgula) de onde saiu a distribuição `dm`
+_LOTES_DA_DISTRIBUICAO = """COALESCE((SELECT GROUP_CONCAT(el.lote, ', ') FROM DistribuicaoLote dl
+    JOIN EstoqueMedicamentoPosto el ON el.id_estoque = dl.id_estoque WHERE dl.id_distribuicao = dm.id_distribuicao), emp.lote)"""
+# Lotes efetivamente distribuídos para a prescrição `pr` (lote da prescrição `emp` quando a distribuição não tem registro)
+_LOTES_DISTRIBUIDOS_PRESCRICAO = """(SELECT GROUP_CONCAT(DISTINCT COALESCE(el.lote, emp.lote)) FROM DistribuicaoMedicamento dmp
+    LEFT JOIN DistribuicaoLote dl ON dl.id_distribuicao = dmp.id_distribuicao
+    LEFT JOIN EstoqueMedicamentoPosto el ON el.id_estoque = dl.id_estoque
+    WHERE dmp.id_prescricao = pr.id_prescricao)"""
+
+MAX_IDS_POR_CONSULTA = 500 # IDs por "IN (...)", abaixo do limite de parâmetros por consulta do SQLite
+
+def _lotes_das_distribuicoes(cursor, ids_distribuicao):
+    """Retorna {id_distribuicao: [lotes]} com a quantidade que saiu de cada lote, na ordem da alocação."""
+    lotes = {}
+    for inicio in range(0, len(ids_distribuicao), MAX_IDS_POR_CONSULTA):
+        bloco = ids_distribuicao[inicio:inicio + MAX_IDS_POR_CONSULTA]
+        cursor.execute(
+            f"""SELECT dl.id_distribuicao, dl.id_estoque, emp.lote, emp.data_validade, dl.quantidade
+            FROM DistribuicaoLote dl LEFT JOIN EstoqueMedicamentoPosto emp ON emp.id_estoque = dl.id_estoque
+            WHERE dl.id_distribuicao IN ({', '.join('?' * len(bloco))}) ORDER BY dl.id_distribuicao_lote""",
+            tuple(bloco)
+        )
+        for row in cursor.fetchall():
+            item = dict(row)
+            lotes.setdefault(item.pop("id_distribuicao"), []).append(item)
+    return lotes
+
+def _planejar_fefo(cursor, id_medicamento, id_posto, quantidade):
+    """Escolhe os lotes que cobrem a quantidade, validade mais próxima primeiro.
+
+    Retorna (alocacao, disponivel); alocacao é None quando o estoque válido não é suficiente,
+    e então `disponivel` é o total que os lotes válidos conseguem cobrir.
+    """
+    cursor.execute(
+        """SELECT id_estoque, lote, data_validade, quantidade_atual FROM EstoqueMedicamentoPosto
+        WHERE id_medicamento = ? AND id_posto = ? AND data_validade >= ? AND quantidade_atual > 0
+        ORDER BY data_validade, id_estoque""",
+        (id_medicamento, id_posto, date.today().strftime("%Y-%m-%d"))
+    )
+    alocacao = []
+    restante = quantidade
+    for lote in cursor:
+        retirada = min(restante, lote["quantidade_atual"])
+        alocacao.append({"id_estoque": lote["id_estoque"], "lote": lote["lote"],
+                         "data_validade": lote["data_validade"], "quantidade": retirada})
+        restante -= retirada
+        if restante == 0:
+            return alocacao, quantidade
+    return None, quantidade - restante
+
+def alocar_lotes_fefo(id_medicamento, id_posto, quantidade):
+    """Simula a alocação FEFO de uma quantidade de um medicamento em um posto, sem alterar o estoque."""
+    if not quantidade or quantidade <= 0:
+        return {"success": False, "message": "Quantidade deve ser maior que zero."}
+    if _posto_fora_do_escopo(id_posto):
+        return {"success": False, "message": "Posto de saúde não encontrado."}
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        alocacao, disponivel = _planejar_fefo(cursor, id_medicamento, id_posto, quantidade)
+        if alocacao is None:
+            return {"success": False, "message": f"Estoque válido insuficiente para o medicamento no posto ({disponivel}).", "disponivel": disponivel}
+        return {"success": True, "data": alocacao}
+    except sqlite3.Error as e:
+        return {"success": False, "message": f"Erro ao alocar lotes: {e}"}
+    finally:
+        conn.close()
+
+# --- Alertas de Estoque ---
+# AlertaEstoque guarda só os lotes que pedem atenção: estoque_baixo (saldo <= mínimo), validade_proxima
+# (com saldo e vencendo dentro de `dias_validade`) e vencido (com saldo e já vencido). Triggers em
+# EstoqueMedicamentoPosto mantêm a tabela a cada alteração de lote, e a passagem do tempo é coberta
+# por uma varredura diária de validade (tarefa "alertas" do manutencao.py), que percorre só os lotes
+# com saldo na janela de alerta (índice parcial em data_validade). Painéis e notificações só leem a
+# tabela, em O(alertas).
+
+DIAS_ALERTA_VALIDADE = 30
+
+_LIMITE_VALIDADE_SQL = "date('now', 'localtime', '+' || (SELECT dias_validade FROM ConfiguracaoAlerta WHERE id = 1) || ' days')"
+_COLUNAS_ALERTA = "id_estoque, id_medicamento, id_posto, tipo_alerta, lote, data_validade, quantidade_atual, quantidade_minima_alerta"
+_ATUALIZAR_ALERTA_SQL = """ON CONFLICT (id_estoque, tipo_alerta) DO UPDATE SET lote = excluded.lote, data_validade = excluded.data_validade,
+    quantidade_atual = excluded.quantidade_atual, quantidade_minima_alerta = excluded.quantidade_minima_alerta"""
+
+def _condicao_estoque_baixo(ref):
+    return f"{ref}.quantidade_atual <= {ref}.quantidade_minima_alerta"
+
+def _condicao_validade(ref):
+    return f"{ref}.quantidade_atual > 0 AND {ref}.data_validade <= {_LIMITE_VALIDADE_SQL}"
+
+def _tipo_alerta_validade(ref):
+    return f"CASE WHEN {ref}.data_validade < date('now', 'localtime') THEN 'vencido' ELSE 'validade_proxima' END"
+
+def _valores_alerta(ref, tipo_alerta):
+    return (f"{ref}.id_estoque, {ref}.id_medicamento, {ref}.id_posto, {tipo_alerta}, {ref}.lote, "
+            f"{ref}.data_validade, {ref}.quantidade_atual, {ref}.quantidade_minima_alerta")
+
+def _criar_alertas_estoque(conn):
+    """Cria a tabela de alertas, a configuração, os triggers e o índice da varredura de validade."""
+    nova = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'AlertaEstoque'").fetchone() is None
+    conn.execute("""CREATE TABLE IF NOT EXISTS ConfiguracaoAlerta (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        dias_validade INTEGER NOT NULL,
+        data_ultima_varredura TEXT
+    )""")
+    conn.execute("INSERT OR IGNORE INTO ConfiguracaoAlerta (id, dias_validade) VALUES (1, ?)", (DIAS_ALERTA_VALIDADE,))
+    conn.execute("""CREATE TABLE IF NOT EXISTS AlertaEstoque (
+        id_alerta INTEGER PRIMARY KEY AUTOINCREMENT,
+        id_estoque INTEGER NOT NULL,
+        id_medicamento INTEGER NOT NULL,
+        id_posto INTEGER NOT NULL,
+        tipo_alerta TEXT NOT NULL,
+        lote TEXT NOT NULL,
+        data_validade TEXT NOT NULL,
+        quantidade_atual INTEGER NOT NULL,
+        quantidade_minima_alerta INTEGER NOT NULL,
+        data_hora_alerta TEXT NOT NULL DEFAULT (datetime('now', 'localtime')),
+        UNIQUE (id_estoque, tipo_alerta)
+    )""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_estoque_validade_com_saldo ON EstoqueMedicamentoPosto (data_validade) WHERE quantidade_atual > 0")
+
+    for evento in ("INSERT", "UPDATE OF quantidade_atual, quantidade_minima_alerta, data_validade, lote"):
+        nome = evento.split()[0].lower()
+        conn.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_alerta_estoque_{nome}
+            AFTER {evento} ON EstoqueMedicamentoPosto
+            BEGIN
+                DELETE FROM AlertaEstoque WHERE id_estoque = NEW.id_estoque
+                    AND NOT (tipo_alerta = 'estoque_baixo' AND {_condicao_estoque_baixo("NEW")})
+                    AND NOT (tipo_alerta = {_tipo_alerta_validade("NEW")} AND {_condicao_validade("NEW")});
+                INSERT INTO AlertaEstoque ({_COLUNAS_ALERTA})
+                    SELECT {_valores_alerta("NEW", "'estoque_baixo'")} WHERE {_condicao_estoque_baixo("NEW")}
+                    {_ATUALIZAR_ALERTA_SQL};
+                INSERT INTO AlertaEstoque ({_COLUNAS_ALERTA})
+                    SELECT {_valores_alerta("NEW", _tipo_alerta_validade("NEW"))} WHERE {_condicao_validade("NEW")}
+                    {_ATUALIZAR_ALERTA_SQL};
+            END""")
+    conn.execute("""CREATE TRIGGER IF NOT EXISTS trg_alerta_estoque_delete
+        AFTER DELETE ON EstoqueMedicamentoPosto
+        BEGIN DELETE FROM AlertaEstoque WHERE id_estoque = OLD.id_estoque; END""")
+
+    if nova: # Lotes que já existiam antes da tabela de alertas
+        _recalcular_alertas(conn)
+
+def _recalcular_alertas(conn):
+    """Reconstrói a tabela de alertas a partir de todos os lotes (usado na criação e ao mudar a configuração)."""
+    conn.execute("DELETE FROM AlertaEstoque")
+    conn.execute(f"""INSERT INTO AlertaEstoque ({_COLUNAS_ALERTA})
+        SELECT {_valores_alerta("emp", "'estoque_baixo'")} FROM EstoqueMedicamentoPosto emp WHERE {_condicao_estoque_baixo("emp")}""")
+    conn.execute(f"""INSERT INTO AlertaEstoque ({_COLUNAS_ALERTA})
+        SELECT {_valores_alerta("emp", _tipo_alerta_validade("emp"))} FROM EstoqueMedicamentoPosto emp WHERE {_condicao_validade("emp")}""")
+    conn.execute("UPDATE ConfiguracaoAlerta SET data_ultima_varredura = date('now', 'localtime') WHERE id = 1")
+
+def _varrer_validades(conn):
+    # Alertas de validade próxima de lotes que venceram passam a 'vencido'
+    conn.execute("DELETE FROM AlertaEstoque WHERE tipo_alerta = 'validade_proxima' AND data_validade < date('now', 'localtime')")
+    conn.execute(f"""INSERT INTO AlertaEstoque ({_COLUNAS_ALERTA})
+        SELECT {_valores_alerta("emp", _tipo_alerta_validade("emp"))} FROM EstoqueMedicamentoPosto emp WHERE {_condicao_validade("emp")}
+        ON CONFLICT (id_estoque, tipo_alerta) DO NOTHING""")
+    conn.execute("UPDATE ConfiguracaoAlerta SET data_ultima_varredura = date('now', 'localtime') WHERE id = 1")
+
+@repetir_se_ocupado
+def varrer_alertas_validade():
+    """Executa a varredura de validade (lotes que entraram na janela de alerta ou venceram desde a última)."""
+    conn = get_db_connection()
+    try:
+        _varrer_validades(conn)
+        conn.commit()
+        return {"success": True, "message": "Varredura de validade concluída."}
+    except sqlite3.Error as e:
+        conn.rollback()
+        return {"success": False, "message": f"Erro na varredura de validade: {e}"}
+    finally:
+        conn.close()
+
+@repetir_se_ocupado
+def configurar_alertas(dias_validade):
+    """Altera a janela de alerta de validade (em dias) e recalcula todos os alertas."""
+    if dias_validade is None or dias_validade < 0:
+        return {"success": False, "message": "A janela de validade deve ser um número de dias maior ou igual a zero."}
+    conn = get_db_connection()
+    try:
+        conn.execute("UPDATE ConfiguracaoAlerta SET dias_validade = ? WHERE id = 1", (int(dias_validade),))
+        _recalcular_alertas(conn)
+        conn.commit()
+        return {"success": True, "message": "Configuração de alertas atualizada com sucesso!"}
+    except sqlite3.Error as e:
+        conn.rollback()
+        return {"success": False, "message": f"Erro ao configurar alertas: {e}"}
+    finally:
+        conn.close()
+
+def get_alertas_estoque(tipo_alerta=None, id_posto=None, id_medicamento=None):
+    """Retorna os alertas de estoque ativos (vencido, validade_proxima, estoque_baixo), com filtros opcionais."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        query = """SELECT a.*, m.nome_comercial_medicamento, ps.nome_posto
+            FROM AlertaEstoque a
+            JOIN Medicamento m ON a.id_medicamento = m.id_medicamento
+            JOIN PostoSaude ps ON a.id_posto = ps.id_posto
+            WHERE 1=1"""
+        filtro, params = _filtro_escopo("a.id_posto")
+        query += filtro
+        if tipo_alerta:
+            query += " AND a.tipo_alerta = ?"
+            params.append(tipo_alerta)
+        if id_posto:
+            query += " AND a.id_posto = ?"
+            params.append(id_posto)
+        if id_medicamento:
+            query += " AND a.id_medicamento = ?"
+            params.append(id_medicamento)
+        query += " ORDER BY CASE a.tipo_alerta WHEN 'vencido' THEN 0 WHEN 'validade_proxima' THEN 1 ELSE 2 END, a.data_validade"
+
+        cursor.execute(query, tuple(params))
+        alertas = cursor.fetchall()
+        return {"success": True, "data": [dict(row) for row in alertas]}
+    except sqlite3.Error as e:
+        return {"success": False, "message": f"Erro ao buscar alertas de estoque: {e}"}
+    finally:
+        conn.close()
+
+def get_resumo_alertas():
+    """Retorna a quantidade de alertas ativos por tipo (para contadores em painéis)."""
+    conn = get_db_connection()
+    try:
+        filtro, params = _filtro_escopo("id_posto")
+        rows = conn.execute(f"SELECT tipo_alerta, COUNT(*) AS total FROM AlertaEstoque WHERE 1=1{filtro} GROUP BY tipo_alerta", params).fetchall()
+        return {"success": True, "data": {row["tipo_alerta"]: row["total"] for row in rows}}
+    except sqlite3.Error as e:
+        return {"success": False, "message": f"Erro ao buscar resumo de alertas: {e}"}
+    finally:
+        conn.close()
+
 # --- Funções CRUD para Atendimento ---
 
+@repetir_se_ocupado
 def create_atendimento(id_paciente, id_funcionario_responsavel, id_posto_atendimento, tipo_atendimento, descricao_sintomas_queixa, data_hora_inicio=None, data_hora_fim=None, diagnostico=None, cid10=None, grau_doenca_observado=None, observacoes_gerais=None):
     """Cria um novo registro de atendimento no banco de dados."""
     if not all([id_paciente, id_funcionario_responsavel, id_posto_atendimento, tipo_atendimento, descricao_sintomas_queixa]):
@@ -827,20 +2165,36 @@ def create_atendimento(id_paciente, id_funcionario_responsavel, id_posto_atendim
     finally:
         conn.close()
 
-def get_all_atendimentos(search_term=None, id_paciente=None, id_funcionario=None, id_posto=None, tipo_atendimento=None, cid10=None, grau_doenca=None, start_date=None, end_date=None):
-    """Retorna todos os atendimentos, com opções de busca e filtros."""
+_LISTAGEM_ATENDIMENTOS = {
+    "tabela": "Atendimento a",
+    "chave": "a.id_atendimento",
+    "escopo": ("postos", "a.id_posto_atendimento"),
+    "padrao": "a.*, p.nome_paciente, f.nome_funcionario, ps.nome_posto",
+    "joins": [
+        ("p", "JOIN Paciente p ON a.id_paciente = p.id_paciente", ()),
+        ("f", "JOIN Funcionario f ON a.id_funcionario_responsavel = f.id_funcionario", ()),
+        ("ps", "JOIN PostoSaude ps ON a.id_posto_atendimento = ps.id_posto", ()),
+    ],
+    "campos": {
+        "id_atendimento": "a.id_atendimento", "id_paciente": "a.id_paciente",
+        "id_funcionario_responsavel": "a.id_funcionario_responsavel", "id_posto_atendimento": "a.id_posto_atendimento",
+        "data_hora_inicio_atendimento": "a.data_hora_inicio_atendimento", "data_hora_fim_atendimento": "a.data_hora_fim_atendimento",
+        "tipo_atendimento": "a.tipo_atendimento", "descricao_sintomas_queixa": "a.descricao_sintomas_queixa",
+        "diagnostico": "a.diagnostico", "cid10": "a.cid10", "grau_doenca_observado": "a.grau_doenca_observado",
+        "observacoes_gerais": "a.observacoes_gerais",
+        "nome_paciente": "p.nome_paciente", "nome_funcionario": "f.nome_funcionario", "nome_posto": "ps.nome_posto",
+    },
+}
+
+def get_all_atendimentos(search_term=None, id_paciente=None, id_funcionario=None, id_posto=None, tipo_atendimento=None, cid10=None, grau_doenca=None, start_date=None, end_date=None, fields=None, after_id=None, limit=None, if_version=None):
+    """Retorna todos os atendimentos, com opções de busca, filtros, projeção de colunas (fields), paginação por keyset (after_id/limit) e leitura condicional (if_version)."""
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
-        query = """SELECT a.*, p.nome_paciente, f.nome_funcionario, ps.nome_posto
-            FROM Atendimento a
-            JOIN Paciente p ON a.id_paciente = p.id_paciente
-            JOIN Funcionario f ON a.id_funcionario_responsavel = f.id_funcionario
-            JOIN PostoSaude ps ON a.id_posto_atendimento = ps.id_posto
-            WHERE 1=1
-            """
-        params = []
-        conditions = []
+        versao = _versao_tabelas(conn, _tabelas_da_listagem(_LISTAGEM_ATENDIMENTOS))
+        if versao == if_version:
+            return _nao_modificado(versao)
+        conditions, params = _condicoes_escopo(_LISTAGEM_ATENDIMENTOS)
 
         if search_term:
             conditions.append("(p.nome_paciente LIKE ? OR f.nome_funcionario LIKE ? OR a.descricao_sintomas_queixa LIKE ? OR a.diagnostico LIKE ?)")
@@ -873,14 +2227,19 @@ def get_all_atendimentos(search_term=None, id_paciente=None, id_funcionario=None
             conditions.append("DATE(a.data_hora_inicio_atendimento) <= ?")
             params.append(end_date)
         
+        ordem = _aplicar_paginacao(_LISTAGEM_ATENDIMENTOS, conditions, params, after_id, limit, " ORDER BY a.data_hora_inicio_atendimento DESC")
+        query = _montar_select(_LISTAGEM_ATENDIMENTOS, fields, conditions)
         if conditions:
             query += " AND " + " AND ".join(conditions)
 
-        query += " ORDER BY a.data_hora_inicio_atendimento DESC"
+        query += ordem
+        query = _com_fontes(query, _fontes_arquivadas(conn, start_date, end_date))
 
         cursor.execute(query, tuple(params))
         atendimentos = cursor.fetchall()
-        return {"success": True, "data": [dict(row) for row in atendimentos]}
+        return {"success": True, "data": [dict(row) for row in atendimentos], "version": versao}
+    except ValueError as e:
+        return {"success": False, "message": str(e)}
     except sqlite3.Error as e:
         return {"success": False, "message": f"Erro ao buscar atendimentos: {e}"}
     finally:
@@ -891,14 +2250,15 @@ def get_atendimento_by_id(atendimento_id):
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
-        query = """SELECT a.*, p.nome_paciente, f.nome_funcionario, ps.nome_posto
+        filtro, params = _escopo_por_id(_LISTAGEM_ATENDIMENTOS)
+        query = f"""SELECT a.*, p.nome_paciente, f.nome_funcionario, ps.nome_posto
             FROM Atendimento a
             JOIN Paciente p ON a.id_paciente = p.id_paciente
             JOIN Funcionario f ON a.id_funcionario_responsavel = f.id_funcionario
             JOIN PostoSaude ps ON a.id_posto_atendimento = ps.id_posto
-            WHERE a.id_atendimento = ?"""
-        cursor.execute(query, (atendimento_id,))
-        atendimento = cursor.fetchone()
+            WHERE a.id_atendimento = ?{filtro}"""
+        cursor.execute(query, (atendimento_id, *params))
+        atendimento = cursor.fetchone() or _buscar_no_historico(conn, query, (atendimento_id, *params))
         if atendimento:
             return {"success": True, "data": dict(atendimento)}
         return {"success": False, "message": "Atendimento não encontrado."}
@@ -907,6 +2267,7 @@ def get_atendimento_by_id(atendimento_id):
     finally:
         conn.close()
 
+@repetir_se_ocupado
 def update_atendimento(atendimento_id, id_paciente=None, id_funcionario_responsavel=None, id_posto_atendimento=None, data_hora_inicio=None, data_hora_fim=None, tipo_atendimento=None, descricao_sintomas_queixa=None, diagnostico=None, cid10=None, grau_doenca=None, observacoes_gerais=None):
     """Atualiza um registro de atendimento."""
     if not atendimento_id:
@@ -945,6 +2306,7 @@ def update_atendimento(atendimento_id, id_paciente=None, id_funcionario_responsa
     finally:
         conn.close()
 
+@repetir_se_ocupado
 def delete_atendimento(atendimento_id):
     """Deleta um registro de atendimento."""
     conn = get_db_connection()
@@ -967,6 +2329,7 @@ def delete_atendimento(atendimento_id):
 
 # --- Funções CRUD para Prescricao ---
 
+@repetir_se_ocupado
 def create_prescricao(id_atendimento, id_medicamento_estoque, posologia, quantidade_prescrita):
     """Cria um novo registro de prescrição."""
     if not all([id_atendimento, id_medicamento_estoque, posologia, quantidade_prescrita is not None]):
@@ -986,22 +2349,38 @@ def create_prescricao(id_atendimento, id_medicamento_estoque, posologia, quantid
     finally:
         conn.close()
 
-def get_all_prescricoes(search_term=None, id_atendimento=None, id_medicamento=None, status_distribuicao=None):
-    """Retorna todas as prescrições, com opções de busca e filtros."""
+_LISTAGEM_PRESCRICOES = {
+    "tabela": "Prescricao pr",
+    "chave": "pr.id_prescricao",
+    "escopo": ("postos", "emp.id_posto"),
+    "padrao": f"pr.*, a.data_hora_inicio_atendimento, p.nome_paciente, m.nome_comercial_medicamento, emp.lote, {_LOTES_DISTRIBUIDOS_PRESCRICAO} AS lotes_distribuidos, emp.quantidade_atual as estoque_atual, ps.nome_posto",
+    "joins": [
+        ("a", "JOIN Atendimento a ON pr.id_atendimento = a.id_atendimento", ()),
+        ("p", "JOIN Paciente p ON a.id_paciente = p.id_paciente", ("a",)),
+        ("emp", "JOIN EstoqueMedicamentoPosto emp ON pr.id_medicamento_estoque = emp.id_estoque", ()),
+        ("m", "JOIN Medicamento m ON emp.id_medicamento = m.id_medicamento", ("emp",)),
+        ("ps", "JOIN PostoSaude ps ON emp.id_posto = ps.id_posto", ("emp",)),
+    ],
+    "campos": {
+        "id_prescricao": "pr.id_prescricao", "id_atendimento": "pr.id_atendimento",
+        "id_medicamento_estoque": "pr.id_medicamento_estoque", "posologia": "pr.posologia",
+        "quantidade_prescrita": "pr.quantidade_prescrita", "data_hora_prescricao": "pr.data_hora_prescricao",
+        "status_distribuicao": "pr.status_distribuicao",
+        "data_hora_inicio_atendimento": "a.data_hora_inicio_atendimento", "nome_paciente": "p.nome_paciente",
+        "nome_comercial_medicamento": "m.nome_comercial_medicamento", "lote": "emp.lote",
+        "lotes_distribuidos": _LOTES_DISTRIBUIDOS_PRESCRICAO, "estoque_atual": "emp.quantidade_atual", "nome_posto": "ps.nome_posto",
+    },
+}
+
+def get_all_prescricoes(search_term=None, id_atendimento=None, id_medicamento=None, status_distribuicao=None, fields=None, after_id=None, limit=None, if_version=None):
+    """Retorna todas as prescrições, com opções de busca, filtros, projeção de colunas (fields), paginação por keyset (after_id/limit) e leitura condicional (if_version)."""
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
-        query = """SELECT pr.*, a.data_hora_inicio_atendimento, p.nome_paciente, m.nome_comercial_medicamento, emp.lote, emp.quantidade_atual as estoque_atual, ps.nome_posto
-            FROM Prescricao pr
-            JOIN Atendimento a ON pr.id_atendimento = a.id_atendimento
-            JOIN Paciente p ON a.id_paciente = p.id_paciente
-            JOIN EstoqueMedicamentoPosto emp ON pr.id_medicamento_estoque = emp.id_estoque
-            JOIN Medicamento m ON emp.id_medicamento = m.id_medicamento
-            JOIN PostoSaude ps ON emp.id_posto = ps.id_posto
-            WHERE 1=1
-            """
-        params = []
-        conditions = []
+        versao = _versao_tabelas(conn, _tabelas_da_listagem(_LISTAGEM_PRESCRICOES))
+        if versao == if_version:
+            return _nao_modificado(versao)
+        conditions, params = _condicoes_escopo(_LISTAGEM_PRESCRICOES)
 
         if search_term:
             conditions.append("(p.nome_paciente LIKE ? OR m.nome_comercial_medicamento LIKE ? OR pr.posologia LIKE ?)")
@@ -1018,14 +2397,18 @@ def get_all_prescricoes(search_term=None, id_atendimento=None, id_medicamento=No
             conditions.append("pr.status_distribuicao = ?")
             params.append(status_distribuicao)
         
+        ordem = _aplicar_paginacao(_LISTAGEM_PRESCRICOES, conditions, params, after_id, limit, " ORDER BY pr.data_hora_prescricao DESC")
+        query = _montar_select(_LISTAGEM_PRESCRICOES, fields, conditions)
         if conditions:
             query += " AND " + " AND ".join(conditions)
 
-        query += " ORDER BY pr.data_hora_prescricao DESC"
+        query += ordem
 
         cursor.execute(query, tuple(params))
         prescricoes = cursor.fetchall()
-        return {"success": True, "data": [dict(row) for row in prescricoes]}
+        return {"success": True, "data": [dict(row) for row in prescricoes], "version": versao}
+    except ValueError as e:
+        return {"success": False, "message": str(e)}
     except sqlite3.Error as e:
         return {"success": False, "message": f"Erro ao buscar prescrições: {e}"}
     finally:
@@ -1036,16 +2419,17 @@ def get_prescricao_by_id(prescricao_id):
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
-        query = """SELECT pr.*, a.data_hora_inicio_atendimento, p.nome_paciente, m.nome_comercial_medicamento, emp.lote, emp.quantidade_atual as estoque_atual, ps.nome_posto
+        filtro, params = _escopo_por_id(_LISTAGEM_PRESCRICOES)
+        query = f"""SELECT pr.*, a.data_hora_inicio_atendimento, p.nome_paciente, m.nome_comercial_medicamento, emp.lote, {_LOTES_DISTRIBUIDOS_PRESCRICAO} AS lotes_distribuidos, emp.quantidade_atual as estoque_atual, ps.nome_posto
             FROM Prescricao pr
             JOIN Atendimento a ON pr.id_atendimento = a.id_atendimento
             JOIN Paciente p ON a.id_paciente = p.id_paciente
             JOIN EstoqueMedicamentoPosto emp ON pr.id_medicamento_estoque = emp.id_estoque
             JOIN Medicamento m ON emp.id_medicamento = m.id_medicamento
             JOIN PostoSaude ps ON emp.id_posto = ps.id_posto
-            WHERE pr.id_prescricao = ?"""
-        cursor.execute(query, (prescricao_id,))
-        prescricao = cursor.fetchone()
+            WHERE pr.id_prescricao = ?{filtro}"""
+        cursor.execute(query, (prescricao_id, *params))
+        prescricao = cursor.fetchone() or _buscar_no_historico(conn, query, (prescricao_id, *params))
         if prescricao:
             return {"success": True, "data": dict(prescricao)}
         return {"success": False, "message": "Prescrição não encontrada."}
@@ -1054,6 +2438,7 @@ def get_prescricao_by_id(prescricao_id):
     finally:
         conn.close()
 
+@repetir_se_ocupado
 def update_prescricao(prescricao_id, id_atendimento=None, id_medicamento_estoque=None, posologia=None, quantidade_prescrita=None, status_distribuicao=None):
     """Atualiza um registro de prescrição."""
     if not prescricao_id:
@@ -1086,6 +2471,7 @@ def update_prescricao(prescricao_id, id_atendimento=None, id_medicamento_estoque
     finally:
         conn.close()
 
+@repetir_se_ocupado
 def delete_prescricao(prescricao_id):
     """Deleta um registro de prescrição."""
     conn = get_db_connection()
@@ -1108,52 +2494,81 @@ def delete_prescricao(prescricao_id):
 
 # --- Funções CRUD para distribuicaoMedicamento ---
 
-def create_distribuicao_medicamento(id_prescricao, id_funcionario_distribuidor, quantidade_distribuida, observacao=None):
-    """Cria um novo registro de distribuição de medicamento e atualiza o estoque e status da prescrição."""
+@repetir_se_ocupado
+def create_distribuicao_medicamento(id_prescricao, id_funcionario_distribuidor, quantidade_distribuida, observacao=None, fefo=True):
+    """Cria um novo registro de distribuição de medicamento e atualiza o estoque e status da prescrição.
+
+    Com fefo=True (padrão) a quantidade sai dos lotes do mesmo medicamento no mesmo posto, pela
+    validade mais próxima primeiro, e pode ser dividida entre vários lotes na mesma transação.
+    Com fefo=False sai apenas do lote indicado na prescrição.
+    """
     if not all([id_prescricao, id_funcionario_distribuidor, quantidade_distribuida is not None]):
         return {"success": False, "message": "Prescrição, funcionário distribuidor e quantidade distribuida são obrigatórios."}
 
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
-        # 1. Obter informações da prescrição e do estoque
-        prescricao_info = get_prescricao_by_id(id_prescricao)
-        if not prescricao_info["success"]:
+        # 1. Obter informações da prescrição, do lote prescrito e do total já distribuído em uma única consulta
+        cursor.execute(
+            """SELECT pr.id_prescricao, pr.quantidade_prescrita, emp.id_estoque, emp.id_medicamento, emp.id_posto,
+                emp.lote, emp.data_validade, emp.quantidade_atual,
+                (SELECT SUM(dm.quantidade_distribuida) FROM DistribuicaoMedicamento dm WHERE dm.id_prescricao = pr.id_prescricao) AS total_distribuido
+            FROM Prescricao pr
+            LEFT JOIN EstoqueMedicamentoPosto emp ON pr.id_medicamento_estoque = emp.id_estoque
+            WHERE pr.id_prescricao = ?""",
+            (id_prescricao,)
+        )
+        prescricao = cursor.fetchone()
+        if not prescricao:
             return {"success": False, "message": "Prescrição não encontrada."}
-        prescricao = prescricao_info["data"]
-
-        estoque_info = get_estoque_medicamento_posto_by_id(prescricao["id_medicamento_estoque"])
-        if not estoque_info["success"]:
+        if prescricao["id_estoque"] is None:
             return {"success": False, "message": "Estoque do medicamento da prescrição não encontrado."}
-        estoque = estoque_info["data"]
 
         # 2. Validar quantidade
         if quantidade_distribuida <= 0:
             return {"success": False, "message": "Quantidade a distribuir deve ser maior que zero."}
-        if quantidade_distribuida > estoque["quantidade_atual"]:
-            return {"success": False, "message": "Quantidade a distribuir excede o estoque disponível."}
-        
-        # Calcular quantidade já distribuida para esta prescrição
-        cursor.execute("SELECT SUM(quantidade_distribuida) FROM DistribuicaoMedicamento WHERE id_prescricao = ?", (id_prescricao,))
-        total_distribuido_anteriormente = cursor.fetchone()[0] or 0
+
+        # Quantidade já distribuida para esta prescrição
+        total_distribuido_anteriormente = prescricao["total_distribuido"] or 0
         
         quantidade_restante_prescricao = prescricao["quantidade_prescrita"] - total_distribuido_anteriormente
 
         if quantidade_distribuida > quantidade_restante_prescricao:
             return {"success": False, "message": f"Quantidade a distribuir excede a quantidade restante na prescrição ({quantidade_restante_prescricao})."}
 
-        # 3. Registrar a distribuição
+        # 3. Escolher os lotes de onde sai a quantidade
+        if fefo:
+            alocacao, disponivel = _planejar_fefo(cursor, prescricao["id_medicamento"], prescricao["id_posto"], quantidade_distribuida)
+            if alocacao is None:
+                return {"success": False, "message": f"Quantidade a distribuir excede o estoque válido do medicamento no posto ({disponivel})."}
+        else:
+            if quantidade_distribuida > prescricao["quantidade_atual"]:
+                return {"success": False, "message": "Quantidade a distribuir excede o estoque disponível."}
+            alocacao = [{"id_estoque": prescricao["id_estoque"], "lote": prescricao["lote"],
+                         "data_validade": prescricao["data_validade"], "quantidade": quantidade_distribuida}]
+
+        # 4. Registrar a distribuição
         cursor.execute(
             "INSERT INTO DistribuicaoMedicamento (id_prescricao, id_funcionario_distribuidor, quantidade_distribuida, observacao) VALUES (?, ?, ?, ?)",
             (id_prescricao, id_funcionario_distribuidor, quantidade_distribuida, observacao)
         )
-
-        # 4. Atualizar o estoque
-        nova_quantidade_estoque = estoque["quantidade_atual"] - quantidade_distribuida
-        cursor.execute("UPDATE EstoqueMedicamentoPosto SET quantidade_atual = ? WHERE id_estoque = ?",
-                       (nova_quantidade_estoque, estoque["id_estoque"]))
-
-        # 5. Atualizar o status da prescrição
+        distribuicao_id = cursor.lastrowid
+
+        # 5. Baixar cada lote e registrar a saída no livro de movimentações e nos lotes da distribuição
+        for item in alocacao:
+            cursor.execute(
+                "UPDATE EstoqueMedicamentoPosto SET quantidade_atual = quantidade_atual - ? WHERE id_estoque = ? AND quantidade_atual >= ?",
+                (item["quantidade"], item["id_estoque"], item["quantidade"])
+            )
+            if cursor.rowcount == 0: # Outro atendimento consumiu o lote entre a escolha e a baixa
+                conn.rollback()
+                return {"success": False, "message": "O estoque foi alterado durante a distribuição. Tente novamente."}
+            _registrar_movimentacao(cursor, item["id_estoque"], "saida_distribuicao", -item["quantidade"],
+                                    id_distribuicao=distribuicao_id)
+            cursor.execute("INSERT INTO DistribuicaoLote (id_distribuicao, id_estoque, quantidade) VALUES (?, ?, ?)",
+                           (distribuicao_id, item["id_estoque"], item["quantidade"]))
+
+        # 6. Atualizar o status da prescrição
         novo_total_distribuido = total_distribuido_anteriormente + quantidade_distribuida
         if novo_total_distribuido == prescricao["quantidade_prescrita"]:
             novo_status_prescricao = "Distribuido Totalmente"
@@ -1166,31 +2581,46 @@ def create_distribuicao_medicamento(id_prescricao, id_funcionario_distribuidor,
                        (novo_status_prescricao, id_prescricao))
 
         conn.commit()
-        return {"success": True, "message": "Distribuição registrada e estoque/prescrição atualizados com sucesso!", "id": cursor.lastrowid}
+        return {"success": True, "message": "Distribuição registrada e estoque/prescrição atualizados com sucesso!", "id": distribuicao_id, "lotes": alocacao}
     except sqlite3.Error as e:
         conn.rollback() # Em caso de erro, desfaz todas as operações
         return {"success": False, "message": f"Erro ao registrar distribuição: {e}"}
     finally:
         conn.close()
 
-def get_all_distribuicoes_medicamento(search_term=None, id_prescricao=None, id_funcionario_distribuidor=None, start_date=None, end_date=None):
-    """Retorna todas as distribuição de medicamento, com opções de busca e filtros."""
+_LISTAGEM_DISTRIBUICOES = {
+    "tabela": "DistribuicaoMedicamento dm",
+    "chave": "dm.id_distribuicao",
+    "escopo": ("postos", "emp.id_posto"),
+    "padrao": f"dm.*, pr.quantidade_prescrita, pr.posologia, p.nome_paciente, f.nome_funcionario, m.nome_comercial_medicamento, {_LOTES_DA_DISTRIBUICAO} AS lote, ps.nome_posto",
+    "joins": [
+        ("pr", "JOIN Prescricao pr ON dm.id_prescricao = pr.id_prescricao", ()),
+        ("a", "JOIN Atendimento a ON pr.id_atendimento = a.id_atendimento", ("pr",)),
+        ("p", "JOIN Paciente p ON a.id_paciente = p.id_paciente", ("a",)),
+        ("f", "JOIN Funcionario f ON dm.id_funcionario_distribuidor = f.id_funcionario", ()),
+        ("emp", f"JOIN EstoqueMedicamentoPosto emp ON emp.id_estoque = {_LOTE_DA_DISTRIBUICAO}", ("pr",)),
+        ("m", "JOIN Medicamento m ON emp.id_medicamento = m.id_medicamento", ("emp",)),
+        ("ps", "JOIN PostoSaude ps ON emp.id_posto = ps.id_posto", ("emp",)),
+    ],
+    "campos": {
+        "id_distribuicao": "dm.id_distribuicao", "id_prescricao": "dm.id_prescricao",
+        "id_funcionario_distribuidor": "dm.id_funcionario_distribuidor", "data_hora_distribuicao": "dm.data_hora_distribuicao",
+        "quantidade_distribuida": "dm.quantidade_distribuida", "observacao": "dm.observacao",
+        "quantidade_prescrita": "pr.quantidade_prescrita", "posologia": "pr.posologia", "nome_paciente": "p.nome_paciente",
+        "nome_funcionario": "f.nome_funcionario", "nome_comercial_medicamento": "m.nome_comercial_medicamento",
+        "lote": _LOTES_DA_DISTRIBUICAO, "nome_posto": "ps.nome_posto",
+    },
+}
+
+def get_all_distribuicoes_medicamento(search_term=None, id_prescricao=None, id_funcionario_distribuidor=None, start_date=None, end_date=None, fields=None, after_id=None, limit=None, if_version=None):
+    """Retorna todas as distribuição de medicamento, com opções de busca, filtros, projeção de colunas (fields), paginação por keyset (after_id/limit) e leitura condicional (if_version)."""
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
-        query = """SELECT dm.*, pr.quantidade_prescrita, pr.posologia, p.nome_paciente, f.nome_funcionario, m.nome_comercial_medicamento, emp.lote, ps.nome_posto
-            FROM DistribuicaoMedicamento dm
-            JOIN Prescricao pr ON dm.id_prescricao = pr.id_prescricao
-            JOIN Atendimento a ON pr.id_atendimento = a.id_atendimento
-            JOIN Paciente p ON a.id_paciente = p.id_paciente
-            JOIN Funcionario f ON dm.id_funcionario_distribuidor = f.id_funcionario
-            JOIN EstoqueMedicamentoPosto emp ON pr.id_medicamento_estoque = emp.id_estoque
-            JOIN Medicamento m ON emp.id_medicamento = m.id_medicamento
-            JOIN PostoSaude ps ON emp.id_posto = ps.id_posto
-            WHERE 1=1
-            """
-        params = []
-        conditions = []
+        versao = _versao_tabelas(conn, _tabelas_da_listagem(_LISTAGEM_DISTRIBUICOES))
+        if versao == if_version:
+            return _nao_modificado(versao)
+        conditions, params = _condicoes_escopo(_LISTAGEM_DISTRIBUICOES)
 
         if search_term:
             conditions.append("(p.nome_paciente LIKE ? OR m.nome_comercial_medicamento LIKE ? OR f.nome_funcionario LIKE ?)")
@@ -1210,14 +2640,19 @@ def get_all_distribuicoes_medicamento(search_term=None, id_prescricao=None, id_f
             conditions.append("DATE(dm.data_hora_distribuicao) <= ?")
             params.append(end_date)
         
+        ordem = _aplicar_paginacao(_LISTAGEM_DISTRIBUICOES, conditions, params, after_id, limit, " ORDER BY dm.data_hora_distribuicao DESC")
+        query = _montar_select(_LISTAGEM_DISTRIBUICOES, fields, conditions)
         if conditions:
             query += " AND " + " AND ".join(conditions)
         
-        query += " ORDER BY dm.data_hora_distribuicao DESC"
+        query += ordem
+        query = _com_fontes(query, _fontes_arquivadas(conn, start_date, end_date, por_distribuicao=True))
 
         cursor.execute(query, tuple(params))
         distribuicao = cursor.fetchall()
-        return {"success": True, "data": [dict(row) for row in distribuicao]}
+        return {"success": True, "data": [dict(row) for row in distribuicao], "version": versao}
+    except ValueError as e:
+        return {"success": False, "message": str(e)}
     except sqlite3.Error as e:
         return {"success": False, "message": f"Erro ao buscar distribuições de medicamento: {e}"}
     finally:
@@ -1228,38 +2663,182 @@ def get_distribuicao_medicamento_by_id(distribuicao_id):
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
-        query = """SELECT dm.*, pr.quantidade_prescrita, pr.posologia, p.nome_paciente, f.nome_funcionario, m.nome_comercial_medicamento, emp.lote, ps.nome_posto
+        filtro, params = _escopo_por_id(_LISTAGEM_DISTRIBUICOES)
+        query = f"""SELECT dm.*, pr.quantidade_prescrita, pr.posologia, p.nome_paciente, f.nome_funcionario, m.nome_comercial_medicamento, {_LOTES_DA_DISTRIBUICAO} AS lote, ps.nome_posto
             FROM DistribuicaoMedicamento dm
             JOIN Prescricao pr ON dm.id_prescricao = pr.id_prescricao
             JOIN Atendimento a ON pr.id_atendimento = a.id_atendimento
             JOIN Paciente p ON a.id_paciente = p.id_paciente
             JOIN Funcionario f ON dm.id_funcionario_distribuidor = f.id_funcionario
-            JOIN EstoqueMedicamentoPosto emp ON pr.id_medicamento_estoque = emp.id_estoque
+            JOIN EstoqueMedicamentoPosto emp ON emp.id_estoque = {_LOTE_DA_DISTRIBUICAO}
             JOIN Medicamento m ON emp.id_medicamento = m.id_medicamento
             JOIN PostoSaude ps ON emp.id_posto = ps.id_posto
-            WHERE dm.id_distribuicao = ?"""
-        cursor.execute(query, (distribuicao_id,))
-        distribuicao = cursor.fetchone()
+            WHERE dm.id_distribuicao = ?{filtro}"""
+        cursor.execute(query, (distribuicao_id, *params))
+        distribuicao = cursor.fetchone() or _buscar_no_historico(conn, query, (distribuicao_id, *params))
         if distribuicao:
-            return {"success": True, "data": dict(distribuicao)}
+            distribuicao = dict(distribuicao)
+            distribuicao["lotes"] = _lotes_das_distribuicoes(cursor, [distribuicao_id]).get(distribuicao_id, [])
+            return {"success": True, "data": distribuicao}
         return {"success": False, "message": "distribuição de medicamento não encontrada."}
     except sqlite3.Error as e:
         return {"success": False, "message": f"Erro ao buscar distribuição de medicamento: {e}"}
     finally:
         conn.close()
 
-# --- Funções de Relatório ---
+# --- Prontuário (linha do tempo do paciente) ---
+
+TAMANHO_PAGINA_PRONTUARIO = 20
+MAX_PAGINA_PRONTUARIO = 200
+
+def _criar_indices_prontuario(conn):
+    """Cria os índices usados pela linha do tempo do paciente (atendimentos por paciente e data, e os filhos de cada um)."""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_atendimento_paciente_data ON Atendimento (id_paciente, data_hora_inicio_atendimento, id_atendimento)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_prescricao_atendimento ON Prescricao (id_atendimento)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_distribuicao_prescricao ON DistribuicaoMedicamento (id_prescricao)")
+
+def get_patient_timeline(id_paciente, since=None, limit=TAMANHO_PAGINA_PRONTUARIO, before_id=None, if_version=None):
+    """Retorna o prontuário do paciente: atendimentos (mais recentes primeiro) com as prescrições e as distribuições de cada uma.
+
+    Em cada fonte (tabelas quentes e cada ano arquivado alcançado por `since`; todos sem `since`) são
+    três consultas indexadas, qualquer que seja o tamanho do histórico: até `limit` atendimentos
+    anteriores ao cursor, e as prescrições e distribuições só dos atendimentos que entram na página.
+    Os anos são anexados um por vez. Para a página seguinte, passe o `next_before_id` retornado em `before_id`.
+    """
+    if not id_paciente:
+        return {"success": False, "message": "O paciente é obrigatório."}
+    limit = max(1, min(int(limit or TAMANHO_PAGINA_PRONTUARIO), MAX_PAGINA_PRONTUARIO))
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        versao = _versao_tabelas(conn, ("Atendimento", "Prescricao", "DistribuicaoMedicamento", "Funcionario", "PostoSaude", "EstoqueMedicamentoPosto", "Medicamento"))
+        if versao == if_version:
+            return _nao_modificado(versao)
+        query = """SELECT a.*, f.nome_funcionario, ps.nome_posto
+            FROM Atendimento a
+            JOIN Funcionario f ON a.id_funcionario_responsavel = f.id_funcionario
+            JOIN PostoSaude ps ON a.id_posto_atendimento = ps.id_posto
+            WHERE a.id_paciente = ?"""
+        params = [id_paciente]
+        filtro, params_escopo = _filtro_escopo("a.id_posto_atendimento") # Só os atendimentos dos postos do escopo ativo
+        query += filtro
+        params.extend(params_escopo)
+        if since:
+            query += " AND a.data_hora_inicio_atendimento >= ?"
+            params.append(str(since))
+        if before_id:
+            # Keyset na mesma ordem da página: (data, id) decrescentes; o atendimento do cursor pode estar arquivado
+            consulta_cursor = "SELECT data_hora_inicio_atendimento, id_atendimento FROM Atendimento WHERE id_atendimento = ?"
+            anterior = cursor.execute(consulta_cursor, (before_id,)).fetchone() or _buscar_no_historico(conn, consulta_cursor, (before_id,))
+            if anterior is None:
+                return {"success": True, "data": [], "next_before_id": None, "version": versao}
+            query += " AND (a.data_hora_inicio_atendimento, a.id_atendimento) < (?, ?)"
+            params.extend(anterior)
+        query += " ORDER BY a.data_hora_inicio_atendimento DESC, a.id_atendimento DESC LIMIT ?"
+        params.append(limit + 1) # Uma linha a mais só para saber se há próxima página
+
+        # Atendimentos abertos há muito tempo continuam nas tabelas quentes, então as fontes se intercalam
+        # na ordem de datas: cada uma contribui com sua página e a junção fica com as `limit` mais recentes
+        fontes = [(None, None)] + _anos_arquivados(conn, since)
+        candidatos = []
+        for ano, arquivo in fontes:
+            fonte = _fontes_do_ano(_anexar_arquivo(conn, ano, arquivo)) if ano else {}
+            cursor.execute(_com_fontes(query, fonte), tuple(params))
+            candidatos.extend((dict(row), ano) for row in cursor.fetchall())
+        candidatos.sort(key=lambda c: (c[0]["data_hora_inicio_atendimento"] or "", c[0]["id_atendimento"]), reverse=True)
+        tem_mais = len(candidatos) > limit
+        candidatos = candidatos[:limit]
+        if not candidatos:
+            return {"success": True, "data": [], "next_before_id": None, "version": versao}
+
+        prescricoes = []
+        distribuicoes_por_prescricao = {}
+        for ano, arquivo in fontes:
+            ids_atendimento = [a["id_atendimento"] for a, ano_atendimento in candidatos if ano_atendimento == ano]
+            if not ids_atendimento:
+                continue
+            fonte = _fontes_do_ano(_anexar_arquivo(conn, ano, arquivo)) if ano else {}
+            marcadores = ", ".join("?" * len(ids_atendimento))
+            cursor.execute(_com_fontes(f"""SELECT pr.*, m.nome_comercial_medicamento, emp.lote, {_LOTES_DISTRIBUIDOS_PRESCRICAO} AS lotes_distribuidos
+                FROM Prescricao pr
+                JOIN EstoqueMedicamentoPosto emp ON pr.id_medicamento_estoque = emp.id_estoque
+                JOIN Medicamento m ON emp.id_medicamento = m.id_medicamento
+                WHERE pr.id_atendimento IN ({marcadores})
+                ORDER BY pr.id_prescricao""", fonte), tuple(ids_atendimento))
+            prescricoes.extend(dict(row) for row in cursor.fetchall())
+
+            cursor.execute(_com_fontes(f"""SELECT dm.*, f.nome_funcionario
+                FROM DistribuicaoMedicamento dm
+                JOIN Funcionario f ON dm.id_funcionario_distribuidor = f.id_funcionario
+                WHERE dm.id_prescricao IN (SELECT id_prescricao FROM Prescricao WHERE id_atendimento IN ({marcadores}))
+                ORDER BY dm.data_hora_distribuicao, dm.id_distribuicao""", fonte), tuple(ids_atendimento))
+            for row in cursor.fetchall():
+                distribuicoes_por_prescricao.setdefault(row["id_prescricao"], []).append(dict(row))
+
+        # Lotes de onde saiu cada distribuição (sem registro, o lote da prescrição)
+        distribuicoes = [d for lista in distribuicoes_por_prescricao.values() for d in lista]
+        lotes = _lotes_das_distribuicoes(cursor, [d["id_distribuicao"] for d in distribuicoes])
+        lote_prescrito = {pr["id_prescricao"]: {"id_estoque": pr["id_medicamento_estoque"], "lote": pr["lote"]} for pr in prescricoes}
+        for distribuicao in distribuicoes:
+            distribuicao["lotes"] = lotes.get(distribuicao["id_distribuicao"]) or [
+                dict(lote_prescrito[distribuicao["id_prescricao"]], quantidade=distribuicao["quantidade_distribuida"])]
+
+        prescricoes_por_atendimento = {}
+        for prescricao in prescricoes:
+            prescricao["distribuicoes"] = distribuicoes_por_prescricao.get(prescricao["id_prescricao"], [])
+            prescricoes_por_atendimento.setdefault(prescricao["id_atendimento"], []).append(prescricao)
+        atendimentos = [a for a, _ in candidatos]
+        for atendimento in atendimentos:
+            atendimento["prescricoes"] = prescricoes_por_atendimento.get(atendimento["id_atendimento"], [])
+
+        return {"success": True, "data": atendimentos, "next_before_id": atendimentos[-1]["id_atendimento"] if tem_mais else None, "version": versao}
+    except sqlite3.Error as e:
+        return {"success": False, "message": f"Erro ao buscar o prontuário do paciente: {e}"}
+    finally:
+        conn.close()
 
-def get_atendimentos_by_type(start_date=None, end_date=None):
+# --- Funções de Relatório ---
+# Um motor alternativo (ex.: espelho_analitico, sobre uma cópia colunar) pode registrar versões
+# próprias dos relatórios com configurar_motor_relatorios; enquanto registradas, as funções abaixo
+# delegam para elas com os mesmos argumentos (exceto com um escopo de acesso ativo, que só o
+# SQLite aplica, ou com um período que alcança o arquivo histórico, que só o SQLite lê).
+_motor_relatorios = {}
+
+def configurar_motor_relatorios(implementacoes=None):
+    """Registra implementações alternativas dos relatórios ({nome_da_funcao: funcao}); None volta ao SQLite."""
+    _motor_relatorios.clear()
+    _motor_relatorios.update(implementacoes or {})
+
+def _relatorio(func):
+    assinatura = inspect.signature(func)
+
+    @functools.wraps(func)
+    def executar(*args, **kwargs):
+        if _escopo_acesso.get() is not None or func.__name__ not in _motor_relatorios:
+            return func(*args, **kwargs)
+        try:
+            argumentos = assinatura.bind_partial(*args, **kwargs).arguments
+        except TypeError:
+            argumentos = {}
+        if _alcanca_arquivos(argumentos.get("start_date"), argumentos.get("end_date")):
+            return func(*args, **kwargs)
+        return _motor_relatorios[func.__name__](*args, **kwargs)
+    return executar
+
+@_relatorio
+def get_atendimentos_by_type(start_date=None, end_date=None, if_version=None):
     """Retorna a contagem de atendimentos por tipo em um período específico."""
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
-        query = """SELECT tipo_atendimento, COUNT(*) as total
+        versao = _versao_tabelas(conn, ("Atendimento",))
+        if versao == if_version:
+            return _nao_modificado(versao)
+        filtro, params = _filtro_escopo("id_posto_atendimento")
+        query = f"""SELECT tipo_atendimento, COUNT(*) as total
             FROM Atendimento
-            WHERE 1=1
+            WHERE 1=1{filtro}
             """
-        params = []
         if start_date:
             query += " AND DATE(data_hora_inicio_atendimento) >= ?"
             params.append(start_date)
@@ -1268,25 +2847,29 @@ def get_atendimentos_by_type(start_date=None, end_date=None):
             params.append(end_date)
         query += " GROUP BY tipo_atendimento ORDER BY total DESC"
         
-        cursor.execute(query, tuple(params))
+        cursor.execute(_com_fontes(query, _fontes_arquivadas(conn, start_date, end_date)), tuple(params))
         data = cursor.fetchall()
-        return {"success": True, "data": [dict(row) for row in data]}
+        return {"success": True, "data": [dict(row) for row in data], "version": versao}
     except sqlite3.Error as e:
         return {"success": False, "message": f"Erro ao buscar atendimentos por tipo: {e}"}
     finally:
         conn.close()
 
-def get_atendimentos_by_posto(start_date=None, end_date=None):
+@_relatorio
+def get_atendimentos_by_posto(start_date=None, end_date=None, if_version=None):
     """Retorna a contagem de atendimentos por posto de saúde em um período específico."""
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
-        query = """SELECT ps.nome_posto, COUNT(a.id_atendimento) as total
+        versao = _versao_tabelas(conn, ("Atendimento", "PostoSaude"))
+        if versao == if_version:
+            return _nao_modificado(versao)
+        filtro, params = _filtro_escopo("a.id_posto_atendimento")
+        query = f"""SELECT ps.nome_posto, COUNT(a.id_atendimento) as total
             FROM Atendimento a
             JOIN PostoSaude ps ON a.id_posto_atendimento = ps.id_posto
-            WHERE 1=1
+            WHERE 1=1{filtro}
             """
-        params = []
         if start_date:
             query += " AND DATE(a.data_hora_inicio_atendimento) >= ?"
             params.append(start_date)
@@ -1295,35 +2878,46 @@ def get_atendimentos_by_posto(start_date=None, end_date=None):
             params.append(end_date)
         query += " GROUP BY ps.nome_posto ORDER BY total DESC"
         
-        cursor.execute(query, tuple(params))
+        cursor.execute(_com_fontes(query, _fontes_arquivadas(conn, start_date, end_date)), tuple(params))
         data = cursor.fetchall()
-        return {"success": True, "data": [dict(row) for row in data]}
+        return {"success": True, "data": [dict(row) for row in data], "version": versao}
     except sqlite3.Error as e:
         return {"success": False, "message": f"Erro ao buscar atendimentos por posto: {e}"}
     finally:
         conn.close()
 
-def get_pacientes_by_genero():
+@_relatorio
+def get_pacientes_by_genero(if_version=None):
     """Retorna a contagem de pacientes por gênero."""
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
-        query = "SELECT genero_paciente, COUNT(*) as total FROM Paciente GROUP BY genero_paciente ORDER BY total DESC"
-        cursor.execute(query)
+        versao = _versao_tabelas(conn, ("Paciente",))
+        if versao == if_version:
+            return _nao_modificado(versao)
+        filtro, params = _filtro_escopo("id_posto_referencia")
+        query = f"SELECT genero_paciente, COUNT(*) as total FROM Paciente WHERE 1=1{filtro} GROUP BY genero_paciente ORDER BY total DESC"
+        cursor.execute(query, tuple(params))
         data = cursor.fetchall()
-        return {"success": True, "data": [dict(row) for row in data]}
+        return {"success": True, "data": [dict(row) for row in data], "version": versao}
     except sqlite3.Error as e:
         return {"success": False, "message": f"Erro ao buscar pacientes por gênero: {e}"}
     finally:
         conn.close()
 
-def get_pacientes_by_idade_group():
+@_relatorio
+def get_pacientes_by_idade_group(if_version=None):
     """Retorna a contagem de pacientes por faixa etária (simplificado)."""
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
-        query = "SELECT data_nascimento_paciente FROM Paciente"
-        cursor.execute(query)
+        # As idades mudam com a data, então o dia de hoje também compõe a versão
+        versao = _versao_tabelas(conn, ("Paciente",)) * 1000000 + date.today().toordinal()
+        if versao == if_version:
+            return _nao_modificado(versao)
+        filtro, params = _filtro_escopo("id_posto_referencia")
+        query = f"SELECT data_nascimento_paciente FROM Paciente WHERE 1=1{filtro}"
+        cursor.execute(query, tuple(params))
         data = cursor.fetchall()
         
         ages = []
@@ -1349,25 +2943,29 @@ def get_pacientes_by_idade_group():
         # Converter para o formato de lista de dicionários
         formatted_data = [{"faixa_etaria": k, "total": v} for k, v in age_groups.items()]
         
-        return {"success": True, "data": formatted_data}
+        return {"success": True, "data": formatted_data, "version": versao}
     except sqlite3.Error as e:
         return {"success": False, "message": f"Erro ao buscar pacientes por faixa etária: {e}"}
     finally:
         conn.close()
 
-def get_top_distribui_medicamentos(start_date=None, end_date=None, limit=10):
+@_relatorio
+def get_top_distribui_medicamentos(start_date=None, end_date=None, limit=10, if_version=None):
     """Retorna os medicamentos mais distribuidos em um período específico."""
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
-        query = """SELECT m.nome_comercial_medicamento, SUM(dm.quantidade_distribuida) as total_distribuido
+        versao = _versao_tabelas(conn, ("DistribuicaoMedicamento", "Prescricao", "EstoqueMedicamentoPosto", "Medicamento"))
+        if versao == if_version:
+            return _nao_modificado(versao)
+        filtro, params = _filtro_escopo("emp.id_posto")
+        query = f"""SELECT m.nome_comercial_medicamento, SUM(dm.quantidade_distribuida) as total_distribuido
             FROM DistribuicaoMedicamento dm
             JOIN Prescricao pr ON dm.id_prescricao = pr.id_prescricao
             JOIN EstoqueMedicamentoPosto emp ON pr.id_medicamento_estoque = emp.id_estoque
             JOIN Medicamento m ON emp.id_medicamento = m.id_medicamento
-            WHERE 1=1
+            WHERE 1=1{filtro}
             """
-        params = []
         if start_date:
             query += " AND DATE(dm.data_hora_distribuicao) >= ?"
             params.append(start_date)
@@ -1377,24 +2975,28 @@ def get_top_distribui_medicamentos(start_date=None, end_date=None, limit=10):
         query += " GROUP BY m.nome_comercial_medicamento ORDER BY total_distribuido DESC LIMIT ?"
         params.append(limit)
         
-        cursor.execute(query, tuple(params))
+        cursor.execute(_com_fontes(query, _fontes_arquivadas(conn, start_date, end_date, por_distribuicao=True)), tuple(params))
         data = cursor.fetchall()
-        return {"success": True, "data": [dict(row) for row in data]}
+        return {"success": True, "data": [dict(row) for row in data], "version": versao}
     except sqlite3.Error as e:
         return {"success": False, "message": f"Erro ao buscar medicamentos mais distribuidos: {e}"}
     finally:
         conn.close()
 
-def get_top_diagnosticos(start_date=None, end_date=None, limit=10):
+@_relatorio
+def get_top_diagnosticos(start_date=None, end_date=None, limit=10, if_version=None):
     """Retorna os diagnósticos (CID-10) mais comuns em um período específico."""
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
-        query = """SELECT cid10, COUNT(*) as total
+        versao = _versao_tabelas(conn, ("Atendimento",))
+        if versao == if_version:
+            return _nao_modificado(versao)
+        filtro, params = _filtro_escopo("id_posto_atendimento")
+        query = f"""SELECT cid10, COUNT(*) as total
             FROM Atendimento
-            WHERE cid10 IS NOT NULL AND cid10 != ''
+            WHERE cid10 IS NOT NULL AND cid10 != ''{filtro}
             """
-        params = []
         if start_date:
             query += " AND DATE(data_hora_inicio_atendimento) >= ?"
             params.append(start_date)
@@ -1404,10 +3006,134 @@ def get_top_diagnosticos(start_date=None, end_date=None, limit=10):
         query += " GROUP BY cid10 ORDER BY total DESC LIMIT ?"
         params.append(limit)
         
-        cursor.execute(query, tuple(params))
+        cursor.execute(_com_fontes(query, _fontes_arquivadas(conn, start_date, end_date)), tuple(params))
         data = cursor.fetchall()
-        return {"success": True, "data": [dict(row) for row in data]}
+        return {"success": True, "data": [dict(row) for row in data], "version": versao}
     except sqlite3.Error as e:
         return {"success": False, "message": f"Erro ao buscar diagnósticos mais comuns: {e}"}
     finally:
         conn.close()
+
+# Métricas da série temporal: FROM (sempre com Atendimento "a" e PostoSaude "ps"), coluna de data e valor agregado
+_METRICAS_SERIE = {
+    "atendimentos": {
+        "from": """Atendimento a
+            JOIN PostoSaude ps ON a.id_posto_atendimento = ps.id_posto""",
+        "data": "a.data_hora_inicio_atendimento",
+        "valor": "COUNT(*)",
+    },
+    "prescricoes": {
+        "from": """Prescricao pr
+            JOIN Atendimento a ON pr.id_atendimento = a.id_atendimento
+            JOIN PostoSaude ps ON a.id_posto_atendimento = ps.id_posto
+            JOIN EstoqueMedicamentoPosto emp ON pr.id_medicamento_estoque = emp.id_estoque
+            JOIN Medicamento m ON emp.id_medicamento = m.id_medicamento""",
+        "data": "pr.data_hora_prescricao",
+        "valor": "SUM(pr.quantidade_prescrita)",
+    },
+    "distribuicoes": {
+        "from": """DistribuicaoMedicamento dm
+            JOIN Prescricao pr ON dm.id_prescricao = pr.id_prescricao
+            JOIN Atendimento a ON pr.id_atendimento = a.id_atendimento
+            JOIN EstoqueMedicamentoPosto emp ON pr.id_medicamento_estoque = emp.id_estoque
+            JOIN PostoSaude ps ON emp.id_posto = ps.id_posto
+            JOIN Medicamento m ON emp.id_medicamento = m.id_medicamento""",
+        "data": "dm.data_hora_distribuicao",
+        "valor": "SUM(dm.quantidade_distribuida)",
+    },
+}
+
+_DIMENSOES_SERIE = {
+    "posto": "ps.nome_posto",
+    "tipo_atendimento": "a.tipo_atendimento",
+    "cid10": "UPPER(TRIM(a.cid10))",
+    "grau_doenca_observado": "a.grau_doenca_observado",
+    "medicamento": "m.nome_comercial_medicamento",
+}
+
+# Início do período de cada data: semanas começam na segunda-feira
+_PERIODOS_SERIE = {
+    "dia": "DATE({coluna})",
+    "semana": "DATE({coluna}, 'weekday 0', '-6 days')",
+    "mes": "strftime('%Y-%m-01', {coluna})",
+}
+
+def _periodos_entre(inicio, fim, periodo):
+    """Lista densa (AAAA-MM-DD) dos inícios de período de `inicio` até `fim`."""
+    if periodo == "semana":
+        inicio -= timedelta(days=inicio.weekday())
+    elif periodo == "mes":
+        inicio = inicio.replace(day=1)
+    periodos = []
+    while inicio <= fim:
+        periodos.append(inicio.isoformat())
+        if periodo == "dia":
+            inicio += timedelta(days=1)
+        elif periodo == "semana":
+            inicio += timedelta(days=7)
+        else:
+            inicio = (inicio.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return periodos
+
+@_relatorio
+def get_serie_temporal(metrica="atendimentos", periodo="mes", dimensoes=None, start_date=None, end_date=None, if_version=None):
+    """Retorna uma métrica agrupada por período (dia/semana/mes) e por dimensões opcionais, em uma única consulta.
+
+    O resultado é denso: "periodos" lista todos os períodos do intervalo e cada item de "data" traz o
+    grupo (valores das dimensões) e a lista de valores alinhada com "periodos", com zero onde não houve
+    registros. Dimensões: posto, tipo_atendimento, cid10, grau_doenca_observado e medicamento (este só
+    para prescricoes e distribuicoes).
+    """
+    dimensoes = list(dimensoes or [])
+    if metrica not in _METRICAS_SERIE:
+        return {"success": False, "message": f"Métrica inválida. Use uma de: {', '.join(_METRICAS_SERIE)}."}
+    if periodo not in _PERIODOS_SERIE:
+        return {"success": False, "message": f"Período inválido. Use um de: {', '.join(_PERIODOS_SERIE)}."}
+    invalidas = [d for d in dimensoes if d not in _DIMENSOES_SERIE or (d == "medicamento" and metrica == "atendimentos")]
+    if invalidas:
+        return {"success": False, "message": f"Dimensões inválidas para '{metrica}': {', '.join(invalidas)}."}
+
+    metrica_sql = _METRICAS_SERIE[metrica]
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        versao = _versao_tabelas(conn, (metrica_sql["from"].split()[0], *re.findall(r"\bJOIN\s+(\w+)", metrica_sql["from"])))
+        if versao == if_version:
+            return _nao_modificado(versao)
+        coluna = metrica_sql["data"]
+        grupos_sql = [f"COALESCE(NULLIF({_DIMENSOES_SERIE[d]}, ''), 'Não informado') AS {d}" for d in dimensoes]
+        filtro, params = _filtro_escopo("ps.id_posto")
+        query = f"""SELECT {_PERIODOS_SERIE[periodo].format(coluna=coluna)} AS periodo, {', '.join(grupos_sql + [''])}{metrica_sql["valor"]} AS total
+            FROM {metrica_sql["from"]}
+            WHERE {coluna} IS NOT NULL{filtro}
+            """
+        # Comparação direta com a coluna (sem DATE()) para poder usar índice na data
+        if start_date:
+            query += f" AND {coluna} >= ?"
+            params.append(str(start_date))
+        if end_date:
+            query += f" AND {coluna} < ?"
+            params.append((date.fromisoformat(str(end_date)) + timedelta(days=1)).isoformat())
+        query += f" GROUP BY {', '.join(['periodo'] + dimensoes)}"
+
+        cursor.execute(_com_fontes(query, _fontes_arquivadas(conn, start_date, end_date, por_distribuicao=metrica != "atendimentos")), tuple(params))
+        rows = [row for row in cursor.fetchall() if row["periodo"]] # Datas fora do formato AAAA-MM-DD não entram
+        if start_date or rows:
+            inicio = date.fromisoformat(str(start_date)) if start_date else min(date.fromisoformat(row["periodo"]) for row in rows)
+            fim = date.fromisoformat(str(end_date)) if end_date else max([date.fromisoformat(row["periodo"]) for row in rows] + [inicio])
+            periodos = _periodos_entre(inicio, fim, periodo)
+        else:
+            periodos = []
+        posicao = {p: i for i, p in enumerate(periodos)}
+
+        series = {}
+        for row in rows:
+            grupo = tuple(row[d] for d in dimensoes)
+            valores = series.setdefault(grupo, [0] * len(periodos))
+            valores[posicao[row["periodo"]]] += row["total"] or 0
+        data = [{"grupo": dict(zip(dimensoes, grupo)), "valores": valores} for grupo, valores in sorted(series.items())]
+        return {"success": True, "data": data, "periodos": periodos, "version": versao}
+    except (sqlite3.Error, ValueError) as e:
+        return {"success": False, "message": f"Erro ao buscar série temporal: {e}"}
+    finally:
+        conn.close()
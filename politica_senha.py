@@ -0,0 +1,234 @@
+"""
+Política de senhas: custo (work factor) do bcrypt configurável e calibrado para o hardware.
+
+O custo usado em novos hashes vem, nesta ordem, da variável de ambiente BCRYPT_CUSTO, da tabela
+ConfiguracaoSenha (gravada pela calibração) ou de CUSTO_PADRAO. Cada +1 no custo dobra o tempo
+de uma verificação; a calibração mede o hardware atual e escolhe o maior custo cuja verificação
+fica dentro do tempo alvo, sem descer de CUSTO_MINIMO.
+
+Hashes gravados com outro custo continuam válidos: no próximo login bem-sucedido o serviço de
+autenticação gera um hash novo com o custo atual (rehash no login), então a troca de servidor ou
+de custo se propaga aos usuários sem pedir troca de senha.
+
+Uso:
+    python politica_senha.py --mostrar
+    python politica_senha.py --calibrar --alvo-ms 250 --salvar
+"""
+import argparse
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import bcrypt
+
+import open_crud
+
+CUSTO_PADRAO = 12
+CUSTO_MINIMO = 10
+CUSTO_MAXIMO = 16
+TEMPO_ALVO_MS = 250
+REPETICOES_CALIBRACAO = 3
+CACHE_CUSTO_TTL = 30.0 # Segundos até reler a configuração (outra instância pode ter recalibrado)
+
+_cache_custo = {} # banco -> (custo, instante da leitura)
+_trava_cache = threading.Lock()
+
+
+def _criar_tabela(conn):
+    conn.execute("""CREATE TABLE IF NOT EXISTS ConfiguracaoSenha (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        custo_bcrypt INTEGER NOT NULL,
+        tempo_alvo_ms REAL,
+        tempo_medido_ms REAL,
+        data_calibracao TEXT
+    )""")
+
+
+def _custo_valido(custo):
+    return CUSTO_MINIMO <= custo <= CUSTO_MAXIMO
+
+
+def _custo_configurado():
+    """Lê o custo salvo no banco, sem criar o arquivo nem tabelas (None se não houver)."""
+    if not os.path.exists(open_crud.DATABASE_NAME):
+        return None
+    try:
+        conn = sqlite3.connect(f"file:{open_crud.DATABASE_NAME}?mode=ro", uri=True)
+        try:
+            row = conn.execute("SELECT custo_bcrypt FROM ConfiguracaoSenha WHERE id = 1").fetchone()
+        finally:
+            conn.close()
+    except sqlite3.Error: # Tabela ainda não existe (nunca calibrado) ou banco indisponível
+        return None
+    return row[0] if row else None
+
+
+def custo_bcrypt():
+    """Custo em vigor para novos hashes."""
+    ambiente = os.environ.get("BCRYPT_CUSTO")
+    if ambiente:
+        custo = int(ambiente)
+        if not _custo_valido(custo):
+            raise ValueError(f"BCRYPT_CUSTO deve estar entre {CUSTO_MINIMO} e {CUSTO_MAXIMO}.")
+        return custo
+    agora = time.monotonic()
+    with _trava_cache:
+        em_cache = _cache_custo.get(open_crud.DATABASE_NAME)
+        if em_cache and agora - em_cache[1] < CACHE_CUSTO_TTL:
+            return em_cache[0]
+    custo = _custo_configurado() or CUSTO_PADRAO
+    with _trava_cache:
+        _cache_custo[open_crud.DATABASE_NAME] = (custo, agora)
+    return custo
+
+
+def hash_senha(senha, custo=None):
+    """Gera o hash bcrypt de uma senha com o custo em vigor (ou o informado)."""
+    return bcrypt.hashpw(senha.encode("utf-8"), bcrypt.gensalt(rounds=custo or custo_bcrypt())).decode("utf-8")
+
+
+def custo_do_hash(senha_hash):
+    """Extrai o custo de um hash bcrypt ("$2b$12$..."); None se o formato não for reconhecido."""
+    partes = senha_hash.split("$")
+    if len(partes) < 4 or not partes[2].isdigit():
+        return None
+    return int(partes[2])
+
+
+def precisa_rehash(senha_hash):
+    """Indica se o hash foi gerado com um custo diferente do atual."""
+    return custo_do_hash(senha_hash) != custo_bcrypt()
+
+
+@open_crud.repetir_se_ocupado
+def atualizar_hash(id_funcionario, hash_antigo, hash_novo):
+    """Troca o hash de um funcionário só se ele ainda for `hash_antigo` (não sobrescreve uma troca de senha concorrente)."""
+    conn = open_crud.get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "UPDATE Funcionario SET senha_hash = ? WHERE id_funcionario = ? AND senha_hash = ?",
+            (hash_novo, id_funcionario, hash_antigo),
+        )
+        conn.commit()
+        if cursor.rowcount > 0:
+            return {"success": True, "message": "Hash de senha atualizado para o custo atual."}
+        return {"success": False, "message": "Senha alterada por outra operação; hash mantido."}
+    except sqlite3.Error as e:
+        return {"success": False, "message": f"Erro ao atualizar hash de senha: {e}"}
+    finally:
+        conn.close()
+
+
+# --- Calibração ---
+
+def medir_verificacao(custo, repeticoes=REPETICOES_CALIBRACAO):
+    """Tempo (ms) de uma verificação bcrypt com o custo informado; usa a menor de `repeticoes` medições."""
+    senha = b"calibracao-politica-senha"
+    senha_hash = bcrypt.hashpw(senha, bcrypt.gensalt(rounds=custo))
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        bcrypt.checkpw(senha, senha_hash)
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return min(tempos)
+
+
+def calibrar(tempo_alvo_ms=TEMPO_ALVO_MS, repeticoes=REPETICOES_CALIBRACAO):
+    """Escolhe o maior custo cuja verificação fica dentro de `tempo_alvo_ms` neste hardware."""
+    medicoes = {}
+    custo = CUSTO_MINIMO
+    medicoes[custo] = medir_verificacao(custo, repeticoes)
+    # O tempo dobra a cada +1; só mede o próximo custo se a estimativa couber no alvo
+    while custo < CUSTO_MAXIMO and medicoes[custo] * 2 <= tempo_alvo_ms * 1.1:
+        custo += 1
+        medicoes[custo] = medir_verificacao(custo, repeticoes)
+    dentro_do_alvo = [c for c, ms in medicoes.items() if ms <= tempo_alvo_ms]
+    escolhido = max(dentro_do_alvo) if dentro_do_alvo else CUSTO_MINIMO
+    return {
+        "success": True,
+        "data": {
+            "custo_bcrypt": escolhido,
+            "tempo_medido_ms": round(medicoes[escolhido], 1),
+            "tempo_alvo_ms": tempo_alvo_ms,
+            "medicoes_ms": {c: round(ms, 1) for c, ms in medicoes.items()},
+            "acima_do_alvo": not dentro_do_alvo,
+        },
+    }
+
+
+@open_crud.repetir_se_ocupado
+def salvar_custo(custo, tempo_alvo_ms=None, tempo_medido_ms=None):
+    """Grava o custo no banco; passa a valer para novos hashes e para o rehash no login."""
+    if not _custo_valido(custo):
+        return {"success": False, "message": f"O custo deve estar entre {CUSTO_MINIMO} e {CUSTO_MAXIMO}."}
+    conn = open_crud.get_db_connection()
+    try:
+        _criar_tabela(conn)
+        conn.execute(
+            """INSERT INTO ConfiguracaoSenha (id, custo_bcrypt, tempo_alvo_ms, tempo_medido_ms, data_calibracao)
+               VALUES (1, ?, ?, ?, ?)
+               ON CONFLICT (id) DO UPDATE SET custo_bcrypt = excluded.custo_bcrypt, tempo_alvo_ms = excluded.tempo_alvo_ms,
+                   tempo_medido_ms = excluded.tempo_medido_ms, data_calibracao = excluded.data_calibracao""",
+            (custo, tempo_alvo_ms, tempo_medido_ms, datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+        )
+        conn.commit()
+        with _trava_cache:
+            _cache_custo.pop(open_crud.DATABASE_NAME, None)
+        return {"success": True, "message": f"Custo bcrypt definido em {custo}."}
+    except sqlite3.Error as e:
+        return {"success": False, "message": f"Erro ao salvar a política de senha: {e}"}
+    finally:
+        conn.close()
+
+
+def resumo_hashes():
+    """Quantidade de funcionários por custo de hash ({custo: quantidade})."""
+    conn = open_crud.get_db_connection()
+    try:
+        contagem = {}
+        for (senha_hash,) in conn.execute("SELECT senha_hash FROM Funcionario"):
+            custo = custo_do_hash(senha_hash or "")
+            contagem[custo] = contagem.get(custo, 0) + 1
+        return {"success": True, "data": contagem}
+    except sqlite3.Error as e:
+        return {"success": False, "message": f"Erro ao ler os hashes de senha: {e}"}
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Política de senhas: custo do bcrypt e calibração.")
+    parser.add_argument("--db", default=open_crud.DATABASE_NAME)
+    parser.add_argument("--mostrar", action="store_true", help="Mostra o custo em vigor e os custos dos hashes gravados.")
+    parser.add_argument("--calibrar", action="store_true", help="Mede o hardware e sugere o custo para o tempo alvo.")
+    parser.add_argument("--alvo-ms", type=float, default=TEMPO_ALVO_MS)
+    parser.add_argument("--salvar", action="store_true", help="Grava o custo calibrado (ou --custo) no banco.")
+    parser.add_argument("--custo", type=int, help="Define o custo manualmente (com --salvar).")
+    args = parser.parse_args()
+    open_crud.DATABASE_NAME = args.db
+
+    if args.calibrar:
+        dados = calibrar(args.alvo_ms)["data"]
+        for custo, ms in dados["medicoes_ms"].items():
+            print(f"custo {custo:>2}: {ms:>8.1f} ms por verificação")
+        aviso = " (acima do alvo mesmo no custo mínimo)" if dados["acima_do_alvo"] else ""
+        print(f"Custo sugerido para {args.alvo_ms:.0f} ms: {dados['custo_bcrypt']}{aviso}")
+        if args.salvar:
+            print(salvar_custo(dados["custo_bcrypt"], args.alvo_ms, dados["tempo_medido_ms"])["message"])
+    elif args.custo is not None and args.salvar:
+        print(salvar_custo(args.custo)["message"])
+    if args.mostrar or not (args.calibrar or args.salvar):
+        print(f"Custo em vigor: {custo_bcrypt()}")
+        resumo = resumo_hashes()
+        if resumo["success"]:
+            for custo, quantidade in sorted(resumo["data"].items(), key=lambda item: item[0] or 0):
+                print(f"  hashes com custo {custo}: {quantidade}")
+        else:
+            print(resumo["message"])
+
+
+if __name__ == "__main__":
+    main()
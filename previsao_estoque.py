@@ -0,0 +1,265 @@
+"""
+Previsão de consumo de medicamentos por posto e pontos de reposição.
+
+Monta séries diárias de consumo por (posto, medicamento) a partir de DistribuicaoMedicamento,
+ajusta suavização exponencial com sazonalidade semanal (Holt-Winters aditivo, sem tendência)
+em todas as séries de uma vez com NumPy e grava as previsões e os pontos de reposição sugeridos
+nas tabelas PrevisaoConsumo e PontoReposicao.
+
+O laço é sobre os dias do histórico; cada passo atualiza todas as séries e todas as combinações
+de parâmetros da grade como arrays, então milhares de séries são ajustadas em poucos segundos.
+
+Uso:
+    python previsao_estoque.py --dias-historico 180 --horizonte 14 --prazo-reposicao 7
+"""
+import argparse
+import math
+import sqlite3
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+import fragmentacao
+import open_crud
+
+DIAS_HISTORICO = 180
+HORIZONTE_DIAS = 14
+PRAZO_REPOSICAO_DIAS = 7
+PERIODO_SAZONAL = 7
+NIVEL_SERVICO_Z = 1.645 # ~95% de nível de serviço no estoque de segurança
+
+# Grade de parâmetros testada para cada série (o melhor par é escolhido pelo erro de um passo à frente)
+GRADE_ALPHA = np.array([0.05, 0.1, 0.2, 0.3, 0.5])
+GRADE_GAMMA = np.array([0.0, 0.05, 0.1, 0.2])
+
+
+def _criar_tabelas(conn):
+    conn.execute("""CREATE TABLE IF NOT EXISTS PrevisaoConsumo (
+        id_posto INTEGER NOT NULL,
+        id_medicamento INTEGER NOT NULL,
+        data_previsao TEXT NOT NULL,
+        quantidade_prevista REAL NOT NULL,
+        data_geracao TEXT NOT NULL,
+        PRIMARY KEY (id_posto, id_medicamento, data_previsao)
+    )""")
+    conn.execute("""CREATE TABLE IF NOT EXISTS PontoReposicao (
+        id_posto INTEGER NOT NULL,
+        id_medicamento INTEGER NOT NULL,
+        consumo_medio_diario REAL NOT NULL,
+        desvio_diario REAL NOT NULL,
+        demanda_prazo_reposicao REAL NOT NULL,
+        estoque_seguranca REAL NOT NULL,
+        ponto_reposicao REAL NOT NULL,
+        estoque_atual INTEGER NOT NULL,
+        quantidade_sugerida INTEGER NOT NULL,
+        alpha REAL NOT NULL,
+        gamma REAL NOT NULL,
+        data_geracao TEXT NOT NULL,
+        PRIMARY KEY (id_posto, id_medicamento)
+    )""")
+
+
+def carregar_series(conn, dias_historico, data_fim):
+    """Retorna (chaves, matriz) com o consumo diário: chaves[i] = (id_posto, id_medicamento), matriz[i, d] = unidades no dia d."""
+    inicio = data_fim - timedelta(days=dias_historico - 1)
+    rows = conn.execute(
+        """SELECT emp.id_posto, emp.id_medicamento, DATE(dm.data_hora_distribuicao) AS dia, SUM(dm.quantidade_distribuida)
+        FROM DistribuicaoMedicamento dm
+        JOIN Prescricao pr ON dm.id_prescricao = pr.id_prescricao
+        JOIN EstoqueMedicamentoPosto emp ON pr.id_medicamento_estoque = emp.id_estoque
+        WHERE dm.data_hora_distribuicao >= ? AND dm.data_hora_distribuicao < ?
+        GROUP BY emp.id_posto, emp.id_medicamento, dia""",
+        (inicio.isoformat(), (data_fim + timedelta(days=1)).isoformat())
+    ).fetchall()
+    if not rows:
+        return [], np.zeros((0, dias_historico))
+
+    pares = np.array([(row[0], row[1]) for row in rows], dtype=np.int64)
+    dias = np.array([(date.fromisoformat(row[2]) - inicio).days for row in rows])
+    quantidades = np.array([row[3] for row in rows], dtype=float)
+    chaves, indice = np.unique(pares, axis=0, return_inverse=True)
+    matriz = np.zeros((len(chaves), dias_historico))
+    np.add.at(matriz, (indice.ravel(), dias), quantidades)
+    return [(int(p), int(m)) for p, m in chaves], matriz
+
+
+def ajustar_suavizacao_sazonal(Y, alphas=GRADE_ALPHA, gammas=GRADE_GAMMA, periodo=PERIODO_SAZONAL):
+    """Ajusta Holt-Winters aditivo sem tendência em todas as linhas de Y, escolhendo (alpha, gamma) por série.
+
+    Retorna (nivel, sazonal, desvio, alpha, gamma): estado final de cada série, desvio-padrão do
+    erro de um passo à frente e os parâmetros escolhidos. A coluna t de Y cai na estação t % periodo.
+    """
+    n, T = Y.shape
+    semanas = min(T // periodo, 4)
+    if semanas >= 2:
+        inicio = Y[:, :semanas * periodo].reshape(n, semanas, periodo)
+        nivel_inicial = inicio.mean(axis=(1, 2))
+        sazonal_inicial = inicio.mean(axis=1) - nivel_inicial[:, None]
+    else: # Histórico curto demais para estimar o padrão semanal
+        nivel_inicial = Y.mean(axis=1)
+        sazonal_inicial = np.zeros((n, periodo))
+
+    A = np.repeat(alphas, len(gammas))[:, None] # (K, 1): uma linha por combinação da grade
+    G = np.tile(gammas, len(alphas))[:, None]
+    K = len(A)
+    nivel = np.broadcast_to(nivel_inicial, (K, n)).copy()
+    sazonal = np.broadcast_to(sazonal_inicial, (K, n, periodo)).copy()
+    sse = np.zeros((K, n))
+    for t in range(T):
+        s = t % periodo
+        erro = Y[:, t] - (nivel + sazonal[:, :, s])
+        sse += erro ** 2
+        nivel = nivel + A * erro
+        sazonal[:, :, s] += G * (Y[:, t] - nivel - sazonal[:, :, s])
+
+    melhor = sse.argmin(axis=0)
+    series = np.arange(n)
+    return (nivel[melhor, series], sazonal[melhor, series], np.sqrt(sse[melhor, series] / max(T, 1)),
+            A[melhor, 0], G[melhor, 0])
+
+
+def prever(nivel, sazonal, inicio, horizonte, periodo=PERIODO_SAZONAL):
+    """Previsão diária (n, horizonte) a partir do dia de índice `inicio`; consumo nunca negativo."""
+    estacoes = np.arange(inicio, inicio + horizonte) % periodo
+    return np.maximum(nivel[:, None] + sazonal[:, estacoes], 0.0)
+
+
+def calcular_reposicao(previsao, desvio, estoque_atual, prazo_reposicao, z=NIVEL_SERVICO_Z):
+    """Calcula demanda no prazo, estoque de segurança, ponto de reposição e quantidade sugerida (vetorizado).
+
+    A quantidade sugerida repõe até o ponto de reposição mais a demanda do horizonte, e só é
+    sugerida quando o estoque atual já está no ponto de reposição ou abaixo dele.
+    """
+    horizonte = previsao.shape[1]
+    if prazo_reposicao <= horizonte:
+        demanda_prazo = previsao[:, :prazo_reposicao].sum(axis=1)
+    else:
+        demanda_prazo = previsao.mean(axis=1) * prazo_reposicao
+    estoque_seguranca = z * desvio * math.sqrt(prazo_reposicao)
+    ponto = demanda_prazo + estoque_seguranca
+    sugerida = np.where(estoque_atual <= ponto, np.ceil(ponto + previsao.sum(axis=1) - estoque_atual), 0)
+    return demanda_prazo, estoque_seguranca, ponto, np.maximum(sugerida, 0).astype(int)
+
+
+@open_crud.repetir_se_ocupado
+def gerar_previsoes(dias_historico=DIAS_HISTORICO, horizonte=HORIZONTE_DIAS, prazo_reposicao=PRAZO_REPOSICAO_DIAS, data_fim=None):
+    """Ajusta os modelos de todas as séries e regrava PrevisaoConsumo e PontoReposicao."""
+    if fragmentacao.consultas_no_catalogo():
+        return {"success": False, "message": fragmentacao.MENSAGEM_SO_BANCO_UNICO}
+    inicio_execucao = time.perf_counter()
+    data_fim = data_fim or date.today()
+    conn = open_crud.get_db_connection()
+    try:
+        _criar_tabelas(conn)
+        chaves, Y = carregar_series(conn, dias_historico, data_fim)
+        if not chaves:
+            return {"success": False, "message": "Não há distribuições no período para gerar previsões."}
+
+        nivel, sazonal, desvio, alpha, gamma = ajustar_suavizacao_sazonal(Y)
+        previsao = prever(nivel, sazonal, dias_historico, horizonte)
+
+        saldos = dict(((row[0], row[1]), row[2]) for row in conn.execute(
+            """SELECT id_posto, id_medicamento, SUM(quantidade_atual) FROM EstoqueMedicamentoPosto
+            WHERE data_validade >= ? GROUP BY id_posto, id_medicamento""",
+            (date.today().isoformat(),)
+        ))
+        estoque_atual = np.array([saldos.get(chave, 0) for chave in chaves], dtype=float)
+        demanda_prazo, estoque_seguranca, ponto, sugerida = calcular_reposicao(previsao, desvio, estoque_atual, prazo_reposicao)
+
+        gerado_em = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        datas = [(data_fim + timedelta(days=h + 1)).isoformat() for h in range(horizonte)]
+        conn.execute("DELETE FROM PrevisaoConsumo")
+        conn.executemany(
+            "INSERT INTO PrevisaoConsumo (id_posto, id_medicamento, data_previsao, quantidade_prevista, data_geracao) VALUES (?, ?, ?, ?, ?)",
+            ((p, m, datas[h], round(float(previsao[i, h]), 3), gerado_em)
+             for i, (p, m) in enumerate(chaves) for h in range(horizonte))
+        )
+        conn.execute("DELETE FROM PontoReposicao")
+        conn.executemany(
+            """INSERT INTO PontoReposicao (id_posto, id_medicamento, consumo_medio_diario, desvio_diario, demanda_prazo_reposicao,
+                estoque_seguranca, ponto_reposicao, estoque_atual, quantidade_sugerida, alpha, gamma, data_geracao)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            ((p, m, round(float(previsao[i].mean()), 3), round(float(desvio[i]), 3), round(float(demanda_prazo[i]), 3),
+              round(float(estoque_seguranca[i]), 3), round(float(ponto[i]), 3), int(estoque_atual[i]), int(sugerida[i]),
+              float(alpha[i]), float(gamma[i]), gerado_em)
+             for i, (p, m) in enumerate(chaves))
+        )
+        conn.commit()
+        segundos = time.perf_counter() - inicio_execucao
+        return {
+            "success": True,
+            "message": f"Previsões geradas para {len(chaves)} séries em {segundos:.2f}s ({int((sugerida > 0).sum())} reposições sugeridas).",
+            "data": {"series": len(chaves), "reposicoes_sugeridas": int((sugerida > 0).sum()), "segundos": segundos},
+        }
+    except sqlite3.Error as e:
+        conn.rollback()
+        return {"success": False, "message": f"Erro ao gerar previsões: {e}"}
+    finally:
+        conn.close()
+
+
+def get_pontos_reposicao(id_posto=None, id_medicamento=None, apenas_sugeridos=False):
+    """Retorna os pontos de reposição da última execução, com nomes de posto e medicamento."""
+    if fragmentacao.consultas_no_catalogo():
+        return {"success": False, "message": fragmentacao.MENSAGEM_SO_BANCO_UNICO}
+    conn = open_crud.get_db_connection()
+    try:
+        _criar_tabelas(conn)
+        query = """SELECT pr.*, ps.nome_posto, m.nome_comercial_medicamento
+            FROM PontoReposicao pr
+            JOIN PostoSaude ps ON pr.id_posto = ps.id_posto
+            JOIN Medicamento m ON pr.id_medicamento = m.id_medicamento
+            WHERE 1=1"""
+        params = []
+        if id_posto:
+            query += " AND pr.id_posto = ?"
+            params.append(id_posto)
+        if id_medicamento:
+            query += " AND pr.id_medicamento = ?"
+            params.append(id_medicamento)
+        if apenas_sugeridos:
+            query += " AND pr.quantidade_sugerida > 0"
+        query += " ORDER BY pr.quantidade_sugerida DESC, ps.nome_posto, m.nome_comercial_medicamento"
+        rows = conn.execute(query, tuple(params)).fetchall()
+        return {"success": True, "data": [dict(row) for row in rows]}
+    except sqlite3.Error as e:
+        return {"success": False, "message": f"Erro ao buscar pontos de reposição: {e}"}
+    finally:
+        conn.close()
+
+
+def get_previsoes_consumo(id_posto, id_medicamento):
+    """Retorna a previsão diária de consumo de um medicamento em um posto."""
+    if fragmentacao.consultas_no_catalogo():
+        return {"success": False, "message": fragmentacao.MENSAGEM_SO_BANCO_UNICO}
+    conn = open_crud.get_db_connection()
+    try:
+        _criar_tabelas(conn)
+        rows = conn.execute(
+            """SELECT data_previsao, quantidade_prevista FROM PrevisaoConsumo
+            WHERE id_posto = ? AND id_medicamento = ? ORDER BY data_previsao""",
+            (id_posto, id_medicamento)
+        ).fetchall()
+        return {"success": True, "data": [dict(row) for row in rows]}
+    except sqlite3.Error as e:
+        return {"success": False, "message": f"Erro ao buscar previsões de consumo: {e}"}
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera previsões de consumo e pontos de reposição por posto e medicamento.")
+    parser.add_argument("--db", default=open_crud.DATABASE_NAME, help="Arquivo SQLite do banco de dados.")
+    parser.add_argument("--dias-historico", type=int, default=DIAS_HISTORICO)
+    parser.add_argument("--horizonte", type=int, default=HORIZONTE_DIAS, help="Dias previstos à frente.")
+    parser.add_argument("--prazo-reposicao", type=int, default=PRAZO_REPOSICAO_DIAS, help="Dias entre o pedido e a chegada do medicamento.")
+    args = parser.parse_args()
+
+    open_crud.DATABASE_NAME = args.db
+    resultado = gerar_previsoes(args.dias_historico, args.horizonte, args.prazo_reposicao)
+    print(resultado["message"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,359 @@
+"""
+Réplica de leitura: relatórios e listagens servidos por um retrato do banco atualizado periodicamente.
+
+Sem WAL, uma consulta longa dos Relatórios segura a trava de leitura do arquivo e as escritas da
+recepção esperam por ela. Aqui uma thread de fundo copia o banco, a cada `intervalo` segundos,
+para <banco>_replica.sqlite com a API de backup (backup._copiar, em passos pausados) e troca o
+arquivo de uma vez com os.replace; as funções de leitura pesada do open_crud (relatórios,
+listagens, série temporal, estoque na data) passam a ler a réplica e o banco principal fica só com
+o tráfego transacional (cadastros, buscas por ID, login, prontuário, alertas).
+
+  * A data de modificação da réplica é o início da cópia que a gerou, então a idade dos dados é
+    conhecida por qualquer processo sem estado em memória. Se a réplica tiver mais de
+    `atraso_maximo` segundos (atualização atrasada ou falhando), as leituras voltam ao banco principal.
+  * Leitura das próprias escritas: dentro de sessao(estado) (no app, o st.session_state), cada
+    escrita bem-sucedida anota a hora em `estado`, e a sessão lê do banco principal até existir
+    uma réplica copiada depois dela. Sem sessão (ex.: a API), vale só o atraso máximo.
+  * A réplica fica na mesma pasta do banco, então os arquivos históricos (arquivamento.py)
+    continuam sendo encontrados pelo caminho relativo registrado no ArquivoHistorico.
+
+O envio incremental do WAL não é usado: o SQLite não expõe os quadros do WAL e a cópia pela API de
+backup já é a usada pelos backups. A réplica não está disponível no modo fragmentado.
+
+Uso:
+    python replica_leitura.py --atualizar                 # gera (ou renova) a réplica uma vez
+    python replica_leitura.py --servir --intervalo 30     # renova a réplica a cada 30 s
+    HOSPITAL_REPLICA=30 streamlit run app.py              # intervalo[,atraso máximo] em segundos
+    HOSPITAL_REPLICA=0,120 streamlit run app.py           # só lê; a réplica é renovada pelo --servir
+    python api_server.py --replica 30
+    python replica_leitura.py --benchmark
+"""
+import argparse
+import contextlib
+import contextvars
+import functools
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+import backup
+import fragmentacao
+import open_crud
+
+VARIAVEL_AMBIENTE = "HOSPITAL_REPLICA"
+SUFIXO_REPLICA = "_replica"
+INTERVALO_ATUALIZACAO = 30 # segundos entre as cópias
+ATRASO_MAXIMO = 120 # segundos; réplica mais velha que isso não é usada
+CHAVE_ULTIMA_ESCRITA = "replica_ultima_escrita"
+
+# Leituras servidas pela réplica. Buscas por ID, login e prontuário ficam no banco principal.
+LEITURAS_REPLICA = (
+    "get_all_hospitals", "get_all_postos_saude", "get_all_funcionarios", "get_all_pacientes",
+    "get_all_medicamentos", "get_all_estoque_medicamento_posto", "get_all_atendimentos",
+    "get_all_prescricoes", "get_all_distribuicoes_medicamento",
+    "get_movimentacoes_estoque", "get_estoque_na_data", "get_alertas_estoque", "get_resumo_alertas",
+    "get_atendimentos_by_type", "get_atendimentos_by_posto", "get_pacientes_by_genero",
+    "get_pacientes_by_idade_group", "get_top_distribui_medicamentos", "get_top_diagnosticos",
+    "get_serie_temporal",
+)
+
+_atraso_maximo = None # None = réplica desativada
+_originais = {}
+_sessao = contextvars.ContextVar("sessao_replica", default=None)
+
+
+def caminho_replica(banco=None):
+    """<pasta do banco>/<nome>_replica.sqlite."""
+    raiz, extensao = os.path.splitext(banco or open_crud.DATABASE_NAME)
+    return f"{raiz}{SUFIXO_REPLICA}{extensao or '.sqlite'}"
+
+
+def idade_replica(banco=None):
+    """Segundos desde o início da cópia que gerou a réplica (None se ela não existir)."""
+    try:
+        return max(time.time() - os.stat(caminho_replica(banco)).st_mtime, 0.0)
+    except FileNotFoundError:
+        return None
+
+
+# --- Atualização ---
+
+def atualizar(banco=None, paginas_por_passo=backup.PAGINAS_POR_PASSO, pausa=backup.PAUSA_ENTRE_PASSOS):
+    """Copia o banco para um arquivo temporário e o publica como a nova réplica."""
+    banco = banco or open_crud.DATABASE_NAME
+    destino = caminho_replica(banco)
+    temporario = f"{destino}.{os.getpid()}.novo"
+    inicio = time.time()
+    try:
+        copia = backup._copiar(banco, temporario, paginas_por_passo, pausa)
+        conn = sqlite3.connect(temporario)
+        try:
+            # A cópia de um banco em WAL herda o modo; a réplica só é lida e não precisa de -wal/-shm
+            conn.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            conn.close()
+        os.utime(temporario, (inicio, inicio)) # A idade da réplica conta do início da cópia
+        os.replace(temporario, destino) # Quem já está lendo segue com o arquivo anterior até fechar a conexão
+    except (sqlite3.Error, OSError) as e:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        return {"success": False, "message": f"Erro ao atualizar a réplica de leitura: {e}"}
+    segundos = time.time() - inicio
+    return {"success": True, "message": f"Réplica de leitura atualizada em {segundos:.1f}s ({copia['paginas']} páginas).",
+            "data": {"caminho": destino, "segundos": segundos, **copia}}
+
+
+def descartar(banco=None):
+    """Remove a réplica (ex.: depois de uma restauração, quando ela não corresponde mais ao banco)."""
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(caminho_replica(banco))
+
+
+class AtualizadorReplica:
+    """Thread de fundo que renova a réplica sempre que ela passa de `intervalo` segundos."""
+
+    def __init__(self, intervalo=INTERVALO_ATUALIZACAO):
+        self.intervalo = intervalo
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._executar, name="replica_leitura", daemon=True)
+
+    def iniciar(self):
+        self._thread.start()
+        return self
+
+    def parar(self):
+        self._parar.set()
+        self._thread.join()
+
+    def _executar(self):
+        espera = 0
+        while not self._parar.wait(espera):
+            idade = idade_replica()
+            if idade is None or idade >= self.intervalo:
+                resultado = atualizar()
+                if not resultado["success"]:
+                    print(f"[réplica] {resultado['message']}", flush=True)
+                idade = 0
+            espera = max(self.intervalo - idade, 1)
+
+
+# --- Roteamento das leituras ---
+
+@contextlib.contextmanager
+def sessao(estado):
+    """Anota em `estado` (um dict por usuário, ex.: st.session_state) as escritas feitas dentro do
+    bloco, para que as leituras seguintes da mesma sessão não venham de uma réplica anterior a elas."""
+    token = _sessao.set(estado)
+    try:
+        yield
+    finally:
+        _sessao.reset(token)
+
+
+def _replica_utilizavel():
+    """Caminho da réplica se ela puder atender a leitura atual, senão None (lê do banco principal)."""
+    if _atraso_maximo is None or open_crud._banco_roteado.get() is not None:
+        return None
+    caminho = caminho_replica()
+    try:
+        copiada_em = os.stat(caminho).st_mtime
+    except FileNotFoundError:
+        return None
+    if time.time() - copiada_em > _atraso_maximo:
+        return None
+    estado = _sessao.get()
+    if estado is not None and estado.get(CHAVE_ULTIMA_ESCRITA, 0) >= copiada_em:
+        return None
+    return caminho
+
+
+def _envolver_leitura(original):
+    @functools.wraps(original)
+    def lida_da_replica(*args, **kwargs):
+        caminho = _replica_utilizavel()
+        if caminho is None:
+            return original(*args, **kwargs)
+        with open_crud.usando_banco(caminho):
+            return original(*args, **kwargs)
+    return lida_da_replica
+
+
+def _envolver_escrita(original):
+    @functools.wraps(original)
+    def escrita_anotada(*args, **kwargs):
+        resultado = original(*args, **kwargs)
+        estado = _sessao.get()
+        if estado is not None and (not isinstance(resultado, dict) or resultado.get("success", True)):
+            estado[CHAVE_ULTIMA_ESCRITA] = time.time()
+        return resultado
+    return escrita_anotada
+
+
+def _escritas():
+    """Escritas do open_crud (as marcadas com repetir_se_ocupado), que mandam as leituras seguintes
+    da sessão para o banco principal."""
+    return [nome for nome in dir(open_crud)
+            if getattr(getattr(open_crud, nome), "repete_se_ocupado", False) and not nome.startswith("get_")]
+
+
+def ativar(atraso_maximo=ATRASO_MAXIMO):
+    """Passa as leituras de LEITURAS_REPLICA para a réplica (enquanto ela tiver até `atraso_maximo` segundos).
+
+    Como em fragmentacao.ativar, deve ser chamado antes de `from open_crud import ...` nos módulos
+    que usam as funções. Não renova a réplica: isso é feito por iniciar_atualizador (ou por outro
+    processo com `--servir`).
+    """
+    global _atraso_maximo
+    if fragmentacao._roteador is not None:
+        raise ValueError("A réplica de leitura não está disponível no modo fragmentado.")
+    _atraso_maximo = atraso_maximo
+    if _originais:
+        return
+    for nome in LEITURAS_REPLICA:
+        _originais[nome] = getattr(open_crud, nome)
+        setattr(open_crud, nome, _envolver_leitura(_originais[nome]))
+    for nome in _escritas():
+        _originais[nome] = getattr(open_crud, nome)
+        setattr(open_crud, nome, _envolver_escrita(_originais[nome]))
+
+
+def desativar():
+    """Restaura as funções originais do open_crud (todas as leituras voltam ao banco principal)."""
+    global _atraso_maximo
+    for nome, original in _originais.items():
+        setattr(open_crud, nome, original)
+    _originais.clear()
+    _atraso_maximo = None
+
+
+def ativa():
+    """Indica se as leituras estão sendo roteadas para a réplica."""
+    return _atraso_maximo is not None
+
+
+_atualizador = None
+_trava_atualizador = threading.Lock()
+
+
+def iniciar_atualizador(intervalo=INTERVALO_ATUALIZACAO):
+    """Inicia (uma vez por processo) a thread que renova a réplica."""
+    global _atualizador
+    with _trava_atualizador:
+        if _atualizador is None:
+            _atualizador = AtualizadorReplica(intervalo).iniciar()
+        return _atualizador
+
+
+def configuracao_de_texto(texto):
+    """'30' -> (30, ATRASO_MAXIMO ou 4x o intervalo, o que for maior); '30,90' -> (30, 90)."""
+    partes = [float(parte) for parte in texto.split(",")]
+    intervalo = partes[0]
+    atraso = partes[1] if len(partes) > 1 else max(ATRASO_MAXIMO, 4 * intervalo)
+    return intervalo, atraso
+
+
+def ativar_com_atualizador(intervalo=INTERVALO_ATUALIZACAO, atraso_maximo=ATRASO_MAXIMO):
+    """Ativa o roteamento das leituras e a renovação da réplica neste processo (intervalo 0: a
+    réplica é renovada por outro processo, ex.: `replica_leitura.py --servir` no modo multiprocesso)."""
+    ativar(atraso_maximo)
+    return iniciar_atualizador(intervalo) if intervalo > 0 else None
+
+
+def ativar_se_configurado():
+    """Ativa a réplica se a variável de ambiente HOSPITAL_REPLICA definir o intervalo (ex.: 30 ou 30,120)."""
+    texto = os.environ.get(VARIAVEL_AMBIENTE)
+    return ativar_com_atualizador(*configuracao_de_texto(texto)) if texto else None
+
+
+# --- Benchmark ---
+
+def _relatorios_em_laco(parar, contagem):
+    """Roda os relatórios da tela de Relatórios sem parar, como vários gerentes com a página aberta."""
+    while not parar.is_set():
+        open_crud.get_top_diagnosticos()
+        open_crud.get_atendimentos_by_posto()
+        open_crud.get_serie_temporal(periodo="mes")
+        contagem.append(1)
+
+
+def _medir_escritas(ids, escritas_por_segundo, segundos):
+    """Cria atendimentos no ritmo pedido enquanto os relatórios rodam; retorna (latências, falhas, relatórios)."""
+    latencias, contagem = [], []
+    falhas = 0
+    parar = threading.Event()
+    leitor = threading.Thread(target=_relatorios_em_laco, args=(parar, contagem))
+    leitor.start()
+    fim = time.perf_counter() + segundos
+    while time.perf_counter() < fim:
+        inicio = time.perf_counter()
+        resultado = open_crud.create_atendimento(*ids, "Consulta", "Benchmark réplica")
+        latencias.append(time.perf_counter() - inicio)
+        falhas += not resultado["success"]
+        time.sleep(max(1 / escritas_por_segundo - latencias[-1], 0))
+    parar.set()
+    leitor.join()
+    return latencias, falhas, len(contagem)
+
+
+def executar_benchmark(db, escritas_por_segundo=5, segundos=20):
+    """Mede a latência das escritas com os relatórios rodando no banco principal e na réplica."""
+    print(f"Banco: {db} ({os.path.getsize(db) / 2**20:.0f} MB)")
+    banco_anterior = open_crud.DATABASE_NAME
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(db))) as temporario:
+        # As escritas do teste vão para uma cópia, nunca para o banco informado
+        origem = os.path.join(temporario, "origem.sqlite")
+        backup._copiar(db, origem, -1, 0)
+        open_crud.DATABASE_NAME = origem
+        try:
+            conn = sqlite3.connect(origem)
+            ids = conn.execute("""SELECT p.id_paciente, f.id_funcionario, f.id_posto_lotacao
+                FROM Paciente p, Funcionario f LIMIT 1""").fetchone()
+            conn.close()
+            for usar_replica in (False, True):
+                if usar_replica:
+                    resultado = atualizar(origem)
+                    print(resultado["message"])
+                    ativar(atraso_maximo=segundos * 10)
+                try:
+                    latencias, falhas, relatorios = _medir_escritas(ids, escritas_por_segundo, segundos)
+                finally:
+                    desativar()
+                rotulo = "na réplica" if usar_replica else "no banco principal"
+                print(f"Relatórios {rotulo}: {relatorios} rodadas; escritas: {backup._resumo_latencias(latencias)}, {falhas} falha(s)")
+        finally:
+            open_crud.DATABASE_NAME = banco_anterior
+            open_crud._bancos_preparados.difference_update({origem, caminho_replica(origem)})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Réplica de leitura do banco para relatórios e listagens.")
+    parser.add_argument("--db", default=open_crud.DATABASE_NAME, help="Arquivo SQLite do banco de dados.")
+    parser.add_argument("--atualizar", action="store_true", help="Gera (ou renova) a réplica uma vez.")
+    parser.add_argument("--servir", action="store_true", help="Fica rodando e renova a réplica a cada --intervalo segundos.")
+    parser.add_argument("--intervalo", type=float, default=INTERVALO_ATUALIZACAO, help="Segundos entre as renovações do --servir.")
+    parser.add_argument("--benchmark", action="store_true", help="Mede escritas com os relatórios no banco principal e na réplica.")
+    parser.add_argument("--escritas", type=int, default=5, help="Escritas por segundo no benchmark.")
+    args = parser.parse_args()
+    open_crud.DATABASE_NAME = args.db
+
+    if args.benchmark:
+        executar_benchmark(args.db, args.escritas)
+    elif args.servir:
+        print(f"Renovando {caminho_replica()} a cada {args.intervalo:g}s.", flush=True)
+        atualizador = iniciar_atualizador(args.intervalo)
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            atualizador.parar()
+    elif args.atualizar:
+        print(atualizar()["message"])
+    else:
+        idade = idade_replica()
+        print(f"{caminho_replica()}: " + ("não existe." if idade is None else f"copiada há {idade:.0f}s."))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""
+Sessões de login no servidor.
+
+Após o login o cliente guarda só um token opaco; o servidor mantém, em memória, o principal da
+sessão (id, nome, cargo, posto, hospital e postos visíveis pelo cargo) com validade renovada a cada uso. Ler o
+usuário atual e checar permissões é uma consulta a um dicionário, sem acesso ao banco a cada
+rerun, e o hash da senha nunca fica na sessão.
+
+Quando um funcionário é alterado ou excluído pelo open_crud, os principais das suas sessões são
+descartados: no próximo acesso o principal é relido do banco uma única vez (cargo ou posto novos
+passam a valer) e, se o funcionário não existir mais, a sessão é encerrada.
+
+Uso:
+    token = sessoes.criar_sessao(id_funcionario)
+    principal = sessoes.obter_principal(token) # None se expirada ou encerrada
+    sessoes.encerrar_sessao(token)
+"""
+import secrets
+import sqlite3
+import threading
+import time
+
+import open_crud
+
+# Alcance dos dados por cargo: "global" (todos os postos), "hospital" (postos do hospital do
+# funcionário) ou "posto" (só o posto de lotação, padrão para cargos não listados)
+ESCOPO_POR_CARGO = {
+    "Administrativo": "global",
+    "Médico": "hospital",
+    "Farmacêutico": "hospital",
+}
+
+SESSAO_TTL = 8 * 3600 # Segundos sem uso até a sessão expirar (um turno)
+MAX_SESSOES = 50000
+INTERVALO_LIMPEZA = 300 # Segundos entre varreduras das sessões expiradas
+
+
+class Principal:
+    """Identidade e lotação do funcionário logado (sem dados sensíveis)."""
+
+    __slots__ = ("id_funcionario", "nome", "cargo", "id_posto", "nome_posto", "id_hospital", "postos_visiveis", "hospitais_visiveis")
+
+    def __init__(self, id_funcionario, nome, cargo, id_posto, nome_posto, id_hospital, postos_visiveis=None, hospitais_visiveis=None):
+        self.id_funcionario = id_funcionario
+        self.nome = nome
+        self.cargo = cargo
+        self.id_posto = id_posto
+        self.nome_posto = nome_posto
+        self.id_hospital = id_hospital
+        self.postos_visiveis = postos_visiveis # None = todos
+        self.hospitais_visiveis = hospitais_visiveis
+
+    def escopo(self):
+        """Contexto que restringe as listagens e relatórios do open_crud aos dados visíveis a este funcionário."""
+        return open_crud.escopo_acesso(self.postos_visiveis, self.hospitais_visiveis)
+
+    def __repr__(self):
+        return f"Principal(id_funcionario={self.id_funcionario}, cargo={self.cargo!r}, id_posto={self.id_posto})"
+
+
+def carregar_principal(id_funcionario):
+    """Lê do banco o principal de um funcionário (None se ele não existir), já com os postos visíveis pelo cargo."""
+    conn = open_crud.get_db_connection()
+    try:
+        row = conn.execute(
+            """SELECT f.id_funcionario, f.nome_funcionario, f.cargo_funcionario, f.id_posto_lotacao, ps.nome_posto, ps.id_hospital_vinculado
+               FROM Funcionario f JOIN PostoSaude ps ON f.id_posto_lotacao = ps.id_posto
+               WHERE f.id_funcionario = ?""",
+            (id_funcionario,),
+        ).fetchone()
+        if row is None:
+            return None
+        alcance = ESCOPO_POR_CARGO.get(row["cargo_funcionario"], "posto")
+        if alcance == "global":
+            return Principal(*row)
+        if alcance == "hospital":
+            postos = tuple(r[0] for r in conn.execute("SELECT id_posto FROM PostoSaude WHERE id_hospital_vinculado = ?", (row["id_hospital_vinculado"],)))
+        else:
+            postos = (row["id_posto_lotacao"],)
+        return Principal(*row, postos_visiveis=postos, hospitais_visiveis=(row["id_hospital_vinculado"],))
+    finally:
+        conn.close()
+
+
+class ArmazemSessoes:
+    """Sessões em memória: token -> [id_funcionario, principal (ou None se desatualizado), expira_em]."""
+
+    def __init__(self, ttl=SESSAO_TTL, max_sessoes=MAX_SESSOES):
+        self.ttl = ttl
+        self.max_sessoes = max_sessoes
+        self._sessoes = {}
+        self._por_funcionario = {} # id_funcionario -> {tokens}
+        self._trava = threading.Lock()
+        self._proxima_limpeza = time.monotonic() + INTERVALO_LIMPEZA
+
+    def criar(self, id_funcionario):
+        """Abre uma sessão para o funcionário e retorna o token (None se o funcionário não existir)."""
+        principal = carregar_principal(id_funcionario)
+        if principal is None:
+            return None
+        token = secrets.token_urlsafe(24)
+        agora = time.monotonic()
+        with self._trava:
+            if agora >= self._proxima_limpeza or len(self._sessoes) >= self.max_sessoes:
+                self._limpar_expiradas(agora)
+            if len(self._sessoes) >= self.max_sessoes: # Ainda cheio: descarta a sessão que expira primeiro
+                self._remover(min(self._sessoes, key=lambda t: self._sessoes[t][2]))
+            self._sessoes[token] = [id_funcionario, principal, agora + self.ttl]
+            self._por_funcionario.setdefault(id_funcionario, set()).add(token)
+        return token
+
+    def obter(self, token):
+        """Principal da sessão, renovando a validade; None se o token for inválido ou expirado."""
+        if not token:
+            return None
+        agora = time.monotonic()
+        with self._trava:
+            sessao = self._sessoes.get(token)
+            if sessao is None:
+                return None
+            if sessao[2] < agora:
+                self._remover(token)
+                return None
+            sessao[2] = agora + self.ttl
+            if sessao[1] is not None:
+                return sessao[1]
+            id_funcionario = sessao[0]
+        # Principal descartado por uma alteração do funcionário: relê uma vez, fora da trava
+        try:
+            principal = carregar_principal(id_funcionario)
+        except sqlite3.Error:
+            return None
+        with self._trava:
+            sessao = self._sessoes.get(token)
+            if sessao is None:
+                return None
+            if principal is None: # Funcionário excluído
+                self._remover(token)
+                return None
+            sessao[1] = principal
+            return principal
+
+    def encerrar(self, token):
+        with self._trava:
+            self._remover(token)
+
+    def invalidar_funcionario(self, id_funcionario):
+        """Descarta os principais em cache das sessões do funcionário (None = de todos); são relidos no próximo acesso."""
+        with self._trava:
+            tokens = self._sessoes if id_funcionario is None else self._por_funcionario.get(id_funcionario, ())
+            for token in tokens:
+                self._sessoes[token][1] = None
+
+    def encerrar_sessoes_funcionario(self, id_funcionario):
+        with self._trava:
+            for token in list(self._por_funcionario.get(id_funcionario, ())):
+                self._remover(token)
+
+    def __len__(self):
+        return len(self._sessoes)
+
+    def _remover(self, token):
+        sessao = self._sessoes.pop(token, None)
+        if sessao is None:
+            return
+        tokens = self._por_funcionario.get(sessao[0])
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._por_funcionario[sessao[0]]
+
+    def _limpar_expiradas(self, agora):
+        for token in [t for t, sessao in self._sessoes.items() if sessao[2] < agora]:
+            self._remover(token)
+        self._proxima_limpeza = agora + INTERVALO_LIMPEZA
+
+
+_armazem = ArmazemSessoes()
+open_crud.registrar_ouvinte_funcionario(_armazem.invalidar_funcionario)
+
+
+def criar_sessao(id_funcionario):
+    return _armazem.criar(id_funcionario)
+
+
+def obter_principal(token):
+    return _armazem.obter(token)
+
+
+def encerrar_sessao(token):
+    _armazem.encerrar(token)
+
+
+def encerrar_sessoes_funcionario(id_funcionario):
+    """Encerra todas as sessões de um funcionário (ex.: acesso revogado)."""
+    _armazem.encerrar_sessoes_funcionario(id_funcionario)
@@ -0,0 +1,87 @@
+"""
+Banco de teste pequeno e previsível, criado pelas funções do open_crud em um diretório temporário,
+com o esquema das tabelas do hospital_db.sqlite do repositório.
+
+Dois hospitais com dois postos cada; em cada posto um médico, dois pacientes e um lote de cada
+medicamento. Cada paciente tem um atendimento encerrado em cada data de DATAS_ATENDIMENTO, com uma
+prescrição distribuída por inteiro, então todos podem ser arquivados conforme a data de corte.
+"""
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+os.environ.setdefault("BCRYPT_CUSTO", "10") # Menor custo aceito pela política de senhas: testes rápidos
+
+import open_crud
+
+ESQUEMA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "hospital_db.sqlite")
+
+HOJE = "2026-10-19"
+DATAS_ATENDIMENTO = ("2024-11-05", "2025-05-12", "2026-02-20", "2026-09-30")
+SENHA = "Senha-forte-123"
+
+
+def criar_banco(caminho, hospitais=2, postos_por_hospital=2):
+    """Cria o banco em `caminho` e retorna os IDs criados ({"postos", "estoques", "pacientes", "atendimentos", ...})."""
+    origem = sqlite3.connect(f"file:{ESQUEMA}?mode=ro", uri=True)
+    conn = sqlite3.connect(caminho)
+    try:
+        for (sql,) in origem.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY rowid"):
+            conn.execute(sql)
+        conn.commit()
+    finally:
+        conn.close()
+        origem.close()
+    ids = {"hospitais": [], "postos": [], "funcionarios": [], "medicamentos": [], "estoques": [], "pacientes": [], "atendimentos": [],
+           "prescricoes": [], "distribuicoes": []}
+    with open_crud.usando_banco(caminho):
+        medicamentos = [open_crud.create_medicamento(f"Medicamento {m}", f"Princípio {m}")["id"] for m in range(2)]
+        ids["medicamentos"] = medicamentos
+        for h in range(hospitais):
+            id_hospital = open_crud.create_hospital(f"Hospital {h}")["id"]
+            ids["hospitais"].append(id_hospital)
+            for p in range(postos_por_hospital):
+                n = len(ids["postos"])
+                id_posto = open_crud.create_posto_saude(f"Posto {n}", f"Rua {n}", id_hospital)["id"]
+                ids["postos"].append(id_posto)
+                id_medico = open_crud.create_funcionario(f"Médico {n}", f"000000000{n:02d}", "Médico", f"medico{n}@teste.com", SENHA, id_posto)["id"]
+                ids["funcionarios"].append(id_medico)
+                estoques = [open_crud.create_estoque_medicamento_posto(m, id_posto, f"L{n}-{m}", "2099-12-31", 1000)["id"] for m in medicamentos]
+                ids["estoques"] += estoques
+                for k in range(2):
+                    id_paciente = open_crud.create_paciente(f"Paciente {n}-{k}", f"1000000{n:02d}{k:02d}", "1980-01-01", "Feminino", f"Rua {n}", id_posto)["id"]
+                    ids["pacientes"].append(id_paciente)
+                    for d, data in enumerate(DATAS_ATENDIMENTO):
+                        id_atendimento = open_crud.create_atendimento(
+                            id_paciente, id_medico, id_posto, "Consulta", "Febre", data_hora_inicio=f"{data} 09:00:00",
+                            data_hora_fim=f"{data} 09:30:00", diagnostico="Gripe", cid10="J11")["id"]
+                        id_prescricao = open_crud.create_prescricao(id_atendimento, estoques[d % 2], "1 ao dia", 2)["id"]
+                        id_distribuicao = open_crud.create_distribuicao_medicamento(id_prescricao, id_medico, 2)["id"]
+                        ids["atendimentos"].append(id_atendimento)
+                        ids["prescricoes"].append(id_prescricao)
+                        ids["distribuicoes"].append(id_distribuicao)
+    return ids
+
+
+class TesteComBanco(unittest.TestCase):
+    """Cria o banco de teste uma vez por classe, em um diretório temporário; cada teste usa uma cópia."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls._modelo = tempfile.mkdtemp(prefix="hospital_teste_")
+        cls.ids = criar_banco(os.path.join(cls._modelo, "modelo.sqlite"))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls._modelo, ignore_errors=True)
+
+    def setUp(self):
+        self.pasta = tempfile.mkdtemp(prefix="hospital_teste_")
+        self.addCleanup(shutil.rmtree, self.pasta, True)
+        self.banco = os.path.join(self.pasta, "hospital.sqlite")
+        shutil.copy(os.path.join(self._modelo, "modelo.sqlite"), self.banco)
+        banco_anterior = open_crud.DATABASE_NAME
+        open_crud.DATABASE_NAME = self.banco
+        self.addCleanup(setattr, open_crud, "DATABASE_NAME", banco_anterior)
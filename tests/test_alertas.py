@@ -0,0 +1,93 @@
+import datetime
+import sqlite3
+import unittest
+
+from tests.apoio import TesteComBanco
+
+import open_crud
+
+
+def _daqui_a(dias):
+    return (datetime.date.today() + datetime.timedelta(days=dias)).isoformat()
+
+
+class TesteAlertasEstoque(TesteComBanco):
+
+    def setUp(self):
+        super().setUp()
+        self.posto = self.ids["postos"][0]
+        self.medicamento = self.ids["medicamentos"][0]
+        self.assertEqual(open_crud.get_alertas_estoque()["data"], []) # Lotes do banco de teste: saldo alto, vencem em 2099
+
+    def _alertas(self, **filtros):
+        return {(alerta["id_estoque"], alerta["tipo_alerta"]) for alerta in open_crud.get_alertas_estoque(**filtros)["data"]}
+
+    def _lote(self, lote, validade, quantidade=10):
+        resultado = open_crud.create_estoque_medicamento_posto(self.medicamento, self.posto, lote, validade, quantidade)
+        self.assertTrue(resultado["success"], resultado["message"])
+        return resultado["id"]
+
+    def _sql(self, sql, params=()):
+        conn = sqlite3.connect(self.banco)
+        try:
+            conn.execute(sql, params)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def test_estoque_baixo_ao_cruzar_o_minimo(self):
+        estoque = self.ids["estoques"][0]
+        saldo = open_crud.get_estoque_medicamento_posto_by_id(estoque)["data"]["quantidade_atual"]
+        open_crud.update_estoque_medicamento_posto(estoque, quantidade_minima_alerta=saldo - 5)
+        self.assertEqual(self._alertas(), set())
+
+        open_crud.registrar_movimentacao_estoque(estoque, "ajuste", -4)
+        self.assertEqual(self._alertas(), set())
+        open_crud.registrar_movimentacao_estoque(estoque, "perda_validade", 1) # Saldo == mínimo
+        self.assertEqual(self._alertas(), {(estoque, "estoque_baixo")})
+        alerta = open_crud.get_alertas_estoque(tipo_alerta="estoque_baixo")["data"][0]
+        self.assertEqual(alerta["quantidade_atual"], saldo - 5)
+        self.assertEqual(open_crud.get_resumo_alertas()["data"], {"estoque_baixo": 1})
+
+        open_crud.registrar_movimentacao_estoque(estoque, "entrada", 1)
+        self.assertEqual(self._alertas(), set())
+
+    def test_validade_no_cadastro_do_lote(self):
+        proximo = self._lote("PROXIMO", _daqui_a(10))
+        vencido = self._lote("VENCIDO", _daqui_a(-1))
+        distante = self._lote("DISTANTE", _daqui_a(40))
+        self._lote("ZERADO", _daqui_a(10), quantidade=0) # Sem saldo: sem alerta de validade, mas com estoque baixo
+        alertas = self._alertas()
+        self.assertIn((proximo, "validade_proxima"), alertas)
+        self.assertIn((vencido, "vencido"), alertas)
+        self.assertNotIn(distante, {id_estoque for id_estoque, _ in alertas})
+        self.assertEqual(open_crud.get_resumo_alertas()["data"], {"validade_proxima": 1, "vencido": 1, "estoque_baixo": 1})
+
+        open_crud.configurar_alertas(60)
+        self.assertIn((distante, "validade_proxima"), self._alertas())
+        open_crud.registrar_movimentacao_estoque(proximo, "perda_validade", 10) # Lote zerado sai dos alertas de validade
+        self.assertNotIn((proximo, "validade_proxima"), self._alertas())
+
+    def test_varredura_cobre_a_passagem_do_tempo(self):
+        proximo = self._lote("PROXIMO", _daqui_a(10))
+        vencido = self._lote("VENCIDO", _daqui_a(-1))
+        # Como se o primeiro lote tivesse entrado na janela e o segundo vencido desde a última alteração
+        self._sql("DELETE FROM AlertaEstoque WHERE id_estoque = ?", (proximo,))
+        self._sql("UPDATE AlertaEstoque SET tipo_alerta = 'validade_proxima' WHERE id_estoque = ?", (vencido,))
+        self.assertEqual(self._alertas(), {(vencido, "validade_proxima")})
+
+        self.assertTrue(open_crud.varrer_alertas_validade()["success"])
+        self.assertEqual(self._alertas(), {(proximo, "validade_proxima"), (vencido, "vencido")})
+        self.assertTrue(open_crud.varrer_alertas_validade()["success"])
+        self.assertEqual(len(open_crud.get_alertas_estoque()["data"]), 2)
+
+    def test_filtros(self):
+        self._lote("PROXIMO", _daqui_a(10))
+        outro_posto = open_crud.create_estoque_medicamento_posto(self.medicamento, self.ids["postos"][1], "OUTRO", _daqui_a(5), 10)["id"]
+        self.assertEqual(self._alertas(id_posto=self.ids["postos"][1]), {(outro_posto, "validade_proxima")})
+        self.assertEqual(self._alertas(tipo_alerta="vencido"), set())
+        self.assertEqual(self._alertas(id_medicamento=self.ids["medicamentos"][1]), set())
+
+
+if __name__ == "__main__":
+    unittest.main()
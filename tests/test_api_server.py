@@ -0,0 +1,72 @@
+import json
+import unittest
+
+from tornado.testing import AsyncHTTPTestCase
+
+from tests.apoio import SENHA, TesteComBanco
+
+import api_server
+import open_crud
+
+
+class TesteEscritasNoEscopo(TesteComBanco, AsyncHTTPTestCase):
+    """Médico do posto 0 enxerga os postos do seu hospital (0 e 1); os postos 2 e 3 são do outro hospital."""
+
+    def setUp(self):
+        TesteComBanco.setUp(self)
+        AsyncHTTPTestCase.setUp(self)
+        self.token = self._login("medico0@teste.com")
+
+    def get_app(self):
+        return api_server.make_app()
+
+    def _login(self, email):
+        resposta = self.fetch("/api/sessao", method="POST", body=json.dumps({"email": email, "senha": SENHA}))
+        self.assertEqual(resposta.code, 201, resposta.body)
+        return json.loads(resposta.body)["token"]
+
+    def _pedir(self, metodo, caminho, corpo=None, token=None):
+        return self.fetch(caminho, method=metodo, body=None if corpo is None else json.dumps(corpo),
+                          headers={"Authorization": f"Bearer {token or self.token}"}, allow_nonstandard_methods=True)
+
+    def _paciente(self, indice_posto):
+        return self.ids["pacientes"][2 * indice_posto]
+
+    def test_atualizar_registro_de_outro_posto(self):
+        self.assertEqual(self._pedir("PUT", f"/api/pacientes/{self._paciente(2)}", {"telefone": "1"}).code, 403)
+        self.assertEqual(self._pedir("PUT", f"/api/pacientes/{self._paciente(1)}", {"telefone": "1"}).code, 200)
+        self.assertEqual(self._pedir("PUT", "/api/pacientes/999999", {"telefone": "1"}).code, 404)
+
+    def test_mover_registro_para_outro_posto(self):
+        resposta = self._pedir("PUT", f"/api/pacientes/{self._paciente(0)}", {"id_posto_referencia": self.ids["postos"][2]})
+        self.assertEqual(resposta.code, 403)
+        self.assertEqual(open_crud.get_paciente_by_id(self._paciente(0))["data"]["id_posto_referencia"], self.ids["postos"][0])
+
+    def test_excluir_registro_de_outro_posto(self):
+        self.assertEqual(self._pedir("DELETE", f"/api/atendimentos/{self.ids['atendimentos'][-1]}").code, 403)
+        self.assertTrue(open_crud.get_atendimento_by_id(self.ids["atendimentos"][-1])["success"])
+
+    def test_cadastro_com_referencias_de_outro_posto(self):
+        paciente = {"nome": "Novo", "cpf": "55555555555", "data_nascimento": "1990-01-01", "genero": "Feminino", "endereco": "Rua"}
+        self.assertEqual(self._pedir("POST", "/api/pacientes", dict(paciente, id_posto_referencia=self.ids["postos"][2])).code, 403)
+        self.assertEqual(self._pedir("POST", "/api/pacientes", dict(paciente, id_posto_referencia=self.ids["postos"][0])).code, 201)
+        atendimento = {"id_paciente": self._paciente(2), "id_funcionario_responsavel": self.ids["funcionarios"][0],
+                       "id_posto_atendimento": self.ids["postos"][0], "tipo_atendimento": "Consulta", "descricao_sintomas_queixa": "Dor"}
+        self.assertEqual(self._pedir("POST", "/api/atendimentos", atendimento).code, 403)
+        movimentacao = {"estoque_id": self.ids["estoques"][-1], "tipo_movimentacao": "ajuste", "quantidade": -1}
+        self.assertEqual(self._pedir("POST", "/api/movimentacoes", movimentacao).code, 403)
+
+    def test_cadastros_globais_so_para_administrativo(self):
+        self.assertEqual(self._pedir("POST", "/api/hospitais", {"nome": "Hospital Novo"}).code, 403)
+        self.assertEqual(self._pedir("PUT", f"/api/medicamentos/{self.ids['medicamentos'][0]}", {"fabricante": "X"}).code, 403)
+        self.assertEqual(self._pedir("DELETE", f"/api/postos/{self.ids['postos'][0]}").code, 403)
+
+        resultado = open_crud.create_funcionario("Admin", "99999999999", "Administrativo", "admin@teste.com", SENHA, self.ids["postos"][0])
+        self.assertTrue(resultado["success"], resultado["message"])
+        admin = self._login("admin@teste.com")
+        self.assertEqual(self._pedir("POST", "/api/hospitais", {"nome": "Hospital Novo"}, token=admin).code, 201)
+        self.assertEqual(self._pedir("PUT", f"/api/pacientes/{self._paciente(3)}", {"telefone": "1"}, token=admin).code, 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
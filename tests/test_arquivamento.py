@@ -0,0 +1,63 @@
+import os
+import unittest
+from datetime import date
+
+from tests.apoio import DATAS_ATENDIMENTO, TesteComBanco
+
+import arquivamento
+import open_crud
+
+
+class TesteArquivamento(TesteComBanco):
+
+    def _arquivar(self, hoje=date(2026, 10, 19), meses=6):
+        resultado = arquivamento.arquivar(meses, tamanho_lote=5, hoje=hoje)
+        self.assertTrue(resultado["success"], resultado["message"])
+        return resultado
+
+    def test_move_os_atendimentos_anteriores_ao_corte(self):
+        resultado = self._arquivar()
+        self.assertEqual({ano: totais["atendimentos"] for ano, totais in resultado["data"].items()}, {2024: 8, 2025: 8, 2026: 8})
+        self.assertEqual([arquivo["ano"] for arquivo in arquivamento.get_arquivos()["data"]], [2024, 2025, 2026])
+        for ano in (2024, 2025, 2026):
+            self.assertTrue(os.path.exists(os.path.join(self.pasta, "hospital_arquivo", f"arquivo_{ano}.sqlite")))
+        # Só o período em uso fica nas tabelas quentes; as listagens que pedem o passado alcançam o arquivo
+        self.assertEqual(len(open_crud.get_all_atendimentos()["data"]), 8)
+        self.assertEqual(len(open_crud.get_all_atendimentos(start_date=DATAS_ATENDIMENTO[0])["data"]), 32)
+
+    def test_leituras_do_passado_iguais_antes_e_depois(self):
+        paciente = self.ids["pacientes"][0]
+        antes = {
+            "prontuario": open_crud.get_patient_timeline(paciente)["data"],
+            "por_tipo": open_crud.get_atendimentos_by_type(start_date="2024-01-01")["data"],
+            "atendimento": open_crud.get_atendimento_by_id(self.ids["atendimentos"][0])["data"],
+        }
+        self._arquivar()
+        self.assertEqual(open_crud.get_patient_timeline(paciente)["data"], antes["prontuario"])
+        self.assertEqual(open_crud.get_atendimentos_by_type(start_date="2024-01-01")["data"], antes["por_tipo"])
+        self.assertEqual(open_crud.get_atendimento_by_id(self.ids["atendimentos"][0])["data"], antes["atendimento"])
+
+    def test_arquivar_de_novo_nao_duplica(self):
+        self._arquivar()
+        self.assertEqual(self._arquivar()["data"], {})
+        self.assertEqual(len(open_crud.get_all_atendimentos(start_date=DATAS_ATENDIMENTO[0])["data"]), 32)
+
+    def test_exclusao_considera_o_arquivo(self):
+        self._arquivar(hoje=date(2027, 6, 1)) # Todos os atendimentos arquivados
+        self.assertEqual(open_crud.get_all_atendimentos()["data"], [])
+        resultado = open_crud.delete_paciente(self.ids["pacientes"][0])
+        self.assertFalse(resultado["success"])
+        self.assertIsNotNone(open_crud.get_paciente_by_id(self.ids["pacientes"][0])["data"])
+
+    def test_atendimento_aberto_fica_nas_tabelas_quentes(self):
+        resultado = open_crud.create_atendimento(self.ids["pacientes"][0], self.ids["funcionarios"][0], self.ids["postos"][0],
+                                                 "Consulta", "Dor", data_hora_inicio="2025-01-10 08:00:00")
+        self.assertTrue(resultado["success"], resultado["message"])
+        self._arquivar()
+        aberto = open_crud.get_all_atendimentos(start_date="2025-01-10", end_date="2025-01-10")["data"]
+        self.assertEqual([linha["id_atendimento"] for linha in aberto], [resultado["id"]])
+        self.assertIn(resultado["id"], [linha["id_atendimento"] for linha in open_crud.get_all_atendimentos()["data"]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+import asyncio
+import time
+import unittest
+
+from tests.apoio import TesteComBanco
+
+import open_crud
+from async_crud import AsyncCrud
+
+
+class TesteAsyncCrud(TesteComBanco):
+
+    def test_chamadas_concorrentes_com_escopo(self):
+        async def consultar():
+            async with AsyncCrud(max_workers=2) as crud:
+                with open_crud.escopo_acesso([self.ids["postos"][0]]):
+                    return await asyncio.gather(crud.get_all_pacientes(), crud.get_all_estoque_medicamento_posto())
+
+        pacientes, estoque = asyncio.run(consultar())
+        self.assertEqual({linha["id_posto_referencia"] for linha in pacientes["data"]}, {self.ids["postos"][0]})
+        self.assertEqual({linha["id_posto"] for linha in estoque["data"]}, {self.ids["postos"][0]})
+
+    def test_saida_do_contexto_nao_trava_o_loop(self):
+        async def executar():
+            crud = AsyncCrud(max_workers=1)
+            crud._funcoes["consulta_lenta"] = lambda: time.sleep(0.3) or {"success": True}
+            batidas = []
+
+            async def relogio():
+                while True:
+                    batidas.append(time.perf_counter())
+                    await asyncio.sleep(0.01)
+
+            async with crud:
+                lenta = asyncio.ensure_future(crud.chamar("consulta_lenta"))
+                await asyncio.sleep(0.05) # A consulta já começou na thread do pool
+                tarefa = asyncio.ensure_future(relogio())
+            tarefa.cancel()
+            self.assertTrue((await lenta)["success"]) # A chamada em execução termina
+            return batidas
+
+        batidas = asyncio.run(executar())
+        self.assertGreater(len(batidas), 10) # O loop seguiu atendendo enquanto o pool era encerrado
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import asyncio
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from tests.apoio import SENHA, TesteComBanco
+
+import autenticacao
+import open_crud
+
+
+class TesteAutenticacao(TesteComBanco):
+
+    def setUp(self):
+        super().setUp()
+        self.servico = autenticacao.ServicoAutenticacao(workers=1)
+        self.addCleanup(self.servico.close)
+        servico = mock.patch.object(autenticacao, "_servico", self.servico)
+        servico.start()
+        self.addCleanup(servico.stop)
+
+    def test_login_valido_ignora_maiusculas(self):
+        resultado = self.servico.autenticar(" Medico0@Teste.com ", SENHA, ip="10.0.0.1")
+        self.assertTrue(resultado["success"], resultado.get("message"))
+        self.assertNotIn("senha_hash", resultado["data"])
+
+    def test_falhas_de_credencial_tem_a_mesma_resposta(self):
+        senha_errada = self.servico.autenticar("medico0@teste.com", "errada", ip="10.0.0.1")
+        desconhecido = self.servico.autenticar("ninguem@teste.com", SENHA, ip="10.0.0.1")
+        self.assertEqual(senha_errada["message"], desconhecido["message"])
+        self.assertNotIn("motivo", desconhecido)
+        self.assertTrue(self.servico.emails_desconhecidos.contem("ninguem@teste.com"))
+
+    def test_recusas_baratas_nao_esperam_na_thread(self):
+        inicio = time.perf_counter()
+        self.servico.emails_desconhecidos.adicionar("ninguem@teste.com")
+        resultado = self.servico.autenticar("NINGUEM@teste.com", SENHA)
+        self.assertLess(time.perf_counter() - inicio, self.servico._tempo_bcrypt)
+        self.assertGreater(resultado["espera"], 0) # Completada por quem responde
+
+        for _ in range(autenticacao.CAPACIDADE_CONTA):
+            self.servico.autenticar("medico1@teste.com", "errada")
+        limitado = self.servico.autenticar("medico1@teste.com", SENHA)
+        self.assertEqual(limitado["motivo"], "limite")
+        self.assertNotIn("espera", limitado)
+
+    def test_cadastro_tira_o_email_do_cache_negativo(self):
+        self.assertFalse(self.servico.autenticar("novo@teste.com", SENHA)["success"])
+        self.assertTrue(self.servico.emails_desconhecidos.contem("novo@teste.com"))
+        resultado = open_crud.create_funcionario("Novo", "77777777777", "Enfermeiro", "Novo@teste.com", SENHA, self.ids["postos"][0])
+        self.assertTrue(resultado["success"], resultado["message"])
+        self.assertTrue(self.servico.autenticar("novo@teste.com", SENHA)["success"])
+
+    def test_espera_assincrona_nao_ocupa_o_executor(self):
+        self.servico.emails_desconhecidos.adicionar("ninguem@teste.com")
+        executor = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(executor.shutdown)
+
+        async def rajada():
+            return await asyncio.gather(*(autenticacao.autenticar_async("ninguem@teste.com", SENHA, executor=executor) for _ in range(5)))
+
+        inicio = time.perf_counter()
+        resultados = asyncio.run(rajada())
+        segundos = time.perf_counter() - inicio
+        self.assertTrue(all(not r["success"] and "espera" not in r for r in resultados))
+        self.assertGreaterEqual(segundos, self.servico._tempo_bcrypt * 0.9)
+        self.assertLess(segundos, self.servico._tempo_bcrypt * 3) # As 5 esperas correm juntas, não uma por thread
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import os
+import sqlite3
+import unittest
+from unittest import mock
+
+from tests.apoio import TesteComBanco
+
+import backup
+import fragmentacao
+
+
+def _nomes_pacientes(caminho):
+    conn = sqlite3.connect(caminho)
+    try:
+        return [nome for (nome,) in conn.execute("SELECT nome_paciente FROM Paciente ORDER BY id_paciente")]
+    finally:
+        conn.close()
+
+
+def _renomear_pacientes(caminho, nome):
+    conn = sqlite3.connect(caminho)
+    try:
+        conn.execute("UPDATE Paciente SET nome_paciente = ?", (nome,))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _temporarios(pasta):
+    return [nome for _, _, arquivos in os.walk(pasta) for nome in arquivos if nome.endswith(backup.SUFIXO_RESTAURACAO)]
+
+
+class TesteBackup(TesteComBanco):
+
+    def test_restaurar_volta_ao_conteudo_do_backup(self):
+        originais = _nomes_pacientes(self.banco)
+        criado = backup.criar_backup()
+        self.assertTrue(criado["success"], criado["message"])
+        _renomear_pacientes(self.banco, "Alterado")
+
+        resultado = backup.restaurar(criado["data"]["nome"])
+        self.assertTrue(resultado["success"], resultado["message"])
+        self.assertEqual(_nomes_pacientes(self.banco), originais)
+        self.assertEqual(_temporarios(self.pasta), [])
+
+        # O estado de antes da restauração fica salvo em outro backup
+        resultado = backup.restaurar(resultado["data"]["anterior"], salvar_atual=False)
+        self.assertTrue(resultado["success"], resultado["message"])
+        self.assertEqual(set(_nomes_pacientes(self.banco)), {"Alterado"})
+
+    def test_restaurar_backup_inexistente(self):
+        resultado = backup.restaurar("backup_19990101_000000")
+        self.assertFalse(resultado["success"])
+        self.assertEqual(backup.listar_backups()["data"], [])
+
+
+class TesteBackupFragmentado(TesteComBanco):
+
+    def setUp(self):
+        super().setUp()
+        self.fragmentos = os.path.join(self.pasta, "fragmentos")
+        resultado = fragmentacao.fragmentar(self.banco, self.fragmentos)
+        self.assertTrue(resultado["success"], resultado["message"])
+        self.bancos = fragmentacao.bancos_do_conjunto(self.fragmentos)[1:]
+        self.originais = {banco: _nomes_pacientes(banco) for banco in self.bancos}
+        criado = backup.criar_backups(self.fragmentos)
+        self.assertTrue(criado["success"], criado["message"])
+        self.nome = criado["data"][0]["nome"]
+        for banco in self.bancos:
+            _renomear_pacientes(banco, "Alterado")
+
+    def _conferir_alterados(self):
+        for banco in self.bancos:
+            self.assertEqual(set(_nomes_pacientes(banco)), {"Alterado"}, banco)
+        self.assertEqual(_temporarios(self.fragmentos), [])
+
+    def test_restaurar_todos_os_bancos(self):
+        resultado = backup.restaurar_backups(self.nome, self.fragmentos)
+        self.assertTrue(resultado["success"], resultado["message"])
+        self.assertEqual(len(resultado["data"]), len(self.bancos) + 1)
+        for banco in self.bancos:
+            self.assertEqual(_nomes_pacientes(banco), self.originais[banco], banco)
+        self.assertEqual(_temporarios(self.fragmentos), [])
+
+    def test_backup_ausente_em_um_fragmento_nao_restaura_nenhum(self):
+        ultimo = self.bancos[-1]
+        pasta = os.path.join(backup.diretorio_backups(ultimo), self.nome)
+        os.remove(os.path.join(pasta, "backup.json"))
+
+        resultado = backup.restaurar_backups(self.nome, self.fragmentos)
+        self.assertFalse(resultado["success"])
+        self.assertIn(os.path.basename(ultimo), resultado["message"])
+        self._conferir_alterados()
+
+    def test_falha_na_troca_desfaz_os_bancos_ja_trocados(self):
+        ultimo = self.bancos[-1]
+        copiar = backup._copiar
+
+        def copiar_com_falha(origem, destino, *args):
+            if destino == ultimo and origem.endswith(backup.SUFIXO_RESTAURACAO):
+                raise OSError("disco cheio")
+            return copiar(origem, destino, *args)
+
+        with mock.patch.object(backup, "_copiar", copiar_com_falha):
+            resultado = backup.restaurar_backups(self.nome, self.fragmentos)
+        self.assertFalse(resultado["success"])
+        self.assertIn("disco cheio", resultado["message"])
+        self.assertIn("voltaram ao estado anterior", resultado["message"])
+        self._conferir_alterados()
+
+
+if __name__ == "__main__":
+    unittest.main()
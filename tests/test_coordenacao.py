@@ -0,0 +1,112 @@
+import sqlite3
+import unittest
+from unittest import mock
+
+from tests.apoio import TesteComBanco
+
+import coordenacao
+import open_crud
+import sessoes
+
+
+class TesteMonitorVersoes(TesteComBanco):
+
+    def setUp(self):
+        super().setUp()
+        self.chamadas = []
+        self.monitor = coordenacao.MonitorVersoes()
+        self.monitor.observar(coordenacao.TABELAS_SESSOES, lambda: self.chamadas.append("sessoes"))
+        self.assertEqual(self.monitor.verificar(), []) # Versões de referência
+
+    def _escrever_em_outro_processo(self, sql, params=()):
+        # Conexão fora do open_crud: nenhum aviso em memória, só os triggers da VersaoTabela
+        conn = sqlite3.connect(self.banco)
+        try:
+            conn.execute(sql, params)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def test_escrita_externa_chama_o_observador(self):
+        self._escrever_em_outro_processo("UPDATE Funcionario SET nome_funcionario = 'Outro' WHERE id_funcionario = ?",
+                                         (self.ids["funcionarios"][0],))
+        self.assertEqual(self.monitor.verificar(), ["Funcionario"])
+        self.assertEqual(self.chamadas, ["sessoes"])
+        self.assertEqual(self.monitor.verificar(), [])
+        self.assertEqual(self.chamadas, ["sessoes"])
+
+    def test_escrita_externa_renova_as_sessoes(self):
+        token = sessoes.criar_sessao(self.ids["funcionarios"][0])
+        self.addCleanup(sessoes.encerrar_sessao, token)
+        self.assertEqual(sessoes.obter_principal(token).cargo, "Médico")
+        self.monitor.observar(coordenacao.TABELAS_SESSOES, open_crud.notificar_funcionario)
+        self.monitor.verificar()
+        self._escrever_em_outro_processo("UPDATE Funcionario SET cargo_funcionario = 'Administrativo' WHERE id_funcionario = ?",
+                                         (self.ids["funcionarios"][0],))
+        self.monitor.verificar()
+        principal = sessoes.obter_principal(token)
+        self.assertEqual(principal.cargo, "Administrativo")
+        self.assertIsNone(principal.postos_visiveis)
+
+    def test_tabela_nao_observada_nao_chama(self):
+        self._escrever_em_outro_processo("UPDATE Paciente SET nome_paciente = 'Outro'")
+        self.assertEqual(self.monitor.verificar(), [])
+        self.assertEqual(self.chamadas, [])
+
+    def test_um_aviso_por_verificacao(self):
+        self._escrever_em_outro_processo("UPDATE Funcionario SET nome_funcionario = 'Outro'")
+        self._escrever_em_outro_processo("UPDATE Hospital SET nome_hospital = 'Outro'")
+        self.assertEqual(sorted(self.monitor.verificar()), ["Funcionario", "Hospital"])
+        self.assertEqual(self.chamadas, ["sessoes"])
+
+
+class TesteRepetirSeOcupado(TesteComBanco):
+
+    def setUp(self):
+        super().setUp()
+        self.trava = sqlite3.connect(self.banco)
+        self.addCleanup(self.trava.close)
+        self.trava.execute("BEGIN EXCLUSIVE")
+        self.tentativas = 0
+        espera = mock.patch.object(open_crud, "ESPERA_BANCO_OCUPADO", 0.001) # Sem as esperas reais entre tentativas
+        espera.start()
+        self.addCleanup(espera.stop)
+
+    def _escrita(self, liberar_na=None, sql="UPDATE Paciente SET nome_paciente = 'Outro'"):
+        @open_crud.repetir_se_ocupado
+        def escrita():
+            self.tentativas += 1
+            if self.tentativas == liberar_na:
+                self.trava.rollback()
+            conn = sqlite3.connect(self.banco, factory=open_crud._Conexao, timeout=0)
+            try:
+                conn.execute(sql)
+                conn.commit()
+                return {"success": True}
+            except sqlite3.Error as e:
+                return {"success": False, "message": str(e)}
+            finally:
+                conn.close()
+        return escrita
+
+    def test_repete_enquanto_o_banco_estiver_ocupado(self):
+        resultado = self._escrita(liberar_na=3)()
+        self.assertTrue(resultado["success"], resultado.get("message"))
+        self.assertEqual(self.tentativas, 3)
+
+    def test_desiste_depois_das_tentativas(self):
+        resultado = self._escrita()()
+        self.assertFalse(resultado["success"])
+        self.assertIn("locked", resultado["message"])
+        self.assertEqual(self.tentativas, open_crud.TENTATIVAS_BANCO_OCUPADO)
+
+    def test_outros_erros_nao_sao_repetidos(self):
+        self.trava.rollback()
+        resultado = self._escrita(sql="UPDATE TabelaInexistente SET coluna = 1")()
+        self.assertFalse(resultado["success"])
+        self.assertIn("no such table", resultado["message"])
+        self.assertEqual(self.tentativas, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+import datetime
+import unittest
+
+from tests.apoio import SENHA, TesteComBanco
+
+import open_crud
+import sessoes
+
+
+class TesteEscopoAcesso(TesteComBanco):
+    """Enfermeiro lotado no posto 0: escopo de posto, sem acesso aos demais."""
+
+    def setUp(self):
+        super().setUp()
+        self.posto = self.ids["postos"][0]
+        resultado = open_crud.create_funcionario("Enfermeiro", "88888888888", "Enfermeiro", "enfermeiro@teste.com", SENHA, self.posto)
+        self.assertTrue(resultado["success"], resultado["message"])
+        self.principal = sessoes.carregar_principal(resultado["id"])
+
+    def test_principal_ve_so_o_posto_de_lotacao(self):
+        self.assertEqual(self.principal.postos_visiveis, (self.posto,))
+        medico = sessoes.carregar_principal(self.ids["funcionarios"][0])
+        self.assertEqual(medico.postos_visiveis, tuple(self.ids["postos"][:2])) # Médico: postos do hospital
+
+    def test_listagens_e_relatorios(self):
+        hoje = datetime.date.today().isoformat() # O livro de estoque do banco de teste é de hoje
+        with self.principal.escopo():
+            pacientes = open_crud.get_all_pacientes()["data"]
+            estoque = open_crud.get_all_estoque_medicamento_posto()["data"]
+            por_posto = open_crud.get_atendimentos_by_posto(start_date="2024-01-01")["data"]
+            na_data = open_crud.get_estoque_na_data(hoje)["data"]
+        self.assertEqual({linha["id_posto_referencia"] for linha in pacientes}, {self.posto})
+        self.assertEqual({linha["id_posto"] for linha in estoque}, {self.posto})
+        self.assertEqual(len(por_posto), 1)
+        self.assertEqual({linha["id_posto"] for linha in na_data}, {self.posto})
+        self.assertEqual(len(open_crud.get_estoque_na_data(hoje)["data"]), len(self.ids["estoques"]))
+
+    def test_buscas_por_id_e_prontuario(self):
+        de_fora = self.ids["pacientes"][-1]
+        with self.principal.escopo():
+            self.assertTrue(open_crud.get_paciente_by_id(self.ids["pacientes"][0])["success"])
+            self.assertFalse(open_crud.get_paciente_by_id(de_fora)["success"])
+            self.assertFalse(open_crud.get_atendimento_by_id(self.ids["atendimentos"][-1])["success"])
+            self.assertFalse(open_crud.get_estoque_medicamento_posto_by_id(self.ids["estoques"][-1])["success"])
+            self.assertEqual(open_crud.get_patient_timeline(de_fora)["data"], [])
+
+    def test_alocacao_fefo_em_outro_posto(self):
+        with self.principal.escopo():
+            self.assertFalse(open_crud.alocar_lotes_fefo(self.ids["medicamentos"][0], self.ids["postos"][-1], 1)["success"])
+            self.assertTrue(open_crud.alocar_lotes_fefo(self.ids["medicamentos"][0], self.posto, 1)["success"])
+
+
+if __name__ == "__main__":
+    unittest.main()
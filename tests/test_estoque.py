@@ -0,0 +1,95 @@
+import datetime
+import sqlite3
+import threading
+import unittest
+
+from tests.apoio import TesteComBanco
+
+import open_crud
+
+
+class TesteLivroEstoque(TesteComBanco):
+
+    def _saldo_e_livro(self, estoque_id):
+        conn = sqlite3.connect(self.banco)
+        try:
+            saldo = conn.execute("SELECT quantidade_atual FROM EstoqueMedicamentoPosto WHERE id_estoque = ?", (estoque_id,)).fetchone()[0]
+            livro = conn.execute("SELECT COALESCE(SUM(quantidade), 0) FROM MovimentacaoEstoque WHERE id_estoque = ?", (estoque_id,)).fetchone()[0]
+        finally:
+            conn.close()
+        return saldo, livro
+
+    def _saldos_atuais(self):
+        return {linha["id_estoque"]: linha["quantidade_atual"] for linha in open_crud.get_all_estoque_medicamento_posto()["data"]}
+
+    def _saldos_na_data(self, data):
+        resultado = open_crud.get_estoque_na_data(data, por_lote=True)
+        self.assertTrue(resultado["success"], resultado.get("message"))
+        return {linha["id_estoque"]: linha["quantidade"] for linha in resultado["data"]}
+
+    def _movimentar(self):
+        estoque = self.ids["estoques"][0]
+        self.assertTrue(open_crud.registrar_movimentacao_estoque(estoque, "entrada", 50)["success"])
+        self.assertTrue(open_crud.registrar_movimentacao_estoque(estoque, "ajuste", -7)["success"])
+        self.assertTrue(open_crud.registrar_movimentacao_estoque(estoque, "perda_validade", 3)["success"])
+        self.assertTrue(open_crud.update_estoque_medicamento_posto(self.ids["estoques"][1], quantidade_atual=10)["success"])
+
+    def test_livro_reproduz_o_saldo(self):
+        self._movimentar()
+        negativo = open_crud.registrar_movimentacao_estoque(self.ids["estoques"][1], "perda_validade", 11)
+        self.assertFalse(negativo["success"])
+        for estoque in self.ids["estoques"]: # Inclui as saídas por distribuição do banco de teste
+            saldo, livro = self._saldo_e_livro(estoque)
+            self.assertEqual(livro, saldo, estoque)
+        self.assertEqual(self._saldo_e_livro(self.ids["estoques"][0])[0], 1000 - 2 * 4 + 50 - 7 - 3)
+        self.assertEqual(self._saldo_e_livro(self.ids["estoques"][1])[0], 10)
+
+    def test_snapshot_preserva_os_saldos(self):
+        hoje = datetime.date.today().isoformat()
+        self._movimentar()
+        self.assertIn("id", open_crud.compactar_estoque())
+        self.assertNotIn("id", open_crud.compactar_estoque()) # Nada novo desde o snapshot
+        self.assertEqual(self._saldos_na_data(hoje), self._saldos_atuais())
+        self.assertTrue(open_crud.registrar_movimentacao_estoque(self.ids["estoques"][2], "entrada", 5)["success"])
+        self.assertEqual(self._saldos_na_data(hoje), self._saldos_atuais()) # Snapshot + cauda do livro
+
+    def test_saldo_em_data_passada(self):
+        antes = self._saldos_atuais()
+        conn = sqlite3.connect(self.banco)
+        try: # Histórico do banco de teste passa a ser de janeiro
+            conn.execute("UPDATE MovimentacaoEstoque SET data_hora_movimentacao = '2026-01-10 08:00:00'")
+            conn.execute("UPDATE SnapshotEstoque SET data_hora_snapshot = '2026-01-01 00:00:00'")
+            conn.commit()
+        finally:
+            conn.close()
+        self._movimentar()
+        self.assertIn("id", open_crud.compactar_estoque())
+        self.assertEqual(self._saldos_na_data("2026-01-31"), antes)
+        self.assertEqual(self._saldos_na_data(datetime.date.today().isoformat()), self._saldos_atuais())
+        self.assertFalse(open_crud.get_estoque_na_data("2025-12-31")["success"]) # Antes do primeiro snapshot
+
+    def test_edicoes_concorrentes_registram_o_ajuste_real(self):
+        estoque = self.ids["estoques"][0]
+        falhas = []
+
+        def escrever(indice):
+            for k in range(20):
+                if k % 2:
+                    resultado = open_crud.update_estoque_medicamento_posto(estoque, quantidade_atual=500 + 10 * indice + k)
+                else:
+                    resultado = open_crud.registrar_movimentacao_estoque(estoque, "entrada", 3)
+                if not resultado["success"]:
+                    falhas.append(resultado["message"])
+
+        threads = [threading.Thread(target=escrever, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(falhas, [])
+        saldo, livro = self._saldo_e_livro(estoque)
+        self.assertEqual(livro, saldo)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+
+from tests.apoio import TesteComBanco
+
+import open_crud
+
+
+class TesteAlocacaoFefo(TesteComBanco):
+    """Posto 0, medicamento 0: o lote do banco de teste vence em 2099; aqui entram um vencido e dois que vencem antes."""
+
+    def setUp(self):
+        super().setUp()
+        self.posto = self.ids["postos"][0]
+        self.medicamento = self.ids["medicamentos"][0]
+        self.principal = self.ids["estoques"][0]
+        self.vencido = self._lote("VENCIDO", "2020-01-01", 100)
+        self.segundo = self._lote("B", "2030-01-01", 5)
+        self.primeiro = self._lote("A", "2028-06-30", 4)
+
+    def _lote(self, lote, validade, quantidade):
+        resultado = open_crud.create_estoque_medicamento_posto(self.medicamento, self.posto, lote, validade, quantidade)
+        self.assertTrue(resultado["success"], resultado["message"])
+        return resultado["id"]
+
+    def _quantidade(self, estoque_id):
+        return open_crud.get_estoque_medicamento_posto_by_id(estoque_id)["data"]["quantidade_atual"]
+
+    def test_validade_mais_proxima_primeiro(self):
+        resultado = open_crud.alocar_lotes_fefo(self.medicamento, self.posto, 12)
+        self.assertTrue(resultado["success"], resultado.get("message"))
+        self.assertEqual([(item["id_estoque"], item["quantidade"]) for item in resultado["data"]],
+                         [(self.primeiro, 4), (self.segundo, 5), (self.principal, 3)])
+        self.assertEqual(self._quantidade(self.primeiro), 4) # Só simula
+
+    def test_estoque_insuficiente(self):
+        disponivel = self._quantidade(self.principal) + 4 + 5 # O lote vencido não conta
+        resultado = open_crud.alocar_lotes_fefo(self.medicamento, self.posto, disponivel + 1)
+        self.assertFalse(resultado["success"])
+        self.assertEqual(resultado["disponivel"], disponivel)
+        self.assertTrue(open_crud.alocar_lotes_fefo(self.medicamento, self.posto, disponivel)["success"])
+
+    def test_distribuicao_baixa_e_registra_os_lotes(self):
+        atendimento = open_crud.create_atendimento(self.ids["pacientes"][0], self.ids["funcionarios"][0], self.posto, "Consulta", "Dor")["id"]
+        prescricao = open_crud.create_prescricao(atendimento, self.principal, "1 ao dia", 6)["id"] # Prescrito pelo lote de 2099
+        resultado = open_crud.create_distribuicao_medicamento(prescricao, self.ids["funcionarios"][0], 6)
+        self.assertTrue(resultado["success"], resultado["message"])
+        self.assertEqual([item["id_estoque"] for item in resultado["lotes"]], [self.primeiro, self.segundo])
+        self.assertEqual((self._quantidade(self.primeiro), self._quantidade(self.segundo)), (0, 3))
+        self.assertEqual(self._quantidade(self.vencido), 100)
+        self.assertEqual(set(open_crud.get_distribuicao_medicamento_by_id(resultado["id"])["data"]["lote"].split(", ")), {"A", "B"})
+
+        movimentacoes = open_crud.get_movimentacoes_estoque(tipo_movimentacao="saida_distribuicao", id_posto=self.posto)["data"]
+        self.assertEqual(sorted((m["id_estoque"], m["quantidade"]) for m in movimentacoes if m["id_distribuicao"] == resultado["id"]),
+                         sorted([(self.primeiro, -4), (self.segundo, -2)]))
+
+    def test_distribuicao_sem_fefo_usa_o_lote_prescrito(self):
+        atendimento = open_crud.create_atendimento(self.ids["pacientes"][0], self.ids["funcionarios"][0], self.posto, "Consulta", "Dor")["id"]
+        prescricao = open_crud.create_prescricao(atendimento, self.principal, "1 ao dia", 6)["id"]
+        resultado = open_crud.create_distribuicao_medicamento(prescricao, self.ids["funcionarios"][0], 6, fefo=False)
+        self.assertEqual([item["id_estoque"] for item in resultado["lotes"]], [self.principal])
+        self.assertEqual(self._quantidade(self.primeiro), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import os
+import sqlite3
+import unittest
+
+from tests.apoio import TesteComBanco
+
+import fragmentacao
+import open_crud
+
+
+class TesteFragmentacao(TesteComBanco):
+
+    def setUp(self):
+        super().setUp()
+        self.unico = {
+            "atendimentos": open_crud.get_all_atendimentos()["data"],
+            "por_tipo": open_crud.get_atendimentos_by_type(start_date="2024-01-01")["data"],
+            "prontuario": open_crud.get_patient_timeline(self.ids["pacientes"][-1])["data"],
+        }
+        self.diretorio = os.path.join(self.pasta, "fragmentos")
+        resultado = fragmentacao.fragmentar(self.banco, self.diretorio)
+        self.assertTrue(resultado["success"], resultado["message"])
+        self.assertEqual(resultado["data"]["fragmentos"], len(self.ids["hospitais"]))
+        fragmentacao.ativar(self.diretorio)
+        self.addCleanup(fragmentacao.desativar)
+
+    def test_leituras_iguais_as_do_banco_unico(self):
+        ids = lambda linhas: sorted(linha["id_atendimento"] for linha in linhas)
+        self.assertEqual(ids(open_crud.get_all_atendimentos()["data"]), ids(self.unico["atendimentos"]))
+        self.assertEqual(open_crud.get_atendimentos_by_type(start_date="2024-01-01")["data"], self.unico["por_tipo"])
+        self.assertEqual(open_crud.get_patient_timeline(self.ids["pacientes"][-1])["data"], self.unico["prontuario"])
+        atendimento = open_crud.get_atendimento_by_id(self.ids["atendimentos"][-1])
+        self.assertTrue(atendimento["success"], atendimento.get("message"))
+        self.assertEqual(atendimento["data"]["id_posto_atendimento"], self.ids["postos"][-1])
+
+    def test_cadastro_vai_para_o_fragmento_do_posto(self):
+        resultado = open_crud.create_atendimento(self.ids["pacientes"][-1], self.ids["funcionarios"][-1], self.ids["postos"][-1], "Consulta", "Tosse")
+        self.assertTrue(resultado["success"], resultado["message"])
+        roteador = fragmentacao._roteador
+        ultimo = roteador.fragmentos()[-1]
+        for numero in roteador.fragmentos():
+            conn = sqlite3.connect(roteador.caminho(numero))
+            try:
+                encontrado = conn.execute("SELECT COUNT(*) FROM Atendimento WHERE id_atendimento = ?", (resultado["id"],)).fetchone()[0]
+            finally:
+                conn.close()
+            self.assertEqual(encontrado, int(numero == ultimo), numero)
+        self.assertNotIn(resultado["id"], self.ids["atendimentos"])
+        self.assertEqual(open_crud.get_atendimento_by_id(resultado["id"])["data"]["descricao_sintomas_queixa"], "Tosse")
+
+    def test_escopo_restringe_listagens_e_buscas_por_id(self):
+        posto, hospital = self.ids["postos"][0], self.ids["hospitais"][0]
+        with open_crud.escopo_acesso([posto], [hospital]):
+            atendimentos = open_crud.get_all_atendimentos()["data"]
+            pacientes = open_crud.get_all_pacientes()["data"]
+            fora = open_crud.get_atendimento_by_id(self.ids["atendimentos"][-1])
+        self.assertEqual({linha["id_posto_atendimento"] for linha in atendimentos}, {posto})
+        self.assertEqual(len(atendimentos), 8)
+        self.assertEqual({linha["id_posto_referencia"] for linha in pacientes}, {posto})
+        self.assertFalse(fora["success"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+from datetime import date
+
+from tests.apoio import DATAS_ATENDIMENTO, TesteComBanco
+
+import arquivamento
+import open_crud
+
+
+class TestePaginacaoProntuario(TesteComBanco):
+    """Paciente 0 do banco de teste: um atendimento em cada data de DATAS_ATENDIMENTO, mais os criados aqui."""
+
+    def setUp(self):
+        super().setUp()
+        self.paciente = self.ids["pacientes"][0]
+
+    def _atendimentos_no_mesmo_horario(self, data_hora, quantidade):
+        ids = []
+        for _ in range(quantidade):
+            resultado = open_crud.create_atendimento(self.paciente, self.ids["funcionarios"][0], self.ids["postos"][0], "Consulta", "Dor",
+                                                     data_hora_inicio=data_hora, data_hora_fim=data_hora)
+            self.assertTrue(resultado["success"], resultado["message"])
+            ids.append(resultado["id"])
+        return ids
+
+    def _paginas(self, limit, **filtros):
+        paginas = []
+        before_id = None
+        for _ in range(20): # Um cursor que não avança repetiria páginas para sempre
+            resultado = open_crud.get_patient_timeline(self.paciente, limit=limit, before_id=before_id, **filtros)
+            self.assertTrue(resultado["success"], resultado.get("message"))
+            paginas.append([a["id_atendimento"] for a in resultado["data"]])
+            before_id = resultado["next_before_id"]
+            if before_id is None:
+                return paginas
+        self.fail(f"Paginação não terminou: {paginas}")
+
+    def _ordem_esperada(self, **filtros):
+        todos = open_crud.get_patient_timeline(self.paciente, limit=open_crud.MAX_PAGINA_PRONTUARIO, **filtros)["data"]
+        self.assertEqual(len({(a["data_hora_inicio_atendimento"], a["id_atendimento"]) for a in todos}), len(todos))
+        self.assertEqual(todos, sorted(todos, key=lambda a: (a["data_hora_inicio_atendimento"], a["id_atendimento"]), reverse=True))
+        return [a["id_atendimento"] for a in todos]
+
+    def test_paginas_com_horarios_iguais(self):
+        empatados = self._atendimentos_no_mesmo_horario("2026-10-01 10:00:00", 5)
+        paginas = self._paginas(limit=2)
+        self.assertEqual([len(pagina) for pagina in paginas], [2, 2, 2, 2, 1])
+        corridos = [id_atendimento for pagina in paginas for id_atendimento in pagina]
+        self.assertEqual(corridos, self._ordem_esperada()) # Sem repetir nem pular
+        self.assertEqual(corridos[:5], sorted(empatados, reverse=True))
+
+    def test_paginas_entre_tabelas_quentes_e_arquivo(self):
+        antigos = self._atendimentos_no_mesmo_horario(f"{DATAS_ATENDIMENTO[0]} 09:00:00", 3) # Mesmo horário de um atendimento da base
+        self._atendimentos_no_mesmo_horario("2026-10-01 10:00:00", 2)
+        esperado = self._ordem_esperada()
+        resultado = arquivamento.arquivar(6, tamanho_lote=5, hoje=date(2026, 10, 19))
+        self.assertTrue(resultado["success"], resultado.get("message"))
+        self.assertEqual(len(open_crud.get_all_atendimentos(id_paciente=self.paciente)["data"]), 3) # Só os dos últimos 6 meses nas tabelas quentes
+
+        corridos = [id_atendimento for pagina in self._paginas(limit=3) for id_atendimento in pagina]
+        self.assertEqual(corridos, esperado)
+        self.assertEqual(corridos[-4:], sorted(antigos + [self.ids["atendimentos"][0]], reverse=True))
+
+    def test_prescricoes_e_filtro_since(self):
+        pagina = open_crud.get_patient_timeline(self.paciente, limit=1)
+        atendimento = pagina["data"][0]
+        self.assertEqual(atendimento["id_atendimento"], self.ids["atendimentos"][3])
+        self.assertEqual(len(atendimento["prescricoes"]), 1)
+        distribuicao = atendimento["prescricoes"][0]["distribuicoes"][0]
+        self.assertEqual(sum(lote["quantidade"] for lote in distribuicao["lotes"]), 2)
+
+        recentes = self._paginas(limit=1, since=DATAS_ATENDIMENTO[2])
+        self.assertEqual(recentes, [[self.ids["atendimentos"][3]], [self.ids["atendimentos"][2]]])
+        self.assertEqual(open_crud.get_patient_timeline(self.paciente, before_id=999999)["data"], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import time
+import unittest
+
+from tests.apoio import TesteComBanco
+
+import fragmentacao
+import open_crud
+import replica_leitura
+
+
+class TesteReplicaLeitura(TesteComBanco):
+
+    def setUp(self):
+        super().setUp()
+        resultado = replica_leitura.atualizar()
+        self.assertTrue(resultado["success"], resultado["message"])
+        replica_leitura.ativar(atraso_maximo=60)
+        self.addCleanup(replica_leitura.desativar)
+
+    def _novo_paciente(self, nome):
+        resultado = open_crud.create_paciente(nome, "99999999999", "1990-01-01", "Masculino", "Rua Nova", self.ids["postos"][0])
+        self.assertTrue(resultado["success"], resultado["message"])
+        return resultado["id"]
+
+    def _listados(self):
+        return [linha["id_paciente"] for linha in open_crud.get_all_pacientes()["data"]]
+
+    def test_listagens_leem_a_replica(self):
+        self.assertEqual(replica_leitura.caminho_replica(), os.path.join(self.pasta, "hospital_replica.sqlite"))
+        novo = self._novo_paciente("Paciente Novo")
+        self.assertNotIn(novo, self._listados()) # Réplica anterior à escrita
+        self.assertTrue(open_crud.get_paciente_by_id(novo)["success"]) # Busca por ID lê o banco principal
+        replica_leitura.atualizar()
+        self.assertIn(novo, self._listados())
+
+    def test_sessao_le_as_proprias_escritas(self):
+        estado = {}
+        with replica_leitura.sessao(estado):
+            novo = self._novo_paciente("Paciente da Sessão")
+            self.assertIn(replica_leitura.CHAVE_ULTIMA_ESCRITA, estado)
+            self.assertIn(novo, self._listados())
+        with replica_leitura.sessao({}): # Outra sessão segue com a réplica
+            self.assertNotIn(novo, self._listados())
+
+    def test_replica_atrasada_nao_e_usada(self):
+        novo = self._novo_paciente("Paciente Novo")
+        antiga = time.time() - 120
+        os.utime(replica_leitura.caminho_replica(), (antiga, antiga))
+        self.assertIn(novo, self._listados())
+        replica_leitura.descartar()
+        self.assertIsNone(replica_leitura.idade_replica())
+        self.assertIn(novo, self._listados())
+
+    def test_desativar_volta_ao_banco_principal(self):
+        novo = self._novo_paciente("Paciente Novo")
+        replica_leitura.desativar()
+        self.assertFalse(replica_leitura.ativa())
+        self.assertIn(novo, self._listados())
+
+    def test_indisponivel_no_modo_fragmentado(self):
+        replica_leitura.desativar()
+        diretorio = os.path.join(self.pasta, "fragmentos")
+        self.assertTrue(fragmentacao.fragmentar(self.banco, diretorio)["success"])
+        fragmentacao.ativar(diretorio)
+        self.addCleanup(fragmentacao.desativar)
+        with self.assertRaises(ValueError):
+            replica_leitura.ativar()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import datetime
+import unittest
+
+from tests.apoio import TesteComBanco
+
+import open_crud
+import sessoes
+
+
+class TesteSerieTemporal(TesteComBanco):
+    """Cada data de DATAS_ATENDIMENTO tem 8 atendimentos, dois em cada posto; prescrições e distribuições são de hoje."""
+
+    def _atendimento(self, data_hora, tipo="Consulta", posto=0):
+        resultado = open_crud.create_atendimento(self.ids["pacientes"][2 * posto], self.ids["funcionarios"][posto], self.ids["postos"][posto],
+                                                 tipo, "Dor", data_hora_inicio=data_hora)
+        self.assertTrue(resultado["success"], resultado["message"])
+
+    def test_serie_mensal_densa(self):
+        resultado = open_crud.get_serie_temporal(periodo="mes", start_date="2024-11-01", end_date="2025-05-31")
+        self.assertTrue(resultado["success"], resultado.get("message"))
+        self.assertEqual(resultado["periodos"], ["2024-11-01", "2024-12-01", "2025-01-01", "2025-02-01", "2025-03-01", "2025-04-01", "2025-05-01"])
+        self.assertEqual(resultado["data"], [{"grupo": {}, "valores": [8, 0, 0, 0, 0, 0, 8]}])
+
+    def test_semanas_comecam_na_segunda(self):
+        self._atendimento("2026-02-22 23:00:00") # Domingo: mesma semana da sexta 2026-02-20
+        self._atendimento("2026-02-23 00:30:00") # Segunda: semana seguinte
+        resultado = open_crud.get_serie_temporal(periodo="semana", start_date="2026-02-18", end_date="2026-02-23")
+        self.assertEqual(resultado["periodos"], ["2026-02-16", "2026-02-23"])
+        self.assertEqual(resultado["data"][0]["valores"], [9, 1])
+
+    def test_fim_do_intervalo_inclui_o_dia_inteiro(self):
+        resultado = open_crud.get_serie_temporal(periodo="dia", start_date="2026-09-29", end_date="2026-09-30")
+        self.assertEqual(resultado["periodos"], ["2026-09-29", "2026-09-30"])
+        self.assertEqual(resultado["data"][0]["valores"], [0, 8])
+
+    def test_dimensoes(self):
+        self._atendimento("2026-09-30 10:00:00", tipo="Retorno", posto=1)
+        resultado = open_crud.get_serie_temporal(periodo="mes", dimensoes=["posto", "tipo_atendimento"], start_date="2026-09-01", end_date="2026-09-30")
+        grupos = {(item["grupo"]["posto"], item["grupo"]["tipo_atendimento"]): item["valores"] for item in resultado["data"]}
+        self.assertEqual(grupos, {("Posto 0", "Consulta"): [2], ("Posto 1", "Consulta"): [2], ("Posto 1", "Retorno"): [1],
+                                  ("Posto 2", "Consulta"): [2], ("Posto 3", "Consulta"): [2]})
+
+        hoje = datetime.date.today().isoformat()
+        distribuicoes = open_crud.get_serie_temporal("distribuicoes", periodo="dia", dimensoes=["medicamento"], start_date=hoje, end_date=hoje)
+        self.assertEqual([(item["grupo"]["medicamento"], item["valores"]) for item in distribuicoes["data"]],
+                         [("Medicamento 0", [32]), ("Medicamento 1", [32])])
+
+    def test_parametros_invalidos(self):
+        self.assertFalse(open_crud.get_serie_temporal("leitos")["success"])
+        self.assertFalse(open_crud.get_serie_temporal(periodo="ano")["success"])
+        self.assertFalse(open_crud.get_serie_temporal(dimensoes=["medicamento"])["success"]) # Só para prescrições e distribuições
+
+    def test_escopo_do_principal(self):
+        principal = sessoes.carregar_principal(self.ids["funcionarios"][2]) # Médico: postos 2 e 3, do hospital 1
+        with principal.escopo():
+            resultado = open_crud.get_serie_temporal(periodo="mes", dimensoes=["posto"], start_date="2026-09-01", end_date="2026-09-30")
+        self.assertEqual([(item["grupo"]["posto"], item["valores"]) for item in resultado["data"]], [("Posto 2", [2]), ("Posto 3", [2])])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import sqlite3
+import unittest
+
+from tests.apoio import SENHA, TesteComBanco
+
+import open_crud
+import sessoes
+
+
+class TesteSessoes(TesteComBanco):
+
+    def setUp(self):
+        super().setUp()
+        resultado = open_crud.create_funcionario("Enfermeiro", "88888888888", "Enfermeiro", "enfermeiro@teste.com", SENHA, self.ids["postos"][0])
+        self.assertTrue(resultado["success"], resultado["message"])
+        self.funcionario = resultado["id"]
+        self.token = sessoes.criar_sessao(self.funcionario)
+        self.addCleanup(sessoes.encerrar_sessao, self.token)
+
+    def test_principal_fica_em_memoria(self):
+        principal = sessoes.obter_principal(self.token)
+        self.assertEqual((principal.cargo, principal.postos_visiveis), ("Enfermeiro", (self.ids["postos"][0],)))
+        self.assertFalse(hasattr(principal, "senha_hash"))
+        conn = sqlite3.connect(self.banco) # Alteração sem passar pelo open_crud: a sessão não relê o banco
+        try:
+            conn.execute("UPDATE Funcionario SET nome_funcionario = 'Outro' WHERE id_funcionario = ?", (self.funcionario,))
+            conn.commit()
+        finally:
+            conn.close()
+        self.assertIs(sessoes.obter_principal(self.token), principal)
+        self.assertIsNone(sessoes.obter_principal("token-invalido"))
+
+    def test_alteracao_do_funcionario_vale_na_sessao(self):
+        antes = sessoes.obter_principal(self.token)
+        open_crud.update_funcionario(self.funcionario, cargo="Farmacêutico", id_posto_lotacao=self.ids["postos"][2])
+        principal = sessoes.obter_principal(self.token)
+        self.assertIsNot(principal, antes)
+        self.assertEqual((principal.cargo, principal.id_posto), ("Farmacêutico", self.ids["postos"][2]))
+        self.assertEqual(principal.postos_visiveis, tuple(self.ids["postos"][2:])) # Farmacêutico: postos do hospital 1
+        self.assertIs(sessoes.obter_principal(self.token), principal) # Relido uma única vez
+
+    def test_novo_posto_no_hospital_amplia_o_escopo(self):
+        medico = sessoes.criar_sessao(self.ids["funcionarios"][0])
+        self.addCleanup(sessoes.encerrar_sessao, medico)
+        self.assertEqual(sessoes.obter_principal(medico).postos_visiveis, tuple(self.ids["postos"][:2]))
+        novo = open_crud.create_posto_saude("Posto Novo", "Rua Nova", self.ids["hospitais"][0])["id"]
+        self.assertEqual(sessoes.obter_principal(medico).postos_visiveis, (*self.ids["postos"][:2], novo))
+        open_crud.update_posto_saude(novo, id_hospital_vinculado=self.ids["hospitais"][1])
+        self.assertEqual(sessoes.obter_principal(medico).postos_visiveis, tuple(self.ids["postos"][:2]))
+
+    def test_exclusao_encerra_a_sessao(self):
+        self.assertTrue(open_crud.delete_funcionario(self.funcionario)["success"])
+        self.assertIsNone(sessoes.obter_principal(self.token))
+        self.assertIsNone(sessoes.criar_sessao(self.funcionario))
+
+    def test_expiracao_e_limite(self):
+        armazem = sessoes.ArmazemSessoes(ttl=-1)
+        self.assertIsNone(armazem.obter(armazem.criar(self.funcionario)))
+        self.assertEqual(len(armazem), 0)
+
+        armazem = sessoes.ArmazemSessoes(max_sessoes=2)
+        tokens = [armazem.criar(self.funcionario) for _ in range(3)]
+        self.assertEqual(len(armazem), 2)
+        self.assertIsNone(armazem.obter(tokens[0])) # A que expiraria primeiro
+        armazem.encerrar_sessoes_funcionario(self.funcionario)
+        self.assertEqual(len(armazem), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,266 @@
+"""
+Sugestão de transferências de estoque entre postos do mesmo hospital.
+
+Para cada lote válido estima, com o consumo diário do posto, quanto ele vai consumir antes do
+vencimento (ou do fim do horizonte) seguindo FEFO; o que sobra pode ser doado. Postos irmãos
+(mesmo id_hospital_vinculado) cujo estoque consumível não cobre a demanda do horizonte recebem
+essas sobras, primeiro dos lotes que vencem antes, e de cada lote só o que conseguem consumir
+antes do vencimento. O consumo por lote é vetorizado com NumPy sobre todos os medicamentos e
+hospitais de uma vez; o resultado fica em TransferenciaSugerida.
+
+O consumo diário vem de PontoReposicao (previsao_estoque.py) quando existir, senão da média
+das distribuições recentes.
+
+Uso:
+    python transferencia_estoque.py --horizonte 30 --dias-minimos 7
+"""
+import argparse
+import sqlite3
+import time
+from datetime import date, datetime
+
+import numpy as np
+
+import fragmentacao
+import open_crud
+import previsao_estoque
+
+HORIZONTE_DIAS = 30
+DIAS_CONSUMO = 60
+DIAS_MINIMOS_VALIDADE = 7 # Lotes que vencem antes disso não compensam o transporte
+
+
+def _criar_tabela(conn):
+    conn.execute("""CREATE TABLE IF NOT EXISTS TransferenciaSugerida (
+        id_transferencia INTEGER PRIMARY KEY AUTOINCREMENT,
+        id_estoque_origem INTEGER NOT NULL,
+        id_posto_origem INTEGER NOT NULL,
+        id_posto_destino INTEGER NOT NULL,
+        id_medicamento INTEGER NOT NULL,
+        lote TEXT NOT NULL,
+        data_validade TEXT NOT NULL,
+        quantidade INTEGER NOT NULL,
+        motivo TEXT NOT NULL CHECK (motivo IN ('risco_vencimento', 'excesso')),
+        data_geracao TEXT NOT NULL
+    )""")
+
+
+def _taxas_consumo(conn, dias_consumo):
+    """Consumo diário por (id_posto, id_medicamento): previsão gravada quando houver, senão média recente."""
+    chaves, Y = previsao_estoque.carregar_series(conn, dias_consumo, date.today())
+    taxas = dict(zip(chaves, Y.mean(axis=1).tolist())) if chaves else {}
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'PontoReposicao'").fetchone():
+        for row in conn.execute("SELECT id_posto, id_medicamento, consumo_medio_diario FROM PontoReposicao"):
+            taxas[(row[0], row[1])] = row[2]
+    return taxas
+
+
+def _minimo_acumulado_por_grupo(valores, inicio_grupo):
+    """np.minimum.accumulate reiniciando a cada grupo (inicio_grupo marca a primeira linha de cada grupo)."""
+    if not len(valores):
+        return valores
+    # Cada grupo recebe um deslocamento menor que o anterior, então o mínimo nunca atravessa grupos
+    grupo = np.cumsum(inicio_grupo) - 1
+    passo = 2 * (np.abs(valores).max() + 1)
+    return np.minimum.accumulate(valores - grupo * passo) + grupo * passo
+
+
+def consumo_fefo(quantidades, dias, taxas, inicio_grupo):
+    """Unidades de cada lote consumidas antes de `dias`, consumindo os lotes do grupo em ordem de validade.
+
+    Com C_i o total consumido até o vencimento do lote i, C_i = min(taxa * dias_i, C_{i-1} + q_i),
+    cuja forma fechada é C_i = S_i + min(0, min_{j<=i}(taxa * dias_j - S_j)), S = soma acumulada de q.
+    """
+    grupo = np.cumsum(inicio_grupo) - 1
+    acumulado = np.cumsum(quantidades)
+    antes_do_grupo = (acumulado - quantidades)[inicio_grupo]
+    S = acumulado - antes_do_grupo[grupo]
+    C = S + np.minimum(0, _minimo_acumulado_por_grupo(taxas * dias - S, inicio_grupo))
+    C_anterior = np.where(inicio_grupo, 0, np.roll(C, 1))
+    return C - C_anterior, C
+
+
+def _emparelhar(doadores, chave, posto, dias, sobra, receptores, consumo_proprio, horizonte):
+    """Distribui as sobras dos lotes doadores entre os postos com falta do mesmo (hospital, medicamento).
+
+    Os doadores vêm em ordem de validade e cada um é oferecido aos receptores da sua chave, maior
+    falta primeiro; o posto do próprio lote é pulado e a sobra segue para os demais. Um posto só
+    recebe de um lote o que consegue consumir até o vencimento dele (ou o fim do horizonte):
+    taxa * dias, menos o que já consome dos próprios lotes que vencem antes e o que já recebeu de
+    lotes doados antes. `receptores` é {(hospital, medicamento): [[posto, taxa, falta], ...]} e
+    `consumo_proprio` é {(posto, medicamento): (dias dos lotes, consumo acumulado no horizonte)}.
+    Retorna [(indice_doador, posto_destino, quantidade)].
+    """
+    recebido = {}
+    emparelhados = []
+    for origem in doadores.tolist():
+        restante = sobra[origem]
+        prazo = min(dias[origem], horizonte)
+        id_medicamento = chave[origem][1]
+        for receptor in receptores.get(chave[origem], ()):
+            posto_destino, taxa, falta = receptor
+            if falta <= 0 or posto_destino == posto[origem]:
+                continue
+            ja_consumido = 0.0
+            if (posto_destino, id_medicamento) in consumo_proprio:
+                dias_lotes, acumulado = consumo_proprio[(posto_destino, id_medicamento)]
+                anteriores = np.searchsorted(dias_lotes, dias[origem], side="right") # Lotes próprios que vencem até este
+                ja_consumido = acumulado[anteriores - 1] if anteriores else 0.0
+            capacidade = np.floor(np.round(taxa * prazo - ja_consumido - recebido.get((posto_destino, id_medicamento), 0), 6))
+            quantidade = min(restante, falta, capacidade)
+            if quantidade <= 0:
+                continue
+            emparelhados.append((origem, posto_destino, int(quantidade)))
+            receptor[2] -= quantidade
+            recebido[(posto_destino, id_medicamento)] = recebido.get((posto_destino, id_medicamento), 0) + quantidade
+            restante -= quantidade
+            if restante <= 0:
+                break
+    return emparelhados
+
+
+@open_crud.repetir_se_ocupado
+def gerar_transferencias(horizonte=HORIZONTE_DIAS, dias_consumo=DIAS_CONSUMO, dias_minimos=DIAS_MINIMOS_VALIDADE):
+    """Calcula as transferências sugeridas entre postos irmãos e regrava TransferenciaSugerida."""
+    if fragmentacao.consultas_no_catalogo():
+        return {"success": False, "message": fragmentacao.MENSAGEM_SO_BANCO_UNICO}
+    inicio_execucao = time.perf_counter()
+    hoje = date.today()
+    conn = open_crud.get_db_connection()
+    try:
+        _criar_tabela(conn)
+        taxas = _taxas_consumo(conn, dias_consumo)
+        hospital_do_posto = dict(conn.execute("SELECT id_posto, id_hospital_vinculado FROM PostoSaude").fetchall())
+        lotes = conn.execute(
+            """SELECT e.id_estoque, ps.id_hospital_vinculado, e.id_medicamento, e.id_posto, e.lote, e.data_validade, e.quantidade_atual
+            FROM EstoqueMedicamentoPosto e
+            JOIN PostoSaude ps ON e.id_posto = ps.id_posto
+            WHERE e.quantidade_atual > 0 AND e.data_validade >= ?
+            ORDER BY ps.id_hospital_vinculado, e.id_medicamento, e.id_posto, e.data_validade""",
+            (hoje.isoformat(),)
+        ).fetchall()
+
+        # --- Oferta: o que cada lote não vai consumir no próprio posto ---
+        hosp = np.array([row[1] for row in lotes], dtype=np.int64)
+        med = np.array([row[2] for row in lotes], dtype=np.int64)
+        posto = np.array([row[3] for row in lotes], dtype=np.int64)
+        dias = np.array([(date.fromisoformat(row[5]) - hoje).days for row in lotes], dtype=float)
+        qtd = np.array([row[6] for row in lotes], dtype=float)
+        taxa = np.array([taxas.get((row[3], row[2]), 0.0) for row in lotes], dtype=float)
+        inicio_grupo = np.ones(len(lotes), dtype=bool)
+        inicio_grupo[1:] = (posto[1:] != posto[:-1]) | (med[1:] != med[:-1])
+
+        consumo_horizonte, consumivel = consumo_fefo(qtd, np.minimum(dias, horizonte), taxa, inicio_grupo)
+        consumo_validade, _ = consumo_fefo(qtd, dias, taxa, inicio_grupo)
+        risco_vencimento = consumo_validade < qtd
+        sobra = np.floor(np.round(qtd - consumo_horizonte, 6))
+        sobra[dias < dias_minimos] = 0
+
+        # --- Demanda: falta de cada (posto, medicamento) no horizonte ---
+        fim_grupo = np.append(inicio_grupo[1:], True)[:len(lotes)]
+        consumivel_por_par = dict(zip(zip(posto[fim_grupo].tolist(), med[fim_grupo].tolist()), consumivel[fim_grupo].tolist()))
+        pares_demanda = sorted(
+            (hospital_do_posto[p], m, -(t * horizonte - consumivel_por_par.get((p, m), 0.0)), p)
+            for (p, m), t in taxas.items() if p in hospital_do_posto
+        )
+        falta = np.ceil(np.round([-row[2] for row in pares_demanda], 6)) # Arredonda antes para não virar 1 por erro de ponto flutuante
+
+        receptores = {}
+        for (id_hospital, m, _, p), f in zip(pares_demanda, falta.tolist()):
+            if f > 0:
+                receptores.setdefault((id_hospital, m), []).append([p, taxas[(p, m)], f])
+        # Consumo acumulado no horizonte dos lotes de cada (posto, medicamento), em ordem de validade
+        inicios = np.flatnonzero(inicio_grupo)
+        consumo_proprio = {
+            (int(posto[a]), int(med[a])): (dias[a:b], np.cumsum(consumo_horizonte[a:b]))
+            for a, b in zip(inicios.tolist(), np.append(inicios[1:], len(lotes)).tolist())
+        }
+
+        doador = np.flatnonzero(sobra > 0)
+        doador = doador[np.lexsort((dias[doador], med[doador], hosp[doador]))] # Lotes que vencem antes são doados primeiro
+        chave = list(zip(hosp.tolist(), med.tolist()))
+        gerado_em = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        transferencias = [
+            (lotes[origem][0], lotes[origem][3], posto_destino, lotes[origem][2], lotes[origem][4], lotes[origem][5],
+             quantidade, "risco_vencimento" if risco_vencimento[origem] else "excesso", gerado_em)
+            for origem, posto_destino, quantidade in _emparelhar(doador, chave, posto, dias, sobra, receptores, consumo_proprio, horizonte)
+        ]
+
+        conn.execute("DELETE FROM TransferenciaSugerida")
+        conn.executemany(
+            """INSERT INTO TransferenciaSugerida (id_estoque_origem, id_posto_origem, id_posto_destino, id_medicamento,
+                lote, data_validade, quantidade, motivo, data_geracao)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            transferencias
+        )
+        conn.commit()
+        unidades = sum(t[6] for t in transferencias)
+        unidades_em_risco = sum(t[6] for t in transferencias if t[7] == "risco_vencimento")
+        segundos = time.perf_counter() - inicio_execucao
+        return {
+            "success": True,
+            "message": f"{len(transferencias)} transferências sugeridas ({unidades} unidades, {unidades_em_risco} de lotes com risco de vencimento) em {segundos:.2f}s.",
+            "data": {"transferencias": len(transferencias), "unidades": unidades, "unidades_risco_vencimento": unidades_em_risco, "segundos": segundos},
+        }
+    except sqlite3.Error as e:
+        conn.rollback()
+        return {"success": False, "message": f"Erro ao gerar transferências: {e}"}
+    finally:
+        conn.close()
+
+
+def get_transferencias_sugeridas(id_hospital=None, id_medicamento=None):
+    """Retorna as transferências sugeridas na última execução, com nomes de postos e medicamento."""
+    if fragmentacao.consultas_no_catalogo():
+        return {"success": False, "message": fragmentacao.MENSAGEM_SO_BANCO_UNICO}
+    conn = open_crud.get_db_connection()
+    try:
+        _criar_tabela(conn)
+        query = """SELECT ts.*, m.nome_comercial_medicamento, po.nome_posto AS nome_posto_origem, pd.nome_posto AS nome_posto_destino
+            FROM TransferenciaSugerida ts
+            JOIN Medicamento m ON ts.id_medicamento = m.id_medicamento
+            JOIN PostoSaude po ON ts.id_posto_origem = po.id_posto
+            JOIN PostoSaude pd ON ts.id_posto_destino = pd.id_posto
+            WHERE 1=1"""
+        params = []
+        escopo = open_crud.escopo_atual()
+        if escopo is not None:
+            # Visível a quem enxerga o posto de origem ou o de destino
+            origem, params_origem = open_crud._filtro_in("ts.id_posto_origem", escopo["postos"])
+            destino, params_destino = open_crud._filtro_in("ts.id_posto_destino", escopo["postos"])
+            query += f" AND ({origem} OR {destino})"
+            params.extend(params_origem + params_destino)
+        if id_hospital:
+            query += " AND po.id_hospital_vinculado = ?"
+            params.append(id_hospital)
+        if id_medicamento:
+            query += " AND ts.id_medicamento = ?"
+            params.append(id_medicamento)
+        query += " ORDER BY ts.data_validade, ts.quantidade DESC"
+        rows = conn.execute(query, tuple(params)).fetchall()
+        return {"success": True, "data": [dict(row) for row in rows]}
+    except sqlite3.Error as e:
+        return {"success": False, "message": f"Erro ao buscar transferências sugeridas: {e}"}
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sugere transferências de estoque entre postos do mesmo hospital.")
+    parser.add_argument("--db", default=open_crud.DATABASE_NAME, help="Arquivo SQLite do banco de dados.")
+    parser.add_argument("--horizonte", type=int, default=HORIZONTE_DIAS, help="Dias de demanda que cada posto deve cobrir.")
+    parser.add_argument("--dias-consumo", type=int, default=DIAS_CONSUMO, help="Janela do consumo médio quando não há previsão gravada.")
+    parser.add_argument("--dias-minimos", type=int, default=DIAS_MINIMOS_VALIDADE, help="Validade mínima restante para transferir um lote.")
+    args = parser.parse_args()
+
+    open_crud.DATABASE_NAME = args.db
+    resultado = gerar_transferencias(args.horizonte, args.dias_consumo, args.dias_minimos)
+    print(resultado["message"])
+    if resultado["success"]:
+        for t in get_transferencias_sugeridas()["data"]:
+            print(f"  {t['quantidade']:>6} x {t['nome_comercial_medicamento']} (lote {t['lote']}, validade {t['data_validade']}): "
+                  f"{t['nome_posto_origem']} -> {t['nome_posto_destino']} [{t['motivo']}]")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+"""
+Vigilância epidemiológica: detecção de surtos por CID-10 e posto.
+
+Agrega Atendimento por (cid10, posto, dia) e acompanha cada série com dois detectores, EWMA e
+CUSUM, atualizados dia a dia para todas as séries de uma vez com NumPy. O estado de cada série
+(média e variância de referência, EWMA, CUSUM) fica em EstadoVigilancia e o último dia processado
+em ConfiguracaoVigilancia, então cada execução só lê os atendimentos dos dias novos em vez de
+recalcular todo o histórico. Uma série começa a ser acompanhada no dia do seu primeiro caso, seja
+qual for o bloco ou a execução em que ele aparece, então atualizar dia a dia ou de uma vez chega ao
+mesmo estado e aos mesmos alertas. Os alertas são gravados em AlertaSurto.
+
+Só dias completos (até ontem) são processados. Atendimentos lançados depois para um dia já
+processado não são reavaliados; use --reprocessar para reconstruir o estado do zero.
+
+Uso:
+    python vigilancia_epidemiologica.py
+    python vigilancia_epidemiologica.py --reprocessar --dias-historico 365
+"""
+import argparse
+import sqlite3
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+import fragmentacao
+import open_crud
+
+DIAS_HISTORICO = 365 # Janela lida na primeira execução (ou ao reprocessar)
+DIAS_POR_BLOCO = 31 # Dias lidos do banco por vez
+DIAS_AQUECIMENTO = 14 # Dias observados antes de uma série poder gerar alertas
+CASOS_MINIMOS = 3 # Abaixo disso no dia não há alerta, por maior que seja o desvio
+
+TAXA_REFERENCIA = 0.05 # Velocidade com que a média/variância de referência acompanham a série
+LAMBDA_EWMA = 0.3
+LIMITE_EWMA = 3.0 # Em desvios-padrão da EWMA
+FOLGA_CUSUM = 0.5 # k, em desvios-padrão
+LIMITE_CUSUM = 4.0 # h, em desvios-padrão
+
+
+def _criar_tabelas(conn):
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_atendimento_data_hora ON Atendimento (data_hora_inicio_atendimento)")
+    conn.execute("""CREATE TABLE IF NOT EXISTS ConfiguracaoVigilancia (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        ultimo_dia_processado TEXT
+    )""")
+    conn.execute("INSERT OR IGNORE INTO ConfiguracaoVigilancia (id, ultimo_dia_processado) VALUES (1, NULL)")
+    conn.execute("""CREATE TABLE IF NOT EXISTS EstadoVigilancia (
+        cid10 TEXT NOT NULL,
+        id_posto INTEGER NOT NULL,
+        media REAL NOT NULL,
+        variancia REAL NOT NULL,
+        ewma REAL NOT NULL,
+        cusum REAL NOT NULL,
+        dias_observados INTEGER NOT NULL,
+        em_surto INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (cid10, id_posto)
+    )""")
+    conn.execute("""CREATE TABLE IF NOT EXISTS AlertaSurto (
+        id_alerta INTEGER PRIMARY KEY AUTOINCREMENT,
+        cid10 TEXT NOT NULL,
+        id_posto INTEGER NOT NULL,
+        data_referencia TEXT NOT NULL,
+        casos INTEGER NOT NULL,
+        casos_esperados REAL NOT NULL,
+        estatistica REAL NOT NULL,
+        metodo TEXT NOT NULL CHECK (metodo IN ('ewma', 'cusum')),
+        data_hora_alerta TEXT NOT NULL,
+        UNIQUE (cid10, id_posto, data_referencia, metodo)
+    )""")
+
+
+class EstadoSeries:
+    """Estado dos detectores de todas as séries, como arrays alinhados com `chaves`."""
+
+    CAMPOS = ("media", "variancia", "ewma", "cusum", "dias_observados", "em_surto")
+
+    def __init__(self, chaves=(), valores=None):
+        self.chaves = list(chaves)
+        self.indice = {chave: i for i, chave in enumerate(self.chaves)}
+        valores = valores if valores is not None else np.zeros((len(self.chaves), len(self.CAMPOS)))
+        for k, campo in enumerate(self.CAMPOS):
+            setattr(self, campo, np.array(valores[:, k], dtype=float))
+
+    def garantir(self, chaves):
+        """Acrescenta séries novas (estado zerado) e retorna o índice de cada chave recebida."""
+        novas = [chave for chave in dict.fromkeys(chaves) if chave not in self.indice]
+        if novas:
+            for chave in novas:
+                self.indice[chave] = len(self.chaves)
+                self.chaves.append(chave)
+            for campo in self.CAMPOS:
+                setattr(self, campo, np.concatenate([getattr(self, campo), np.zeros(len(novas))]))
+        return np.array([self.indice[chave] for chave in chaves], dtype=np.int64)
+
+    def avancar_dia(self, casos, ativas=None):
+        """Processa um dia de contagens (um valor por série).
+
+        Só as séries marcadas em `ativas` (todas, se None) avançam; as demais ficam como estavam.
+        Retorna (alarme_ewma, alarme_cusum, cusum_do_dia); o CUSUM volta a zero após cada alarme.
+        """
+        if ativas is not None and not ativas.all():
+            anteriores = {campo: getattr(self, campo).copy() for campo in self.CAMPOS}
+            alarme_ewma, alarme_cusum, cusum_do_dia = self.avancar_dia(casos)
+            for campo, valores in anteriores.items():
+                getattr(self, campo)[~ativas] = valores[~ativas]
+            return alarme_ewma & ativas, alarme_cusum & ativas, cusum_do_dia
+        desvio = np.sqrt(np.maximum(self.variancia, np.maximum(self.media, 1.0))) # Piso de Poisson
+        z = (casos - self.media) / desvio
+        self.ewma = LAMBDA_EWMA * casos + (1 - LAMBDA_EWMA) * self.ewma
+        self.cusum = np.maximum(0.0, self.cusum + z - FOLGA_CUSUM)
+
+        elegivel = (self.dias_observados >= DIAS_AQUECIMENTO) & (casos >= CASOS_MINIMOS)
+        acima_ewma = self.ewma > self.media + LIMITE_EWMA * desvio * np.sqrt(LAMBDA_EWMA / (2 - LAMBDA_EWMA))
+        alarme_ewma = elegivel & acima_ewma & (self.em_surto == 0) # Só no início de cada excursão
+        alarme_cusum = elegivel & (self.cusum > LIMITE_CUSUM)
+        self.em_surto = (acima_ewma & (self.dias_observados >= DIAS_AQUECIMENTO)).astype(float)
+        cusum_do_dia = self.cusum.copy()
+        self.cusum[alarme_cusum] = 0.0
+
+        # A referência só aprende com dias normais, para o surto não virar o novo normal;
+        # nos primeiros dias a taxa maior faz dela a média simples do que já foi visto
+        normal = ~(alarme_ewma | alarme_cusum | (self.em_surto > 0))
+        taxa = np.maximum(TAXA_REFERENCIA, 1.0 / (self.dias_observados + 1))
+        diferenca = casos - self.media
+        self.media = np.where(normal, self.media + taxa * diferenca, self.media)
+        self.variancia = np.where(normal, (1 - taxa) * (self.variancia + taxa * diferenca ** 2), self.variancia)
+        self.dias_observados += 1
+        return alarme_ewma, alarme_cusum, cusum_do_dia
+
+    def linhas(self):
+        valores = np.stack([getattr(self, campo) for campo in self.CAMPOS], axis=1).tolist()
+        return [(c, p, *v[:4], int(v[4]), int(v[5])) for (c, p), v in zip(self.chaves, valores)]
+
+
+def _carregar_estado(conn):
+    rows = conn.execute(f"SELECT cid10, id_posto, {', '.join(EstadoSeries.CAMPOS)} FROM EstadoVigilancia").fetchall()
+    if not rows:
+        return EstadoSeries()
+    return EstadoSeries([(row[0], row[1]) for row in rows], np.array([tuple(row)[2:] for row in rows], dtype=float))
+
+
+def _casos_por_dia(conn, inicio, fim):
+    """Contagens (cid10, id_posto, dia) entre inicio e fim (inclusive)."""
+    return conn.execute(
+        """SELECT UPPER(TRIM(cid10)) AS cid, id_posto_atendimento, DATE(data_hora_inicio_atendimento) AS dia, COUNT(*)
+        FROM Atendimento
+        WHERE data_hora_inicio_atendimento >= ? AND data_hora_inicio_atendimento < ?
+          AND cid10 IS NOT NULL AND TRIM(cid10) <> ''
+        GROUP BY cid, id_posto_atendimento, dia""",
+        (inicio.isoformat(), (fim + timedelta(days=1)).isoformat())
+    ).fetchall()
+
+
+@open_crud.repetir_se_ocupado
+def atualizar_vigilancia(ate=None, dias_historico=DIAS_HISTORICO):
+    """Processa os dias completos ainda não vistos (até `ate`, padrão ontem) e grava os alertas novos."""
+    if fragmentacao.consultas_no_catalogo():
+        return {"success": False, "message": fragmentacao.MENSAGEM_SO_BANCO_UNICO}
+    ate = ate or date.today() - timedelta(days=1)
+    conn = open_crud.get_db_connection()
+    try:
+        _criar_tabelas(conn)
+        ultimo = conn.execute("SELECT ultimo_dia_processado FROM ConfiguracaoVigilancia WHERE id = 1").fetchone()[0]
+        inicio = date.fromisoformat(ultimo) + timedelta(days=1) if ultimo else ate - timedelta(days=dias_historico - 1)
+        if inicio > ate:
+            return {"success": True, "message": "Vigilância já está atualizada.", "data": {"dias": 0, "alertas": 0}}
+
+        estado = _carregar_estado(conn)
+        alertas = []
+        gerado_em = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        bloco_inicio = inicio
+        while bloco_inicio <= ate:
+            bloco_fim = min(bloco_inicio + timedelta(days=DIAS_POR_BLOCO - 1), ate)
+            rows = _casos_por_dia(conn, bloco_inicio, bloco_fim)
+            existentes = len(estado.chaves)
+            series = estado.garantir([(row[0], row[1]) for row in rows])
+            dias = np.array([(date.fromisoformat(row[2]) - bloco_inicio).days for row in rows], dtype=np.int64)
+            casos = np.zeros((len(estado.chaves), (bloco_fim - bloco_inicio).days + 1))
+            np.add.at(casos, (series, dias), [row[3] for row in rows])
+            # Séries novas no bloco começam no dia do primeiro caso, não no início do bloco
+            primeiro_dia = np.zeros(len(estado.chaves), dtype=np.int64)
+            primeiro_dia[existentes:] = casos.shape[1]
+            np.minimum.at(primeiro_dia, series, dias)
+
+            for d in range(casos.shape[1]):
+                esperado = estado.media.copy()
+                alarme_ewma, alarme_cusum, cusum_do_dia = estado.avancar_dia(casos[:, d], primeiro_dia <= d)
+                estatisticas = {"ewma": estado.ewma, "cusum": cusum_do_dia}
+                dia = (bloco_inicio + timedelta(days=d)).isoformat()
+                for metodo, alarme in (("ewma", alarme_ewma), ("cusum", alarme_cusum)):
+                    for i in np.flatnonzero(alarme).tolist():
+                        alertas.append((*estado.chaves[i], dia, int(casos[i, d]), round(float(esperado[i]), 3),
+                                        round(float(estatisticas[metodo][i]), 3), metodo, gerado_em))
+            bloco_inicio = bloco_fim + timedelta(days=1)
+
+        conn.executemany(
+            """INSERT INTO AlertaSurto (cid10, id_posto, data_referencia, casos, casos_esperados, estatistica, metodo, data_hora_alerta)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (cid10, id_posto, data_referencia, metodo) DO NOTHING""",
+            alertas
+        )
+        conn.executemany(
+            f"INSERT OR REPLACE INTO EstadoVigilancia (cid10, id_posto, {', '.join(EstadoSeries.CAMPOS)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            estado.linhas()
+        )
+        conn.execute("UPDATE ConfiguracaoVigilancia SET ultimo_dia_processado = ? WHERE id = 1", (ate.isoformat(),))
+        conn.commit()
+        dias_processados = (ate - inicio).days + 1
+        return {
+            "success": True,
+            "message": f"{dias_processados} dia(s) processado(s) em {len(estado.chaves)} séries; {len(alertas)} alerta(s) novo(s).",
+            "data": {"dias": dias_processados, "series": len(estado.chaves), "alertas": len(alertas)},
+        }
+    except sqlite3.Error as e:
+        conn.rollback()
+        return {"success": False, "message": f"Erro ao atualizar a vigilância: {e}"}
+    finally:
+        conn.close()
+
+
+@open_crud.repetir_se_ocupado
+def reiniciar_vigilancia():
+    """Apaga estado, alertas e o último dia processado; a próxima atualização relê o histórico."""
+    if fragmentacao.consultas_no_catalogo():
+        return {"success": False, "message": fragmentacao.MENSAGEM_SO_BANCO_UNICO}
+    conn = open_crud.get_db_connection()
+    try:
+        _criar_tabelas(conn)
+        conn.execute("DELETE FROM EstadoVigilancia")
+        conn.execute("DELETE FROM AlertaSurto")
+        conn.execute("UPDATE ConfiguracaoVigilancia SET ultimo_dia_processado = NULL WHERE id = 1")
+        conn.commit()
+        return {"success": True, "message": "Vigilância reiniciada."}
+    except sqlite3.Error as e:
+        conn.rollback()
+        return {"success": False, "message": f"Erro ao reiniciar a vigilância: {e}"}
+    finally:
+        conn.close()
+
+
+def get_alertas_surto(cid10=None, id_posto=None, desde=None):
+    """Retorna os alertas de surto (mais recentes primeiro), atualizando antes a vigilância se houver dias novos."""
+    if fragmentacao.consultas_no_catalogo():
+        return {"success": False, "message": fragmentacao.MENSAGEM_SO_BANCO_UNICO}
+    atualizacao = atualizar_vigilancia()
+    if not atualizacao["success"]:
+        return atualizacao
+    conn = open_crud.get_db_connection()
+    try:
+        query = """SELECT a.*, ps.nome_posto
+            FROM AlertaSurto a
+            JOIN PostoSaude ps ON a.id_posto = ps.id_posto
+            WHERE 1=1"""
+        filtro, params = open_crud._filtro_escopo("a.id_posto") # Só os postos do escopo de acesso ativo
+        query += filtro
+        if cid10:
+            query += " AND a.cid10 = ?"
+            params.append(cid10.strip().upper())
+        if id_posto:
+            query += " AND a.id_posto = ?"
+            params.append(id_posto)
+        if desde:
+            query += " AND a.data_referencia >= ?"
+            params.append(str(desde))
+        query += " ORDER BY a.data_referencia DESC, a.casos DESC"
+        rows = conn.execute(query, tuple(params)).fetchall()
+        return {"success": True, "data": [dict(row) for row in rows]}
+    except sqlite3.Error as e:
+        return {"success": False, "message": f"Erro ao buscar alertas de surto: {e}"}
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Atualiza a detecção de surtos por CID-10 e posto.")
+    parser.add_argument("--db", default=open_crud.DATABASE_NAME, help="Arquivo SQLite do banco de dados.")
+    parser.add_argument("--dias-historico", type=int, default=DIAS_HISTORICO, help="Dias lidos na primeira execução.")
+    parser.add_argument("--reprocessar", action="store_true", help="Descarta o estado salvo e relê o histórico.")
+    parser.add_argument("--desde", help="Mostra alertas a partir desta data (AAAA-MM-DD).")
+    args = parser.parse_args()
+
+    open_crud.DATABASE_NAME = args.db
+    if args.reprocessar:
+        print(reiniciar_vigilancia()["message"])
+    resultado = atualizar_vigilancia(dias_historico=args.dias_historico)
+    print(resultado["message"])
+    if resultado["success"]:
+        for a in get_alertas_surto(desde=args.desde)["data"]:
+            print(f"  {a['data_referencia']} {a['cid10']:<8} {a['nome_posto']}: {a['casos']} casos "
+                  f"(esperado {a['casos_esperados']:.1f}) [{a['metodo']}]")
+
+
+if __name__ == "__main__":
+    main()